@@ -1,12 +1,39 @@
 import os
-import random
-from dataclasses import dataclass
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date, datetime, timezone
 from typing import Dict, List, Tuple, Optional
 
 import pandas as pd
 import numpy as np
 import streamlit as st
-import altair as alt
+
+from nebula_core import (
+    ACTIVITY_BOOST, add_plan_costs, affected_slots, age_to_life_stage, APP_TITLE, assign_household_ids,
+    BREED_DF, BREED_META, build_category_prep_summary, build_weekly_shopping_list, changed_dependencies,
+    clean_household_profiles, compute_daily_energy, CONTAINER_SIZES_G, default_household_profiles,
+    default_plan_locks, diet_profile, dog_taste_entries, energy_adjustment, energy_sensitivity_grid,
+    ensure_ratio_sum, epoch_days, estimate_food_grams_from_energy, export_format_available,
+    EXPORT_FORMATS, export_bytes, feeding_chart_by_weight_band, filter_breed_options,
+    filter_ingredients_by_category, generate_plan_df, grams_for_day, household_dog_labels, import_taste_log,
+    ingredient_df, INGREDIENT_INDEX, INGREDIENT_NAMES, INGREDIENT_TAGS, INGREDIENTS,
+    KCAL_PER_KG_TISSUE, LazyModule, load_price_table, lock_matrix, MEAL_MAX_PER_DAY, MEAL_REST_DAYS,
+    meal_slot_breaks, MEAL_SLOT_COLUMNS, MICRO_KEYS, MICRO_MATRIX, MICRO_UNITS, normalize_search_text,
+    pack_meal_portions, plan_category_kcal_per_g, plan_day_count, plan_dependencies, plan_household,
+    plan_meal_slots, plan_signature, PlanCancelled, PreferenceModel, price_shopping_list,
+    PriceTable, profile_energy_key, ProfileRegistry, ratio_density_sweep, ratio_grid, RATIO_PRESETS,
+    recommend_ingredients, refresh_plan_rows, regenerate_plan_slots, ROTATION_CATEGORIES,
+    rotation_pools, RotationRules, RULE_EXAMPLES, schedule_cooking_sessions, score_micronutrients,
+    SHELF_LIFE_DAYS, SHOPPING_COLUMNS, SUPPLEMENT_BY_NAME, SUPPLEMENTS, SWEEP_DENSITIES,
+    SWEEP_METRICS, SWEEP_ON_TARGET_PCT, SWEEP_SEEDS, taste_dog_key, taste_log_frame, taste_prior_for,
+    taste_priors, TRAJECTORY_HORIZONS, update_shopping_list, WEEKDAY_NAMES, weight_trajectory_frames,
+)
+
+alt = LazyModule("altair")  # loaded by the first chart, not on every cold start
 
 
 # =========================================================
@@ -14,7 +41,6 @@ import altair as alt
 # English UI • No ingredient photos • Robust breed fallback
 # =========================================================
 
-APP_TITLE = "Nebula Paw Kitchen™"
 APP_SUBTITLE = "A premium cooked-fresh meal intelligence studio for dogs"
 
 st.set_page_config(
@@ -97,959 +123,780 @@ st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
 
 
 # =========================================================
-# 1) Breed Atlas — built-in mega list + safe optional CSV
+# Taste log (session-backed)
 # =========================================================
 
-def _builtin_breed_rows() -> List[Dict[str, str]]:
-    # A large, globally diverse starter atlas.
-    # Not literally every variety on earth, but intentionally broad.
-    # You can later replace/extend via data/breeds.csv safely.
-
-    def row(b, grp, reg, sz, notes=""):
-        return {"Breed": b, "FCI Group": grp, "Region": reg, "Size Class": sz, "Notes": notes}
-
-    G1 = "Group 1 - Sheepdogs and Cattle Dogs"
-    G2 = "Group 2 - Pinscher / Schnauzer / Molossoid / Swiss Mountain"
-    G3 = "Group 3 - Terriers"
-    G4 = "Group 4 - Dachshunds"
-    G5 = "Group 5 - Spitz and Primitive types"
-    G6 = "Group 6 - Scent hounds and related"
-    G7 = "Group 7 - Pointing Dogs"
-    G8 = "Group 8 - Retrievers / Flushing Dogs / Water Dogs"
-    G9 = "Group 9 - Companion and Toy Dogs"
-    G10 = "Group 10 - Sighthounds"
-    NA = "N/A"
-
-    rows = [
-        row("Mixed Breed / Unknown", NA, "Global", "Unknown", "For rescues or uncertain lineage"),
-
-        # Group 1
-        row("German Shepherd Dog", G1, "Europe", "Large"),
-        row("Belgian Malinois", G1, "Europe", "Large"),
-        row("Belgian Tervuren", G1, "Europe", "Large"),
-        row("Belgian Groenendael", G1, "Europe", "Large"),
-        row("Belgian Laekenois", G1, "Europe", "Large"),
-        row("Border Collie", G1, "Europe", "Medium"),
-        row("Rough Collie", G1, "Europe", "Large"),
-        row("Smooth Collie", G1, "Europe", "Large"),
-        row("Shetland Sheepdog", G1, "Europe", "Small"),
-        row("Old English Sheepdog", G1, "Europe", "Large"),
-        row("Australian Shepherd", G1, "Oceania", "Medium"),
-        row("Miniature American Shepherd", G1, "North America", "Small"),
-        row("Australian Cattle Dog", G1, "Oceania", "Medium"),
-        row("Pembroke Welsh Corgi", G1, "Europe", "Small"),
-        row("Cardigan Welsh Corgi", G1, "Europe", "Small"),
-        row("Dutch Shepherd", G1, "Europe", "Large"),
-        row("White Swiss Shepherd Dog", G1, "Europe", "Large"),
-        row("Bearded Collie", G1, "Europe", "Medium"),
-        row("Briard", G1, "Europe", "Large"),
-        row("Puli", G1, "Europe", "Medium"),
-        row("Pumi", G1, "Europe", "Medium"),
-        row("Mudi", G1, "Europe", "Medium"),
-        row("Bergamasco Sheepdog", G1, "Europe", "Large"),
-        row("Pyrenean Shepherd", G1, "Europe", "Small"),
-
-        # Group 2
-        row("Doberman Pinscher", G2, "Europe", "Large"),
-        row("Miniature Pinscher", G2, "Europe", "Small"),
-        row("German Pinscher", G2, "Europe", "Medium"),
-        row("Affenpinscher", G2, "Europe", "Toy"),
-        row("Schnauzer - Giant", G2, "Europe", "Large"),
-        row("Schnauzer - Standard", G2, "Europe", "Medium"),
-        row("Schnauzer - Miniature", G2, "Europe", "Small"),
-        row("Rottweiler", G2, "Europe", "Large"),
-        row("Boxer", G2, "Europe", "Large"),
-        row("Great Dane", G2, "Europe", "Giant"),
-        row("Bullmastiff", G2, "Europe", "Giant"),
-        row("Mastiff - English", G2, "Europe", "Giant"),
-        row("Neapolitan Mastiff", G2, "Europe", "Giant"),
-        row("Cane Corso", G2, "Europe", "Large"),
-        row("Dogue de Bordeaux", G2, "Europe", "Giant"),
-        row("Bernese Mountain Dog", G2, "Europe", "Giant"),
-        row("Greater Swiss Mountain Dog", G2, "Europe", "Giant"),
-        row("Saint Bernard", G2, "Europe", "Giant"),
-        row("Newfoundland", G2, "Europe", "Giant"),
-        row("Leonberger", G2, "Europe", "Giant"),
-        row("Tibetan Mastiff", G2, "Asia", "Giant"),
-        row("Boerboel", G2, "Africa", "Giant"),
-        row("Akbash", G2, "Middle East", "Giant", "Livestock guardian type"),
-        row("Kangal Shepherd Dog", G2, "Middle East", "Giant", "Livestock guardian type"),
-
-        # Group 3
-        row("Airedale Terrier", G3, "Europe", "Large"),
-        row("Bull Terrier", G3, "Europe", "Medium"),
-        row("Staffordshire Bull Terrier", G3, "Europe", "Medium"),
-        row("American Staffordshire Terrier", G3, "North America", "Large"),
-        row("West Highland White Terrier", G3, "Europe", "Small"),
-        row("Cairn Terrier", G3, "Europe", "Small"),
-        row("Scottish Terrier", G3, "Europe", "Small"),
-        row("Norfolk Terrier", G3, "Europe", "Small"),
-        row("Norwich Terrier", G3, "Europe", "Small"),
-        row("Border Terrier", G3, "Europe", "Small"),
-        row("Jack Russell Terrier", G3, "Europe", "Small"),
-        row("Parson Russell Terrier", G3, "Europe", "Small"),
-        row("Wire Fox Terrier", G3, "Europe", "Small"),
-        row("Smooth Fox Terrier", G3, "Europe", "Small"),
-        row("Kerry Blue Terrier", G3, "Europe", "Medium"),
-        row("Irish Terrier", G3, "Europe", "Medium"),
-        row("Soft Coated Wheaten Terrier", G3, "Europe", "Medium"),
-        row("Australian Terrier", G3, "Oceania", "Small"),
-        row("Yorkshire Terrier", G3, "Europe", "Toy"),
-
-        # Group 4
-        row("Dachshund - Standard", G4, "Europe", "Small"),
-        row("Dachshund - Miniature", G4, "Europe", "Toy"),
-        row("Dachshund - Wirehaired", G4, "Europe", "Small"),
-
-        # Group 5
-        row("Siberian Husky", G5, "Europe", "Large"),
-        row("Alaskan Malamute", G5, "North America", "Giant"),
-        row("Samoyed", G5, "Europe", "Large"),
-        row("Akita", G5, "Asia", "Large"),
-        row("American Akita", G5, "North America", "Large"),
-        row("Shiba Inu", G5, "Asia", "Medium"),
-        row("Korean Jindo", G5, "Asia", "Medium"),
-        row("Chow Chow", G5, "Asia", "Large"),
-        row("Keeshond", G5, "Europe", "Medium"),
-        row("Pomeranian", G5, "Europe", "Toy"),
-        row("Finnish Spitz", G5, "Europe", "Medium"),
-        row("Norwegian Elkhound", G5, "Europe", "Medium"),
-        row("Icelandic Sheepdog", G5, "Europe", "Medium"),
-        row("Basenji", G5, "Africa", "Medium"),
-        row("Thai Ridgeback", G5, "Asia", "Large"),
-        row("Pharaoh Hound", G5, "Europe", "Large"),
-        row("Xoloitzcuintli", G5, "North America", "Small/Medium", "Primitive heritage"),
-        row("Peruvian Inca Orchid", G5, "South America", "Medium", "Primitive heritage"),
-        row("Kishu Ken", G5, "Asia", "Medium"),
-        row("Kai Ken", G5, "Asia", "Medium"),
-        row("Shikoku", G5, "Asia", "Medium"),
-        row("Hokkaido", G5, "Asia", "Medium"),
-        row("Borzoi (Spitz line)", G5, "Europe", "Large", "Classification varies by registry"),
-
-        # Group 6
-        row("Beagle", G6, "Europe", "Medium"),
-        row("Basset Hound", G6, "Europe", "Medium"),
-        row("Bloodhound", G6, "Europe", "Large"),
-        row("Rhodesian Ridgeback", G6, "Africa", "Large"),
-        row("Coonhound - Black and Tan", G6, "North America", "Large"),
-        row("Coonhound - Redbone", G6, "North America", "Large"),
-        row("Coonhound - Treeing Walker", G6, "North America", "Large"),
-        row("Harrier", G6, "Europe", "Medium"),
-        row("Drever", G6, "Europe", "Medium"),
-        row("Finnish Hound", G6, "Europe", "Medium"),
-
-        # Group 7
-        row("German Shorthaired Pointer", G7, "Europe", "Large"),
-        row("German Wirehaired Pointer", G7, "Europe", "Large"),
-        row("English Pointer", G7, "Europe", "Large"),
-        row("Vizsla", G7, "Europe", "Medium"),
-        row("Weimaraner", G7, "Europe", "Large"),
-        row("Brittany", G7, "Europe", "Medium"),
-        row("English Setter", G7, "Europe", "Large"),
-        row("Gordon Setter", G7, "Europe", "Large"),
-        row("Irish Setter", G7, "Europe", "Large"),
-
-        # Group 8
-        row("Labrador Retriever", G8, "Europe", "Large"),
-        row("Golden Retriever", G8, "Europe", "Large"),
-        row("Flat-Coated Retriever", G8, "Europe", "Large"),
-        row("Curly-Coated Retriever", G8, "Europe", "Large"),
-        row("Chesapeake Bay Retriever", G8, "North America", "Large"),
-        row("Nova Scotia Duck Tolling Retriever", G8, "North America", "Medium"),
-        row("English Springer Spaniel", G8, "Europe", "Medium"),
-        row("English Cocker Spaniel", G8, "Europe", "Small"),
-        row("American Cocker Spaniel", G8, "North America", "Small"),
-        row("Portuguese Water Dog", G8, "Europe", "Large"),
-        row("Spanish Water Dog", G8, "Europe", "Medium"),
-        row("Lagotto Romagnolo", G8, "Europe", "Medium"),
-
-        # Group 9
-        row("Pug", G9, "Asia", "Small"),
-        row("French Bulldog", G9, "Europe", "Small"),
-        row("Bulldog - English", G9, "Europe", "Medium"),
-        row("Boston Terrier", G9, "North America", "Small"),
-        row("Cavalier King Charles Spaniel", G9, "Europe", "Small"),
-        row("King Charles Spaniel", G9, "Europe", "Toy"),
-        row("Maltese", G9, "Europe", "Toy"),
-        row("Bichon Frise", G9, "Europe", "Small"),
-        row("Havanese", G9, "North America", "Small"),
-        row("Shih Tzu", G9, "Asia", "Toy"),
-        row("Lhasa Apso", G9, "Asia", "Small"),
-        row("Pekingese", G9, "Asia", "Toy"),
-        row("Japanese Chin", G9, "Asia", "Toy"),
-        row("Papillon", G9, "Europe", "Toy"),
-        row("Chihuahua", G9, "North America", "Toy"),
-        row("Chinese Crested", G9, "Asia", "Toy"),
-        row("Coton de Tulear", G9, "Africa", "Small"),
-        row("Brussels Griffon", G9, "Europe", "Toy"),
-        row("Affenpinscher (Companion)", G9, "Europe", "Toy"),
-        row("Poodle - Toy", G9, "Europe", "Toy"),
-        row("Poodle - Miniature", G9, "Europe", "Small"),
-        row("Poodle - Standard", G9, "Europe", "Large"),
-        row("Italian Greyhound", G9, "Europe", "Toy"),
-        row("Yorkshire Terrier (Companion line)", G9, "Europe", "Toy"),
-        row("Russian Toy", G9, "Europe", "Toy"),
-        row("Bolognese", G9, "Europe", "Small"),
-        row("Lowchen", G9, "Europe", "Small"),
-
-        # Group 10
-        row("Greyhound", G10, "Europe", "Large"),
-        row("Whippet", G10, "Europe", "Medium"),
-        row("Saluki", G10, "Middle East", "Large"),
-        row("Afghan Hound", G10, "Asia", "Large"),
-        row("Irish Wolfhound", G10, "Europe", "Giant"),
-        row("Scottish Deerhound", G10, "Europe", "Giant"),
-        row("Italian Greyhound (Sighthound)", G10, "Europe", "Toy"),
-
-        # Widely recognized non-FCI or registry-variant lines
-        row("American Eskimo Dog", NA, "North America", "Small/Medium", "Spitz-type classification varies"),
-        row("Great Pyrenees", NA, "Europe", "Giant", "Livestock guardian type"),
-        row("Anatolian Shepherd Dog", NA, "Middle East", "Giant", "Livestock guardian type"),
-        row("Caucasian Shepherd Dog", NA, "Europe/Asia", "Giant", "Also called Caucasian Ovcharka"),
-        row("Central Asian Shepherd Dog", NA, "Europe/Asia", "Giant", "Also called Alabai"),
-        row("Maremma Sheepdog", NA, "Europe", "Large", "Livestock guardian type"),
-        row("Kuvasz", NA, "Europe", "Large", "Livestock guardian type"),
-        row("Komondor", NA, "Europe", "Large", "Livestock guardian type"),
-        row("Korean Sapsaree", NA, "Asia", "Large", "National heritage breed"),
-        row("Tosa", NA, "Asia", "Large", "Japanese mastiff-type"),
-        row("Catahoula Leopard Dog", NA, "North America", "Large", "Working heritage"),
-
-        # Popular global breeds not yet listed above
-        row("Rough-haired German Shepherd Mix", NA, "Global", "Large", "Common informal mix label"),
-        row("Schnauzer Mix", NA, "Global", "Small/Medium", "Common companion mix"),
-        row("Shiba Mix", NA, "Global", "Small/Medium", "Common companion mix"),
-
-        # Designer / modern mixes (educational only)
-        row("Cockapoo", NA, "Global", "Small", "Designer mix"),
-        row("Labradoodle", NA, "Global", "Medium/Large", "Designer mix"),
-        row("Goldendoodle", NA, "Global", "Medium/Large", "Designer mix"),
-        row("Cavapoo", NA, "Global", "Small", "Designer mix"),
-        row("Maltipoo", NA, "Global", "Toy", "Designer mix"),
-        row("Shihpoo", NA, "Global", "Small", "Designer mix"),
-        row("Pomsky", NA, "Global", "Small/Medium", "Designer mix"),
-    ]
-
-    # Expand with a broad plain-name list (no special metadata)
-    # to simulate a larger atlas without risking CSV parsing issues.
-    extra_names = [
-        "Basset Fauve de Bretagne", "Black Russian Terrier", "Bohemian Shepherd",
-        "Bolognese (Registry)", "Boykin Spaniel", "Bracco Italiano",
-        "Briquet Griffon Vendeen", "Canaan Dog", "Catalan Sheepdog",
-        "Chinese Shar-Pei", "Clumber Spaniel", "Dandie Dinmont Terrier",
-        "English Toy Terrier", "Eurasier", "Field Spaniel",
-        "Finnish Lapphund", "Glen of Imaal Terrier", "Ibizan Hound",
-        "Irish Water Spaniel", "Japanese Spitz", "Keeshond (Registry)",
-        "Kerry Beagle", "Koolie", "Laika (Regional types)",
-        "Manchester Terrier", "Miniature Bull Terrier",
-        "Norwegian Buhund", "Norwegian Lundehund",
-        "Otterhound", "Pyrenean Mastiff", "Schipperke",
-        "Sloughi", "Spanish Mastiff", "Swedish Vallhund",
-        "Thai Bangkaew Dog", "Tibetan Spaniel", "Tibetan Terrier",
-        "Treeing Tennessee Brindle", "Volpino Italiano",
-        "Welsh Springer Spaniel", "Wirehaired Pointing Griffon",
-        "Xiasi Dog (China)", "Yakutian Laika",
-    ]
-    for n in extra_names:
-        rows.append(row(n, NA, "Global", "Unknown", "Broad atlas placeholder"))
-
-    return rows
-
-
-def build_builtin_breed_df() -> pd.DataFrame:
-    df = pd.DataFrame(_builtin_breed_rows())
-    # normalize
-    for c in ["Breed", "FCI Group", "Region", "Size Class", "Notes"]:
-        if c not in df.columns:
-            df[c] = ""
-        df[c] = df[c].astype(str).str.strip()
-    df = df.drop_duplicates(subset=["Breed"]).sort_values("Breed").reset_index(drop=True)
-    return df
-
-
-@st.cache_data
-def load_breeds() -> pd.DataFrame:
+def dog_taste_evidence(dog_name: str) -> PreferenceModel:
     """
-    Safe loader:
-    - Uses data/breeds.csv if present.
-    - Any read/parse issue -> fallback to built-in atlas.
-    This prevents pandas.errors.ParserError from breaking the app.
+    One dog's taste evidence faded to today: its own taste-log rows only,
+    fitted once per session and then updated in place as entries arrive.
+    A copy, so plan workers never see later entries; day granularity keeps
+    plan signatures stable within a day.
     """
-    builtin = build_builtin_breed_df()
-    path = os.path.join("data", "breeds.csv")
+    key = taste_dog_key(dog_name)
+    models = st.session_state.taste_models
+    if key not in models:
+        models[key] = PreferenceModel.from_entries(dog_taste_entries(st.session_state.taste_log, dog_name))
+    return models[key].decayed(epoch_days(date.today()))
 
-    if not os.path.exists(path):
-        return builtin
 
-    try:
-        df = pd.read_csv(
-            path,
-            dtype=str,
-            keep_default_na=False,
-            engine="python",
-        )
-        # ensure columns
-        required = ["Breed", "FCI Group", "Region", "Size Class", "Notes"]
-        for col in required:
-            if col not in df.columns:
-                df[col] = ""
-            df[col] = df[col].astype(str).str.strip()
-
-        if not (df["Breed"] == "Mixed Breed / Unknown").any():
-            df = pd.concat([pd.DataFrame([{
-                "Breed": "Mixed Breed / Unknown",
-                "FCI Group": "N/A",
-                "Region": "Global",
-                "Size Class": "Unknown",
-                "Notes": ""
-            }]), df], ignore_index=True)
-
-        df = df.drop_duplicates(subset=["Breed"]).sort_values("Breed").reset_index(drop=True)
-        # If someone accidentally provided an empty or weird file, fallback
-        if df.empty or "Breed" not in df.columns:
-            return builtin
-        return df
-
-    except Exception:
-        return builtin
-
-
-BREED_DF = load_breeds()
-BREED_META = BREED_DF.set_index("Breed").to_dict(orient="index")
-
-
-def filter_breed_options(search: str, fci_groups: List[str], regions: List[str], sizes: List[str]) -> List[str]:
-    df = BREED_DF.copy()
-    if fci_groups:
-        df = df[df["FCI Group"].isin(fci_groups)]
-    if regions:
-        df = df[df["Region"].isin(regions)]
-    if sizes:
-        df = df[df["Size Class"].isin(sizes)]
-    if search.strip():
-        s = search.strip().lower()
-        mask = (
-            df["Breed"].str.lower().str.contains(s, na=False) |
-            df["Notes"].astype(str).str.lower().str.contains(s, na=False)
-        )
-        df = df[mask]
-    opts = df["Breed"].tolist()
-    return opts if opts else ["Mixed Breed / Unknown"]
+def get_taste_model(dog_name: str, breed: str, age_years: float) -> PreferenceModel:
+    """The dog's evidence on top of the learned prior for its size class / FCI group / life stage."""
+    return dog_taste_evidence(dog_name).with_prior(taste_prior_for(breed, age_years))
 
 
 # =========================================================
-# 2) Ingredient knowledge base (cooked-focus)
+# Background plan jobs (worker pool + cancellation)
 # =========================================================
 
-@dataclass(frozen=True)
-class Ingredient:
-    name: str
-    category: str  # Meat, Veg, Carb, Oil, Treat
-    kcal_per_100g: float
-    protein_g: float
-    fat_g: float
-    carbs_g: float
-    micronote: str
-    benefits: List[str]
-    cautions: List[str]
-
-
-def build_ingredients() -> Dict[str, Ingredient]:
-    items = [
-        # --- MEATS / PROTEINS ---
-        Ingredient("Chicken (lean, cooked)", "Meat", 165, 31, 3.6, 0,
-                   "B vitamins / selenium.",
-                   ["High-quality protein", "Great base protein for rotation", "Widely available"],
-                   ["Avoid if allergy suspected", "Remove skin for lower-fat plans"]),
-        Ingredient("Turkey (lean, cooked)", "Meat", 150, 29, 2.0, 0,
-                   "Niacin / selenium.",
-                   ["Lean option for weight-aware plans", "Mild flavor", "Good GI-friendly anchor"],
-                   ["Avoid processed turkey"]),
-        Ingredient("Beef (lean, cooked)", "Meat", 200, 26, 10, 0,
-                   "Iron / zinc / B12.",
-                   ["Strong palatability", "Useful for active adults", "Supports red-blood-cell nutrition"],
-                   ["Fat varies by cut"]),
-        Ingredient("Lamb (lean, cooked)", "Meat", 206, 25, 12, 0,
-                   "Zinc / carnitine.",
-                   ["Alternative protein", "Rich taste to combat boredom", "Rotation diversity"],
-                   ["Richer profile—use caution for fat-sensitive dogs"]),
-        Ingredient("Pork (lean, cooked)", "Meat", 195, 27, 9, 0,
-                   "Thiamine-rich protein.",
-                   ["Good rotation variety", "Often highly palatable"],
-                   ["Avoid processed pork"]),
-        Ingredient("Duck (lean, cooked)", "Meat", 190, 24, 11, 0,
-                   "Flavor-forward protein.",
-                   ["Excellent for picky eaters", "Rotation variety"],
-                   ["Moderate fat"]),
-        Ingredient("Venison (lean, cooked)", "Meat", 158, 30, 3.2, 0,
-                   "Often considered a novel protein.",
-                   ["Lean alternative", "Rotation diversity"],
-                   ["Novel protein strategies should be vet-guided"]),
-        Ingredient("Rabbit (cooked)", "Meat", 173, 33, 3.5, 0,
-                   "Very lean / light protein.",
-                   ["Great for rotation", "Weight-aware option"],
-                   ["Ensure safe sourcing"]),
-        Ingredient("Egg (cooked)", "Meat", 155, 13, 11, 1.1,
-                   "Complete amino-acid profile.",
-                   ["High biological value", "Palatability booster"],
-                   ["Introduce gradually"]),
-        Ingredient("Salmon (cooked)", "Meat", 208, 20, 13, 0,
-                   "Omega-3 / vitamin D.",
-                   ["Skin and coat support", "Senior-friendly rotation"],
-                   ["Higher fat—portion carefully"]),
-        Ingredient("White Fish (cod, cooked)", "Meat", 105, 23, 0.9, 0,
-                   "Very lean protein.",
-                   ["Excellent for low-fat plans", "Gentle for sensitive stomachs"],
-                   ["Keep unseasoned"]),
-        Ingredient("Sardines (cooked, deboned)", "Meat", 208, 25, 11, 0,
-                   "Omega-3 rich mini-fish.",
-                   ["Great topper", "Highly palatable"],
-                   ["Watch sodium if canned"]),
-
-        # --- VEGETABLES ---
-        Ingredient("Pumpkin (cooked)", "Veg", 26, 1, 0.1, 6.5,
-                   "Soluble fiber / beta-carotene.",
-                   ["Supports stool quality", "Gentle gut helper", "Excellent transition vegetable"],
-                   ["Too much may dilute calories"]),
-        Ingredient("Carrot (cooked)", "Veg", 35, 0.8, 0.2, 8,
-                   "Beta-carotene.",
-                   ["Colorful antioxidant support", "Low-cal micronutrient boost"],
-                   ["Cook/soften for tiny breeds"]),
-        Ingredient("Zucchini (cooked)", "Veg", 17, 1.2, 0.3, 3.1,
-                   "Hydration-friendly veggie.",
-                   ["Great for volumizing meals", "Mild flavor"],
-                   ["Avoid seasoning"]),
-        Ingredient("Green Beans (cooked)", "Veg", 31, 1.8, 0.1, 7,
-                   "Low-cal bulk.",
-                   ["Helpful for weight management", "Gentle fiber"],
-                   []),
-        Ingredient("Broccoli (cooked)", "Veg", 34, 2.8, 0.4, 7,
-                   "Vitamin C / K.",
-                   ["Rotation-friendly antioxidants"],
-                   ["Large amounts can cause gas"]),
-        Ingredient("Cauliflower (cooked)", "Veg", 25, 1.9, 0.3, 5,
-                   "Low-cal crucifer.",
-                   ["Adds volume and variety"],
-                   ["May cause gas"]),
-        Ingredient("Bell Pepper (red, cooked)", "Veg", 31, 1, 0.3, 6,
-                   "Color-rich vitamin profile.",
-                   ["Adds antioxidant diversity"],
-                   ["Avoid spicy/seasoned"]),
-        Ingredient("Spinach (cooked, small portions)", "Veg", 23, 2.9, 0.4, 3.6,
-                   "Folate / magnesium.",
-                   ["Micronutrient accent"],
-                   ["Use small portions"]),
-        Ingredient("Kale (cooked, small portions)", "Veg", 35, 2.9, 1.5, 4.4,
-                   "Dense micronutrients.",
-                   ["Small-dose antioxidant boost"],
-                   ["Use small portions"]),
-        Ingredient("Cabbage (cooked, small portions)", "Veg", 23, 1.3, 0.1, 5.5,
-                   "Budget-friendly fiber.",
-                   ["Adds variety"],
-                   ["May cause gas"]),
-
-        # --- CARBS ---
-        Ingredient("Sweet Potato (cooked)", "Carb", 86, 1.6, 0.1, 20,
-                   "Beta-carotene / potassium.",
-                   ["Palatable controlled carb", "Great rotation energy base"],
-                   ["Portion for weight control"]),
-        Ingredient("Brown Rice (cooked)", "Carb", 123, 2.7, 1.0, 25.6,
-                   "Gentle starch base.",
-                   ["Neutral and easy-to-digest"],
-                   ["Lower for weight-loss plans"]),
-        Ingredient("White Rice (cooked)", "Carb", 130, 2.4, 0.3, 28.2,
-                   "Very gentle GI carb.",
-                   ["Useful during sensitive-stomach phases"],
-                   ["Lower micronutrients vs brown rice"]),
-        Ingredient("Oats (cooked)", "Carb", 71, 2.5, 1.4, 12,
-                   "Soluble fiber.",
-                   ["Satiety support", "Gut-friendly option"],
-                   ["Introduce gradually"]),
-        Ingredient("Quinoa (cooked)", "Carb", 120, 4.4, 1.9, 21.3,
-                   "Higher-protein pseudo-grain.",
-                   ["Adds amino-acid diversity"],
-                   ["Rinse well before cooking"]),
-        Ingredient("Barley (cooked)", "Carb", 123, 2.3, 0.4, 28,
-                   "Fiber-friendly grain.",
-                   ["Satiety-supporting carb"],
-                   ["Introduce gradually"]),
-        Ingredient("Potato (cooked, plain)", "Carb", 87, 2, 0.1, 20,
-                   "Simple starch.",
-                   ["Limited-ingredient carb option"],
-                   ["Never raw / no green parts"]),
-
-        # --- OILS ---
-        Ingredient("Fish Oil (supplemental)", "Oil", 900, 0, 100, 0,
-                   "EPA/DHA omega-3s.",
-                   ["Skin/coat support", "Joint and inflammatory balance"],
-                   ["Dose carefully"]),
-        Ingredient("Olive Oil (small amounts)", "Oil", 884, 0, 100, 0,
-                   "Monounsaturated fats.",
-                   ["Palatability booster"],
-                   ["Too much may cause GI upset"]),
-        Ingredient("Flaxseed Oil (small amounts)", "Oil", 884, 0, 100, 0,
-                   "ALA omega-3 (plant-based).",
-                   ["Rotation fat option"],
-                   ["ALA conversion is limited"]),
-
-        # --- TREATS / FRUIT TOPPERS ---
-        Ingredient("Blueberries (small portions)", "Treat", 57, 0.7, 0.3, 14.5,
-                   "Antioxidant fruit topper.",
-                   ["Light enrichment", "Palette diversity"],
-                   ["Use small portions"]),
-        Ingredient("Apple (peeled, no seeds)", "Treat", 52, 0.3, 0.2, 14,
-                   "Hydrating sweet crunch.",
-                   ["Low-cal treat topper"],
-                   ["Remove seeds/core"]),
-        Ingredient("Strawberries (small portions)", "Treat", 32, 0.7, 0.3, 7.7,
-                   "Vitamin C and flavor variety.",
-                   ["Light fruity enrichment"],
-                   ["Use small portions"]),
-    ]
-    return {i.name: i for i in items}
+@dataclass
+class PlanJob:
+    signature: Tuple
+    future: Future
+    cancel_event: threading.Event
+    progress: Dict[str, int]
+    started_at: float
+    dependencies: Dict = field(default_factory=dict)
+    derived: Dict[str, object] = field(default_factory=dict)  # memoized views of the finished plan
+    # Stable widget-key suffix; id() can be reused once an old job is collected.
+    token: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+
+
+@st.cache_resource
+def get_plan_executor() -> ThreadPoolExecutor:
+    # One bounded pool per server process, shared by every session.
+    workers = max(1, min(4, (os.cpu_count() or 2) - 1))
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="nebula-plan")
+
+
+def submit_plan_job(inputs: Dict, fn=generate_plan_df) -> PlanJob:
+    cancel_event = threading.Event()
+    progress = {"done": 0, "total": int(inputs.get("days", 7))}
+    future = get_plan_executor().submit(
+        fn, **inputs, progress=progress, cancel_event=cancel_event
+    )
+    deps = plan_dependencies(inputs)
+    return PlanJob(
+        signature=plan_signature(deps),
+        future=future,
+        cancel_event=cancel_event,
+        progress=progress,
+        started_at=time.time(),
+        dependencies=deps,
+    )
 
 
-INGREDIENTS = build_ingredients()
+def cancel_plan_job(job: Optional[PlanJob]) -> None:
+    if job is None:
+        return
+    job.cancel_event.set()
+    job.future.cancel()  # drops it outright if still queued
 
 
-def ingredient_df() -> pd.DataFrame:
-    rows = []
-    for ing in INGREDIENTS.values():
-        rows.append({
-            "Ingredient": ing.name,
-            "Category": ing.category,
-            "kcal/100g": ing.kcal_per_100g,
-            "Protein(g)": ing.protein_g,
-            "Fat(g)": ing.fat_g,
-            "Carbs(g)": ing.carbs_g,
-            "Micro-note": ing.micronote,
-            "Benefits": " • ".join(ing.benefits),
-            "Cautions": " • ".join(ing.cautions) if ing.cautions else "",
-        })
-    return pd.DataFrame(rows).sort_values(["Category", "Ingredient"]).reset_index(drop=True)
+def plan_job_result(job: PlanJob) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
+    """(plan_df, error) for a finished job; (None, None) when cancelled."""
+    if job.future.cancelled():
+        return None, None
+    err = job.future.exception()
+    if isinstance(err, PlanCancelled):
+        return None, None
+    if err is not None:
+        return None, f"{type(err).__name__}: {err}"
+    return job.future.result(), None
 
 
-def filter_ingredients_by_category(cat: str) -> List[str]:
-    return [i.name for i in INGREDIENTS.values() if i.category == cat]
+# Per-profile plan slots kept in a session; older ones are dropped, least recently used first.
+PLAN_SLOTS_KEPT = 5
 
 
-# =========================================================
-# 3) Energy + life-stage logic (educational)
-# =========================================================
+def drop_plan_slot(state_key: str) -> None:
+    """Cancel the slot's job and forget the slot with its locks and repair state."""
+    cancel_plan_job(st.session_state.get(state_key))
+    for suffix in ("", "_locks", "_previous", "_stale"):
+        st.session_state.pop(f"{state_key}{suffix}", None)
+    order = st.session_state.get("plan_slot_order", [])
+    if state_key in order:
+        order.remove(state_key)
 
-def age_to_life_stage(age_years: float) -> str:
-    if age_years < 1:
-        return "Puppy"
-    if age_years < 7:
-        return "Adult"
-    return "Senior"
 
+def use_plan_slot(state_key: str) -> str:
+    """Mark `state_key` most recently used and evict slots beyond PLAN_SLOTS_KEPT."""
+    order = st.session_state.setdefault("plan_slot_order", [])
+    if state_key in order:
+        order.remove(state_key)
+    order.append(state_key)
+    while len(order) > PLAN_SLOTS_KEPT:
+        drop_plan_slot(order[0])
+    return state_key
 
-def calc_rer(weight_kg: float) -> float:
-    return 70 * (weight_kg ** 0.75)
 
+def drive_plan_job(state_key: str, inputs: Dict, generate: bool, cancel: bool,
+                   fn=generate_plan_df) -> Optional[pd.DataFrame]:
+    """
+    Session-side lifecycle of one background plan slot (`state_key`):
+    submit on Generate, supersede a running job whose inputs changed, drop a
+    finished result once one of its dependencies changes, cancel on request,
+    and poll progress with a fragment while the worker runs.
+    Returns the finished plan for the current inputs, if any. A kept plan is
+    the very same DataFrame across reruns, so views memoized on it through
+    plan_artifact() are reused too.
+    """
+    signature = plan_signature(plan_dependencies(inputs))
+    job = st.session_state.get(state_key)
+    stale_key = f"{state_key}_stale"
+    if generate:
+        st.session_state.pop(stale_key, None)
+        st.session_state.pop(f"{state_key}_previous", None)
+        reusable = (
+            job is not None and job.signature == signature and job.future.done()
+            and plan_job_result(job)[0] is not None
+        )
+        if not reusable:
+            # identical dependencies + seed would only rebuild the same plan
+            cancel_plan_job(job)
+            job = submit_plan_job(inputs, fn)
+    elif job is not None and job.signature != signature:
+        if job.future.done():
+            # finished plan no longer matches the sidebar/planner inputs
+            changed = changed_dependencies(job.dependencies, plan_dependencies(inputs))
+            st.session_state[stale_key] = changed
+            if plan_job_result(job)[0] is not None:
+                # kept so the plan can be repaired instead of fully regenerated
+                st.session_state[f"{state_key}_previous"] = job
+            job = None
+        else:
+            # inputs changed mid-run: supersede the stale run with a fresh one
+            cancel_plan_job(job)
+            job = submit_plan_job(inputs, fn)
+    if cancel and job is not None and not job.future.done():
+        cancel_plan_job(job)
+        job = None
+        st.caption("Plan generation cancelled.")
+    st.session_state[state_key] = job
+
+    if job is None:
+        changed = st.session_state.get(stale_key)
+        if changed:
+            st.caption(
+                "Previous plan cleared because these inputs changed: "
+                + ", ".join(k.replace("_", " ") for k in changed) + "."
+            )
+        return None
+    if not job.future.done():
+        @st.fragment(run_every=0.4)
+        def plan_job_monitor():
+            running = st.session_state.get(state_key)
+            if running is None or running.future.done():
+                st.rerun()
+            total = max(1, running.progress.get("total", 1))
+            done = running.progress.get("done", 0)
+            st.progress(
+                min(1.0, done / total),
+                text=f"Generating plan… {done}/{total} days · {time.time() - running.started_at:.1f}s"
+            )
 
-def mer_factor(life_stage: str, activity: str, neutered: bool) -> float:
-    base = 1.6 if neutered else 1.8
-    if life_stage == "Puppy":
-        base = 2.2 if neutered else 2.4
-    elif life_stage == "Senior":
-        base = 1.3 if neutered else 1.4
+        plan_job_monitor()
+        return None
+
+    plan_df, plan_error = plan_job_result(job)
+    if plan_error:
+        st.error(f"Plan generation failed — {plan_error}")
+    return plan_df
+
+
+def adopt_plan_result(state_key: str, inputs: Dict, plan_df: pd.DataFrame,
+                      derived: Optional[Dict[str, object]] = None) -> PlanJob:
+    """Install an already-built plan (e.g. a partial regeneration) as the slot's finished job."""
+    future: Future = Future()
+    future.set_result(plan_df)
+    deps = plan_dependencies(inputs)
+    job = PlanJob(
+        signature=plan_signature(deps),
+        future=future,
+        cancel_event=threading.Event(),
+        progress={"done": len(plan_df), "total": len(plan_df)},
+        started_at=time.time(),
+        dependencies=deps,
+        derived=dict(derived or {}),
+    )
+    st.session_state[state_key] = job
+    st.session_state.pop(f"{state_key}_stale", None)
+    st.session_state.pop(f"{state_key}_previous", None)
+    return job
 
-    activity_boost = {
-        "Low": 0.9,
-        "Normal": 1.0,
-        "High": 1.2,
-        "Athletic/Working": 1.35,
-    }.get(activity, 1.0)
 
-    return base * activity_boost
+def plan_artifact(state_key: str, name, build):
+    """
+    Memoize a view derived from the finished plan in slot `state_key`
+    (shopping list, chart frame, schedule…). Lives on the PlanJob, so it is
+    dropped together with the plan when a dependency changes.
+    """
+    job = st.session_state.get(state_key)
+    if job is None or not job.future.done():
+        return build()
+    if name not in job.derived:
+        job.derived[name] = build()
+    return job.derived[name]
+
+
+def partial_regeneration(
+    state_key: str,
+    base_job: PlanJob,
+    inputs: Dict,
+    regen: np.ndarray,
+    seed: int,
+) -> Tuple[pd.DataFrame, np.ndarray]:
+    """
+    Regenerate the `regen` slots of a finished plan for the current `inputs`
+    and install the result in `state_key`. Only changed rows get new
+    nutrition; the shopping list is patched with just those rows unless the
+    gram targets moved, in which case every row (and the list) is rebuilt.
+    """
+    plan_df = base_job.future.result()
+    pools = rotation_pools(
+        inputs["pantry_meats"], inputs["pantry_vegs"], inputs["pantry_carbs"],
+        inputs["allow_new"], inputs["recommendations"],
+    )
+    new_df, changed = regenerate_plan_slots(
+        plan_df, regen, pools, inputs["taste_meat_map"], inputs["taste_veg_map"],
+        inputs["use_taste_weights"], seed, inputs.get("rules"), inputs.get("start_weekday", 0),
+    )
+    grams_keys = ("daily_grams", "meat_pct", "veg_pct", "carb_pct", "meals_per_day")
+    grams_moved = any(base_job.dependencies.get(k) != inputs.get(k) for k in grams_keys)
+    rows = np.arange(len(new_df)) if grams_moved else changed
+    new_df = refresh_plan_rows(new_df, rows, *(inputs[k] for k in grams_keys))
+    if "Variety Mode" in new_df.columns:
+        new_df["Variety Mode"] = inputs.get("variety_label", new_df["Variety Mode"])
+
+    derived = {}
+    old_shopping = base_job.derived.get("shopping")
+    if old_shopping is not None and not grams_moved:
+        derived["shopping"] = update_shopping_list(
+            old_shopping, plan_df.iloc[changed], new_df.iloc[changed], plan_day_count(new_df)
+        )
+    adopt_plan_result(state_key, inputs, new_df, derived)
+    return new_df, rows
 
 
-def compute_daily_energy(
-    weight_kg: float,
-    age_years: float,
-    activity: str,
-    neutered: bool,
-    special_flags: List[str]
-) -> Tuple[float, float, float, str]:
-    stage = age_to_life_stage(age_years)
-    rer = calc_rer(weight_kg)
-    mer = rer * mer_factor(stage, activity, neutered)
+def weekly_totals(shopping_df: pd.DataFrame) -> pd.DataFrame:
+    # The app always plans one week; core shopping frames carry a generic "Total grams".
+    return shopping_df.rename(columns={"Total grams": "Total grams (7 days)"})
 
-    adj = 1.0
-    rationale = []
 
-    if "Overweight / Weight loss goal" in special_flags:
-        adj *= 0.85
-        rationale.append("Weight-loss adjusted target.")
-    if "Pancreatitis risk / Needs lower fat" in special_flags:
-        adj *= 0.95
-        rationale.append("Fat-sensitive conservative target.")
-    if "Kidney concern (vet-managed)" in special_flags:
-        adj *= 0.95
-        rationale.append("Energy conservative; protein strategy must be vet-guided.")
-    if "Very picky eater" in special_flags:
-        rationale.append("Rotation and palatability tactics emphasized.")
+# =========================================================
+# Kitchen views: cooking sessions + container packing
+# =========================================================
 
-    mer_adj = mer * adj
-    explanation = stage + (" | " + " ".join(rationale) if rationale else "")
+def render_cooking_sessions(plan_df: pd.DataFrame, key_prefix: str, state_key: str,
+                            columns=SHOPPING_COLUMNS) -> None:
+    with st.expander("Fridge shelf-life assumptions"):
+        sl1, sl2, sl3, sl4 = st.columns(4)
+        shelf = {
+            "Meat": sl1.number_input("Meat (days)", 1, 7, SHELF_LIFE_DAYS["Meat"], key=f"{key_prefix}_shelf_meat"),
+            "Veg": sl2.number_input("Veg (days)", 1, 7, SHELF_LIFE_DAYS["Veg"], key=f"{key_prefix}_shelf_veg"),
+            "Carb": sl3.number_input("Carb (days)", 1, 7, SHELF_LIFE_DAYS["Carb"], key=f"{key_prefix}_shelf_carb"),
+        }
+        max_span = sl4.number_input("Max days per session", 1, 7, 7, key=f"{key_prefix}_max_span")
 
-    return rer, mer, mer_adj, explanation
+    sessions_df, session_items = plan_artifact(
+        state_key, ("cooking_sessions", tuple(shelf.values()), max_span, columns),
+        lambda: schedule_cooking_sessions(plan_df, shelf, max_span, columns),
+    )
+    if sessions_df.empty:
+        st.caption("No cooking sessions to schedule.")
+        return
+    st.caption(f"{len(sessions_df)} cooking sessions cover the plan.")
+    cs1, cs2 = st.columns([1, 2])
+    with cs1:
+        st.dataframe(sessions_df, use_container_width=True, height=220)
+    with cs2:
+        st.dataframe(session_items, use_container_width=True, height=220)
+
+
+def render_container_packing(plan_df: pd.DataFrame, key_prefix: str, dog_label: str, state_key: str) -> None:
+    cp1, cp2, cp3 = st.columns([2.0, 1.0, 1.0])
+    with cp1:
+        sizes = st.multiselect(
+            "Available container sizes (g)", CONTAINER_SIZES_G,
+            default=[250, 500, 750], key=f"{key_prefix}_containers"
+        )
+    with cp2:
+        cook_every = st.number_input("Cook every (days)", 1, 14, 7, key=f"{key_prefix}_cook_every")
+    with cp3:
+        fridge_days = st.number_input("Fridge window (days)", 1, 7, 3, key=f"{key_prefix}_fridge_days")
+
+    if not sizes:
+        st.caption("Pick at least one container size.")
+        return
+    packing, summary = plan_artifact(
+        state_key, ("packing", tuple(sorted(sizes)), cook_every, fridge_days, dog_label),
+        lambda: pack_meal_portions(plan_df, sizes, cook_every, fridge_days, dog_label),
+    )
+    if packing.empty:
+        st.caption("Nothing to pack.")
+        return
+    pk1, pk2 = st.columns([1, 2])
+    with pk1:
+        st.metric("Containers", len(packing))
+        st.dataframe(summary, use_container_width=True, height=220)
+    with pk2:
+        st.dataframe(packing, use_container_width=True, height=260)
+    st.download_button(
+        label="⬇️ Download packing list (CSV)",
+        data=packing.to_csv(index=False).encode("utf-8"),
+        file_name=f"{dog_label.lower().replace(' ', '_')}_packing_list.csv",
+        mime="text/csv",
+        key=f"{key_prefix}_packing_csv",
+    )
 
 
 # =========================================================
-# 4) Ratio presets
+# Energy what-if explorer + body-weight trajectory
 # =========================================================
 
-@dataclass(frozen=True)
-class RatioPreset:
-    key: str
-    label: str
-    meat_pct: int
-    veg_pct: int
-    carb_pct: int
-    note: str
-
-
-RATIO_PRESETS = [
-    RatioPreset("balanced", "Balanced Cooked Fresh (default)", 50, 35, 15,
-                "A practical cooked-fresh ratio emphasizing lean protein and diverse vegetables."),
-    RatioPreset("weight", "Weight-Aware & Satiety", 45, 45, 10,
-                "Higher vegetable volume and lower energy density."),
-    RatioPreset("active", "Active Adult Energy", 55, 25, 20,
-                "More energy support for high activity while keeping vegetables present."),
-    RatioPreset("senior", "Senior Gentle Balance", 48, 40, 12,
-                "Fiber and micronutrient focus, moderate carbs."),
-    RatioPreset("puppy", "Puppy Growth (cooked baseline)", 55, 30, 15,
-                "Growth needs are complex; long-term cooked plans require calcium/micronutrient balancing."),
-    RatioPreset("gentle_gi", "Gentle GI Rotation", 50, 40, 10,
-                "A calmer profile leaning on easy proteins and soothing fiber veggies."),
-]
-
+# Cached per-argument views over the pure core helpers.
+energy_sensitivity_grid = st.cache_data(show_spinner=False, max_entries=64)(energy_sensitivity_grid)
+feeding_chart_by_weight_band = st.cache_data(show_spinner=False, max_entries=64)(feeding_chart_by_weight_band)
+weight_trajectory_frames = st.cache_data(show_spinner=False, max_entries=32)(weight_trajectory_frames)
 
-def ensure_ratio_sum(meat_pct: int, veg_pct: int, carb_pct: int) -> Tuple[int, int, int]:
-    total = meat_pct + veg_pct + carb_pct
-    if total == 100:
-        return meat_pct, veg_pct, carb_pct
-    meat = round(meat_pct / total * 100)
-    veg = round(veg_pct / total * 100)
-    carb = 100 - meat - veg
-    carb = max(0, carb)
-    if meat + veg + carb != 100:
-        diff = 100 - (meat + veg + carb)
-        meat = max(0, meat + diff)
-    return meat, veg, carb
 
+@st.fragment
+def render_energy_explorer(
+    weight_kg: float,
+    age_years: float,
+    activity: str,
+    neutered: bool,
+    special_flags: List[str],
+    assumed_kcal_per_g: float,
+    meals_per_day: int,
+    dog_label: str,
+) -> None:
+    adjustment = energy_adjustment(special_flags)
+    grid = energy_sensitivity_grid(
+        float(weight_kg), float(age_years), bool(neutered), adjustment,
+        float(assumed_kcal_per_g), int(meals_per_day),
+    )
+    weights = sorted(grid["Weight (kg)"].unique())
+    ages = sorted(grid["Age (years)"].unique())
+    w_now, a_now = round(float(weight_kg), 1), round(float(age_years), 1)
+
+    wi1, wi2, wi3 = st.columns(3)
+    with wi1:
+        w_sel = st.select_slider("What if weight is (kg)", weights, value=w_now, key="whatif_weight")
+    with wi2:
+        a_sel = st.select_slider("What if age is (years)", ages, value=a_now, key="whatif_age")
+    with wi3:
+        act_sel = st.selectbox("What if activity is", list(ACTIVITY_BOOST),
+                               index=list(ACTIVITY_BOOST).index(activity), key="whatif_activity")
+
+    def lookup(w, a, act):
+        row = grid[(grid["Weight (kg)"] == w) & (grid["Age (years)"] == a) & (grid["Activity"] == act)]
+        return row.iloc[0]
+
+    now = lookup(w_now, a_now, activity)
+    sel = lookup(w_sel, a_sel, act_sel)
+    m1, m2, m3, m4 = st.columns(4)
+    m1.metric("Life stage", sel["Life stage"],
+              delta=None if sel["Life stage"] == now["Life stage"] else f"from {now['Life stage']}")
+    m2.metric("Target kcal/day", f"{sel['Target kcal/day']:.0f}",
+              delta=f"{sel['Target kcal/day'] - now['Target kcal/day']:+.0f}")
+    m3.metric("Cooked mix (g/day)", f"{sel['Cooked mix (g/day)']:.0f}",
+              delta=f"{sel['Cooked mix (g/day)'] - now['Cooked mix (g/day)']:+.0f}")
+    m4.metric(f"Per meal ×{meals_per_day} (g)", f"{sel['Per meal (g)']:.0f}",
+              delta=f"{sel['Per meal (g)'] - now['Per meal (g)']:+.0f}")
+
+    surface = grid[grid["Activity"] == act_sel]
+    heat = (
+        alt.Chart(surface)
+        .mark_rect()
+        .encode(
+            x=alt.X("Age (years):O", axis=alt.Axis(labelAngle=0, values=[a for a in ages if a == int(a)])),
+            y=alt.Y("Weight (kg):O", sort="descending"),
+            color=alt.Color("Target kcal/day:Q", scale=alt.Scale(scheme="viridis")),
+            tooltip=["Weight (kg)", "Age (years)", "Life stage",
+                     "Target kcal/day", "Cooked mix (g/day)", "Per meal (g)"],
+        )
+        .properties(height=320, title=f"Target kcal/day · {act_sel} activity")
+    )
+    st.altair_chart(heat, use_container_width=True)
+
+    st.markdown("#### Feeding chart by weight band")
+    fb1, fb2, fb3 = st.columns(3)
+    with fb1:
+        band_lo = st.number_input("From (kg)", 0.5, 90.0, float(max(0.5, round(w_now * 0.7))), 0.5, key="band_lo")
+    with fb2:
+        band_hi = st.number_input("To (kg)", 1.0, 100.0, float(max(band_lo + 1, round(w_now * 1.3))), 0.5, key="band_hi")
+    with fb3:
+        band_kg = st.select_slider("Band width (kg)", [0.5, 1.0, 2.0, 2.5, 5.0], value=1.0, key="band_kg")
+
+    chart_df = feeding_chart_by_weight_band(
+        float(a_sel), bool(neutered), adjustment, float(assumed_kcal_per_g),
+        int(meals_per_day), float(band_lo), float(max(band_hi, band_lo + band_kg)), float(band_kg),
+    )
+    st.dataframe(chart_df, use_container_width=True, hide_index=True)
+    st.caption(f"Evaluated at age {a_sel:g} · {'neutered' if neutered else 'intact'} · "
+               f"{assumed_kcal_per_g:.2f} kcal/g · special-flag factor ×{adjustment:.2f}.")
+    st.download_button(
+        label="⬇️ Download feeding chart (CSV)",
+        data=chart_df.to_csv(index=False).encode("utf-8"),
+        file_name=f"{dog_label.lower().replace(' ', '_')}_feeding_chart.csv",
+        mime="text/csv",
+        key="feeding_chart_csv",
+    )
 
-def estimate_food_grams_from_energy(daily_kcal: float, assumed_kcal_per_g: float) -> float:
-    return daily_kcal / assumed_kcal_per_g
 
+@st.fragment
+def render_weight_trajectory(
+    plan_df: pd.DataFrame,
+    weight_kg: float,
+    age_years: float,
+    activity: str,
+    neutered: bool,
+    special_flags: List[str],
+    assumed_kcal_per_g: float,
+    ratio: Tuple[int, int, int],
+) -> None:
+    preset_by_label = {p.label: p for p in RATIO_PRESETS}
+    tj1, tj2, tj3, tj4 = st.columns([1.6, 1.1, 1.1, 0.9])
+    with tj1:
+        presets = st.multiselect("Compare ratio presets", list(preset_by_label),
+                                 default=list(preset_by_label), key="traj_presets")
+    with tj2:
+        densities = st.multiselect("Assumed densities (kcal/g)", [1.1, 1.2, 1.3, 1.35, 1.4, 1.5, 1.6, 1.7],
+                                   default=[round(float(assumed_kcal_per_g), 2)], key="traj_densities")
+    with tj3:
+        activities = st.multiselect("Activity levels", list(ACTIVITY_BOOST), default=[activity],
+                                    key="traj_activities")
+    with tj4:
+        horizon = st.selectbox("Horizon", list(TRAJECTORY_HORIZONS), index=2, key="traj_horizon")
+    reportion = st.toggle(
+        "Re-portion weekly to the current weight", value=False, key="traj_reportion",
+        help="Portions follow the dog's weight, so a density mismatch compounds instead of settling."
+    )
 
-def grams_for_day(total_grams: float, meat_pct: int, veg_pct: int, carb_pct: int) -> Tuple[float, float, float]:
-    return (
-        total_grams * meat_pct / 100,
-        total_grams * veg_pct / 100,
-        total_grams * carb_pct / 100
+    ratios = [("Current plan ratio",) + tuple(ratio)]
+    ratios += [(lbl, p.meat_pct, p.veg_pct, p.carb_pct) for lbl, p in preset_by_label.items() if lbl in presets]
+    densities = densities or [round(float(assumed_kcal_per_g), 2)]
+    activities = activities or [activity]
+    scenarios = tuple(
+        (" · ".join(x for x in (name, f"{d:g} kcal/g" if len(densities) > 1 else "",
+                                act if len(activities) > 1 else "") if x),
+         m, v, c, float(d), act)
+        for name, m, v, c in ratios for d in densities for act in activities
     )
 
+    long_df, summary = weight_trajectory_frames(
+        float(weight_kg), float(age_years), bool(neutered), energy_adjustment(special_flags),
+        tuple(sorted(plan_category_kcal_per_g(plan_df).items())), scenarios,
+        TRAJECTORY_HORIZONS[horizon], 7 if reportion else 0,
+    )
 
-def day_nutrition_estimate(meat: str, veg: str, carb: str,
-                           meat_g: float, veg_g: float, carb_g: float) -> Dict[str, float]:
-    def calc(name: str, grams: float) -> Dict[str, float]:
-        ing = INGREDIENTS[name]
-        f = grams / 100.0
-        return {
-            "kcal": ing.kcal_per_100g * f,
-            "protein": ing.protein_g * f,
-            "fat": ing.fat_g * f,
-            "carbs": ing.carbs_g * f,
-        }
-    a, b, c = calc(meat, meat_g), calc(veg, veg_g), calc(carb, carb_g)
-    return {
-        "kcal": a["kcal"] + b["kcal"] + c["kcal"],
-        "protein": a["protein"] + b["protein"] + c["protein"],
-        "fat": a["fat"] + b["fat"] + c["fat"],
-        "carbs": a["carbs"] + b["carbs"] + c["carbs"],
-    }
+    lines = (
+        alt.Chart(long_df)
+        .mark_line()
+        .encode(
+            x=alt.X("Day:Q", title="Days from today"),
+            y=alt.Y("Weight (kg):Q", scale=alt.Scale(zero=False)),
+            color=alt.Color("Scenario:N", legend=alt.Legend(orient="bottom", columns=2)),
+            tooltip=["Scenario", "Day", "Weight (kg)"],
+        )
+        .properties(height=320)
+    )
+    st.altair_chart(lines, use_container_width=True)
+    st.dataframe(summary, use_container_width=True, hide_index=True, height=240)
+    st.caption(
+        f"{len(scenarios)} scenarios. Portions are sized from the assumed density; the dog receives "
+        "the plan's actual ingredient density. A rough energy-balance model "
+        f"({KCAL_PER_KG_TISSUE:.0f} kcal per kg of tissue), not a clinical prediction."
+    )
 
 
 # =========================================================
-# 5) Conservative supplement guide (expanded)
+# Ratio Lab comparison mode (preset × density sweep)
 # =========================================================
 
-SUPPLEMENTS = [
-    {"name": "Omega-3 (Fish Oil)",
-     "why": "Supports skin/coat, joint comfort, and inflammatory balance.",
-     "best_for": ["Dry/itchy skin", "Senior dogs", "Joint-support plans"],
-     "cautions": "Dose carefully; may loosen stool. Check with vet if on clotting-related meds.",
-     "pairing": "Pairs well with lean proteins and colorful vegetables."},
-
-    {"name": "Probiotics",
-     "why": "May improve gut resilience and stool stability.",
-     "best_for": ["Sensitive stomach", "Diet transitions", "Stress-related GI changes"],
-     "cautions": "Choose canine-specific options.",
-     "pairing": "Works nicely with pumpkin and gentle proteins."},
-
-    {"name": "Prebiotic Fiber (e.g., inulin / MOS)",
-     "why": "Supports beneficial gut bacteria.",
-     "best_for": ["Soft stools", "Gut resilience goals"],
-     "cautions": "Too much can cause gas.",
-     "pairing": "Often paired with probiotics."},
-
-    {"name": "Calcium Support (home-cooked essential)",
-     "why": "Long-term home cooking commonly needs calcium balancing.",
-     "best_for": ["Puppies", "Long-term cooked routines"],
-     "cautions": "Over/under supplementation can be risky—vet nutritionist advised.",
-     "pairing": "A backbone supplement for balanced home cooking."},
-
-    {"name": "Canine Multivitamin",
-     "why": "Helps cover micronutrient gaps in simplified routines.",
-     "best_for": ["Limited ingredient variety", "Busy weekly batch cooking"],
-     "cautions": "Avoid human multivitamins unless approved.",
-     "pairing": "Best with rotation-based weeks."},
-
-    {"name": "Joint Support (Glucosamine / Chondroitin / UC-II)",
-     "why": "May support mobility and cartilage comfort.",
-     "best_for": ["Large breeds", "Senior dogs", "Highly active dogs"],
-     "cautions": "Effects vary and take time.",
-     "pairing": "Combine with weight control and omega-3."},
-
-    {"name": "Vitamin E (as guided)",
-     "why": "Antioxidant support often used alongside omega-3.",
-     "best_for": ["Dogs on long-term fish oil"],
-     "cautions": "Avoid excessive dosing.",
-     "pairing": "Consider with fatty-acid protocols."},
-
-    {"name": "Dental Additives (vet-approved)",
-     "why": "Supports plaque control when brushing is difficult.",
-     "best_for": ["Small breeds", "Dental-prone dogs"],
-     "cautions": "Not a substitute for brushing.",
-     "pairing": "Pair with safe chewing strategies."},
-
-    {"name": "L-Carnitine (vet-guided)",
-     "why": "May assist some weight or cardiac strategies.",
-     "best_for": ["Vet-supervised weight plans"],
-     "cautions": "Use under professional advice.",
-     "pairing": "Best with lean protein + veggie-forward ratios."},
-]
-
+ratio_density_sweep = st.cache_data(show_spinner=False, max_entries=32)(ratio_density_sweep)
 
-# =========================================================
-# 6) Personalized ingredient recommendations
-# =========================================================
+SWEEP_DENSITY_OPTIONS = [1.0, 1.1, 1.2, 1.3, 1.35, 1.4, 1.5, 1.6, 1.7, 1.8]
+SWEEP_PCT_STEPS = list(range(0, 75, 5))
 
-def recommend_ingredients(stage: str, special_flags: List[str]) -> Dict[str, List[str]]:
-    meats, vegs, carbs, treats = [], [], [], []
 
-    base_meats = [
-        "Turkey (lean, cooked)", "White Fish (cod, cooked)",
-        "Chicken (lean, cooked)", "Egg (cooked)", "Beef (lean, cooked)"
-    ]
-    base_vegs = [
-        "Pumpkin (cooked)", "Zucchini (cooked)", "Green Beans (cooked)",
-        "Carrot (cooked)", "Bell Pepper (red, cooked)"
-    ]
-    base_carbs = [
-        "Sweet Potato (cooked)", "Brown Rice (cooked)", "Oats (cooked)", "Quinoa (cooked)"
-    ]
-    base_treats = [
-        "Blueberries (small portions)", "Apple (peeled, no seeds)", "Strawberries (small portions)"
-    ]
+@st.fragment
+def render_ratio_sweep(
+    target_kcal: float,
+    assumed_kcal_per_g: float,
+    recommendations: Dict[str, List[str]],
+    custom_ratio: Optional[Tuple[int, int, int]],
+) -> None:
+    density = round(float(assumed_kcal_per_g), 2)
+    sw1, sw2 = st.columns([1.6, 1.0])
+    with sw1:
+        densities = st.multiselect(
+            "Assumed densities (kcal/g)", sorted(set(SWEEP_DENSITY_OPTIONS) | {density}),
+            default=sorted(set(SWEEP_DENSITIES) | {density}), key="sweep_densities",
+        )
+    with sw2:
+        seeds = st.select_slider("Sampled weeks per cell", [8, 16, 32, 64, 128], value=SWEEP_SEEDS,
+                                 key="sweep_seeds")
+    with st.expander("Custom ratio grid (every combination, normalized to 100 %)"):
+        gm, gv, gc = st.columns(3)
+        grid_meat = gm.multiselect("Meat %", SWEEP_PCT_STEPS, key="sweep_grid_meat")
+        grid_veg = gv.multiselect("Veg %", SWEEP_PCT_STEPS, key="sweep_grid_veg")
+        grid_carb = gc.multiselect("Carb %", SWEEP_PCT_STEPS, key="sweep_grid_carb")
+
+    ratios = [(p.label, p.meat_pct, p.veg_pct, p.carb_pct) for p in RATIO_PRESETS]
+    if custom_ratio is not None:
+        ratios.append(("Current custom",) + tuple(custom_ratio))
+    if grid_meat and grid_veg and grid_carb:
+        ratios += ratio_grid(grid_meat, grid_veg, grid_carb)
+    densities = densities or [density]
+
+    # The planner's default pool: pantry plus recommended ingredients (taste weighting off).
+    pools = rotation_pools(
+        list(st.session_state.get("pantry_meats") or []), list(st.session_state.get("pantry_vegs") or []),
+        list(st.session_state.get("pantry_carbs") or []), True, recommendations,
+    )
+    bands, summary = ratio_density_sweep(
+        float(target_kcal), tuple(ratios), tuple(float(d) for d in densities),
+        tuple(tuple(p) for p in pools), int(seeds),
+    )
 
-    meats.extend(base_meats)
-    vegs.extend(base_vegs)
-    carbs.extend(base_carbs)
-    treats.extend(base_treats)
+    best = summary[summary["Rank"] == 1].drop_duplicates("Density")
+    at_current = best[best["Density"] == density]
+    if not at_current.empty:
+        row = at_current.iloc[0]
+        st.success(
+            f"At {density:g} kcal/g, **{row['Ratio']}** lands closest to the target: median "
+            f"{row['Median kcal error (%)']:+.1f} % · {row['Days on target (%)']:.0f} % of days within "
+            f"±{SWEEP_ON_TARGET_PCT:.0f} %."
+        )
 
-    if stage == "Puppy":
-        meats.extend(["Chicken (lean, cooked)", "Beef (lean, cooked)"])
-        carbs.extend(["White Rice (cooked)"])
-    if stage == "Senior":
-        meats.extend(["White Fish (cod, cooked)", "Salmon (cooked)"])
-        vegs.extend(["Pumpkin (cooked)"])
+    base = alt.Chart(bands).encode(
+        y=alt.Y("Ratio:N", title=None, sort=[r[0] for r in ratios]),
+        yOffset=alt.YOffset("Density:N"),
+        color=alt.Color("Density:N", title="kcal/g", legend=alt.Legend(orient="bottom")),
+        tooltip=["Ratio", "Density", "Metric", "p10", "p25", "p50", "p75", "p90"],
+    )
+    bands_chart = alt.layer(
+        base.mark_rule().encode(x=alt.X("p10:Q", title=None), x2="p90:Q"),
+        base.mark_bar(height=5).encode(x="p25:Q", x2="p75:Q"),
+        base.mark_tick(color="white", thickness=2, size=7).encode(x="p50:Q"),
+        data=bands,
+    ).properties(width=240, height=max(120, 26 * len(ratios))).facet(
+        column=alt.Column("Metric:N", title=None, sort=list(SWEEP_METRICS)),
+    ).resolve_scale(x="independent")
+    st.altair_chart(bands_chart, use_container_width=False)
+
+    st.dataframe(summary, use_container_width=True, hide_index=True, height=320)
+    st.caption(
+        f"{len(ratios)} ratios × {len(densities)} densities × {seeds} sampled weeks, all on the same "
+        "rotations (pantry plus recommended ingredients). Lines span p10–p90, bars p25–p75, ticks the "
+        "median day. Portions are sized from the assumed density; the error is what the picked "
+        "ingredients actually deliver against the target."
+    )
 
-    if "Sensitive stomach" in special_flags:
-        meats.extend(["Turkey (lean, cooked)", "White Fish (cod, cooked)"])
-        vegs.extend(["Pumpkin (cooked)"])
-        carbs.extend(["White Rice (cooked)", "Oats (cooked)"])
 
-    if "Skin/coat concern" in special_flags:
-        meats.extend(["Salmon (cooked)", "Sardines (cooked, deboned)"])
-        treats.extend(["Blueberries (small portions)"])
+# =========================================================
+# Micronutrient panel
+# =========================================================
 
-    if "Overweight / Weight loss goal" in special_flags:
-        meats.extend(["Turkey (lean, cooked)", "White Fish (cod, cooked)", "Rabbit (cooked)"])
-        vegs.extend(["Green Beans (cooked)", "Zucchini (cooked)", "Cauliflower (cooked)"])
+def render_micronutrient_panel(plan_df: pd.DataFrame, life_stage, state_key: str,
+                               columns=SHOPPING_COLUMNS) -> None:
+    day_df, summary = plan_artifact(
+        state_key, ("micronutrients", tuple(np.atleast_1d(life_stage)), columns),
+        lambda: score_micronutrients(plan_df, life_stage, columns),
+    )
+    if summary.empty:
+        st.caption("Nothing to score.")
+        return
+    nutrients = summary[summary["Nutrient"] != "Ca:P ratio"]
+    score = float(np.clip(nutrients["Adequacy (%)"], 0, 100).mean())
+    gaps = summary[summary["Status"] != "OK"]
+
+    mn1, mn2, mn3 = st.columns(3)
+    mn1.metric("Completeness score", f"{score:.0f}/100")
+    mn2.metric("Nutrients below need", int((nutrients["Status"] != "OK").sum()))
+    mn3.metric("Avg day score", f"{day_df['Day score'].mean():.0f}/100")
+
+    st.dataframe(summary, use_container_width=True, hide_index=True)
+    with st.expander("Per-day adequacy (% of requirement)"):
+        st.dataframe(day_df, use_container_width=True, hide_index=True)
+
+    suggested = list(dict.fromkeys(n for n in gaps["Suggested supplement"] if n in SUPPLEMENT_BY_NAME))
+    if suggested:
+        st.markdown("**Gaps mapped to the supplement guide**")
+        for name in suggested:
+            sup = SUPPLEMENT_BY_NAME[name]
+            covers = ", ".join(gaps.loc[gaps["Suggested supplement"] == name, "Nutrient"])
+            st.markdown(f"- **{name}** — covers {covers}. {sup['why']} _Caution: {sup['cautions']}_")
+    st.caption(
+        "Reference values per 1000 kcal; ingredient micronutrients are approximate and "
+        "cooking losses vary. Use this to spot gaps, not to dose — confirm with your vet."
+    )
 
-    if "Pancreatitis risk / Needs lower fat" in special_flags:
-        meats = [m for m in meats if m not in ["Salmon (cooked)", "Duck (lean, cooked)", "Sardines (cooked, deboned)"]]
-        meats.extend(["Turkey (lean, cooked)", "White Fish (cod, cooked)"])
 
-    def dedupe(lst):
-        seen, out = set(), []
-        for x in lst:
-            if x in INGREDIENTS and x not in seen:
-                out.append(x)
-                seen.add(x)
-        return out
+# =========================================================
+# Cost summary
+# =========================================================
 
-    return {"Meat": dedupe(meats), "Veg": dedupe(vegs), "Carb": dedupe(carbs), "Treat": dedupe(treats)}
+def render_cost_summary(costed_df: pd.DataFrame, weekly_budget: float) -> None:
+    """Weekly cost of a costed plan (add_plan_costs) against the optional weekly budget."""
+    if costed_df.empty or "Est cost" not in costed_df.columns:
+        return
+    week = float(costed_df["Est cost"].sum())
+    days = max(1, costed_df["Day"].nunique())
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Est. food cost (plan)", f"{week:,.2f}")
+    c2.metric("Per day", f"{week / days:,.2f}")
+    if weekly_budget > 0:
+        c3.metric("Budget left", f"{weekly_budget - week:,.2f}", delta=f"{weekly_budget - week:,.2f}")
+        if week > weekly_budget:
+            st.warning(f"Over the weekly budget by {week - weekly_budget:,.2f}.")
+    st.caption("Costs use the cheapest unit price per ingredient; the shopping list rounds up to whole packs.")
 
 
 # =========================================================
-# 7) Taste learning (single-dog session friendly)
+# Dog profiles (registry-backed sidebar)
 # =========================================================
 
-def pref_score_from_label(p: str) -> int:
-    return {"Dislike": 0, "Neutral": 1, "Like": 2, "Love": 3}.get(p, 1)
-
-
-def get_preference_maps() -> Tuple[Dict[str, float], Dict[str, float]]:
-    entries = st.session_state.get("taste_log", [])
-    if not entries:
-        return {}, {}
-    df = pd.DataFrame(entries)
-    if df.empty:
-        return {}, {}
-    df["score"] = df["Preference"].map(pref_score_from_label)
-
-    protein_map, veg_map = {}, {}
-    sub = df.dropna(subset=["Protein"])
-    if not sub.empty:
-        protein_map = sub.groupby("Protein")["score"].mean().to_dict()
-    sub = df.dropna(subset=["Veg"])
-    if not sub.empty:
-        veg_map = sub.groupby("Veg")["score"].mean().to_dict()
-    return protein_map, veg_map
-
-
-def weighted_choice(rng: random.Random, items: List[str], weights: List[float]) -> str:
-    if not items:
-        raise ValueError("weighted_choice received empty items")
-    if len(items) != len(weights):
-        raise ValueError("weighted_choice items/weights mismatch")
-    total = sum(max(0.0, w) for w in weights)
-    if total <= 0:
-        return rng.choice(items)
-    r = rng.random() * total
-    acc = 0.0
-    for item, w in zip(items, weights):
-        w = max(0.0, w)
-        acc += w
-        if r <= acc:
-            return item
-    return items[-1]
-
-
-def pick_rotation_smart(
-    pantry_meats: List[str],
-    pantry_vegs: List[str],
-    pantry_carbs: List[str],
-    allow_new: bool,
-    recommendations: Dict[str, List[str]],
-    taste_meat_map: Dict[str, float],
-    taste_veg_map: Dict[str, float],
-    use_taste_weights: bool,
-    days: int = 7,
-    seed: int = 42
-) -> List[Dict[str, str]]:
-    rng = random.Random(seed)
+SPECIAL_FLAG_OPTIONS = [
+    "None",
+    "Overweight / Weight loss goal",
+    "Sensitive stomach",
+    "Pancreatitis risk / Needs lower fat",
+    "Skin/coat concern",
+    "Very picky eater",
+    "Kidney concern (vet-managed)",
+    "Food allergy suspected",
+    "Joint/mobility support focus",
+]
 
-    all_meats = filter_ingredients_by_category("Meat")
-    all_vegs = filter_ingredients_by_category("Veg")
-    all_carbs = filter_ingredients_by_category("Carb")
+# profile field -> widget key; the widgets read their value from session state only
+PROFILE_WIDGETS = {
+    "Name": "profile_name",
+    "Breed": "profile_breed",
+    "Age (years)": "profile_age",
+    "Weight (kg)": "profile_weight",
+    "Neutered": "profile_neutered",
+    "Activity": "profile_activity",
+    "Meals/day": "profile_meals",
+    "Flags": "profile_flags",
+}
+PROFILE_WIDGET_DEFAULTS = {
+    "profile_name": "",
+    "profile_age": 3.0,
+    "profile_weight": 10.0,
+    "profile_neutered": True,
+    "profile_activity": "Normal",
+    "profile_meals": 2,
+    "profile_flags": ["None"],
+    "planner_preset": RATIO_PRESETS[0].label,
+    "pantry_meats": [],
+    "pantry_vegs": [],
+    "pantry_carbs": [],
+}
+PANTRY_WIDGETS = {"Meat": "pantry_meats", "Veg": "pantry_vegs", "Carb": "pantry_carbs"}
 
-    if allow_new:
-        meat_pool = list(dict.fromkeys(pantry_meats + recommendations.get("Meat", []) + all_meats))
-        veg_pool = list(dict.fromkeys(pantry_vegs + recommendations.get("Veg", []) + all_vegs))
-        carb_pool = list(dict.fromkeys(pantry_carbs + recommendations.get("Carb", []) + all_carbs))
-    else:
-        meat_pool = pantry_meats if pantry_meats else all_meats
-        veg_pool = pantry_vegs if pantry_vegs else all_vegs
-        carb_pool = pantry_carbs if pantry_carbs else all_carbs
-
-    def taste_weight(name: str, m: Dict[str, float]) -> float:
-        if not use_taste_weights:
-            return 1.0
-        s = m.get(name)
-        if s is None:
-            return 1.0
-        return max(0.25, 0.25 + float(s))  # 0..3 -> 0.25..3.25
-
-    def choose(pool: List[str], last: Optional[str], last2: Optional[str], taste_map: Dict[str, float]) -> str:
-        candidates = pool[:]
-        # prevent boredom: avoid repeating the same ingredient too many days in a row
-        if last and last2 and last == last2:
-            filtered = [x for x in candidates if x != last]
-            if filtered:
-                candidates = filtered
-        if last and len(candidates) > 1:
-            filtered = [x for x in candidates if x != last]
-            if filtered:
-                candidates = filtered
-        weights = [taste_weight(x, taste_map) for x in candidates]
-        return weighted_choice(rng, candidates, weights)
-
-    plan = []
-    last_meat = last_meat2 = None
-    last_veg = last_veg2 = None
-
-    for _ in range(days):
-        meat = choose(meat_pool, last_meat, last_meat2, taste_meat_map)
-        veg = choose(veg_pool, last_veg, last_veg2, taste_veg_map)
-        carb = rng.choice(carb_pool) if carb_pool else rng.choice(all_carbs)
-
-        plan.append({"Meat": meat, "Veg": veg, "Carb": carb})
-
-        last_meat2, last_meat = last_meat, meat
-        last_veg2, last_veg = last_veg, veg
-
-    return plan
-
-
-def build_weekly_shopping_list(plan_df: pd.DataFrame) -> pd.DataFrame:
-    totals = {}
-
-    def add_item(name: str, grams: float):
-        if not name or name == "—":
-            return
-        totals[name] = totals.get(name, 0.0) + float(grams)
-
-    for _, row in plan_df.iterrows():
-        add_item(row.get("Meat"), row.get("Daily Meat (g)", 0))
-        add_item(row.get("Veg"), row.get("Daily Veg (g)", 0))
-        add_item(row.get("Carb"), row.get("Daily Carb (g)", 0))
-
-    rows = []
-    for name, g in totals.items():
-        cat = INGREDIENTS.get(name).category if name in INGREDIENTS else "Unknown"
-        rows.append({
-            "Ingredient": name,
-            "Category": cat,
-            "Total grams (7 days)": int(round(g)),
-            "Avg grams/day": round(g / 7.0, 1),
-        })
-
-    df = pd.DataFrame(rows)
-    if df.empty:
-        return df
-    return df.sort_values(["Category", "Ingredient"]).reset_index(drop=True)
-
-
-def build_category_prep_summary(shopping_df: pd.DataFrame) -> pd.DataFrame:
-    if shopping_df.empty:
-        return shopping_df
-    grp = shopping_df.groupby("Category")["Total grams (7 days)"].sum().reset_index()
-    grp["Total grams (7 days)"] = grp["Total grams (7 days)"].round().astype(int)
-    return grp.sort_values("Total grams (7 days)", ascending=False).reset_index(drop=True)
+
+@st.cache_resource
+def get_profile_registry() -> ProfileRegistry:
+    # One SQLite connection per server process, shared by every session.
+    try:
+        return ProfileRegistry()
+    except sqlite3.Error:
+        return ProfileRegistry(":memory:")  # read-only data dir: profiles last for this process only
+
+
+def current_profile() -> Dict:
+    """The sidebar profile plus the planner preset and pantry, as the registry stores it."""
+    profile = {name: st.session_state.get(key) for name, key in PROFILE_WIDGETS.items()}
+    profile["Breed"] = profile["Breed"] or "Mixed Breed / Unknown"
+    profile["Flags"] = [f for f in profile["Flags"] or [] if f != "None"]
+    preset_key = {p.label: p.key for p in RATIO_PRESETS}.get(st.session_state.get("planner_preset"))
+    profile["Preset"] = preset_key or RATIO_PRESETS[0].key
+    profile["Pantry"] = {cat: list(st.session_state.get(key) or []) for cat, key in PANTRY_WIDGETS.items()}
+    return profile
+
+
+def switch_profile() -> None:
+    profile_id = st.session_state.get("profile_pick")
+    profile = get_profile_registry().get(profile_id) if profile_id is not None else None
+    st.session_state.profile_pick = None
+    if profile is None:
+        return
+    for name, key in PROFILE_WIDGETS.items():
+        st.session_state[key] = profile.get(name)
+    st.session_state.profile_flags = profile.get("Flags") or ["None"]
+    for key in ("breed_search", "breed_fci", "breed_region", "breed_size"):
+        st.session_state.pop(key, None)  # the saved breed must be among the options
+    preset = next((p for p in RATIO_PRESETS if p.key == profile.get("Preset")), RATIO_PRESETS[0])
+    st.session_state.planner_preset = preset.label
+    pantry = profile.get("Pantry") or {}
+    for cat, key in PANTRY_WIDGETS.items():
+        st.session_state[key] = list(pantry.get(cat) or [])
+    st.session_state.active_profile = profile_id
+    st.session_state.active_profile_name = profile["Name"]
+
+
+def save_profile() -> None:
+    profile = current_profile()
+    st.session_state.active_profile = get_profile_registry().save(profile, st.session_state.active_profile)
+    st.session_state.active_profile_name = str(profile["Name"] or "").strip() or "Unnamed"
+
+
+def new_profile() -> None:
+    for key, value in PROFILE_WIDGET_DEFAULTS.items():
+        st.session_state[key] = value
+    st.session_state.pop("profile_breed", None)
+    st.session_state.active_profile = None
+    st.session_state.active_profile_name = None
+
+
+def delete_profile() -> None:
+    if st.session_state.active_profile is not None:
+        get_profile_registry().delete(st.session_state.active_profile)
+        drop_plan_slot(f"plan_job@{st.session_state.active_profile}")
+    st.session_state.active_profile = None
+    st.session_state.active_profile_name = None
+
+
+def profile_energy(profile: Dict) -> Tuple[float, float, float, str]:
+    """
+    Energy targets for the sidebar profile: the values cached with the
+    active saved profile while its energy inputs are unchanged, else computed.
+    """
+    active_id = st.session_state.active_profile
+    saved = get_profile_registry().get(active_id) if active_id is not None else None
+    if saved is not None and saved["Derived"].get("energy_inputs") == profile_energy_key(profile):
+        d = saved["Derived"]
+        return d["rer"], d["mer"], d["mer_adj"], d["explanation"]
+    return compute_daily_energy(
+        weight_kg=profile["Weight (kg)"], age_years=profile["Age (years)"],
+        activity=profile["Activity"], neutered=profile["Neutered"], special_flags=profile["Flags"],
+    )
 
 
 # =========================================================
-# 8) Session state
+# Session state
 # =========================================================
 
 if "taste_log" not in st.session_state:
     st.session_state.taste_log = []
+if "taste_models" not in st.session_state:
+    st.session_state.taste_models = {}  # taste_dog_key -> model, built lazily by dog_taste_evidence()
+if "plan_job" not in st.session_state:
+    st.session_state.plan_job = None
+if "household_job" not in st.session_state:
+    st.session_state.household_job = None
+if "plan_regen_round" not in st.session_state:
+    st.session_state.plan_regen_round = 0
+if "price_table" not in st.session_state:
+    st.session_state.price_table = load_price_table()
+if "active_profile" not in st.session_state:
+    st.session_state.active_profile = None  # registry id of the loaded profile
+for _key, _value in PROFILE_WIDGET_DEFAULTS.items():
+    if _key not in st.session_state:
+        st.session_state[_key] = _value
 
 
 # =========================================================
@@ -1059,50 +906,57 @@ if "taste_log" not in st.session_state:
 st.sidebar.markdown(f"## 🐶🍳 {APP_TITLE}")
 st.sidebar.caption("Cosmic-grade cooked fresh planning")
 
-dog_name = st.sidebar.text_input("Dog name", value="", placeholder="e.g., Mochi / Luna / Atlas")
+st.sidebar.markdown("### 🗂️ Dog profiles")
+registry = get_profile_registry()
+profile_query = st.sidebar.text_input("Find a saved dog", key="profile_query", placeholder="name or breed")
+profile_matches = {pid: f"{name} · {breed_name}" for pid, name, breed_name in registry.search(profile_query)}
+st.sidebar.selectbox(
+    "Switch to", list(profile_matches), index=None, format_func=profile_matches.get,
+    placeholder=f"{len(profile_matches)} match(es)" if profile_query.strip() else "Recent profiles",
+    key="profile_pick", on_change=switch_profile,
+)
+pf1, pf2, pf3 = st.sidebar.columns(3)
+pf1.button("💾 Save", on_click=save_profile, use_container_width=True,
+           help="Save the sidebar, preset and pantry to the active profile (or a new one).")
+pf2.button("➕ New", on_click=new_profile, use_container_width=True)
+pf3.button("🗑️", on_click=delete_profile, disabled=st.session_state.active_profile is None,
+           use_container_width=True, help="Delete the active profile")
+active_label = st.session_state.get("active_profile_name") if st.session_state.active_profile else None
+st.sidebar.caption(f"{registry.count():,} saved · active: {active_label or 'unsaved profile'}")
+
+dog_name = st.sidebar.text_input("Dog name", key="profile_name", placeholder="e.g., Mochi / Luna / Atlas")
 
 st.sidebar.markdown("### Breed Atlas filters")
-breed_search = st.sidebar.text_input("Search breed", value="")
+breed_search = st.sidebar.text_input("Search breed", key="breed_search")
 fci_groups_all = sorted(BREED_DF["FCI Group"].unique().tolist())
 regions_all = sorted(BREED_DF["Region"].unique().tolist())
 sizes_all = sorted(BREED_DF["Size Class"].unique().tolist())
 
-breed_fci = st.sidebar.multiselect("FCI Group", fci_groups_all, default=[])
-breed_region = st.sidebar.multiselect("Region", regions_all, default=[])
-breed_size = st.sidebar.multiselect("Size class", sizes_all, default=[])
+breed_fci = st.sidebar.multiselect("FCI Group", fci_groups_all, key="breed_fci")
+breed_region = st.sidebar.multiselect("Region", regions_all, key="breed_region")
+breed_size = st.sidebar.multiselect("Size class", sizes_all, key="breed_size")
 
 breed_options = filter_breed_options(breed_search, breed_fci, breed_region, breed_size)
 
-breed = st.sidebar.selectbox("Breed", breed_options, index=0)
+breed = st.sidebar.selectbox("Breed", breed_options, index=0, key="profile_breed")
+if breed_search.strip() and normalize_search_text(breed_search) not in normalize_search_text(breed_options[0]):
+    st.sidebar.caption(f"Closest matches for “{breed_search.strip()}” (typos and aliases included).")
 
 colA, colB = st.sidebar.columns(2)
 with colA:
-    age_years = st.number_input("Age (years)", 0.1, 25.0, 3.0, 0.1)
+    age_years = st.number_input("Age (years)", 0.1, 25.0, step=0.1, key="profile_age")
 with colB:
-    weight_kg = st.number_input("Weight (kg)", 0.5, 90.0, 10.0, 0.1)
+    weight_kg = st.number_input("Weight (kg)", 0.5, 90.0, step=0.1, key="profile_weight")
 
-neutered = st.sidebar.toggle("Neutered/Spayed", value=True)
-activity = st.sidebar.select_slider("Activity level", ["Low", "Normal", "High", "Athletic/Working"], value="Normal")
+neutered = st.sidebar.toggle("Neutered/Spayed", key="profile_neutered")
+activity = st.sidebar.select_slider("Activity level", ["Low", "Normal", "High", "Athletic/Working"],
+                                    key="profile_activity")
 
-special_flags = st.sidebar.multiselect(
-    "Special considerations",
-    [
-        "None",
-        "Overweight / Weight loss goal",
-        "Sensitive stomach",
-        "Pancreatitis risk / Needs lower fat",
-        "Skin/coat concern",
-        "Very picky eater",
-        "Kidney concern (vet-managed)",
-        "Food allergy suspected",
-        "Joint/mobility support focus",
-    ],
-    default=["None"]
-)
+special_flags = st.sidebar.multiselect("Special considerations", SPECIAL_FLAG_OPTIONS, key="profile_flags")
 if "None" in special_flags and len(special_flags) > 1:
     special_flags = [f for f in special_flags if f != "None"]
 
-meals_per_day = st.sidebar.select_slider("Meals per day", [1, 2, 3, 4], value=2)
+meals_per_day = st.sidebar.select_slider("Meals per day", [1, 2, 3, 4], key="profile_meals")
 
 assumed_kcal_per_g = st.sidebar.slider(
     "Assumed energy density (kcal/g of cooked mix)",
@@ -1113,6 +967,9 @@ assumed_kcal_per_g = st.sidebar.slider(
 st.sidebar.markdown("---")
 st.sidebar.caption("Educational tool; not a substitute for veterinary nutrition advice.")
 
+# One energy computation per rerun, shared by every tab (cached on the saved profile).
+rer, mer, mer_adj, explanation = profile_energy(current_profile())
+
 
 # =========================================================
 # Hero banner
@@ -1169,14 +1026,6 @@ with tab_home:
     region = meta.get("Region", "Unknown")
     fci_group = meta.get("FCI Group", "Unknown")
 
-    rer, mer, mer_adj, explanation = compute_daily_energy(
-        weight_kg=weight_kg,
-        age_years=age_years,
-        activity=activity,
-        neutered=neutered,
-        special_flags=special_flags
-    )
-
     st.markdown("### Profile Snapshot")
 
     c1, c2, c3, c4 = st.columns(4)
@@ -1190,6 +1039,12 @@ with tab_home:
     st.caption(f"Meals/day: {meals_per_day}")
     st.caption(f"Context note: {explanation}")
 
+    with st.expander("🔭 What-if energy explorer"):
+        render_energy_explorer(
+            weight_kg, age_years, activity, neutered, special_flags,
+            assumed_kcal_per_g, meals_per_day, title_name,
+        )
+
     with st.expander("Breed Atlas (current dataset)"):
         st.dataframe(BREED_DF, use_container_width=True, height=320)
 
@@ -1297,6 +1152,10 @@ with tab_ingredients:
              F {ing_obj.fat_g:.1f}g ·
              C {ing_obj.carbs_g:.1f}g
           </p>
+          <p><b>Micronutrients per 100g:</b>
+             {' · '.join(f"{k} {v:g} {MICRO_UNITS[k]}"
+                         for k, v in zip(MICRO_KEYS, MICRO_MATRIX[INGREDIENT_INDEX[ing_obj.name]]))}
+          </p>
           <p><b>Micro-note:</b> {ing_obj.micronote}</p>
           <div class="nebula-divider"></div>
           <p><b>Benefits</b></p>
@@ -1353,12 +1212,6 @@ with tab_ratio:
         meat_pct, veg_pct, carb_pct = ensure_ratio_sum(meat_pct, veg_pct, carb_pct)
         st.caption(f"Normalized ratio: Meat {meat_pct}% · Veg {veg_pct}% · Carb {carb_pct}%")
 
-    rer, mer, mer_adj, explanation = compute_daily_energy(
-        weight_kg=weight_kg, age_years=age_years,
-        activity=activity, neutered=neutered,
-        special_flags=special_flags
-    )
-
     daily_grams = estimate_food_grams_from_energy(mer_adj, assumed_kcal_per_g)
     meat_g, veg_g, carb_g = grams_for_day(daily_grams, meat_pct, veg_pct, carb_pct)
 
@@ -1398,6 +1251,15 @@ with tab_ratio:
     )
     st.altair_chart(chart, use_container_width=True)
 
+    st.markdown("### Compare every preset")
+    if st.toggle("Comparison mode (all presets × densities × sampled weeks)", value=False, key="sweep_mode",
+                 help="Scores every preset, and any custom ratio grid, against the daily kcal target."):
+        render_ratio_sweep(
+            mer_adj, assumed_kcal_per_g,
+            recommend_ingredients(age_to_life_stage(age_years), special_flags),
+            (meat_pct, veg_pct, carb_pct) if use_custom else None,
+        )
+
 
 # =========================================================
 # 7-Day Intelligent Plan
@@ -1412,11 +1274,11 @@ with tab_planner:
 
     col_p1, col_p2, col_p3 = st.columns(3)
     with col_p1:
-        pantry_meats = st.multiselect("Meats you have", all_meats, default=[])
+        pantry_meats = st.multiselect("Meats you have", all_meats, key="pantry_meats")
     with col_p2:
-        pantry_vegs = st.multiselect("Vegetables you have", all_vegs, default=[])
+        pantry_vegs = st.multiselect("Vegetables you have", all_vegs, key="pantry_vegs")
     with col_p3:
-        pantry_carbs = st.multiselect("Carbs you have", all_carbs, default=[])
+        pantry_carbs = st.multiselect("Carbs you have", all_carbs, key="pantry_carbs")
 
     st.markdown("### Planning style")
 
@@ -1446,6 +1308,25 @@ with tab_planner:
             help="If ON, the engine may recommend and use ingredients you don't currently have."
         )
 
+    with st.expander("📏 Rotation rules"):
+        rules_text = st.text_area(
+            "One rule per line",
+            key="rotation_rules",
+            placeholder="\n".join(RULE_EXAMPLES),
+            help="Name an ingredient (\"salmon\") or a group (" + ", ".join(INGREDIENT_TAGS) + "). "
+                 "Rules shape every slot as it is sampled; if a rule would leave a slot with nothing "
+                 "to pick, it gives way for that slot and the plan check below reports it.",
+        )
+        start_weekday = st.selectbox(
+            "Day 1 of the plan is a", range(7), index=date.today().weekday(),
+            format_func=lambda i: WEEKDAY_NAMES[i], key="plan_start_weekday",
+        )
+        rotation_rules, rule_errors = RotationRules.parse(rules_text)
+        for problem in rule_errors:
+            st.warning(problem)
+        if len(rotation_rules):
+            st.caption(f"{len(rotation_rules)} rule(s) active; weeks run Monday to Sunday.")
+
     stage = age_to_life_stage(age_years)
     recs = recommend_ingredients(stage, special_flags)
 
@@ -1466,10 +1347,15 @@ with tab_planner:
             st.write("\n".join([f"• {x}" for x in recs["Treat"][:8]]))
         else:
             st.write("—")
+    diet = diet_profile(stage, special_flags)
+    if diet.boosted:
+        st.caption("Added for your dog's flags: " + ", ".join(diet.boosted))
+    if diet.avoid:
+        st.caption("Kept out of suggestions and add-on pools: " + ", ".join(diet.avoid))
 
     st.markdown("### Ratio configuration for weekly planner")
     preset_labels = {p.label: p.key for p in RATIO_PRESETS}
-    planner_preset_label = st.selectbox("Planner ratio preset", list(preset_labels.keys()), index=0)
+    planner_preset_label = st.selectbox("Planner ratio preset", list(preset_labels.keys()), key="planner_preset")
     planner_preset_obj = next(p for p in RATIO_PRESETS if p.key == preset_labels[planner_preset_label])
 
     planner_custom = st.toggle("Fine-tune planner ratio", value=False)
@@ -1485,12 +1371,6 @@ with tab_planner:
             carb_pct = st.slider("Planner Carb %", 0, 30, planner_preset_obj.carb_pct, key="planner_carb")
         meat_pct, veg_pct, carb_pct = ensure_ratio_sum(meat_pct, veg_pct, carb_pct)
 
-    rer, mer, mer_adj, explanation = compute_daily_energy(
-        weight_kg=weight_kg, age_years=age_years,
-        activity=activity, neutered=neutered,
-        special_flags=special_flags
-    )
-
     daily_grams = estimate_food_grams_from_energy(mer_adj, assumed_kcal_per_g)
     meat_g, veg_g, carb_g = grams_for_day(daily_grams, meat_pct, veg_pct, carb_pct)
 
@@ -1499,85 +1379,208 @@ with tab_planner:
         f"{daily_grams:.0f}g total → Meat {meat_g:.0f}g · Veg {veg_g:.0f}g · Carb {carb_g:.0f}g"
     )
     st.caption(f"Meals/day: {meals_per_day} → per-meal split will be shown in the plan.")
+    mv1, mv2, mv3 = st.columns([1.4, 1.0, 1.0])
+    with mv1:
+        meal_variety = st.toggle(
+            "Vary meals within the day",
+            value=False,
+            key="meal_variety",
+            disabled=meals_per_day == 1,
+            help="Meal 1 follows the day plan; every other meal draws its own protein, veg and carb "
+                 "(taste-weighted, rotation rules apply) so the day's bowls differ.",
+        )
+    with mv2:
+        meal_max_per_day = st.select_slider(
+            "Same ingredient per day (max)", [1, 2, 3], value=MEAL_MAX_PER_DAY,
+            key="meal_max_per_day", disabled=not meal_variety,
+        )
+    with mv3:
+        meal_rest_days = st.select_slider(
+            "Rest days after an extra meal", [0, 1, 2, 3], value=MEAL_REST_DAYS,
+            key="meal_rest_days", disabled=not meal_variety,
+        )
+    meal_variety = meal_variety and meals_per_day > 1
+
+    st.markdown("### 💰 Prices & budget")
+    with st.expander("Price table (per ingredient and pack size)"):
+        st.caption("Loaded from data/prices.csv when present, else illustrative defaults. "
+                   "Add one row per pack size; the shopping list buys the cheapest mix of whole packs.")
+        edited_prices = st.data_editor(
+            st.session_state.price_table,
+            key="price_editor",
+            num_rows="dynamic",
+            use_container_width=True,
+            column_config={
+                "Ingredient": st.column_config.SelectboxColumn("Ingredient", options=INGREDIENT_NAMES),
+                "Pack (g)": st.column_config.NumberColumn("Pack (g)", min_value=1, step=1),
+                "Pack price": st.column_config.NumberColumn("Pack price", min_value=0.01, step=0.01, format="%.2f"),
+            },
+        )
+    prices = PriceTable(edited_prices)
+    bm1, bm2 = st.columns([1.4, 1.0])
+    with bm1:
+        budget_mode = st.toggle(
+            "Budget mode",
+            value=False,
+            help="Picks the cheapest of thousands of candidate rotations that still keeps an average "
+                 "taste score of Neutral or better, no disliked slots and at least three different "
+                 "proteins and vegetables. The ratio above is always kept.",
+        )
+    with bm2:
+        weekly_budget = st.number_input("Weekly budget (0 = none)", 0.0, 10_000.0, 0.0, 5.0)
 
     seed = st.slider("Rotation randomness seed", 1, 999, 42)
-    generate = st.button("✨ Generate 7-Day Nebula Plan")
-
-    taste_meat_map, taste_veg_map = get_preference_maps()
 
-    if generate:
-        effective_allow_new = (allow_new and not pantry_only)
-
-        rotation = pick_rotation_smart(
-            pantry_meats=pantry_meats,
-            pantry_vegs=pantry_vegs,
-            pantry_carbs=pantry_carbs,
-            allow_new=effective_allow_new,
-            recommendations=recs,
-            taste_meat_map=taste_meat_map,
-            taste_veg_map=taste_veg_map,
-            use_taste_weights=taste_mode,
-            days=7,
-            seed=seed
-        )
-
-        fruit_rotation = []
-        if include_fruit and recs["Treat"]:
-            rng = random.Random(seed + 7)
-            for _ in range(7):
-                fruit_rotation.append(rng.choice(recs["Treat"]))
-        else:
-            fruit_rotation = [None] * 7
-
-        per_meal_total = daily_grams / meals_per_day
-        per_meal_meat = meat_g / meals_per_day
-        per_meal_veg = veg_g / meals_per_day
-        per_meal_carb = carb_g / meals_per_day
-
-        rows = []
-        for i, combo in enumerate(rotation, start=1):
-            mg, vg, cg = grams_for_day(daily_grams, meat_pct, veg_pct, carb_pct)
-
-            # protect against missing dict keys (shouldn't happen)
-            meat_name = combo.get("Meat", all_meats[0])
-            veg_name = combo.get("Veg", all_vegs[0])
-            carb_name = combo.get("Carb", all_carbs[0])
-
-            nut = day_nutrition_estimate(meat_name, veg_name, carb_name, mg, vg, cg)
-
-            rows.append({
-                "Day": f"Day {i}",
-                "Meat": meat_name,
-                "Veg": veg_name,
-                "Carb": carb_name,
-                "Optional Fruit Topper": fruit_rotation[i-1] or "—",
-                "Daily Meat (g)": round(mg),
-                "Daily Veg (g)": round(vg),
-                "Daily Carb (g)": round(cg),
-                "Meals/day": meals_per_day,
-                "Per-Meal Total (g)": round(per_meal_total),
-                "Per-Meal Meat (g)": round(per_meal_meat),
-                "Per-Meal Veg (g)": round(per_meal_veg),
-                "Per-Meal Carb (g)": round(per_meal_carb),
-                "Est kcal": round(nut["kcal"]),
-                "Protein (g)": round(nut["protein"], 1),
-                "Fat (g)": round(nut["fat"], 1),
-                "Carbs (g)": round(nut["carbs"], 1),
-                "Variety Mode": "Pantry-only" if pantry_only else ("Smart + add-ons" if effective_allow_new else "Pantry-preferred"),
-            })
+    taste_model = get_taste_model(title_name, breed, age_years)
+    taste_meat_map, taste_veg_map = taste_model.mean_scores()
+
+    effective_allow_new = (allow_new and not pantry_only)
+    plan_inputs = {
+        "pantry_meats": pantry_meats,
+        "pantry_vegs": pantry_vegs,
+        "pantry_carbs": pantry_carbs,
+        "allow_new": effective_allow_new,
+        "recommendations": recs,
+        "taste_meat_map": taste_meat_map,
+        "taste_veg_map": taste_veg_map,
+        "taste_model": taste_model,
+        "use_taste_weights": taste_mode,
+        "include_fruit": include_fruit,
+        "daily_grams": daily_grams,
+        "meat_pct": meat_pct,
+        "veg_pct": veg_pct,
+        "carb_pct": carb_pct,
+        "meals_per_day": meals_per_day,
+        "variety_label": ("Budget · " if budget_mode else "") + (
+            "Pantry-only" if pantry_only else ("Smart + add-ons" if effective_allow_new else "Pantry-preferred")
+        ),
+        "days": 7,
+        "seed": seed,
+        "budget_mode": budget_mode,
+        "prices": prices,
+        "rules": rotation_rules,
+        "start_weekday": start_weekday,
+    }
 
-        plan_df = pd.DataFrame(rows)
+    col_gen1, col_gen2 = st.columns([1.4, 1.0])
+    with col_gen1:
+        generate = st.button("✨ Generate 7-Day Nebula Plan")
+    with col_gen2:
+        cancel_generation = st.button("⏹ Cancel generation")
+
+    # One plan slot per saved profile, so switching dogs keeps each dog's plan (and its views).
+    active_id = st.session_state.active_profile
+    plan_slot = use_plan_slot("plan_job" if active_id is None else f"plan_job@{active_id}")
+    plan_df = drive_plan_job(plan_slot, plan_inputs, generate, cancel_generation)
+
+    previous_job = st.session_state.get(f"{plan_slot}_previous")
+    if plan_df is None and previous_job is not None and st.session_state.get(plan_slot) is None:
+        if st.button("🩹 Repair the previous plan (regenerate affected slots only)"):
+            prev_df = previous_job.future.result()
+            pools = rotation_pools(pantry_meats, pantry_vegs, pantry_carbs, effective_allow_new, recs)
+            regen = affected_slots(
+                prev_df, pools,
+                taste_meat_map if taste_mode else None, taste_veg_map if taste_mode else None,
+                rotation_rules, start_weekday,
+            ) & ~lock_matrix(st.session_state.get(f"{plan_slot}_locks"), prev_df)
+            st.session_state.plan_regen_round += 1
+            plan_df, refreshed = partial_regeneration(
+                plan_slot, previous_job, plan_inputs, regen, seed + st.session_state.plan_regen_round
+            )
+            st.caption(f"Repaired {int(regen.sum())} slot(s); nutrition refreshed on {len(refreshed)} day(s).")
 
+    if plan_df is not None:
         st.markdown(f"### {title_name}'s weekly plan")
-        st.dataframe(plan_df, use_container_width=True, height=360)
+
+        with st.expander("🔒 Lock days or slots, regenerate the rest"):
+            locks = st.session_state.get(f"{plan_slot}_locks")
+            if locks is None or list(locks["Day"]) != list(plan_df["Day"]):
+                locks = default_plan_locks(plan_df)
+            locks = st.data_editor(
+                locks,
+                hide_index=True,
+                disabled=["Day"],
+                use_container_width=True,
+                key=f"plan_lock_editor_{st.session_state[plan_slot].token}",
+            )
+            st.session_state[f"{plan_slot}_locks"] = locks
+            regen = ~lock_matrix(locks, plan_df)
+            st.caption(f"{int((~regen).sum())} of {regen.size} slots locked.")
+            if st.button("🔁 Regenerate unlocked slots", disabled=not regen.any()):
+                st.session_state.plan_regen_round += 1
+                plan_df, refreshed = partial_regeneration(
+                    plan_slot, st.session_state.get(plan_slot), plan_inputs, regen,
+                    seed + st.session_state.plan_regen_round,
+                )
+                st.caption(f"Regenerated {int(regen.sum())} slot(s); {len(refreshed)} day(s) changed.")
+
+        # With meal variety on, the meal-slot plan feeds every view below; its meal 1 is the day plan.
+        meal_df, view_df, view_cols, view_key = None, plan_df, SHOPPING_COLUMNS, ()
+        if meal_variety:
+            view_key = ("meals", meals_per_day, meal_max_per_day, meal_rest_days)
+            meal_df = plan_artifact(plan_slot, ("meal_slots",) + view_key, lambda: plan_meal_slots(
+                plan_df, rotation_pools(pantry_meats, pantry_vegs, pantry_carbs, effective_allow_new, recs),
+                meals_per_day, taste_meat_map, taste_veg_map, taste_mode, seed,
+                meal_max_per_day, meal_rest_days, rotation_rules, start_weekday,
+            ))
+            view_df, view_cols = meal_df, MEAL_SLOT_COLUMNS
+
+        costed_df = plan_artifact(plan_slot, ("costed", prices.signature()) + view_key,
+                                  lambda: add_plan_costs(view_df, prices, view_cols))
+        render_cost_summary(costed_df, weekly_budget)
+        if meal_df is None:
+            st.dataframe(costed_df, use_container_width=True, height=360)
+        else:
+            st.caption(f"{meals_per_day} meals a day: meal 1 follows the day plan, the others are drawn "
+                       f"per meal slot (aiming for an ingredient at most {meal_max_per_day}× a day).")
+            st.dataframe(costed_df, use_container_width=True, height=420)
+            with st.expander("Day plan (meal 1 rotation and daily targets)"):
+                st.dataframe(plan_df, use_container_width=True, height=300)
+        if len(rotation_rules):
+            rotation = view_df[list(ROTATION_CATEGORIES)].to_dict("records")
+            slots_per_day = meals_per_day if meal_df is not None else 1
+            rule_breaks = plan_artifact(
+                plan_slot, ("rule_check", rotation_rules.signature(), start_weekday) + view_key,
+                lambda: rotation_rules.violations(rotation, start_weekday, slots_per_day),
+            )
+            if rule_breaks:
+                st.warning("Rules the pool could not satisfy: " + "; ".join(
+                    f"Day {d // slots_per_day + 1}"
+                    + (f" meal {d % slots_per_day + 1}" if slots_per_day > 1 else "") + f" {cat} — {text}"
+                    for d, cat, text in rule_breaks[:6]
+                ) + (" …" if len(rule_breaks) > 6 else ""))
+            else:
+                st.caption(f"✅ All {len(rotation_rules)} rotation rule(s) met.")
+        if meal_df is not None:
+            meal_breaks = plan_artifact(plan_slot, ("meal_breaks",) + view_key, lambda: meal_slot_breaks(
+                np.column_stack([meal_df[c].map(INGREDIENT_INDEX).to_numpy(dtype=np.int64)
+                                 for c in ROTATION_CATEGORIES]).reshape(len(plan_df), meals_per_day, 3),
+                meal_max_per_day, meal_rest_days,
+            ))
+            if meal_breaks:
+                cap_breaks = sum(kind == "cap" for *_, kind in meal_breaks)
+                st.warning(
+                    f"The pool is too narrow for these meal limits: {cap_breaks} serving(s) over "
+                    f"{meal_max_per_day}× a day and {len(meal_breaks) - cap_breaks} rest-day break(s), e.g. "
+                    + "; ".join(f"Day {d + 1} {ROTATION_CATEGORIES[k]} — {INGREDIENT_NAMES[i]} ({kind})"
+                                for d, k, i, kind in meal_breaks[:4])
+                    + ". Add pantry items, allow add-ons, or loosen the meal limits."
+                )
+            else:
+                st.caption(f"✅ Meal limits met: at most {meal_max_per_day}× a day, "
+                           f"{meal_rest_days} rest day(s) between extra meals.")
 
         st.markdown("### Weekly nutrient trend (approx)")
-        melt = plan_df.melt(
+        trend_cols = ["Est kcal", "Protein (g)", "Fat (g)", "Carbs (g)"]
+        trend_df = plan_df
+        if meal_df is not None:
+            trend_df = meal_df.groupby("Day", sort=False, as_index=False)[trend_cols].sum()
+        melt = plan_artifact(plan_slot, ("nutrient_melt",) + view_key, lambda: trend_df.melt(
             id_vars=["Day"],
-            value_vars=["Est kcal", "Protein (g)", "Fat (g)", "Carbs (g)"],
+            value_vars=trend_cols,
             var_name="Metric",
             value_name="Value"
-        )
+        ))
         line = (
             alt.Chart(melt)
             .mark_line(point=True)
@@ -1591,22 +1594,35 @@ with tab_planner:
         )
         st.altair_chart(line, use_container_width=True)
 
+        st.markdown("### 🧪 Micronutrient completeness")
+        render_micronutrient_panel(view_df, stage, plan_slot, view_cols)
+
+        st.markdown("### ⚖️ Body-weight trajectory")
+        render_weight_trajectory(
+            view_df, weight_kg, age_years, activity, neutered, special_flags,
+            assumed_kcal_per_g, (meat_pct, veg_pct, carb_pct),
+        )
+
         st.markdown("### 🧾 Weekly shopping list & batch-prep calculator")
-        shopping_df = build_weekly_shopping_list(plan_df)
+        shopping_df = plan_artifact(plan_slot, ("shopping",) + view_key if view_key else "shopping",
+                                    lambda: build_weekly_shopping_list(view_df, view_cols))
+        shopping_df = plan_artifact(plan_slot, ("shopping_priced", prices.signature()) + view_key,
+                                    lambda: price_shopping_list(shopping_df, prices))
         if shopping_df.empty:
             st.info("Shopping list is empty. Try regenerating.")
         else:
-            cat_summary = build_category_prep_summary(shopping_df)
+            cat_summary = plan_artifact(plan_slot, ("category_summary",) + view_key,
+                                        lambda: build_category_prep_summary(shopping_df))
 
             csum1, csum2 = st.columns([1, 2])
             with csum1:
                 st.markdown("**Category totals**")
-                st.dataframe(cat_summary, use_container_width=True, height=220)
+                st.dataframe(weekly_totals(cat_summary), use_container_width=True, height=220)
             with csum2:
                 st.markdown("**Ingredient totals (7 days)**")
-                st.dataframe(shopping_df, use_container_width=True, height=220)
+                st.dataframe(weekly_totals(shopping_df), use_container_width=True, height=220)
 
-            csv_bytes = shopping_df.to_csv(index=False).encode("utf-8")
+            csv_bytes = weekly_totals(shopping_df).to_csv(index=False).encode("utf-8")
             st.download_button(
                 label="⬇️ Download shopping list (CSV)",
                 data=csv_bytes,
@@ -1614,6 +1630,53 @@ with tab_planner:
                 mime="text/csv"
             )
 
+        st.markdown("### 🧑‍🍳 Batch-cooking sessions")
+        render_cooking_sessions(view_df, "plan", plan_slot, view_cols)
+
+        st.markdown("### 🥡 Container packing")
+        render_container_packing(plan_df, "plan", title_name, plan_slot)
+
+        st.markdown("### 📦 Export plan data")
+        export_sets = {"Full plan": costed_df if meal_df is None else plan_df}
+        if meal_df is not None:
+            export_sets["Meal slots"] = costed_df
+        if not shopping_df.empty:
+            export_sets["Shopping list"] = weekly_totals(shopping_df)
+            export_sets["Category summary"] = weekly_totals(cat_summary)
+
+        ex1, ex2, ex3 = st.columns([1.1, 1.3, 1.0])
+        with ex1:
+            export_set = st.selectbox("Dataset", list(export_sets.keys()), key="export_set")
+        with ex2:
+            fmt_options = [
+                f for f in EXPORT_FORMATS
+                if f != "iCalendar (cooking days)" or export_set == "Full plan"
+            ]
+            export_fmt = st.selectbox("Format", fmt_options, key="export_fmt")
+        with ex3:
+            export_start = st.date_input("Plan start date", value=date.today(), key="export_start")
+
+        if not export_format_available(export_fmt):
+            st.caption(f"{export_fmt} export needs an optional package (pip install pyarrow openpyxl).")
+        else:
+            export_df = export_sets[export_set]
+            ext, mime = EXPORT_FORMATS[export_fmt]
+            file_stub = f"{title_name.lower().replace(' ', '_')}_{export_set.lower().replace(' ', '_')}"
+
+            def build_export(df=export_df, fmt=export_fmt, sheet=export_set,
+                             start=export_start, label=title_name):
+                # Runs only when the button is clicked.
+                return export_bytes(df, fmt, sheet_name=sheet, start_date=start, dog_label=label)
+
+            st.download_button(
+                label=f"⬇️ Download {export_set.lower()} ({ext.upper()})",
+                data=build_export,
+                file_name=f"{file_stub}.{ext}",
+                mime=mime,
+                on_click="ignore",
+                key="export_download",
+            )
+
         with st.expander("Why this planner does NOT force identical daily ingredients"):
             st.write(
                 """
@@ -1623,6 +1686,136 @@ with tab_planner:
                 """
             )
 
+    st.markdown("### 🏠 Household mode (multi-dog)")
+    household_mode = st.toggle(
+        "Plan several dogs together",
+        value=False,
+        help="Plans every dog in one run, shares the pantry above and prefers one protein per day so cooking can be batched."
+    )
+    if household_mode:
+        if "household_profiles" not in st.session_state:
+            st.session_state.household_profiles = default_household_profiles({
+                "Name": title_name, "Breed": breed, "Age (years)": float(age_years),
+                "Weight (kg)": float(weight_kg), "Neutered": bool(neutered), "Activity": activity,
+                "Meals/day": int(meals_per_day), "Flags": [f for f in special_flags if f != "None"],
+            })
+
+        edited_profiles = st.data_editor(
+            st.session_state.household_profiles,
+            key=f"household_editor_{st.session_state.get('household_editor_round', 0)}",
+            num_rows="dynamic",
+            use_container_width=True,
+            column_config={
+                "Breed": st.column_config.SelectboxColumn("Breed", options=BREED_DF["Breed"].tolist()),
+                "Age (years)": st.column_config.NumberColumn("Age (years)", min_value=0.1, max_value=25.0, step=0.1),
+                "Weight (kg)": st.column_config.NumberColumn("Weight (kg)", min_value=0.5, max_value=90.0, step=0.1),
+                "Neutered": st.column_config.CheckboxColumn("Neutered"),
+                "Activity": st.column_config.SelectboxColumn("Activity", options=list(ACTIVITY_BOOST)),
+                "Meals/day": st.column_config.NumberColumn("Meals/day", min_value=1, max_value=4, step=1),
+                "Flags": st.column_config.MultiselectColumn("Flags", options=SPECIAL_FLAG_OPTIONS[1:]),
+                "Id": None,
+            },
+        )
+        edited_profiles, new_ids = assign_household_ids(edited_profiles)
+        if new_ids:
+            # Persist the ids as the editor's data; a fresh editor key drops the
+            # old edit deltas, which the stored frame now already contains.
+            st.session_state.household_profiles = edited_profiles
+            st.session_state.household_editor_round = st.session_state.get("household_editor_round", 0) + 1
+            st.rerun()
+        household = clean_household_profiles(edited_profiles)
+
+        household_inputs = {
+            "profiles": household.to_dict(orient="records"),
+            "pantry_meats": pantry_meats,
+            "pantry_vegs": pantry_vegs,
+            "pantry_carbs": pantry_carbs,
+            "allow_new": effective_allow_new,
+            "taste_models": {taste_dog_key(name): dog_taste_evidence(name) for name in household["Name"]},
+            "use_taste_weights": taste_mode,
+            "meat_pct": meat_pct,
+            "veg_pct": veg_pct,
+            "carb_pct": carb_pct,
+            "assumed_kcal_per_g": assumed_kcal_per_g,
+            "days": 7,
+            "seed": seed,
+            "rules": rotation_rules,
+            "start_weekday": start_weekday,
+        }
+
+        hh1, hh2 = st.columns([1.4, 1.0])
+        with hh1:
+            generate_household = st.button(
+                f"🏠 Generate household plan ({len(household)} dogs)",
+                disabled=household.empty
+            )
+        with hh2:
+            cancel_household = st.button("⏹ Cancel household run")
+
+        household_df = drive_plan_job(
+            "household_job", household_inputs, generate_household, cancel_household, fn=plan_household
+        )
+
+        if household_df is not None and not household_df.empty:
+            shared_rate = float(household_df["Shared protein"].mean())
+            hm1, hm2, hm3 = st.columns(3)
+            hm1.metric("Dogs planned", household_df["Dog"].nunique())
+            hm2.metric("Bowls on the day's shared protein", f"{shared_rate:.0%}")
+            hm3.metric("Household kcal/day (approx)", f"{household_df['Est kcal'].sum() / 7:.0f}")
+
+            household_costed = plan_artifact("household_job", ("costed", prices.signature()),
+                                             lambda: add_plan_costs(household_df, prices))
+            render_cost_summary(household_costed, weekly_budget)
+            st.dataframe(household_costed, use_container_width=True, height=360)
+
+            per_dog = plan_artifact("household_job", "per_dog", lambda: (
+                household_df.groupby("Dog", sort=False)
+                .agg({"Est kcal": "mean", "Daily Meat (g)": "first", "Daily Veg (g)": "first",
+                      "Daily Carb (g)": "first", "Per-Meal Total (g)": "first"})
+                .rename(columns={"Est kcal": "Avg Est kcal/day"})
+                .round(0)
+                .reset_index()
+            ))
+            st.markdown("**Per-dog daily gram split**")
+            st.dataframe(per_dog, use_container_width=True)
+
+            st.markdown("**Household micronutrient completeness**")
+            stage_by_dog = {
+                label: age_to_life_stage(a)
+                for label, a in zip(household_dog_labels(household["Name"].tolist()), household["Age (years)"])
+            }
+            render_micronutrient_panel(
+                household_df, household_df["Dog"].map(stage_by_dog).fillna("Adult").to_numpy(), "household_job"
+            )
+
+            st.markdown("**Household batch-cooking sessions**")
+            render_cooking_sessions(household_df, "household", "household_job")
+
+            st.markdown("**Household container packing**")
+            render_container_packing(household_df, "household", "household", "household_job")
+
+            hh_shopping = plan_artifact("household_job", "shopping",
+                                        lambda: build_weekly_shopping_list(household_df))
+            hh_shopping = plan_artifact("household_job", ("shopping_priced", prices.signature()),
+                                        lambda: price_shopping_list(hh_shopping, prices))
+            if not hh_shopping.empty:
+                hs1, hs2 = st.columns([1, 2])
+                with hs1:
+                    st.markdown("**Household category totals**")
+                    hh_summary = plan_artifact("household_job", "category_summary",
+                                               lambda: build_category_prep_summary(hh_shopping))
+                    st.dataframe(weekly_totals(hh_summary), use_container_width=True, height=220)
+                with hs2:
+                    st.markdown("**Merged household shopping list (7 days)**")
+                    st.dataframe(weekly_totals(hh_shopping), use_container_width=True, height=220)
+                st.download_button(
+                    label="⬇️ Download household shopping list (CSV)",
+                    data=weekly_totals(hh_shopping).to_csv(index=False).encode("utf-8"),
+                    file_name="household_shopping_list.csv",
+                    mime="text/csv",
+                    key="household_shopping_csv",
+                )
+
 
 # =========================================================
 # Supplement Observatory
@@ -1747,62 +1940,128 @@ with tab_taste:
             "Energy": None if energy == "(skip)" else energy,
             "Skin": None if itch == "(skip)" else itch,
             "Notes": notes.strip(),
+            "Logged": datetime.now(timezone.utc).isoformat(timespec="seconds"),
         }
         st.session_state.taste_log.append(entry)
+        model = st.session_state.taste_models.get(taste_dog_key(entry["Dog Name"]))
+        if model is not None:
+            model.update(entry)
         st.success("Entry added to this session log.")
 
+    with st.expander("📥 Bulk import / export (CSV or JSON Lines)"):
+        st.caption(
+            "Import years of feeding observations at once. Protein and vegetable names are matched "
+            "to the ingredient library (typos and short names like “chiken” are corrected); "
+            "preference, stool, energy and skin values are normalized to the options above. "
+            "Rows without a recognizable preference or ingredient are skipped and listed below."
+        )
+        upload = st.file_uploader("Taste-log file", type=["csv", "jsonl", "ndjson"], key="taste_import_file")
+        if upload is not None and st.button("Import taste log", key="taste_import_go"):
+            import_fmt = "CSV" if upload.name.lower().endswith(".csv") else "JSON Lines"
+            bar = st.progress(0.0, text="Reading…")
+
+            def append_taste_batch(df: pd.DataFrame) -> None:
+                st.session_state.taste_log.extend(df.astype(object).where(df.notna(), None).to_dict("records"))
+                for key, rows in df.groupby(df["Dog Name"].map(taste_dog_key), sort=False):
+                    model = st.session_state.taste_models.get(key)
+                    if model is not None:
+                        model.update_frame(rows)
+
+            def show_import_progress(report) -> None:
+                done = min(upload.tell() / max(upload.size, 1), 1.0)
+                bar.progress(done, text=f"{report.rows_read:,} rows read · {report.rows_imported:,} imported")
+
+            report = import_taste_log(
+                upload, import_fmt, append_taste_batch,
+                defaults={"Dog Name": title_name, "Breed": breed},
+                progress=show_import_progress,
+            )
+            bar.progress(1.0, text="Done")
+            st.success(
+                f"Imported {report.rows_imported:,} of {report.rows_read:,} rows "
+                f"in {report.seconds:.1f}s ({report.rows_per_second:,.0f} rows/s)."
+            )
+            if report.corrections:
+                fixes = pd.DataFrame(
+                    [(col, raw, value) for (col, raw), value in report.corrections.items()],
+                    columns=["Column", "In file", "Imported as"],
+                )
+                st.markdown("**Corrected spellings**")
+                st.dataframe(fixes, use_container_width=True, hide_index=True, height=200)
+            if report.fields_cleared:
+                st.caption(f"{report.fields_cleared:,} unrecognized stool/energy/skin values were left blank.")
+            if report.rows_rejected:
+                st.warning(f"{report.rows_rejected:,} rows skipped. First few:")
+                st.dataframe(pd.DataFrame(report.rejects, columns=["Line", "Reason"]),
+                             use_container_width=True, hide_index=True, height=200)
+
+        if st.session_state.taste_log:
+            tl1, tl2 = st.columns([1.0, 1.4])
+            with tl1:
+                log_fmt = st.selectbox(
+                    "Export format",
+                    [f for f in ("CSV", "JSON Lines", "Parquet", "Excel (XLSX)") if export_format_available(f)],
+                    key="taste_export_fmt",
+                )
+            with tl2:
+                log_ext, log_mime = EXPORT_FORMATS[log_fmt]
+
+                def build_taste_export(fmt=log_fmt):
+                    # Runs only when the button is clicked.
+                    return export_bytes(taste_log_frame(st.session_state.taste_log), fmt, sheet_name="Taste log")
+
+                st.download_button(
+                    label=f"⬇️ Download taste log ({len(st.session_state.taste_log):,} rows, {log_ext.upper()})",
+                    data=build_taste_export,
+                    file_name=f"{title_name.lower().replace(' ', '_')}_taste_log.{log_ext}",
+                    mime=log_mime,
+                    on_click="ignore",
+                    key="taste_export_download",
+                )
+
     if st.session_state.taste_log:
         log_df = pd.DataFrame(st.session_state.taste_log)
 
         st.markdown("### Session taste log")
-        st.dataframe(log_df, use_container_width=True, height=260)
+        if len(log_df) > 5000:
+            st.caption(f"Showing the latest 5,000 of {len(log_df):,} entries; summaries below use all of them.")
+        st.dataframe(log_df.tail(5000), use_container_width=True, height=260)
 
         st.markdown("### Preference summaries (session)")
-
-        def pref_score(p: str) -> int:
-            return {"Dislike": 0, "Neutral": 1, "Like": 2, "Love": 3}.get(p, 1)
-
-        protein_records = log_df.dropna(subset=["Protein"]).copy()
-        veg_records = log_df.dropna(subset=["Veg"]).copy()
+        st.caption(
+            "Bayesian scores (0 = Dislike … 3 = Love): each ingredient starts from a neutral-leaning prior, "
+            "entries fade with a half-life of about four months, and bars show the 80% credible range. "
+            "The planner draws fresh weights from these posteriors every day (Thompson sampling)."
+        )
+        priors = taste_priors()
+        prior_group = priors.describe(breed, age_years) if priors is not None else None
+        if prior_group:
+            st.caption(f"Starting prior learned from similar dogs: {prior_group}.")
+        summary = get_taste_model(title_name, breed, age_years).score_summary()
 
         col_s1, col_s2 = st.columns(2)
-        with col_s1:
-            if not protein_records.empty:
-                protein_records["Score"] = protein_records["Preference"].map(pref_score)
-                rank = protein_records.groupby("Protein")["Score"].mean().sort_values(ascending=False).reset_index()
-                rank.columns = ["Protein", "Avg Preference Score"]
-                bar = (
-                    alt.Chart(rank)
-                    .mark_bar()
-                    .encode(
-                        x=alt.X("Avg Preference Score:Q", scale=alt.Scale(domain=[0, 3])),
-                        y=alt.Y("Protein:N", sort="-x"),
-                        tooltip=["Protein", alt.Tooltip("Avg Preference Score:Q", format=".2f")]
-                    )
-                    .properties(height=240, title="Protein preference (session)")
+        for col_s, kind, label in ((col_s1, "Protein", "Protein"), (col_s2, "Veg", "Vegetable")):
+            with col_s:
+                rank = summary[summary["Kind"] == kind].sort_values("Mean score", ascending=False)
+                if rank.empty:
+                    st.caption(f"No {label.lower()} taste entries yet.")
+                    continue
+                base = alt.Chart(rank).encode(y=alt.Y("Ingredient:N", sort="-x", title=label))
+                bar = base.mark_bar().encode(
+                    x=alt.X("Mean score:Q", scale=alt.Scale(domain=[0, 3]), title="Posterior preference score"),
+                    tooltip=[
+                        "Ingredient",
+                        alt.Tooltip("Mean score:Q", format=".2f"),
+                        alt.Tooltip("Low:Q", format=".2f"),
+                        alt.Tooltip("High:Q", format=".2f"),
+                        alt.Tooltip("Effective entries:Q", format=".1f"),
+                    ],
                 )
-                st.altair_chart(bar, use_container_width=True)
-            else:
-                st.caption("No protein taste entries yet.")
-
-        with col_s2:
-            if not veg_records.empty:
-                veg_records["Score"] = veg_records["Preference"].map(pref_score)
-                rank = veg_records.groupby("Veg")["Score"].mean().sort_values(ascending=False).reset_index()
-                rank.columns = ["Vegetable", "Avg Preference Score"]
-                bar = (
-                    alt.Chart(rank)
-                    .mark_bar()
-                    .encode(
-                        x=alt.X("Avg Preference Score:Q", scale=alt.Scale(domain=[0, 3])),
-                        y=alt.Y("Vegetable:N", sort="-x"),
-                        tooltip=["Vegetable", alt.Tooltip("Avg Preference Score:Q", format=".2f")]
-                    )
-                    .properties(height=240, title="Vegetable preference (session)")
+                band = base.mark_rule(color="white", opacity=0.7).encode(x="Low:Q", x2="High:Q")
+                st.altair_chart(
+                    (bar + band).properties(height=240, title=f"{label} preference (session)"),
+                    use_container_width=True,
                 )
-                st.altair_chart(bar, use_container_width=True)
-            else:
-                st.caption("No vegetable taste entries yet.")
     else:
         st.info("No taste entries yet. Add a few to activate taste-informed rotation.")
 
@@ -0,0 +1,4844 @@
+"""
+Nebula Paw Kitchen™ — planning core.
+
+Pure data and planning logic shared by the Streamlit app (app.py) and the
+local JSON service (service.py). Nothing in here imports Streamlit, so the
+module is safe to use from worker threads and plain Python processes.
+
+Import stays cheap: pandas is only loaded on first use, and the breed atlas,
+its search index and the learned taste priors are built on first access, so
+scalar paths (energy, ratios, recommendations) never pay for them.
+"""
+
+from __future__ import annotations
+
+import importlib
+import io
+import itertools
+import json
+import os
+import random
+import re
+import sqlite3
+import stat
+import tempfile
+import threading
+import time
+import unicodedata
+import uuid
+import zlib
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Dict, List, Tuple, Optional, Union
+
+import numpy as np
+
+
+class LazyModule:
+    """Stand-in for a heavy module that imports it on first attribute access."""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr: str):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+pd = LazyModule("pandas")
+
+_LAZY_GLOBALS: Dict[str, Callable[[], object]] = {}
+_LAZY_LOCK = threading.RLock()
+
+
+def lazy_global(name: str):
+    """
+    Turn a builder into a memoized accessor for module global `name`. The
+    value is built on the first call (or the first `nebula_core.<name>`
+    lookup / `from nebula_core import <name>`) and stored as a real global.
+    """
+    def wrap(build: Callable[[], object]) -> Callable[[], object]:
+        def get():
+            g = globals()
+            if name not in g:
+                with _LAZY_LOCK:
+                    if name not in g:
+                        g[name] = build()
+            return g[name]
+        get.__name__, get.__doc__ = build.__name__, build.__doc__
+        _LAZY_GLOBALS[name] = get
+        return get
+    return wrap
+
+
+def __getattr__(name: str):
+    # PEP 562: only reached for globals that do not exist yet.
+    if name in _LAZY_GLOBALS:
+        return _LAZY_GLOBALS[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+APP_TITLE = "Nebula Paw Kitchen™"
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+# =========================================================
+# 1) Breed Atlas — built-in mega list + safe optional CSV
+# =========================================================
+
+def _builtin_breed_rows() -> List[Dict[str, str]]:
+    # A large, globally diverse starter atlas.
+    # Not literally every variety on earth, but intentionally broad.
+    # You can later replace/extend via data/breeds.csv safely.
+
+    def row(b, grp, reg, sz, notes=""):
+        return {"Breed": b, "FCI Group": grp, "Region": reg, "Size Class": sz, "Notes": notes}
+
+    G1 = "Group 1 - Sheepdogs and Cattle Dogs"
+    G2 = "Group 2 - Pinscher / Schnauzer / Molossoid / Swiss Mountain"
+    G3 = "Group 3 - Terriers"
+    G4 = "Group 4 - Dachshunds"
+    G5 = "Group 5 - Spitz and Primitive types"
+    G6 = "Group 6 - Scent hounds and related"
+    G7 = "Group 7 - Pointing Dogs"
+    G8 = "Group 8 - Retrievers / Flushing Dogs / Water Dogs"
+    G9 = "Group 9 - Companion and Toy Dogs"
+    G10 = "Group 10 - Sighthounds"
+    NA = "N/A"
+
+    rows = [
+        row("Mixed Breed / Unknown", NA, "Global", "Unknown", "For rescues or uncertain lineage"),
+
+        # Group 1
+        row("German Shepherd Dog", G1, "Europe", "Large"),
+        row("Belgian Malinois", G1, "Europe", "Large"),
+        row("Belgian Tervuren", G1, "Europe", "Large"),
+        row("Belgian Groenendael", G1, "Europe", "Large"),
+        row("Belgian Laekenois", G1, "Europe", "Large"),
+        row("Border Collie", G1, "Europe", "Medium"),
+        row("Rough Collie", G1, "Europe", "Large"),
+        row("Smooth Collie", G1, "Europe", "Large"),
+        row("Shetland Sheepdog", G1, "Europe", "Small"),
+        row("Old English Sheepdog", G1, "Europe", "Large"),
+        row("Australian Shepherd", G1, "Oceania", "Medium"),
+        row("Miniature American Shepherd", G1, "North America", "Small"),
+        row("Australian Cattle Dog", G1, "Oceania", "Medium"),
+        row("Pembroke Welsh Corgi", G1, "Europe", "Small"),
+        row("Cardigan Welsh Corgi", G1, "Europe", "Small"),
+        row("Dutch Shepherd", G1, "Europe", "Large"),
+        row("White Swiss Shepherd Dog", G1, "Europe", "Large"),
+        row("Bearded Collie", G1, "Europe", "Medium"),
+        row("Briard", G1, "Europe", "Large"),
+        row("Puli", G1, "Europe", "Medium"),
+        row("Pumi", G1, "Europe", "Medium"),
+        row("Mudi", G1, "Europe", "Medium"),
+        row("Bergamasco Sheepdog", G1, "Europe", "Large"),
+        row("Pyrenean Shepherd", G1, "Europe", "Small"),
+
+        # Group 2
+        row("Doberman Pinscher", G2, "Europe", "Large"),
+        row("Miniature Pinscher", G2, "Europe", "Small"),
+        row("German Pinscher", G2, "Europe", "Medium"),
+        row("Affenpinscher", G2, "Europe", "Toy"),
+        row("Schnauzer - Giant", G2, "Europe", "Large"),
+        row("Schnauzer - Standard", G2, "Europe", "Medium"),
+        row("Schnauzer - Miniature", G2, "Europe", "Small"),
+        row("Rottweiler", G2, "Europe", "Large"),
+        row("Boxer", G2, "Europe", "Large"),
+        row("Great Dane", G2, "Europe", "Giant"),
+        row("Bullmastiff", G2, "Europe", "Giant"),
+        row("Mastiff - English", G2, "Europe", "Giant"),
+        row("Neapolitan Mastiff", G2, "Europe", "Giant"),
+        row("Cane Corso", G2, "Europe", "Large"),
+        row("Dogue de Bordeaux", G2, "Europe", "Giant"),
+        row("Bernese Mountain Dog", G2, "Europe", "Giant"),
+        row("Greater Swiss Mountain Dog", G2, "Europe", "Giant"),
+        row("Saint Bernard", G2, "Europe", "Giant"),
+        row("Newfoundland", G2, "Europe", "Giant"),
+        row("Leonberger", G2, "Europe", "Giant"),
+        row("Tibetan Mastiff", G2, "Asia", "Giant"),
+        row("Boerboel", G2, "Africa", "Giant"),
+        row("Akbash", G2, "Middle East", "Giant", "Livestock guardian type"),
+        row("Kangal Shepherd Dog", G2, "Middle East", "Giant", "Livestock guardian type"),
+
+        # Group 3
+        row("Airedale Terrier", G3, "Europe", "Large"),
+        row("Bull Terrier", G3, "Europe", "Medium"),
+        row("Staffordshire Bull Terrier", G3, "Europe", "Medium"),
+        row("American Staffordshire Terrier", G3, "North America", "Large"),
+        row("West Highland White Terrier", G3, "Europe", "Small"),
+        row("Cairn Terrier", G3, "Europe", "Small"),
+        row("Scottish Terrier", G3, "Europe", "Small"),
+        row("Norfolk Terrier", G3, "Europe", "Small"),
+        row("Norwich Terrier", G3, "Europe", "Small"),
+        row("Border Terrier", G3, "Europe", "Small"),
+        row("Jack Russell Terrier", G3, "Europe", "Small"),
+        row("Parson Russell Terrier", G3, "Europe", "Small"),
+        row("Wire Fox Terrier", G3, "Europe", "Small"),
+        row("Smooth Fox Terrier", G3, "Europe", "Small"),
+        row("Kerry Blue Terrier", G3, "Europe", "Medium"),
+        row("Irish Terrier", G3, "Europe", "Medium"),
+        row("Soft Coated Wheaten Terrier", G3, "Europe", "Medium"),
+        row("Australian Terrier", G3, "Oceania", "Small"),
+        row("Yorkshire Terrier", G3, "Europe", "Toy"),
+
+        # Group 4
+        row("Dachshund - Standard", G4, "Europe", "Small"),
+        row("Dachshund - Miniature", G4, "Europe", "Toy"),
+        row("Dachshund - Wirehaired", G4, "Europe", "Small"),
+
+        # Group 5
+        row("Siberian Husky", G5, "Europe", "Large"),
+        row("Alaskan Malamute", G5, "North America", "Giant"),
+        row("Samoyed", G5, "Europe", "Large"),
+        row("Akita", G5, "Asia", "Large"),
+        row("American Akita", G5, "North America", "Large"),
+        row("Shiba Inu", G5, "Asia", "Medium"),
+        row("Korean Jindo", G5, "Asia", "Medium"),
+        row("Chow Chow", G5, "Asia", "Large"),
+        row("Keeshond", G5, "Europe", "Medium"),
+        row("Pomeranian", G5, "Europe", "Toy"),
+        row("Finnish Spitz", G5, "Europe", "Medium"),
+        row("Norwegian Elkhound", G5, "Europe", "Medium"),
+        row("Icelandic Sheepdog", G5, "Europe", "Medium"),
+        row("Basenji", G5, "Africa", "Medium"),
+        row("Thai Ridgeback", G5, "Asia", "Large"),
+        row("Pharaoh Hound", G5, "Europe", "Large"),
+        row("Xoloitzcuintli", G5, "North America", "Small/Medium", "Primitive heritage"),
+        row("Peruvian Inca Orchid", G5, "South America", "Medium", "Primitive heritage"),
+        row("Kishu Ken", G5, "Asia", "Medium"),
+        row("Kai Ken", G5, "Asia", "Medium"),
+        row("Shikoku", G5, "Asia", "Medium"),
+        row("Hokkaido", G5, "Asia", "Medium"),
+        row("Borzoi (Spitz line)", G5, "Europe", "Large", "Classification varies by registry"),
+
+        # Group 6
+        row("Beagle", G6, "Europe", "Medium"),
+        row("Basset Hound", G6, "Europe", "Medium"),
+        row("Bloodhound", G6, "Europe", "Large"),
+        row("Rhodesian Ridgeback", G6, "Africa", "Large"),
+        row("Coonhound - Black and Tan", G6, "North America", "Large"),
+        row("Coonhound - Redbone", G6, "North America", "Large"),
+        row("Coonhound - Treeing Walker", G6, "North America", "Large"),
+        row("Harrier", G6, "Europe", "Medium"),
+        row("Drever", G6, "Europe", "Medium"),
+        row("Finnish Hound", G6, "Europe", "Medium"),
+
+        # Group 7
+        row("German Shorthaired Pointer", G7, "Europe", "Large"),
+        row("German Wirehaired Pointer", G7, "Europe", "Large"),
+        row("English Pointer", G7, "Europe", "Large"),
+        row("Vizsla", G7, "Europe", "Medium"),
+        row("Weimaraner", G7, "Europe", "Large"),
+        row("Brittany", G7, "Europe", "Medium"),
+        row("English Setter", G7, "Europe", "Large"),
+        row("Gordon Setter", G7, "Europe", "Large"),
+        row("Irish Setter", G7, "Europe", "Large"),
+
+        # Group 8
+        row("Labrador Retriever", G8, "Europe", "Large"),
+        row("Golden Retriever", G8, "Europe", "Large"),
+        row("Flat-Coated Retriever", G8, "Europe", "Large"),
+        row("Curly-Coated Retriever", G8, "Europe", "Large"),
+        row("Chesapeake Bay Retriever", G8, "North America", "Large"),
+        row("Nova Scotia Duck Tolling Retriever", G8, "North America", "Medium"),
+        row("English Springer Spaniel", G8, "Europe", "Medium"),
+        row("English Cocker Spaniel", G8, "Europe", "Small"),
+        row("American Cocker Spaniel", G8, "North America", "Small"),
+        row("Portuguese Water Dog", G8, "Europe", "Large"),
+        row("Spanish Water Dog", G8, "Europe", "Medium"),
+        row("Lagotto Romagnolo", G8, "Europe", "Medium"),
+
+        # Group 9
+        row("Pug", G9, "Asia", "Small"),
+        row("French Bulldog", G9, "Europe", "Small"),
+        row("Bulldog - English", G9, "Europe", "Medium"),
+        row("Boston Terrier", G9, "North America", "Small"),
+        row("Cavalier King Charles Spaniel", G9, "Europe", "Small"),
+        row("King Charles Spaniel", G9, "Europe", "Toy"),
+        row("Maltese", G9, "Europe", "Toy"),
+        row("Bichon Frise", G9, "Europe", "Small"),
+        row("Havanese", G9, "North America", "Small"),
+        row("Shih Tzu", G9, "Asia", "Toy"),
+        row("Lhasa Apso", G9, "Asia", "Small"),
+        row("Pekingese", G9, "Asia", "Toy"),
+        row("Japanese Chin", G9, "Asia", "Toy"),
+        row("Papillon", G9, "Europe", "Toy"),
+        row("Chihuahua", G9, "North America", "Toy"),
+        row("Chinese Crested", G9, "Asia", "Toy"),
+        row("Coton de Tulear", G9, "Africa", "Small"),
+        row("Brussels Griffon", G9, "Europe", "Toy"),
+        row("Affenpinscher (Companion)", G9, "Europe", "Toy"),
+        row("Poodle - Toy", G9, "Europe", "Toy"),
+        row("Poodle - Miniature", G9, "Europe", "Small"),
+        row("Poodle - Standard", G9, "Europe", "Large"),
+        row("Italian Greyhound", G9, "Europe", "Toy"),
+        row("Yorkshire Terrier (Companion line)", G9, "Europe", "Toy"),
+        row("Russian Toy", G9, "Europe", "Toy"),
+        row("Bolognese", G9, "Europe", "Small"),
+        row("Lowchen", G9, "Europe", "Small"),
+
+        # Group 10
+        row("Greyhound", G10, "Europe", "Large"),
+        row("Whippet", G10, "Europe", "Medium"),
+        row("Saluki", G10, "Middle East", "Large"),
+        row("Afghan Hound", G10, "Asia", "Large"),
+        row("Irish Wolfhound", G10, "Europe", "Giant"),
+        row("Scottish Deerhound", G10, "Europe", "Giant"),
+        row("Italian Greyhound (Sighthound)", G10, "Europe", "Toy"),
+
+        # Widely recognized non-FCI or registry-variant lines
+        row("American Eskimo Dog", NA, "North America", "Small/Medium", "Spitz-type classification varies"),
+        row("Great Pyrenees", NA, "Europe", "Giant", "Livestock guardian type"),
+        row("Anatolian Shepherd Dog", NA, "Middle East", "Giant", "Livestock guardian type"),
+        row("Caucasian Shepherd Dog", NA, "Europe/Asia", "Giant", "Also called Caucasian Ovcharka"),
+        row("Central Asian Shepherd Dog", NA, "Europe/Asia", "Giant", "Also called Alabai"),
+        row("Maremma Sheepdog", NA, "Europe", "Large", "Livestock guardian type"),
+        row("Kuvasz", NA, "Europe", "Large", "Livestock guardian type"),
+        row("Komondor", NA, "Europe", "Large", "Livestock guardian type"),
+        row("Korean Sapsaree", NA, "Asia", "Large", "National heritage breed"),
+        row("Tosa", NA, "Asia", "Large", "Japanese mastiff-type"),
+        row("Catahoula Leopard Dog", NA, "North America", "Large", "Working heritage"),
+
+        # Popular global breeds not yet listed above
+        row("Rough-haired German Shepherd Mix", NA, "Global", "Large", "Common informal mix label"),
+        row("Schnauzer Mix", NA, "Global", "Small/Medium", "Common companion mix"),
+        row("Shiba Mix", NA, "Global", "Small/Medium", "Common companion mix"),
+
+        # Designer / modern mixes (educational only)
+        row("Cockapoo", NA, "Global", "Small", "Designer mix"),
+        row("Labradoodle", NA, "Global", "Medium/Large", "Designer mix"),
+        row("Goldendoodle", NA, "Global", "Medium/Large", "Designer mix"),
+        row("Cavapoo", NA, "Global", "Small", "Designer mix"),
+        row("Maltipoo", NA, "Global", "Toy", "Designer mix"),
+        row("Shihpoo", NA, "Global", "Small", "Designer mix"),
+        row("Pomsky", NA, "Global", "Small/Medium", "Designer mix"),
+    ]
+
+    # Expand with a broad plain-name list (no special metadata)
+    # to simulate a larger atlas without risking CSV parsing issues.
+    extra_names = [
+        "Basset Fauve de Bretagne", "Black Russian Terrier", "Bohemian Shepherd",
+        "Bolognese (Registry)", "Boykin Spaniel", "Bracco Italiano",
+        "Briquet Griffon Vendeen", "Canaan Dog", "Catalan Sheepdog",
+        "Chinese Shar-Pei", "Clumber Spaniel", "Dandie Dinmont Terrier",
+        "English Toy Terrier", "Eurasier", "Field Spaniel",
+        "Finnish Lapphund", "Glen of Imaal Terrier", "Ibizan Hound",
+        "Irish Water Spaniel", "Japanese Spitz", "Keeshond (Registry)",
+        "Kerry Beagle", "Koolie", "Laika (Regional types)",
+        "Manchester Terrier", "Miniature Bull Terrier",
+        "Norwegian Buhund", "Norwegian Lundehund",
+        "Otterhound", "Pyrenean Mastiff", "Schipperke",
+        "Sloughi", "Spanish Mastiff", "Swedish Vallhund",
+        "Thai Bangkaew Dog", "Tibetan Spaniel", "Tibetan Terrier",
+        "Treeing Tennessee Brindle", "Volpino Italiano",
+        "Welsh Springer Spaniel", "Wirehaired Pointing Griffon",
+        "Xiasi Dog (China)", "Yakutian Laika",
+    ]
+    for n in extra_names:
+        rows.append(row(n, NA, "Global", "Unknown", "Broad atlas placeholder"))
+
+    return rows
+
+
+def build_builtin_breed_df() -> pd.DataFrame:
+    df = pd.DataFrame(_builtin_breed_rows())
+    # normalize
+    for c in ["Breed", "FCI Group", "Region", "Size Class", "Notes"]:
+        if c not in df.columns:
+            df[c] = ""
+        df[c] = df[c].astype(str).str.strip()
+    df = df.drop_duplicates(subset=["Breed"]).sort_values("Breed").reset_index(drop=True)
+    return df
+
+
+def load_breeds() -> pd.DataFrame:
+    """
+    Safe loader:
+    - Uses data/breeds.csv if present.
+    - Any read/parse issue -> fallback to built-in atlas.
+    This prevents pandas.errors.ParserError from breaking the app.
+    """
+    builtin = build_builtin_breed_df()
+    path = os.path.join(DATA_DIR, "breeds.csv")
+
+    if not os.path.exists(path):
+        return builtin
+
+    try:
+        df = pd.read_csv(
+            path,
+            dtype=str,
+            keep_default_na=False,
+            engine="python",
+        )
+        # ensure columns
+        required = ["Breed", "FCI Group", "Region", "Size Class", "Notes"]
+        for col in required:
+            if col not in df.columns:
+                df[col] = ""
+            df[col] = df[col].astype(str).str.strip()
+
+        if not (df["Breed"] == "Mixed Breed / Unknown").any():
+            df = pd.concat([pd.DataFrame([{
+                "Breed": "Mixed Breed / Unknown",
+                "FCI Group": "N/A",
+                "Region": "Global",
+                "Size Class": "Unknown",
+                "Notes": ""
+            }]), df], ignore_index=True)
+
+        df = df.drop_duplicates(subset=["Breed"]).sort_values("Breed").reset_index(drop=True)
+        # If someone accidentally provided an empty or weird file, fallback
+        if df.empty or "Breed" not in df.columns:
+            return builtin
+        return df
+
+    except Exception:
+        return builtin
+
+
+@lazy_global("BREED_DF")
+def breed_df() -> pd.DataFrame:
+    # Published once per host and memory-mapped by every server process.
+    return shared_catalog("breeds", load_breeds, os.path.join(DATA_DIR, "breeds.csv"))
+
+
+@lazy_global("BREED_META")
+def breed_meta() -> Mapping:
+    return CatalogRows(breed_df(), "Breed")
+
+
+# Common nicknames → atlas breed(s); a nickname covering several atlas entries
+# lists them all. Targets missing from a custom atlas are skipped.
+BREED_ALIASES: Dict[str, Union[str, Tuple[str, ...]]] = {
+    "Lab": "Labrador Retriever",
+    "Labrador": "Labrador Retriever",
+    "Golden": "Golden Retriever",
+    "GSD": "German Shepherd Dog",
+    "Alsatian": "German Shepherd Dog",
+    "Frenchie": "French Bulldog",
+    "Yorkie": "Yorkshire Terrier",
+    "Westie": "West Highland White Terrier",
+    "Sheltie": "Shetland Sheepdog",
+    "Staffy": "Staffordshire Bull Terrier",
+    "Doxie": ("Dachshund - Standard", "Dachshund - Miniature", "Dachshund - Wirehaired"),
+    "Weiner Dog": ("Dachshund - Standard", "Dachshund - Miniature", "Dachshund - Wirehaired"),
+    "Pom": "Pomeranian",
+    "Aussie": "Australian Shepherd",
+    "Berner": "Bernese Mountain Dog",
+    "Dobie": "Doberman Pinscher",
+    "Dobermann": "Doberman Pinscher",
+    "Rottie": "Rottweiler",
+    "Husky": "Siberian Husky",
+    "Pittie": ("American Staffordshire Terrier", "Staffordshire Bull Terrier"),
+    "Pit Bull": ("American Staffordshire Terrier", "Staffordshire Bull Terrier"),
+    "Alabai": "Central Asian Shepherd Dog",
+    "Ovcharka": "Caucasian Shepherd Dog",
+}
+
+_ALIAS_NOTE_RE = re.compile(r"(?:also called|also known as|a\.?k\.?a\.?)\s+([^.;()]+)", re.IGNORECASE)
+_NORMALIZE_RE = re.compile(r"[^0-9a-z]+")
+
+
+def normalize_search_text(text: str) -> str:
+    """Lowercase, strip accents/punctuation, collapse whitespace."""
+    text = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode("ascii")
+    return " ".join(_NORMALIZE_RE.sub(" ", text.lower()).split())
+
+
+def text_trigrams(text: str) -> set:
+    padded = f" {normalize_search_text(text)} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)} if len(padded) > 3 else set()
+
+
+class FuzzyIndex:
+    """
+    Trigram inverted index over a list of keys, each owned by a row id.
+    Several keys may share an owner (name, aliases, notes); lookups rank
+    owners by their best-scoring key, so typos and partial words still match.
+    """
+
+    def __init__(self, keys: List[str], owners: List[int], weights: Optional[List[float]] = None):
+        self.keys = [normalize_search_text(k) for k in keys]
+        self.owners = np.asarray(owners, dtype=np.int64)
+        self.weights = np.ones(len(keys)) if weights is None else np.asarray(weights, dtype=float)
+        postings: Dict[str, List[int]] = {}
+        gram_counts = np.zeros(len(keys), dtype=np.int32)
+        for key_id, key in enumerate(keys):
+            grams = text_trigrams(key)
+            gram_counts[key_id] = len(grams)
+            for g in grams:
+                postings.setdefault(g, []).append(key_id)
+        self.postings = {g: np.asarray(ids, dtype=np.int32) for g, ids in postings.items()}
+        self.gram_counts = np.maximum(gram_counts, 1)
+
+    def search(self, query: str, limit: int = 50, min_score: float = 0.34,
+               owner_mask: Optional[np.ndarray] = None) -> List[Tuple[int, float, int]]:
+        """
+        Ranked (owner, score, key id) matches; score 1.0+ means a literal substring hit.
+        `owner_mask` (bool per owner) drops filtered-out owners before ranking,
+        so `limit` counts only owners that pass it.
+        """
+        q = normalize_search_text(query)
+        if not q:
+            return []
+        if len(q) < 3:
+            # too short for trigrams: plain substring scan
+            cand = np.array([i for i, k in enumerate(self.keys) if q in k], dtype=np.int64)
+            score = np.full(cand.size, min_score)
+        else:
+            qgrams = text_trigrams(q)
+            lists = [self.postings[g] for g in qgrams if g in self.postings]
+            if not lists:
+                return []
+            hits = np.bincount(np.concatenate(lists), minlength=len(self.keys))
+            cand = np.flatnonzero(hits >= max(1, int(np.ceil(min_score * len(qgrams)))))
+            h = hits[cand]
+            containment = h / len(qgrams)
+            dice = 2 * h / (len(qgrams) + self.gram_counts[cand])
+            score = (0.75 * containment + 0.25 * dice) * self.weights[cand]
+        if owner_mask is not None:
+            keep = owner_mask[self.owners[cand]]
+            cand, score = cand[keep], score[keep]
+        if cand.size == 0:
+            return []
+
+        # Literal substring check only on the short list, so it stays cheap.
+        top = cand[np.argsort(-score, kind="stable")[: max(limit * 4, 64)]]
+        score_top = dict(zip(cand, score))
+        ranked = []
+        for key_id in top:
+            s = score_top[key_id]
+            key = self.keys[key_id]
+            if q in key:
+                s = (1.0 + (0.5 if key.startswith(q) else 0.0) + len(q) / len(key)) * self.weights[key_id]
+            if s >= min_score:
+                ranked.append((s, key_id))
+        ranked.sort(key=lambda x: -x[0])
+
+        seen, out = set(), []
+        for s, key_id in ranked:
+            owner = int(self.owners[key_id])
+            if owner in seen:
+                continue
+            seen.add(owner)
+            out.append((owner, float(s), int(key_id)))
+            if len(out) >= limit:
+                break
+        return out
+
+
+def breed_alias_targets() -> List[Tuple[str, str]]:
+    """(alias, breed) pairs, one per target of a multi-breed alias."""
+    return [(alias, b) for alias, targets in BREED_ALIASES.items()
+            for b in ((targets,) if isinstance(targets, str) else targets)]
+
+
+def missing_breed_alias_targets(df: pd.DataFrame) -> List[Tuple[str, str]]:
+    """BREED_ALIASES entries whose target breed is not in the atlas `df`."""
+    known = set(df["Breed"])
+    return [(alias, b) for alias, b in breed_alias_targets() if b not in known]
+
+
+def breed_alias_keys(df: pd.DataFrame) -> List[Tuple[str, int]]:
+    """(alias, row) pairs from BREED_ALIASES and 'Also called …' notes."""
+    row_of = {b: i for i, b in enumerate(df["Breed"])}
+    pairs = [(alias, row_of[b]) for alias, b in breed_alias_targets() if b in row_of]
+    for i, note in enumerate(df["Notes"]):
+        for m in _ALIAS_NOTE_RE.finditer(note or ""):
+            for alias in re.split(r",|\bor\b|/", m.group(1)):
+                if alias.strip():
+                    pairs.append((alias.strip(), i))
+    return pairs
+
+
+def atlas_version(df: pd.DataFrame) -> int:
+    return int(pd.util.hash_pandas_object(df, index=False).sum())
+
+
+_BREED_INDEX_CACHE: Dict[int, FuzzyIndex] = {}
+_BREED_INDEX_LOCK = threading.Lock()
+
+
+def build_breed_index(version: int, _df: pd.DataFrame) -> FuzzyIndex:
+    """Built once per atlas version (content hash) and shared across sessions."""
+    with _BREED_INDEX_LOCK:
+        cached = _BREED_INDEX_CACHE.get(version)
+        if cached is None:
+            cached = _BREED_INDEX_CACHE[version] = _build_breed_index(_df)
+        return cached
+
+
+def _build_breed_index(_df: pd.DataFrame) -> FuzzyIndex:
+    n = len(_df)
+    keys = _df["Breed"].tolist()
+    owners = list(range(n))
+    weights = [1.0] * n
+    for alias, row_i in breed_alias_keys(_df):
+        keys.append(alias)
+        owners.append(row_i)
+        weights.append(0.98)
+    for i, note in enumerate(_df["Notes"]):
+        if note:
+            keys.append(note)
+            owners.append(i)
+            weights.append(0.8)
+    return FuzzyIndex(keys, owners, weights)
+
+
+@lazy_global("BREED_INDEX")
+def breed_index() -> FuzzyIndex:
+    return build_breed_index(atlas_version(breed_df()), breed_df())
+
+
+def filter_breed_options(search: str, fci_groups: List[str], regions: List[str], sizes: List[str]) -> List[str]:
+    atlas = breed_df()
+    mask = np.ones(len(atlas), dtype=bool)
+    if fci_groups:
+        mask &= atlas["FCI Group"].isin(fci_groups).to_numpy()
+    if regions:
+        mask &= atlas["Region"].isin(regions).to_numpy()
+    if sizes:
+        mask &= atlas["Size Class"].isin(sizes).to_numpy()
+    breeds = atlas["Breed"].to_numpy()
+    if search.strip():
+        # Typo-tolerant and alias-aware, ranked best match first
+        ranked = [owner for owner, _, _ in breed_index().search(search, limit=200, owner_mask=mask)]
+        opts = breeds[ranked].tolist()
+    else:
+        opts = breeds[mask].tolist()
+    return opts if opts else ["Mixed Breed / Unknown"]
+
+
+# =========================================================
+# 2) Ingredient knowledge base (cooked-focus)
+# =========================================================
+
+@dataclass(frozen=True)
+class Ingredient:
+    name: str
+    category: str  # Meat, Veg, Carb, Oil, Treat
+    kcal_per_100g: float
+    protein_g: float
+    fat_g: float
+    carbs_g: float
+    micronote: str
+    benefits: List[str]
+    cautions: List[str]
+
+
+def build_ingredients() -> Dict[str, Ingredient]:
+    items = [
+        # --- MEATS / PROTEINS ---
+        Ingredient("Chicken (lean, cooked)", "Meat", 165, 31, 3.6, 0,
+                   "B vitamins / selenium.",
+                   ["High-quality protein", "Great base protein for rotation", "Widely available"],
+                   ["Avoid if allergy suspected", "Remove skin for lower-fat plans"]),
+        Ingredient("Turkey (lean, cooked)", "Meat", 150, 29, 2.0, 0,
+                   "Niacin / selenium.",
+                   ["Lean option for weight-aware plans", "Mild flavor", "Good GI-friendly anchor"],
+                   ["Avoid processed turkey"]),
+        Ingredient("Beef (lean, cooked)", "Meat", 200, 26, 10, 0,
+                   "Iron / zinc / B12.",
+                   ["Strong palatability", "Useful for active adults", "Supports red-blood-cell nutrition"],
+                   ["Fat varies by cut"]),
+        Ingredient("Lamb (lean, cooked)", "Meat", 206, 25, 12, 0,
+                   "Zinc / carnitine.",
+                   ["Alternative protein", "Rich taste to combat boredom", "Rotation diversity"],
+                   ["Richer profile—use caution for fat-sensitive dogs"]),
+        Ingredient("Pork (lean, cooked)", "Meat", 195, 27, 9, 0,
+                   "Thiamine-rich protein.",
+                   ["Good rotation variety", "Often highly palatable"],
+                   ["Avoid processed pork"]),
+        Ingredient("Duck (lean, cooked)", "Meat", 190, 24, 11, 0,
+                   "Flavor-forward protein.",
+                   ["Excellent for picky eaters", "Rotation variety"],
+                   ["Moderate fat"]),
+        Ingredient("Venison (lean, cooked)", "Meat", 158, 30, 3.2, 0,
+                   "Often considered a novel protein.",
+                   ["Lean alternative", "Rotation diversity"],
+                   ["Novel protein strategies should be vet-guided"]),
+        Ingredient("Rabbit (cooked)", "Meat", 173, 33, 3.5, 0,
+                   "Very lean / light protein.",
+                   ["Great for rotation", "Weight-aware option"],
+                   ["Ensure safe sourcing"]),
+        Ingredient("Egg (cooked)", "Meat", 155, 13, 11, 1.1,
+                   "Complete amino-acid profile.",
+                   ["High biological value", "Palatability booster"],
+                   ["Introduce gradually"]),
+        Ingredient("Salmon (cooked)", "Meat", 208, 20, 13, 0,
+                   "Omega-3 / vitamin D.",
+                   ["Skin and coat support", "Senior-friendly rotation"],
+                   ["Higher fat—portion carefully"]),
+        Ingredient("White Fish (cod, cooked)", "Meat", 105, 23, 0.9, 0,
+                   "Very lean protein.",
+                   ["Excellent for low-fat plans", "Gentle for sensitive stomachs"],
+                   ["Keep unseasoned"]),
+        Ingredient("Sardines (cooked, deboned)", "Meat", 208, 25, 11, 0,
+                   "Omega-3 rich mini-fish.",
+                   ["Great topper", "Highly palatable"],
+                   ["Watch sodium if canned"]),
+
+        # --- VEGETABLES ---
+        Ingredient("Pumpkin (cooked)", "Veg", 26, 1, 0.1, 6.5,
+                   "Soluble fiber / beta-carotene.",
+                   ["Supports stool quality", "Gentle gut helper", "Excellent transition vegetable"],
+                   ["Too much may dilute calories"]),
+        Ingredient("Carrot (cooked)", "Veg", 35, 0.8, 0.2, 8,
+                   "Beta-carotene.",
+                   ["Colorful antioxidant support", "Low-cal micronutrient boost"],
+                   ["Cook/soften for tiny breeds"]),
+        Ingredient("Zucchini (cooked)", "Veg", 17, 1.2, 0.3, 3.1,
+                   "Hydration-friendly veggie.",
+                   ["Great for volumizing meals", "Mild flavor"],
+                   ["Avoid seasoning"]),
+        Ingredient("Green Beans (cooked)", "Veg", 31, 1.8, 0.1, 7,
+                   "Low-cal bulk.",
+                   ["Helpful for weight management", "Gentle fiber"],
+                   []),
+        Ingredient("Broccoli (cooked)", "Veg", 34, 2.8, 0.4, 7,
+                   "Vitamin C / K.",
+                   ["Rotation-friendly antioxidants"],
+                   ["Large amounts can cause gas"]),
+        Ingredient("Cauliflower (cooked)", "Veg", 25, 1.9, 0.3, 5,
+                   "Low-cal crucifer.",
+                   ["Adds volume and variety"],
+                   ["May cause gas"]),
+        Ingredient("Bell Pepper (red, cooked)", "Veg", 31, 1, 0.3, 6,
+                   "Color-rich vitamin profile.",
+                   ["Adds antioxidant diversity"],
+                   ["Avoid spicy/seasoned"]),
+        Ingredient("Spinach (cooked, small portions)", "Veg", 23, 2.9, 0.4, 3.6,
+                   "Folate / magnesium.",
+                   ["Micronutrient accent"],
+                   ["Use small portions"]),
+        Ingredient("Kale (cooked, small portions)", "Veg", 35, 2.9, 1.5, 4.4,
+                   "Dense micronutrients.",
+                   ["Small-dose antioxidant boost"],
+                   ["Use small portions"]),
+        Ingredient("Cabbage (cooked, small portions)", "Veg", 23, 1.3, 0.1, 5.5,
+                   "Budget-friendly fiber.",
+                   ["Adds variety"],
+                   ["May cause gas"]),
+
+        # --- CARBS ---
+        Ingredient("Sweet Potato (cooked)", "Carb", 86, 1.6, 0.1, 20,
+                   "Beta-carotene / potassium.",
+                   ["Palatable controlled carb", "Great rotation energy base"],
+                   ["Portion for weight control"]),
+        Ingredient("Brown Rice (cooked)", "Carb", 123, 2.7, 1.0, 25.6,
+                   "Gentle starch base.",
+                   ["Neutral and easy-to-digest"],
+                   ["Lower for weight-loss plans"]),
+        Ingredient("White Rice (cooked)", "Carb", 130, 2.4, 0.3, 28.2,
+                   "Very gentle GI carb.",
+                   ["Useful during sensitive-stomach phases"],
+                   ["Lower micronutrients vs brown rice"]),
+        Ingredient("Oats (cooked)", "Carb", 71, 2.5, 1.4, 12,
+                   "Soluble fiber.",
+                   ["Satiety support", "Gut-friendly option"],
+                   ["Introduce gradually"]),
+        Ingredient("Quinoa (cooked)", "Carb", 120, 4.4, 1.9, 21.3,
+                   "Higher-protein pseudo-grain.",
+                   ["Adds amino-acid diversity"],
+                   ["Rinse well before cooking"]),
+        Ingredient("Barley (cooked)", "Carb", 123, 2.3, 0.4, 28,
+                   "Fiber-friendly grain.",
+                   ["Satiety-supporting carb"],
+                   ["Introduce gradually"]),
+        Ingredient("Potato (cooked, plain)", "Carb", 87, 2, 0.1, 20,
+                   "Simple starch.",
+                   ["Limited-ingredient carb option"],
+                   ["Never raw / no green parts"]),
+
+        # --- OILS ---
+        Ingredient("Fish Oil (supplemental)", "Oil", 900, 0, 100, 0,
+                   "EPA/DHA omega-3s.",
+                   ["Skin/coat support", "Joint and inflammatory balance"],
+                   ["Dose carefully"]),
+        Ingredient("Olive Oil (small amounts)", "Oil", 884, 0, 100, 0,
+                   "Monounsaturated fats.",
+                   ["Palatability booster"],
+                   ["Too much may cause GI upset"]),
+        Ingredient("Flaxseed Oil (small amounts)", "Oil", 884, 0, 100, 0,
+                   "ALA omega-3 (plant-based).",
+                   ["Rotation fat option"],
+                   ["ALA conversion is limited"]),
+
+        # --- TREATS / FRUIT TOPPERS ---
+        Ingredient("Blueberries (small portions)", "Treat", 57, 0.7, 0.3, 14.5,
+                   "Antioxidant fruit topper.",
+                   ["Light enrichment", "Palette diversity"],
+                   ["Use small portions"]),
+        Ingredient("Apple (peeled, no seeds)", "Treat", 52, 0.3, 0.2, 14,
+                   "Hydrating sweet crunch.",
+                   ["Low-cal treat topper"],
+                   ["Remove seeds/core"]),
+        Ingredient("Strawberries (small portions)", "Treat", 32, 0.7, 0.3, 7.7,
+                   "Vitamin C and flavor variety.",
+                   ["Light fruity enrichment"],
+                   ["Use small portions"]),
+    ]
+    return {i.name: i for i in items}
+
+
+INGREDIENTS = build_ingredients()
+
+# Dense per-100g macro table aligned with INGREDIENT_NAMES, for vectorized math.
+MACRO_KEYS = ("kcal", "protein", "fat", "carbs")
+INGREDIENT_NAMES = list(INGREDIENTS.keys())
+INGREDIENT_INDEX = {n: i for i, n in enumerate(INGREDIENT_NAMES)}
+INGREDIENT_CATEGORIES = np.array([i.category for i in INGREDIENTS.values()])
+MACRO_MATRIX = np.array(
+    [[i.kcal_per_100g, i.protein_g, i.fat_g, i.carbs_g] for i in INGREDIENTS.values()],
+    dtype=float,
+)
+
+# Approximate micronutrients per 100g as prepared (USDA-style reference values).
+MICRO_KEYS = ("Ca", "P", "Zn", "Fe", "Cu", "Vit A", "Vit D", "Vit E", "EPA+DHA")
+MICRO_UNITS = {
+    "Ca": "mg", "P": "mg", "Zn": "mg", "Fe": "mg", "Cu": "mg",
+    "Vit A": "µg RAE", "Vit D": "µg", "Vit E": "mg", "EPA+DHA": "mg",
+}
+MICRONUTRIENTS_PER_100G = {
+    #                                    Ca     P     Zn    Fe    Cu     A     D     E   EPA+DHA
+    "Chicken (lean, cooked)":           (15,  228,  1.0,  1.0, 0.05,    6,  0.1,  0.3,     20),
+    "Turkey (lean, cooked)":            (12,  210,  1.8,  1.2, 0.10,    0,  0.2,  0.1,     20),
+    "Beef (lean, cooked)":              (12,  200,  6.0,  2.7, 0.09,    0,  0.1,  0.4,     20),
+    "Lamb (lean, cooked)":              (14,  200,  4.5,  2.0, 0.12,    0,  0.1,  0.2,     30),
+    "Pork (lean, cooked)":              (15,  250,  2.5,  1.0, 0.08,    2,  0.6,  0.2,     10),
+    "Duck (lean, cooked)":              (12,  200,  2.6,  2.7, 0.23,   23,  0.1,  0.7,     30),
+    "Venison (lean, cooked)":           ( 7,  226,  2.8,  4.5, 0.25,    0,  0.0,  0.3,     30),
+    "Rabbit (cooked)":                  (18,  240,  2.4,  2.4, 0.20,    0,  0.0,  0.4,     50),
+    "Egg (cooked)":                     (50,  172,  1.1,  1.2, 0.01,  149,  2.2,  1.0,     40),
+    "Salmon (cooked)":                  (15,  252,  0.4,  0.3, 0.05,   13, 13.0,  1.1,   2000),
+    "White Fish (cod, cooked)":         (14,  138,  0.6,  0.5, 0.04,   14,  1.0,  0.8,    160),
+    "Sardines (cooked, deboned)":       (80,  300,  1.3,  2.9, 0.19,   32,  4.8,  2.0,   1400),
+    "Pumpkin (cooked)":                 (15,   30,  0.2,  0.6, 0.09,  288,  0.0,  0.8,      0),
+    "Carrot (cooked)":                  (30,   30,  0.2,  0.3, 0.02,  852,  0.0,  1.0,      0),
+    "Zucchini (cooked)":                (18,   40,  0.2,  0.4, 0.05,   56,  0.0,  0.1,      0),
+    "Green Beans (cooked)":             (44,   29,  0.3,  0.7, 0.06,   35,  0.0,  0.5,      0),
+    "Broccoli (cooked)":                (40,   67,  0.5,  0.7, 0.06,   77,  0.0,  1.5,      0),
+    "Cauliflower (cooked)":             (16,   32,  0.2,  0.3, 0.02,    1,  0.0,  0.1,      0),
+    "Bell Pepper (red, cooked)":        ( 7,   20,  0.2,  0.4, 0.05,  150,  0.0,  1.6,      0),
+    "Spinach (cooked, small portions)": (136,  56,  0.8,  3.6, 0.17,  524,  0.0,  2.1,      0),
+    "Kale (cooked, small portions)":    (72,   28,  0.2,  0.9, 0.16,  400,  0.0,  0.9,      0),
+    "Cabbage (cooked, small portions)": (48,   33,  0.2,  0.2, 0.02,    4,  0.0,  0.1,      0),
+    "Sweet Potato (cooked)":            (38,   54,  0.3,  0.7, 0.16,  961,  0.0,  0.7,      0),
+    "Brown Rice (cooked)":              (10,  103,  0.6,  0.6, 0.10,    0,  0.0,  0.2,      0),
+    "White Rice (cooked)":              (10,   43,  0.5,  0.2, 0.07,    0,  0.0,  0.0,      0),
+    "Oats (cooked)":                    ( 9,   77,  1.0,  0.9, 0.10,    0,  0.0,  0.1,      0),
+    "Quinoa (cooked)":                  (17,  152,  1.1,  1.5, 0.19,    0,  0.0,  0.6,      0),
+    "Barley (cooked)":                  (11,   54,  0.8,  1.3, 0.10,    0,  0.0,  0.0,      0),
+    "Potato (cooked, plain)":           ( 8,   44,  0.3,  0.3, 0.10,    0,  0.0,  0.0,      0),
+    "Fish Oil (supplemental)":          ( 0,    0,  0.0,  0.0, 0.00,    0,  0.0,  0.0,  30000),
+    "Olive Oil (small amounts)":        ( 1,    0,  0.0,  0.6, 0.00,    0,  0.0, 14.0,      0),
+    "Flaxseed Oil (small amounts)":     ( 0,    1,  0.1,  0.0, 0.00,    0,  0.0,  0.5,      0),
+    "Blueberries (small portions)":     ( 6,   12,  0.2,  0.3, 0.06,    3,  0.0,  0.6,      0),
+    "Apple (peeled, no seeds)":         ( 5,   11,  0.1,  0.1, 0.03,    2,  0.0,  0.1,      0),
+    "Strawberries (small portions)":    (16,   24,  0.1,  0.4, 0.05,    1,  0.0,  0.3,      0),
+}
+MICRO_MATRIX = np.array(
+    [MICRONUTRIENTS_PER_100G.get(n, (0.0,) * len(MICRO_KEYS)) for n in INGREDIENT_NAMES],
+    dtype=float,
+)
+
+
+def build_ingredient_df() -> pd.DataFrame:
+    rows = []
+    for ing in INGREDIENTS.values():
+        rows.append({
+            "Ingredient": ing.name,
+            "Category": ing.category,
+            "kcal/100g": ing.kcal_per_100g,
+            "Protein(g)": ing.protein_g,
+            "Fat(g)": ing.fat_g,
+            "Carbs(g)": ing.carbs_g,
+            "Micro-note": ing.micronote,
+            "Benefits": " • ".join(ing.benefits),
+            "Cautions": " • ".join(ing.cautions) if ing.cautions else "",
+        })
+    return pd.DataFrame(rows).sort_values(["Category", "Ingredient"]).reset_index(drop=True)
+
+
+@lazy_global("INGREDIENT_DF")
+def ingredient_df() -> pd.DataFrame:
+    """The encyclopedia frame, shared and read-only: copy before changing it."""
+    return shared_catalog("ingredients", build_ingredient_df)
+
+
+def filter_ingredients_by_category(cat: str) -> List[str]:
+    return [i.name for i in INGREDIENTS.values() if i.category == cat]
+
+
+LEAN_FAT_G = 4.0  # fat tiers, g fat per 100 g cooked
+HIGH_FAT_G = 10.0
+
+# Ingredient groups that rotation rules (and flags) can name instead of single ingredients.
+INGREDIENT_TAGS = {
+    "poultry": ("Chicken (lean, cooked)", "Turkey (lean, cooked)", "Duck (lean, cooked)"),
+    "red meat": ("Beef (lean, cooked)", "Lamb (lean, cooked)", "Pork (lean, cooked)", "Venison (lean, cooked)"),
+    "fish": ("Salmon (cooked)", "White Fish (cod, cooked)", "Sardines (cooked, deboned)"),
+    "oily fish": ("Salmon (cooked)", "Sardines (cooked, deboned)"),
+    "novel protein": ("Duck (lean, cooked)", "Venison (lean, cooked)", "Rabbit (cooked)"),
+    "leafy greens": ("Spinach (cooked, small portions)", "Kale (cooked, small portions)"),
+    "cruciferous": ("Broccoli (cooked)", "Cauliflower (cooked)", "Kale (cooked, small portions)",
+                    "Cabbage (cooked, small portions)"),
+    "grain": ("Brown Rice (cooked)", "White Rice (cooked)", "Oats (cooked)", "Barley (cooked)"),
+    "rice": ("Brown Rice (cooked)", "White Rice (cooked)"),
+    "root veg": ("Sweet Potato (cooked)", "Potato (cooked, plain)", "Carrot (cooked)"),
+    "common allergen": ("Beef (lean, cooked)", "Chicken (lean, cooked)", "Egg (cooked)", "Lamb (lean, cooked)"),
+    "lean": tuple(n for n in filter_ingredients_by_category("Meat") if INGREDIENTS[n].fat_g <= LEAN_FAT_G),
+    "high fat": tuple(n for n in filter_ingredients_by_category("Meat") if INGREDIENTS[n].fat_g >= HIGH_FAT_G),
+}
+
+
+# =========================================================
+# 3) Energy + life-stage logic (educational)
+# =========================================================
+
+def age_to_life_stage(age_years: float) -> str:
+    if age_years < 1:
+        return "Puppy"
+    if age_years < 7:
+        return "Adult"
+    return "Senior"
+
+
+def calc_rer(weight_kg: float) -> float:
+    return 70 * (weight_kg ** 0.75)
+
+
+LIFE_STAGES = ("Puppy", "Adult", "Senior")
+
+# MER multiplier by life stage: (intact, neutered)
+MER_BASE = {
+    "Puppy": (2.4, 2.2),
+    "Adult": (1.8, 1.6),
+    "Senior": (1.4, 1.3),
+}
+
+ACTIVITY_BOOST = {
+    "Low": 0.9,
+    "Normal": 1.0,
+    "High": 1.2,
+    "Athletic/Working": 1.35,
+}
+
+# Multiplicative energy adjustments for special considerations
+FLAG_ENERGY_ADJ = {
+    "Overweight / Weight loss goal": 0.85,
+    "Pancreatitis risk / Needs lower fat": 0.95,
+    "Kidney concern (vet-managed)": 0.95,
+}
+
+
+def mer_factor(life_stage: str, activity: str, neutered: bool) -> float:
+    intact_f, neutered_f = MER_BASE.get(life_stage, MER_BASE["Adult"])
+    base = neutered_f if neutered else intact_f
+    return base * ACTIVITY_BOOST.get(activity, 1.0)
+
+
+def energy_adjustment(special_flags: List[str]) -> float:
+    adj = 1.0
+    for flag, factor in FLAG_ENERGY_ADJ.items():
+        if flag in special_flags:
+            adj *= factor
+    return adj
+
+
+def compute_daily_energy(
+    weight_kg: float,
+    age_years: float,
+    activity: str,
+    neutered: bool,
+    special_flags: List[str]
+) -> Tuple[float, float, float, str]:
+    stage = age_to_life_stage(age_years)
+    rer = calc_rer(weight_kg)
+    mer = rer * mer_factor(stage, activity, neutered)
+
+    rationale = []
+
+    if "Overweight / Weight loss goal" in special_flags:
+        rationale.append("Weight-loss adjusted target.")
+    if "Pancreatitis risk / Needs lower fat" in special_flags:
+        rationale.append("Fat-sensitive conservative target.")
+    if "Kidney concern (vet-managed)" in special_flags:
+        rationale.append("Energy conservative; protein strategy must be vet-guided.")
+    if "Very picky eater" in special_flags:
+        rationale.append("Rotation and palatability tactics emphasized.")
+
+    mer_adj = mer * energy_adjustment(special_flags)
+    explanation = stage + (" | " + " ".join(rationale) if rationale else "")
+
+    return rer, mer, mer_adj, explanation
+
+
+def compute_daily_energy_batch(
+    weights_kg,
+    ages_years,
+    activities,
+    neutered,
+    adjustments=1.0,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Vectorized twin of compute_daily_energy for many dogs / scenarios at once.
+    All inputs broadcast against each other; `adjustments` is the product of
+    special-flag factors (see energy_adjustment). Returns (rer, mer, mer_adj).
+    """
+    w = np.asarray(weights_kg, dtype=float)
+    age = np.asarray(ages_years, dtype=float)
+    neut = np.asarray(neutered, dtype=bool).astype(int)
+    act = np.asarray(activities)
+    if act.dtype.kind in "US":
+        lookup = np.vectorize(lambda a: ACTIVITY_BOOST.get(a, 1.0), otypes=[float])
+        boost = lookup(act)
+    else:
+        boost = act.astype(float)
+
+    stage_idx = np.where(age < 1, 0, np.where(age < 7, 1, 2))
+    base_table = np.array([MER_BASE[s] for s in LIFE_STAGES], dtype=float)  # (3, 2)
+    base = base_table[stage_idx, neut]
+
+    rer = 70 * np.power(w, 0.75)
+    mer = rer * base * boost
+    mer_adj = mer * np.asarray(adjustments, dtype=float)
+    return rer, mer, mer_adj
+
+
+# =========================================================
+# 4) Ratio presets
+# =========================================================
+
+@dataclass(frozen=True)
+class RatioPreset:
+    key: str
+    label: str
+    meat_pct: int
+    veg_pct: int
+    carb_pct: int
+    note: str
+
+
+RATIO_PRESETS = [
+    RatioPreset("balanced", "Balanced Cooked Fresh (default)", 50, 35, 15,
+                "A practical cooked-fresh ratio emphasizing lean protein and diverse vegetables."),
+    RatioPreset("weight", "Weight-Aware & Satiety", 45, 45, 10,
+                "Higher vegetable volume and lower energy density."),
+    RatioPreset("active", "Active Adult Energy", 55, 25, 20,
+                "More energy support for high activity while keeping vegetables present."),
+    RatioPreset("senior", "Senior Gentle Balance", 48, 40, 12,
+                "Fiber and micronutrient focus, moderate carbs."),
+    RatioPreset("puppy", "Puppy Growth (cooked baseline)", 55, 30, 15,
+                "Growth needs are complex; long-term cooked plans require calcium/micronutrient balancing."),
+    RatioPreset("gentle_gi", "Gentle GI Rotation", 50, 40, 10,
+                "A calmer profile leaning on easy proteins and soothing fiber veggies."),
+]
+
+
+def ensure_ratio_sum(meat_pct: int, veg_pct: int, carb_pct: int) -> Tuple[int, int, int]:
+    total = meat_pct + veg_pct + carb_pct
+    if total == 100:
+        return meat_pct, veg_pct, carb_pct
+    meat = round(meat_pct / total * 100)
+    veg = round(veg_pct / total * 100)
+    carb = 100 - meat - veg
+    carb = max(0, carb)
+    if meat + veg + carb != 100:
+        diff = 100 - (meat + veg + carb)
+        meat = max(0, meat + diff)
+    return meat, veg, carb
+
+
+def estimate_food_grams_from_energy(daily_kcal: float, assumed_kcal_per_g: float) -> float:
+    return daily_kcal / assumed_kcal_per_g
+
+
+def grams_for_day(total_grams: float, meat_pct: int, veg_pct: int, carb_pct: int) -> Tuple[float, float, float]:
+    return (
+        total_grams * meat_pct / 100,
+        total_grams * veg_pct / 100,
+        total_grams * carb_pct / 100
+    )
+
+
+def day_nutrition_estimate(meat: str, veg: str, carb: str,
+                           meat_g: float, veg_g: float, carb_g: float) -> Dict[str, float]:
+    def calc(name: str, grams: float) -> Dict[str, float]:
+        ing = INGREDIENTS[name]
+        f = grams / 100.0
+        return {
+            "kcal": ing.kcal_per_100g * f,
+            "protein": ing.protein_g * f,
+            "fat": ing.fat_g * f,
+            "carbs": ing.carbs_g * f,
+        }
+    a, b, c = calc(meat, meat_g), calc(veg, veg_g), calc(carb, carb_g)
+    return {
+        "kcal": a["kcal"] + b["kcal"] + c["kcal"],
+        "protein": a["protein"] + b["protein"] + c["protein"],
+        "fat": a["fat"] + b["fat"] + c["fat"],
+        "carbs": a["carbs"] + b["carbs"] + c["carbs"],
+    }
+
+
+# =========================================================
+# 5) Conservative supplement guide (expanded)
+# =========================================================
+
+SUPPLEMENTS = [
+    {"name": "Omega-3 (Fish Oil)",
+     "why": "Supports skin/coat, joint comfort, and inflammatory balance.",
+     "best_for": ["Dry/itchy skin", "Senior dogs", "Joint-support plans"],
+     "cautions": "Dose carefully; may loosen stool. Check with vet if on clotting-related meds.",
+     "pairing": "Pairs well with lean proteins and colorful vegetables."},
+
+    {"name": "Probiotics",
+     "why": "May improve gut resilience and stool stability.",
+     "best_for": ["Sensitive stomach", "Diet transitions", "Stress-related GI changes"],
+     "cautions": "Choose canine-specific options.",
+     "pairing": "Works nicely with pumpkin and gentle proteins."},
+
+    {"name": "Prebiotic Fiber (e.g., inulin / MOS)",
+     "why": "Supports beneficial gut bacteria.",
+     "best_for": ["Soft stools", "Gut resilience goals"],
+     "cautions": "Too much can cause gas.",
+     "pairing": "Often paired with probiotics."},
+
+    {"name": "Calcium Support (home-cooked essential)",
+     "why": "Long-term home cooking commonly needs calcium balancing.",
+     "best_for": ["Puppies", "Long-term cooked routines"],
+     "cautions": "Over/under supplementation can be risky—vet nutritionist advised.",
+     "pairing": "A backbone supplement for balanced home cooking."},
+
+    {"name": "Canine Multivitamin",
+     "why": "Helps cover micronutrient gaps in simplified routines.",
+     "best_for": ["Limited ingredient variety", "Busy weekly batch cooking"],
+     "cautions": "Avoid human multivitamins unless approved.",
+     "pairing": "Best with rotation-based weeks."},
+
+    {"name": "Joint Support (Glucosamine / Chondroitin / UC-II)",
+     "why": "May support mobility and cartilage comfort.",
+     "best_for": ["Large breeds", "Senior dogs", "Highly active dogs"],
+     "cautions": "Effects vary and take time.",
+     "pairing": "Combine with weight control and omega-3."},
+
+    {"name": "Vitamin E (as guided)",
+     "why": "Antioxidant support often used alongside omega-3.",
+     "best_for": ["Dogs on long-term fish oil"],
+     "cautions": "Avoid excessive dosing.",
+     "pairing": "Consider with fatty-acid protocols."},
+
+    {"name": "Dental Additives (vet-approved)",
+     "why": "Supports plaque control when brushing is difficult.",
+     "best_for": ["Small breeds", "Dental-prone dogs"],
+     "cautions": "Not a substitute for brushing.",
+     "pairing": "Pair with safe chewing strategies."},
+
+    {"name": "L-Carnitine (vet-guided)",
+     "why": "May assist some weight or cardiac strategies.",
+     "best_for": ["Vet-supervised weight plans"],
+     "cautions": "Use under professional advice.",
+     "pairing": "Best with lean protein + veggie-forward ratios."},
+]
+
+
+# =========================================================
+# 6) Personalized ingredient recommendations
+# =========================================================
+
+DIET_STAGES = ("Puppy", "Adult", "Senior")
+# Flags the diet rules act on; other sidebar flags only change energy or stay informational.
+DIET_FLAGS = (
+    "Sensitive stomach",
+    "Skin/coat concern",
+    "Overweight / Weight loss goal",
+    "Pancreatitis risk / Needs lower fat",
+    "Food allergy suspected",
+    "Joint/mobility support focus",
+)
+
+# (life stage or None, flag or None, "add" | "drop", ingredients and INGREDIENT_TAGS groups).
+# Within a category, suggestions keep the order they are first added in; drops win over adds.
+DIET_RULES: Tuple[Tuple[Optional[str], Optional[str], str, Tuple[str, ...]], ...] = (
+    (None, None, "add", (
+        "Turkey (lean, cooked)", "White Fish (cod, cooked)", "Chicken (lean, cooked)", "Egg (cooked)",
+        "Beef (lean, cooked)",
+        "Pumpkin (cooked)", "Zucchini (cooked)", "Green Beans (cooked)", "Carrot (cooked)",
+        "Bell Pepper (red, cooked)",
+        "Sweet Potato (cooked)", "Brown Rice (cooked)", "Oats (cooked)", "Quinoa (cooked)",
+        "Blueberries (small portions)", "Apple (peeled, no seeds)", "Strawberries (small portions)",
+    )),
+    ("Puppy", None, "add", ("Chicken (lean, cooked)", "Beef (lean, cooked)", "White Rice (cooked)")),
+    ("Senior", None, "add", ("White Fish (cod, cooked)", "Salmon (cooked)", "Pumpkin (cooked)")),
+    (None, "Sensitive stomach", "add", (
+        "Turkey (lean, cooked)", "White Fish (cod, cooked)", "Pumpkin (cooked)", "White Rice (cooked)",
+        "Oats (cooked)",
+    )),
+    (None, "Skin/coat concern", "add", ("oily fish", "Blueberries (small portions)")),
+    (None, "Overweight / Weight loss goal", "add", (
+        "Turkey (lean, cooked)", "White Fish (cod, cooked)", "Rabbit (cooked)",
+        "Green Beans (cooked)", "Zucchini (cooked)", "Cauliflower (cooked)",
+    )),
+    (None, "Pancreatitis risk / Needs lower fat", "drop", ("high fat",)),
+    (None, "Pancreatitis risk / Needs lower fat", "add", ("Turkey (lean, cooked)", "White Fish (cod, cooked)")),
+    (None, "Food allergy suspected", "drop", ("common allergen",)),
+    (None, "Food allergy suspected", "add", ("novel protein",)),
+    (None, "Joint/mobility support focus", "add", ("oily fish",)),
+)
+RECOMMENDATION_CATEGORIES = ("Meat", "Veg", "Carb", "Treat")
+
+
+def diet_rule_targets(targets: Tuple[str, ...]) -> List[str]:
+    """Ingredient names of a rule, with INGREDIENT_TAGS groups expanded in place."""
+    names = []
+    for t in targets:
+        names.extend(INGREDIENT_TAGS.get(t, (t,)))
+    unknown = [n for n in names if n not in INGREDIENTS]
+    if unknown:
+        raise ValueError(f"diet rule names unknown ingredients: {', '.join(unknown)}")
+    return list(dict.fromkeys(names))
+
+
+@dataclass(frozen=True)
+class DietProfile:
+    recommendations: Dict[str, Tuple[str, ...]]  # category -> suggestions, in rule order
+    boosted: Tuple[str, ...]  # suggestions only there because of a flag
+    avoid: Tuple[str, ...]  # dropped by a flag; kept out of the add-on pools too
+    # Rotation pools per category (see rotation_pools): suggestions first, then
+    # every other item that is not avoided; and just the items not avoided.
+    addon_pools: Dict[str, Tuple[str, ...]] = field(default_factory=dict)
+    open_pools: Dict[str, Tuple[str, ...]] = field(default_factory=dict)
+
+
+class DietTable:
+    """
+    DIET_RULES compiled once for every (life stage, flag set) combination.
+    Row `stage * 2**len(DIET_FLAGS) + flag_bits` holds boolean allowed /
+    boosted / avoid masks over INGREDIENTS and each ingredient's rank, so a
+    lookup is an index plus (once per combination) turning masks into lists.
+    """
+
+    def __init__(self, rules=DIET_RULES):
+        self.names = list(INGREDIENTS)
+        col = {n: j for j, n in enumerate(self.names)}
+        n_rules, n_items = len(rules), len(self.names)
+        add = np.zeros((n_rules, n_items), dtype=bool)
+        drop = np.zeros((n_rules, n_items), dtype=bool)
+        rank = np.full((n_rules, n_items), np.iinfo(np.int64).max, dtype=np.int64)
+        for r, (_, _, action, targets) in enumerate(rules):
+            cols = [col[n] for n in diet_rule_targets(targets)]
+            (add if action == "add" else drop)[r, cols] = True
+            rank[r, cols] = r * n_items + np.arange(len(cols))
+
+        n_flags = len(DIET_FLAGS)
+        combo = np.arange(len(DIET_STAGES) << n_flags)
+        rule_stage = np.array([DIET_STAGES.index(st) if st else -1 for st, _, _, _ in rules])
+        rule_flag = np.array([1 << DIET_FLAGS.index(fl) if fl else 0 for _, fl, _, _ in rules])
+        active = (((rule_stage < 0) | (rule_stage == (combo >> n_flags)[:, None]))
+                  & ((rule_flag == 0) | ((combo[:, None] & rule_flag) != 0)))
+        adds = active[:, :, None] & add[None]
+        self.avoid = (active[:, :, None] & drop[None]).any(axis=1)
+        self.allowed = adds.any(axis=1) & ~self.avoid
+        self.boosted = adds[:, rule_flag != 0].any(axis=1) & ~adds[:, rule_flag == 0].any(axis=1) & self.allowed
+        self.rank = np.where(adds, rank[None], np.iinfo(np.int64).max).min(axis=1)
+        self.category = [INGREDIENTS[n].category for n in self.names]
+        self._profiles: Dict[int, DietProfile] = {}
+
+    @staticmethod
+    def row(stage: str, special_flags: List[str]) -> int:
+        """Unknown stages fall back to the adult rules; flags without rules are ignored."""
+        s = DIET_STAGES.index(stage) if stage in DIET_STAGES else DIET_STAGES.index("Adult")
+        bits = sum(1 << DIET_FLAGS.index(f) for f in set(special_flags) if f in DIET_FLAGS)
+        return (s << len(DIET_FLAGS)) | bits
+
+    def profile(self, stage: str, special_flags: List[str]) -> DietProfile:
+        i = self.row(stage, special_flags)
+        found = self._profiles.get(i)
+        if found is None:
+            order = [j for j in np.argsort(self.rank[i], kind="stable") if self.allowed[i, j]]
+            recommendations = {c: tuple(self.names[j] for j in order if self.category[j] == c)
+                               for c in RECOMMENDATION_CATEGORIES}
+            open_pools, addon_pools = {}, {}
+            for c in ROTATION_CATEGORIES:
+                in_cat = INGREDIENT_CATEGORIES == c
+                open_pools[c] = tuple(self.names[j] for j in np.flatnonzero(in_cat & ~self.avoid[i]))
+                rest = np.flatnonzero(in_cat & ~self.avoid[i] & ~self.allowed[i])
+                addon_pools[c] = recommendations[c] + tuple(self.names[j] for j in rest)
+            found = DietProfile(
+                recommendations=recommendations,
+                boosted=tuple(self.names[j] for j in order if self.boosted[i, j]),
+                avoid=tuple(n for n, a in zip(self.names, self.avoid[i]) if a),
+                addon_pools=addon_pools,
+                open_pools=open_pools,
+            )
+            self._profiles[i] = found
+        return found
+
+
+@lazy_global("DIET_TABLE")
+def diet_table() -> DietTable:
+    return DietTable()
+
+
+def diet_profile(stage: str, special_flags: List[str]) -> DietProfile:
+    return diet_table().profile(stage, special_flags)
+
+
+def recommend_ingredients(stage: str, special_flags: List[str]) -> Dict[str, List[str]]:
+    """Suggestions per category plus "Avoid" (flag-dropped items the planner pools leave out)."""
+    prof = diet_profile(stage, special_flags)
+    recs = {c: list(v) for c, v in prof.recommendations.items()}
+    recs["Avoid"] = list(prof.avoid)
+    return recs
+
+
+# =========================================================
+# 7) Taste learning (single-dog session friendly)
+# =========================================================
+
+def pref_score_from_label(p: str) -> int:
+    return {"Dislike": 0, "Neutral": 1, "Like": 2, "Love": 3}.get(p, 1)
+
+
+def preference_maps(entries: List[Dict]) -> Tuple[Dict[str, float], Dict[str, float]]:
+    """Posterior mean taste score per logged protein and per logged veg (see PreferenceModel)."""
+    if not entries:
+        return {}, {}
+    return PreferenceModel.from_entries(entries).mean_scores()
+
+
+PREFERENCE_LABELS = ("Dislike", "Neutral", "Like", "Love")
+PREFERENCE_SCORES = np.arange(len(PREFERENCE_LABELS), dtype=float)  # 0..3, as pref_score_from_label
+# Dirichlet pseudo-counts every ingredient starts from: worth 2.5 observations,
+# leaning Neutral, so one "Love" moves the mean far less than ten "Neutral"s.
+PREFERENCE_PRIOR = np.array([0.5, 1.0, 0.5, 0.5])
+PREFERENCE_HALF_LIFE_DAYS = 120.0
+# How many observations a protein x veg pair needs before its own
+# evidence outweighs the veg's overall posterior.
+PAIR_PRIOR_STRENGTH = 4.0
+MIN_EVIDENCE = 0.05
+
+
+def epoch_days(ts) -> float:
+    ts = pd.Timestamp(ts)
+    if ts.tzinfo is None:
+        ts = ts.tz_localize("UTC")
+    return (ts - pd.Timestamp(0, tz="UTC")).total_seconds() / 86_400.0
+
+
+class PreferenceModel:
+    """
+    Per-dog Bayesian taste model.
+
+    - Each protein and each veg has a Dirichlet posterior over the four
+      preference labels; counts are time-decayed with a half-life, so old
+      entries fade instead of counting forever.
+    - A protein x veg Dirichlet per pair, shrunk toward the veg's own
+      posterior, captures interactions ("loves carrots, but not with fish").
+    - Counts are kept "as of" the newest entry and rescaled when time moves,
+      so adding an entry is O(1) plus one rescale, never a full refit.
+
+    The rotation engines Thompson-sample weights from the posteriors per day
+    (sample_weights) instead of using a fixed mean.
+    """
+
+    def __init__(self, half_life_days: float = PREFERENCE_HALF_LIFE_DAYS,
+                 prior: Optional[Tuple[np.ndarray, np.ndarray]] = None):
+        self.half_life_days = float(half_life_days)
+        self.meats = filter_ingredients_by_category("Meat")
+        self.vegs = filter_ingredients_by_category("Veg")
+        self.meat_prior, self.veg_prior = prior if prior is not None else (
+            np.broadcast_to(PREFERENCE_PRIOR, (len(self.meats), len(PREFERENCE_LABELS))),
+            np.broadcast_to(PREFERENCE_PRIOR, (len(self.vegs), len(PREFERENCE_LABELS))),
+        )
+        self.meat_col = {n: i for i, n in enumerate(self.meats)}
+        self.veg_col = {n: i for i, n in enumerate(self.vegs)}
+        self.meat_counts = np.zeros((len(self.meats), len(PREFERENCE_LABELS)))
+        self.veg_counts = np.zeros((len(self.vegs), len(PREFERENCE_LABELS)))
+        self.pair_counts = np.zeros((len(self.meats), len(self.vegs), len(PREFERENCE_LABELS)))
+        self.as_of: Optional[float] = None  # epoch days the counts are expressed at
+        self.entries = 0
+
+    # ---- updates -------------------------------------------------------
+
+    @classmethod
+    def from_entries(cls, entries, half_life_days: float = PREFERENCE_HALF_LIFE_DAYS,
+                     prior: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> "PreferenceModel":
+        model = cls(half_life_days, prior)
+        df = entries if isinstance(entries, pd.DataFrame) else pd.DataFrame(list(entries))
+        if not df.empty:
+            model.update_frame(df)
+        return model
+
+    def update(self, entry: Dict) -> None:
+        """Add one taste-log entry."""
+        self.update_frame(pd.DataFrame([entry]))
+
+    def update_frame(self, df: pd.DataFrame) -> None:
+        """Add a batch of taste-log rows in one vectorized pass."""
+        n = len(df)
+        if n == 0:
+            return
+
+        def col(name):
+            return df[name] if name in df.columns else pd.Series([None] * n, index=df.index)
+
+        meat = col("Protein").map(self.meat_col).fillna(-1).to_numpy(dtype=np.int64)
+        veg = col("Veg").map(self.veg_col).fillna(-1).to_numpy(dtype=np.int64)
+        label = col("Preference").map(pref_score_from_label).fillna(1).to_numpy(dtype=np.int64)
+        when = pd.to_datetime(col("Logged"), errors="coerce", format="ISO8601", utc=True)
+        t = ((when - pd.Timestamp(0, tz="UTC")).dt.total_seconds() / 86_400.0).to_numpy(dtype=float)
+
+        newest = np.nanmax(t) if np.isfinite(t).any() else np.nan
+        if np.isfinite(newest) and (self.as_of is None or newest > self.as_of):
+            self._decay_counts(newest)
+        # undated rows count as logged "now" (at the newest time seen)
+        w = np.ones(n) if self.as_of is None else np.where(np.isnan(t), 1.0, self._decay(self.as_of - t))
+
+        m_ok, v_ok = meat >= 0, veg >= 0
+        np.add.at(self.meat_counts, (meat[m_ok], label[m_ok]), w[m_ok])
+        np.add.at(self.veg_counts, (veg[v_ok], label[v_ok]), w[v_ok])
+        both = m_ok & v_ok
+        np.add.at(self.pair_counts, (meat[both], veg[both], label[both]), w[both])
+        self.entries += n
+
+    def _decay(self, dt_days) -> np.ndarray:
+        return np.power(0.5, np.maximum(dt_days, 0.0) / self.half_life_days)
+
+    def _decay_counts(self, to_days: float) -> None:
+        if self.as_of is not None:
+            f = self._decay(to_days - self.as_of)
+            self.meat_counts *= f
+            self.veg_counts *= f
+            self.pair_counts *= f
+        self.as_of = float(to_days)
+
+    def decayed(self, now_days: float) -> "PreferenceModel":
+        """A copy with counts faded to `now_days`; safe to hand to a worker thread."""
+        out = PreferenceModel.__new__(PreferenceModel)
+        out.__dict__.update(self.__dict__)
+        out.meat_counts = self.meat_counts.copy()
+        out.veg_counts = self.veg_counts.copy()
+        out.pair_counts = self.pair_counts.copy()
+        if self.as_of is not None and now_days > self.as_of:
+            out._decay_counts(now_days)
+        return out
+
+    def with_prior(self, prior: Optional[Tuple[np.ndarray, np.ndarray]]) -> "PreferenceModel":
+        """Same evidence on a different prior (e.g. a group prior from TastePriors)."""
+        if prior is None:
+            return self
+        out = PreferenceModel.__new__(PreferenceModel)
+        out.__dict__.update(self.__dict__)
+        out.meat_prior, out.veg_prior = prior
+        return out
+
+    # ---- posteriors ----------------------------------------------------
+
+    def posteriors(self) -> Tuple[np.ndarray, np.ndarray]:
+        return self.meat_prior + self.meat_counts, self.veg_prior + self.veg_counts
+
+    def mean_scores(self) -> Tuple[Dict[str, float], Dict[str, float]]:
+        """Posterior mean score (0..3) for every ingredient with any evidence left."""
+        out = []
+        for names, counts, alpha in zip((self.meats, self.vegs), (self.meat_counts, self.veg_counts),
+                                        self.posteriors()):
+            mean = alpha @ PREFERENCE_SCORES / alpha.sum(axis=1)
+            seen = counts.sum(axis=1) > MIN_EVIDENCE
+            out.append({names[i]: float(mean[i]) for i in np.flatnonzero(seen)})
+        return out[0], out[1]
+
+    def interaction(self) -> np.ndarray:
+        """
+        (meats, vegs) multiplier on a veg's weight given the day's protein.
+        1.0 wherever a pair has no evidence of its own.
+        """
+        _, veg_alpha = self.posteriors()
+        base = PAIR_PRIOR_STRENGTH * veg_alpha / veg_alpha.sum(axis=1, keepdims=True)
+        base = np.broadcast_to(base, self.pair_counts.shape)
+        post = base + self.pair_counts
+        pair_score = post @ PREFERENCE_SCORES / post.sum(axis=-1)
+        base_score = base @ PREFERENCE_SCORES / PAIR_PRIOR_STRENGTH
+        ratio = np.clip((0.25 + pair_score) / (0.25 + base_score), 0.25, 4.0)
+        return np.where(self.pair_counts.sum(axis=-1) > 0, ratio, 1.0)
+
+    def sample_weights(self, rng: np.random.Generator, days: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Thompson draws: (days, meats) and (days, vegs) rotation weights, one
+        independent posterior sample per day, mapped like taste_weight
+        (score 0..3 -> weight 0.25..3.25).
+        """
+        out = []
+        for alpha in self.posteriors():
+            g = rng.standard_gamma(np.broadcast_to(alpha, (days,) + alpha.shape))
+            p = g / g.sum(axis=-1, keepdims=True)
+            out.append(0.25 + p @ PREFERENCE_SCORES)
+        return out[0], out[1]
+
+    def score_summary(self, draws: int = 400, seed: int = 0) -> pd.DataFrame:
+        """Posterior mean and 80% credible interval of the score for logged ingredients."""
+        rng = np.random.default_rng(seed)
+        rows = []
+        for kind, names, counts, alpha in zip(("Protein", "Veg"), (self.meats, self.vegs),
+                                              (self.meat_counts, self.veg_counts), self.posteriors()):
+            seen = np.flatnonzero(counts.sum(axis=1) > MIN_EVIDENCE)
+            if seen.size == 0:
+                continue
+            g = rng.standard_gamma(np.broadcast_to(alpha[seen], (draws, seen.size, alpha.shape[1])))
+            score = (g / g.sum(axis=-1, keepdims=True)) @ PREFERENCE_SCORES
+            lo, hi = np.percentile(score, [10, 90], axis=0)
+            for j, i in enumerate(seen):
+                rows.append({
+                    "Kind": kind, "Ingredient": names[i],
+                    "Mean score": float(alpha[i] @ PREFERENCE_SCORES / alpha[i].sum()),
+                    "Low": float(lo[j]), "High": float(hi[j]),
+                    "Effective entries": float(counts[i].sum()),
+                })
+        return pd.DataFrame(rows, columns=["Kind", "Ingredient", "Mean score", "Low", "High", "Effective entries"])
+
+    def signature(self) -> Tuple:
+        # Rounded so float noise from rescaling never invalidates a plan.
+        return (
+            self.half_life_days,
+            tuple(np.round(self.meat_prior, 4).ravel()),
+            tuple(np.round(self.veg_prior, 4).ravel()),
+            tuple(np.round(self.meat_counts, 4).ravel()),
+            tuple(np.round(self.veg_counts, 4).ravel()),
+            tuple(np.round(self.pair_counts[self.pair_counts.sum(axis=-1) > 0], 4).ravel()),
+            tuple(np.flatnonzero(self.pair_counts.sum(axis=-1).ravel() > 0)),
+        )
+
+
+def taste_dog_key(dog_name) -> str:
+    # Taste-log rows carry only the dog's name; match it loosely.
+    return str(dog_name or "").strip().casefold()
+
+
+def dog_taste_entries(entries, dog_name: str) -> List[Dict]:
+    """The taste-log entries logged for one dog (a session log holds every dog's rows)."""
+    key = taste_dog_key(dog_name)
+    return [e for e in entries if taste_dog_key(e.get("Dog Name")) == key]
+
+
+def taste_model_rng(seed: int, key: str = "") -> np.random.Generator:
+    # Separate stream from the rotation uniforms, so switching the model on
+    # or off does not reshuffle the underlying draws.
+    return np.random.default_rng(np.random.SeedSequence([int(seed), zlib.crc32(str(key).encode("utf-8")), 1]))
+
+
+# Collaborative priors: per (size class, FCI group, life stage) score tables
+# learned offline from many dogs' logs by tools/build_taste_priors.py.
+TASTE_PRIORS_FILE = "taste_priors.csv"
+TASTE_PRIOR_COLUMNS = ["Size Class", "FCI Group", "Life Stage", "Kind", "Ingredient", "Score", "Dogs"]
+ANY_GROUP = "*"
+# A learned prior is worth this many entries; the floor keeps every label possible.
+GROUP_PRIOR_STRENGTH = 3.0
+GROUP_PRIOR_FLOOR = 0.1
+
+
+def prior_from_scores(scores: np.ndarray, strength: float = GROUP_PRIOR_STRENGTH) -> np.ndarray:
+    """
+    (n, 4) Dirichlet pseudo-counts centred on each expected score (0..3):
+    the mass sits on the two labels around the score, plus a small floor.
+    """
+    scores = np.clip(np.asarray(scores, dtype=float), 0.0, PREFERENCE_SCORES[-1])
+    lo = np.minimum(np.floor(scores).astype(int), len(PREFERENCE_LABELS) - 2)
+    frac = scores - lo
+    mass = np.zeros((scores.size, len(PREFERENCE_LABELS)))
+    rows = np.arange(scores.size)
+    mass[rows, lo] = 1.0 - frac
+    mass[rows, lo + 1] = frac
+    floor = GROUP_PRIOR_FLOOR * len(PREFERENCE_LABELS)
+    return GROUP_PRIOR_FLOOR + (strength - floor) * mass
+
+
+class TastePriors:
+    """
+    Group prior lookup. All pseudo-count arrays are built once at load, so a
+    lookup is a handful of dict probes, backing off from the exact
+    (size, FCI group, stage) to coarser groups and finally to everyone.
+    """
+
+    def __init__(self, table: pd.DataFrame):
+        meats = filter_ingredients_by_category("Meat")
+        vegs = filter_ingredients_by_category("Veg")
+        base = {"Protein": meats, "Veg": vegs}
+        self.priors: Dict[Tuple[str, str, str], Tuple[np.ndarray, np.ndarray]] = {}
+        self.dogs: Dict[Tuple[str, str, str], int] = {}
+        for key, grp in table.groupby(["Size Class", "FCI Group", "Life Stage"], sort=False):
+            arrays = []
+            for kind, names in base.items():
+                scores = grp[grp["Kind"] == kind].set_index("Ingredient")["Score"]
+                # ingredients the group never logged keep the neutral-leaning default
+                alpha = np.array(np.broadcast_to(PREFERENCE_PRIOR, (len(names), len(PREFERENCE_LABELS))))
+                known = np.array([n in scores.index for n in names])
+                if known.any():
+                    alpha[known] = prior_from_scores(scores.reindex([n for n in names if n in scores.index]).to_numpy())
+                arrays.append(alpha)
+            self.priors[key] = (arrays[0], arrays[1])
+            self.dogs[key] = int(grp["Dogs"].max())
+
+    def group_key(self, breed: str, age_years: float) -> Tuple[str, str, str]:
+        meta = breed_meta().get(breed, {})
+        return (meta.get("Size Class") or "Unknown", meta.get("FCI Group") or "N/A", age_to_life_stage(float(age_years)))
+
+    def resolve(self, breed: str, age_years: float) -> Optional[Tuple[str, str, str]]:
+        """The most specific group with a learned prior."""
+        size, fci, stage = self.group_key(breed, age_years)
+        for key in ((size, fci, stage), (size, ANY_GROUP, stage), (ANY_GROUP, ANY_GROUP, stage),
+                    (ANY_GROUP, ANY_GROUP, ANY_GROUP)):
+            if key in self.priors:
+                return key
+        return None
+
+    def lookup(self, breed: str, age_years: float) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        key = self.resolve(breed, age_years)
+        return None if key is None else self.priors[key]
+
+    def describe(self, breed: str, age_years: float) -> Optional[str]:
+        key = self.resolve(breed, age_years)
+        if key is None:
+            return None
+        label = " · ".join(k for k in key if k != ANY_GROUP) or "all dogs"
+        return f"{label} ({self.dogs[key]:,} dogs)"
+
+
+def load_taste_priors(path: Optional[str] = None) -> Optional[TastePriors]:
+    """data/taste_priors.csv if present and readable; None means the plain default prior."""
+    path = path or os.path.join(DATA_DIR, TASTE_PRIORS_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        table = pd.read_csv(path, dtype={"Size Class": str, "FCI Group": str, "Life Stage": str,
+                                         "Kind": str, "Ingredient": str}, keep_default_na=False)
+        if not set(TASTE_PRIOR_COLUMNS) <= set(table.columns) or table.empty:
+            return None
+        table["Score"] = pd.to_numeric(table["Score"], errors="coerce")
+        table["Dogs"] = pd.to_numeric(table["Dogs"], errors="coerce").fillna(0).astype(int)
+        table = table.dropna(subset=["Score"])
+        return TastePriors(table) if not table.empty else None
+    except Exception:
+        return None
+
+
+@lazy_global("TASTE_PRIORS")
+def taste_priors() -> Optional[TastePriors]:
+    return load_taste_priors()
+
+
+def taste_prior_for(breed: str, age_years: float) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """The learned group prior for a dog, or None when no priors file is installed."""
+    priors = taste_priors()
+    return priors.lookup(breed, age_years) if priors is not None else None
+
+
+def weighted_choice(rng: random.Random, items: List[str], weights: List[float]) -> str:
+    if not items:
+        raise ValueError("weighted_choice received empty items")
+    if len(items) != len(weights):
+        raise ValueError("weighted_choice items/weights mismatch")
+    total = sum(max(0.0, w) for w in weights)
+    if total <= 0:
+        return rng.choice(items)
+    r = rng.random() * total
+    acc = 0.0
+    for item, w in zip(items, weights):
+        w = max(0.0, w)
+        acc += w
+        if r <= acc:
+            return item
+    return items[-1]
+
+
+def taste_weight(name: str, taste_map: Dict[str, float], use_taste_weights: bool = True) -> float:
+    if not use_taste_weights:
+        return 1.0
+    s = taste_map.get(name)
+    if s is None:
+        return 1.0
+    return max(0.25, 0.25 + float(s))  # 0..3 -> 0.25..3.25
+
+
+def choose_with_variety(
+    rng: random.Random,
+    pool: List[str],
+    last: Optional[str],
+    last2: Optional[str],
+    taste_map: Dict[str, float],
+    use_taste_weights: bool,
+    extra_weight: Optional[Dict[str, float]] = None,
+) -> str:
+    candidates = pool[:]
+    # prevent boredom: avoid repeating the same ingredient too many days in a row
+    if last and last2 and last == last2:
+        filtered = [x for x in candidates if x != last]
+        if filtered:
+            candidates = filtered
+    if last and len(candidates) > 1:
+        filtered = [x for x in candidates if x != last]
+        if filtered:
+            candidates = filtered
+    weights = [taste_weight(x, taste_map, use_taste_weights) for x in candidates]
+    if extra_weight:
+        weights = [w * extra_weight.get(x, 1.0) for x, w in zip(candidates, weights)]
+    return weighted_choice(rng, candidates, weights)
+
+
+_OPEN_POOLS: Dict[frozenset, Dict[str, Tuple[str, ...]]] = {}
+
+
+def open_rotation_pools(avoid: frozenset) -> Dict[str, Tuple[str, ...]]:
+    """Every item of each rotation category except `avoid`, in catalog order (memoized per avoid set)."""
+    found = _OPEN_POOLS.get(avoid)
+    if found is None:
+        keep = ~np.isin(INGREDIENT_NAMES, list(avoid))
+        found = _OPEN_POOLS[avoid] = {
+            c: tuple(INGREDIENT_NAMES[j] for j in np.flatnonzero((INGREDIENT_CATEGORIES == c) & keep))
+            for c in ROTATION_CATEGORIES
+        }
+    return found
+
+
+def rotation_pools(
+    pantry_meats: List[str],
+    pantry_vegs: List[str],
+    pantry_carbs: List[str],
+    allow_new: bool,
+    recommendations: Union[Dict[str, List[str]], DietProfile],
+) -> Tuple[List[str], List[str], List[str]]:
+    """
+    (meat, veg, carb) pools: with add-ons, the pantry then the suggestions then
+    the rest of the category; pantry-only, the pantry (the whole category when
+    empty). Flag-dropped items ("Avoid") stay out of the add-ons; the owner's
+    own pantry is kept as is. A DietProfile brings its pools precompiled from
+    the DietTable masks, so an empty pantry costs nothing and dogs sharing a
+    profile share pool objects; a plain recommendations dict (as from
+    recommend_ingredients) is compiled on the spot.
+    """
+    if isinstance(recommendations, DietProfile):
+        addons, everything = recommendations.addon_pools, recommendations.open_pools
+    else:
+        everything = open_rotation_pools(frozenset(recommendations.get("Avoid", ())))
+        addons = {c: tuple(dict.fromkeys([*recommendations.get(c, ()), *everything[c]]))
+                  for c in ROTATION_CATEGORIES}
+
+    pools = []
+    for c, pantry in zip(ROTATION_CATEGORIES, (pantry_meats, pantry_vegs, pantry_carbs)):
+        if allow_new:
+            pools.append(list(dict.fromkeys([*pantry, *addons[c]])) if pantry else addons[c])
+        else:
+            pools.append(pantry if pantry else everything[c])
+    return pools[0], pools[1], pools[2]
+
+
+def pick_rotation_smart(
+    pantry_meats: List[str],
+    pantry_vegs: List[str],
+    pantry_carbs: List[str],
+    allow_new: bool,
+    recommendations: Dict[str, List[str]],
+    taste_meat_map: Dict[str, float],
+    taste_veg_map: Dict[str, float],
+    use_taste_weights: bool,
+    days: int = 7,
+    seed: int = 42,
+    taste_model: Optional["PreferenceModel"] = None,
+    rules: Optional["RotationRules"] = None,
+    start_weekday: int = 0,
+) -> List[Dict[str, str]]:
+    """
+    Variety-aware rotation. With a taste_model (and taste weighting on), each
+    day's protein/veg weights are a fresh Thompson draw from the posteriors,
+    and the veg weights are scaled by the protein x veg interaction. With
+    `rules`, each slot draws only from the ingredients the rules allow that
+    day (day 1 falls on `start_weekday`, 0 = Monday).
+    """
+    rng = random.Random(seed)
+
+    all_carbs = filter_ingredients_by_category("Carb")
+    meat_pool, veg_pool, carb_pool = rotation_pools(
+        pantry_meats, pantry_vegs, pantry_carbs, allow_new, recommendations
+    )
+
+    def choose(pool: List[str], last: Optional[str], last2: Optional[str], taste_map: Dict[str, float],
+               extra_weight: Optional[Dict[str, float]] = None) -> str:
+        return choose_with_variety(rng, pool, last, last2, taste_map, use_taste_weights, extra_weight)
+
+    sampled = None
+    if taste_model is not None and use_taste_weights:
+        meat_w, veg_w = taste_model.sample_weights(taste_model_rng(seed), days)
+        sampled = (meat_w, veg_w, taste_model.interaction())
+        taste_meat_map = taste_veg_map = {}
+
+    tracker = rules.tracker(1, start_weekday) if rules else None
+
+    def allowed(k: int, pool: List[str]) -> List[str]:
+        return pool if tracker is None else tracker.allowed_names(k, pool)
+
+    def record(k: int, name: str) -> None:
+        if tracker is not None:
+            tracker.record(k, np.array([rules.local[k][name]]))
+
+    plan = []
+    last_meat = last_meat2 = None
+    last_veg = last_veg2 = None
+
+    for d in range(days):
+        if sampled is None:
+            meat = choose(allowed(0, meat_pool), last_meat, last_meat2, taste_meat_map)
+            record(0, meat)
+            veg = choose(allowed(1, veg_pool), last_veg, last_veg2, taste_veg_map)
+        else:
+            meat_w, veg_w, inter = sampled
+            meat = choose(allowed(0, meat_pool), last_meat, last_meat2, {},
+                          dict(zip(taste_model.meats, meat_w[d])))
+            record(0, meat)
+            row = inter[taste_model.meat_col[meat]] if meat in taste_model.meat_col else 1.0
+            veg = choose(allowed(1, veg_pool), last_veg, last_veg2, {},
+                         dict(zip(taste_model.vegs, veg_w[d] * row)))
+        record(1, veg)
+        carb = rng.choice(allowed(2, carb_pool)) if carb_pool else rng.choice(all_carbs)
+        record(2, carb)
+        if tracker is not None:
+            tracker.next_day()
+
+        plan.append({"Meat": meat, "Veg": veg, "Carb": carb})
+
+        last_meat2, last_meat = last_meat, meat
+        last_veg2, last_veg = last_veg, veg
+
+    return plan
+
+
+ROTATION_CATEGORIES = ("Meat", "Veg", "Carb")
+
+
+def rotation_stream_uniforms(dog_keys: List[str], seed: int, days: int, draws: int) -> np.ndarray:
+    """
+    (dogs, days, draws) uniforms, one independent NumPy stream per dog seeded
+    from (seed, dog key). A dog's draws never depend on who else is in the batch.
+    """
+    out = np.empty((len(dog_keys), days, draws))
+    for i, key in enumerate(dog_keys):
+        ss = np.random.SeedSequence([int(seed), zlib.crc32(str(key).encode("utf-8"))])
+        out[i] = np.random.default_rng(ss).random((days, draws))
+    return out
+
+
+def pool_masks(pools: List[List[str]], universe: List[str]) -> np.ndarray:
+    """(dogs, len(universe)) membership masks; an empty pool means the whole category."""
+    col = {name: j for j, name in enumerate(universe)}
+    masks = np.zeros((len(pools), len(universe)), dtype=bool)
+    cols: Dict[int, List[int]] = {}
+    for i, pool in enumerate(pools):
+        if id(pool) not in cols:
+            cols[id(pool)] = [col[x] for x in pool if x in col]
+        masks[i, cols[id(pool)]] = True
+    masks[~masks.any(axis=1)] = True
+    return masks
+
+
+def taste_weight_rows(universe: List[str], taste_maps: List[Dict[str, float]], use_taste_weights: bool) -> np.ndarray:
+    # Dogs (or candidates) often share one map object; weigh each distinct map once.
+    rows: Dict[int, List[float]] = {}
+    for m in taste_maps:
+        if id(m) not in rows:
+            rows[id(m)] = [taste_weight(x, m, use_taste_weights) for x in universe]
+    return np.array([rows[id(m)] for m in taste_maps], dtype=float).reshape(len(taste_maps), len(universe))
+
+
+def variety_pick_batch(
+    u: np.ndarray,
+    masks: np.ndarray,
+    weights: np.ndarray,
+    last: np.ndarray,
+    avoid_last: bool = True,
+) -> np.ndarray:
+    """
+    One day of choose_with_variety for every dog at once: drop yesterday's
+    pick when anything else is left, then a weighted draw with the same
+    cumulative rule as weighted_choice. `last` is -1 when there is no history.
+    """
+    allowed = masks
+    if avoid_last:
+        rows = np.arange(len(masks))
+        has_last = last >= 0
+        excl = np.zeros_like(masks)
+        excl[rows[has_last], last[has_last]] = True
+        trimmed = masks & ~excl
+        allowed = np.where(trimmed.any(axis=1, keepdims=True), trimmed, masks)
+    w = np.where(allowed, np.maximum(weights, 0.0), 0.0)
+    # All-zero weights fall back to a uniform draw, like weighted_choice.
+    w = np.where(w.any(axis=1, keepdims=True), w, allowed.astype(float))
+    cum = np.cumsum(w, axis=1)
+    r = u * cum[:, -1]
+    # `<=` so a draw of exactly 0 skips leading zero-weight (disallowed) columns.
+    idx = (cum <= r[:, None]).sum(axis=1)
+    return np.minimum(idx, masks.shape[1] - 1)
+
+
+def sample_rotations_batch(
+    dog_keys: List[str],
+    pools: List[Tuple[List[str], List[str], List[str]]],
+    taste_meat_maps: List[Dict[str, float]],
+    taste_veg_maps: List[Dict[str, float]],
+    use_taste_weights: bool,
+    days: int = 7,
+    seed: int = 42,
+    preferred_meat: Optional[np.ndarray] = None,
+    progress: Optional[Dict[str, int]] = None,
+    cancel_event: Optional[threading.Event] = None,
+    taste_models: Optional[List[Optional["PreferenceModel"]]] = None,
+    weight_scales: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None,
+    uniforms: Optional[np.ndarray] = None,
+    rules: Optional["RotationRules"] = None,
+    start_weekday: int = 0,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Rotations for M dogs x D days in one vectorized pass over days.
+
+    Keeps each dog's pantry pool, taste weights and the no-repeat rules of
+    pick_rotation_smart; carbs are drawn uniformly from the pool. If
+    `preferred_meat` (one meat column index per day, -1 for none) is given,
+    a dog takes it whenever its pool allows and it was not yesterday's
+    protein, so the no-consecutive-repeat rule holds. Deterministic per (dog key, seed) regardless of batch makeup.
+
+    Dogs with an entry in `taste_models` get per-day Thompson-sampled
+    protein/veg weights (seeded per dog) and protein x veg interactions
+    instead of their flat taste maps. `weight_scales` (one (M, category size)
+    array per rotation category) multiplies into the draw weights, e.g. to
+    tilt candidates toward cheaper ingredients. Pre-drawn (M, D, 3)
+    `uniforms` replace the per-dog streams when batch independence does not
+    matter (candidate search). With `rules`, every slot's candidates are
+    filtered through the compiled rule masks (day 1 falls on
+    `start_weekday`, 0 = Monday); a dog the rules would leave without any
+    candidate keeps its pool for that slot.
+
+    Returns (picks, took_preferred): picks is (M, D, 3) indices into
+    INGREDIENT_NAMES in ROTATION_CATEGORIES order.
+    """
+    universes = [filter_ingredients_by_category(c) for c in ROTATION_CATEGORIES]
+    masks = [pool_masks([p[k] for p in pools], universes[k]) for k in range(3)]
+    meat_w = taste_weight_rows(universes[0], taste_meat_maps, use_taste_weights)
+    veg_w = taste_weight_rows(universes[1], taste_veg_maps, use_taste_weights)
+    carb_w = np.ones_like(masks[2], dtype=float)
+    to_global = [np.array([INGREDIENT_INDEX[x] for x in u]) for u in universes]
+
+    m = len(dog_keys)
+    meat_w_days = np.broadcast_to(meat_w[:, None, :], (m, days, meat_w.shape[1]))
+    veg_w_days = np.broadcast_to(veg_w[:, None, :], (m, days, veg_w.shape[1]))
+    inter = None
+    modelled = [i for i, tm in enumerate(taste_models or []) if tm is not None] if use_taste_weights else []
+    if modelled:
+        meat_w_days, veg_w_days = meat_w_days.copy(), veg_w_days.copy()
+        inter = np.ones((m, meat_w.shape[1], veg_w.shape[1]))
+        for i in modelled:
+            tm = taste_models[i]
+            meat_w_days[i], veg_w_days[i] = tm.sample_weights(taste_model_rng(seed, dog_keys[i]), days)
+            inter[i] = tm.interaction()
+    if weight_scales is not None:
+        meat_w_days = meat_w_days * weight_scales[0][:, None, :]
+        veg_w_days = veg_w_days * weight_scales[1][:, None, :]
+        carb_w = carb_w * weight_scales[2]
+    u = rotation_stream_uniforms(dog_keys, seed, days, 3) if uniforms is None else uniforms
+    local = np.empty((m, days, 3), dtype=np.int64)
+    took_preferred = np.zeros((m, days), dtype=bool)
+    none = np.full(m, -1)
+    last_m, last_v = none, none
+    rows = np.arange(m)
+    tracker = rules.tracker(m, start_weekday) if rules else None
+    if progress is not None:
+        progress["total"] = days
+        progress["done"] = 0
+
+    def allowed(k: int) -> np.ndarray:
+        return masks[k] if tracker is None else tracker.allowed(k, masks[k])
+
+    def record(k: int, picks: np.ndarray) -> None:
+        if tracker is not None:
+            tracker.record(k, picks)
+
+    for d in range(days):
+        if cancel_event is not None and cancel_event.is_set():
+            raise PlanCancelled()
+        meat_mask = allowed(0)
+        meat = variety_pick_batch(u[:, d, 0], meat_mask, meat_w_days[:, d], last_m)
+        if preferred_meat is not None and preferred_meat[d] >= 0:
+            p = int(preferred_meat[d])
+            # Never yesterday's protein, unless the dog's own draw landed on it
+            # anyway (its pool leaves nothing else).
+            take = meat_mask[:, p] & ((last_m != p) | (meat == p))
+            meat = np.where(take, p, meat)
+            took_preferred[:, d] = take
+        record(0, meat)
+        day_veg_w = veg_w_days[:, d] if inter is None else veg_w_days[:, d] * inter[rows, meat]
+        veg = variety_pick_batch(u[:, d, 1], allowed(1), day_veg_w, last_v)
+        record(1, veg)
+        carb = variety_pick_batch(u[:, d, 2], allowed(2), carb_w, none, avoid_last=False)
+        record(2, carb)
+        if tracker is not None:
+            tracker.next_day()
+        local[:, d] = np.column_stack([meat, veg, carb])
+        last_m, last_v = meat, veg
+        if progress is not None:
+            progress["done"] = d + 1
+
+    picks = np.stack([to_global[k][local[..., k]] for k in range(3)], axis=-1)
+    return picks, took_preferred
+
+
+SHOPPING_COLUMNS = (
+    ("Meat", "Daily Meat (g)"),
+    ("Veg", "Daily Veg (g)"),
+    ("Carb", "Daily Carb (g)"),
+)
+# The same pairs in a meal-slot plan (plan_meal_slots: one row per day and meal).
+MEAL_SLOT_COLUMNS = (
+    ("Meat", "Meat (g)"),
+    ("Veg", "Veg (g)"),
+    ("Carb", "Carb (g)"),
+)
+
+
+def build_weekly_shopping_list(plan_df: pd.DataFrame, columns=SHOPPING_COLUMNS) -> pd.DataFrame:
+    """
+    Ingredient totals for a plan. Works on single-dog plans and on long
+    household plans (one row per dog per day) alike: all name/gram column
+    pairs are stacked and summed in one groupby. Meal-slot plans pass
+    MEAL_SLOT_COLUMNS.
+    """
+    parts = []
+    for name_col, grams_col in columns:
+        if name_col not in plan_df.columns:
+            continue
+        grams = plan_df[grams_col] if grams_col in plan_df.columns else 0.0
+        parts.append(pd.DataFrame({"Ingredient": plan_df[name_col], "grams": grams}))
+    if not parts:
+        return pd.DataFrame()
+
+    long_df = pd.concat(parts, ignore_index=True)
+    names = long_df["Ingredient"]
+    long_df = long_df[names.notna() & (names != "") & (names != "—")]
+    if long_df.empty:
+        return pd.DataFrame()
+
+    totals = long_df.groupby("Ingredient", sort=False)["grams"].sum().astype(float)
+    return shopping_frame(totals, plan_day_count(plan_df))
+
+
+def plan_day_count(plan_df: pd.DataFrame) -> int:
+    """Distinct plan days; household and meal-slot frames repeat each Day over several rows."""
+    if "Day" in plan_df.columns:
+        return max(int(plan_df["Day"].nunique()), 1)
+    return max(len(plan_df), 1)
+
+
+def shopping_frame(totals: pd.Series, days: int) -> pd.DataFrame:
+    """Shopping-list table from per-ingredient gram totals over `days` plan days."""
+    df = pd.DataFrame({
+        "Ingredient": totals.index,
+        "Category": [INGREDIENTS[n].category if n in INGREDIENTS else "Unknown" for n in totals.index],
+        "Total grams": totals.round().astype(int).to_numpy(),
+        "Avg grams/day": (totals / days).round(1).to_numpy(),
+    })
+    return df.sort_values(["Category", "Ingredient"]).reset_index(drop=True)
+
+
+def update_shopping_list(shopping_df: pd.DataFrame, removed_rows: pd.DataFrame,
+                         added_rows: pd.DataFrame, days: int) -> pd.DataFrame:
+    """
+    Incremental shopping list: take the rows that left the plan out of the
+    totals and the rows that replaced them in, without re-summing the plan.
+    `days` is the whole plan's day count (plan_day_count), not the changed rows'.
+    """
+    def totals(rows: pd.DataFrame) -> pd.Series:
+        part = build_weekly_shopping_list(rows)
+        if part.empty:
+            return pd.Series(dtype=float)
+        return part.set_index("Ingredient")["Total grams"].astype(float)
+
+    if shopping_df.empty:
+        added = totals(added_rows)
+        return shopping_frame(added, days) if len(added) else pd.DataFrame()
+    current = shopping_df.set_index("Ingredient")["Total grams"].astype(float)
+    current = current.add(totals(added_rows), fill_value=0).sub(totals(removed_rows), fill_value=0)
+    return shopping_frame(current[current > 0.5], days)
+
+
+def build_category_prep_summary(shopping_df: pd.DataFrame) -> pd.DataFrame:
+    if shopping_df.empty:
+        return shopping_df
+    grp = shopping_df.groupby("Category")["Total grams"].sum().reset_index()
+    grp["Total grams"] = grp["Total grams"].round().astype(int)
+    return grp.sort_values("Total grams", ascending=False).reset_index(drop=True)
+
+
+# =========================================================
+# 8) Background plan generation (worker pool + cancellation)
+# =========================================================
+
+class PlanCancelled(Exception):
+    """Raised inside a worker when its plan job was cancelled or superseded."""
+
+
+def generate_plan_df(
+    pantry_meats: List[str],
+    pantry_vegs: List[str],
+    pantry_carbs: List[str],
+    allow_new: bool,
+    recommendations: Dict[str, List[str]],
+    taste_meat_map: Dict[str, float],
+    taste_veg_map: Dict[str, float],
+    use_taste_weights: bool,
+    include_fruit: bool,
+    daily_grams: float,
+    meat_pct: int,
+    veg_pct: int,
+    carb_pct: int,
+    meals_per_day: int,
+    variety_label: str,
+    days: int = 7,
+    seed: int = 42,
+    progress: Optional[Dict[str, int]] = None,
+    cancel_event: Optional[threading.Event] = None,
+    taste_model: Optional[PreferenceModel] = None,
+    budget_mode: bool = False,
+    prices: Optional["PriceTable"] = None,
+    rules: Optional["RotationRules"] = None,
+    start_weekday: int = 0,
+) -> pd.DataFrame:
+    """
+    Full plan build (rotation + fruit toppers + per-day nutrition rows).
+    Safe to run on a worker thread: it never touches st.*, reports progress
+    into the shared `progress` dict and stops early once `cancel_event` is set.
+    In budget mode the rotation is the cheapest of many sampled candidates
+    that still meets the taste and diversity floors (cheapest_rotation).
+    User rotation `rules` apply in both modes; day 1 falls on `start_weekday`.
+    """
+    def check_cancelled():
+        if cancel_event is not None and cancel_event.is_set():
+            raise PlanCancelled()
+
+    if progress is not None:
+        progress["total"] = days
+        progress["done"] = 0
+
+    if budget_mode and prices is not None:
+        rotation, _ = cheapest_rotation(
+            rotation_pools(pantry_meats, pantry_vegs, pantry_carbs, allow_new, recommendations),
+            taste_meat_map, taste_veg_map, use_taste_weights,
+            grams_for_day(daily_grams, meat_pct, veg_pct, carb_pct), prices,
+            days=days, seed=seed, cancel_event=cancel_event, rules=rules, start_weekday=start_weekday,
+        )
+    else:
+        rotation = pick_rotation_smart(
+            pantry_meats=pantry_meats,
+            pantry_vegs=pantry_vegs,
+            pantry_carbs=pantry_carbs,
+            allow_new=allow_new,
+            recommendations=recommendations,
+            taste_meat_map=taste_meat_map,
+            taste_veg_map=taste_veg_map,
+            use_taste_weights=use_taste_weights,
+            days=days,
+            seed=seed,
+            taste_model=taste_model,
+            rules=rules,
+            start_weekday=start_weekday,
+        )
+    check_cancelled()
+
+    fruit_rotation = []
+    if include_fruit and recommendations.get("Treat"):
+        rng = random.Random(seed + 7)
+        for _ in range(days):
+            fruit_rotation.append(rng.choice(recommendations["Treat"]))
+    else:
+        fruit_rotation = [None] * days
+
+    all_meats = filter_ingredients_by_category("Meat")
+    all_vegs = filter_ingredients_by_category("Veg")
+    all_carbs = filter_ingredients_by_category("Carb")
+
+    mg, vg, cg = grams_for_day(daily_grams, meat_pct, veg_pct, carb_pct)
+    per_meal_total = daily_grams / meals_per_day
+    per_meal_meat = mg / meals_per_day
+    per_meal_veg = vg / meals_per_day
+    per_meal_carb = cg / meals_per_day
+
+    rows = []
+    for i, combo in enumerate(rotation, start=1):
+        check_cancelled()
+
+        # protect against missing dict keys (shouldn't happen)
+        meat_name = combo.get("Meat", all_meats[0])
+        veg_name = combo.get("Veg", all_vegs[0])
+        carb_name = combo.get("Carb", all_carbs[0])
+
+        nut = day_nutrition_estimate(meat_name, veg_name, carb_name, mg, vg, cg)
+
+        rows.append({
+            "Day": f"Day {i}",
+            "Meat": meat_name,
+            "Veg": veg_name,
+            "Carb": carb_name,
+            "Optional Fruit Topper": fruit_rotation[i-1] or "—",
+            "Daily Meat (g)": round(mg),
+            "Daily Veg (g)": round(vg),
+            "Daily Carb (g)": round(cg),
+            "Meals/day": meals_per_day,
+            "Per-Meal Total (g)": round(per_meal_total),
+            "Per-Meal Meat (g)": round(per_meal_meat),
+            "Per-Meal Veg (g)": round(per_meal_veg),
+            "Per-Meal Carb (g)": round(per_meal_carb),
+            "Est kcal": round(nut["kcal"]),
+            "Protein (g)": round(nut["protein"], 1),
+            "Fat (g)": round(nut["fat"], 1),
+            "Carbs (g)": round(nut["carbs"], 1),
+            "Variety Mode": variety_label,
+        })
+        if progress is not None:
+            progress["done"] = i
+
+    return pd.DataFrame(rows)
+
+
+def plan_dependencies(inputs: Dict) -> Dict:
+    """
+    The subset of planner inputs the result actually depends on. Taste maps
+    only matter when taste weighting is on, prices only in budget mode,
+    recommendations only feed the pools with add-ons allowed (and the fruit
+    toppers when those are on; "Avoid" always filters the add-ons), so e.g.
+    logging a taste entry with taste weighting off keeps the plan.
+    """
+    deps = dict(inputs)
+    if not deps.get("use_taste_weights", True):
+        deps.pop("taste_meat_map", None)
+        deps.pop("taste_veg_map", None)
+        deps.pop("taste_model", None)
+        deps.pop("taste_models", None)
+    if not deps.get("budget_mode", False):
+        deps.pop("prices", None)
+    if not deps.get("rules"):
+        deps.pop("rules", None)
+        deps.pop("start_weekday", None)
+    recs = deps.get("recommendations")
+    if isinstance(recs, dict):
+        keep = set()
+        if deps.get("allow_new", True):
+            keep |= {"Meat", "Veg", "Carb"}
+        if deps.get("include_fruit", True):
+            keep.add("Treat")
+        keep.add("Avoid")
+        deps["recommendations"] = {k: v for k, v in recs.items() if k in keep}
+    return deps
+
+
+def changed_dependencies(old: Dict, new: Dict) -> List[str]:
+    keys = list(dict.fromkeys(list(old) + list(new)))
+    return [k for k in keys if plan_signature(old.get(k)) != plan_signature(new.get(k))]
+
+
+def plan_signature(inputs: Dict) -> Tuple:
+    """Hashable fingerprint of the planner inputs (lists/dicts frozen in order)."""
+    def freeze(v):
+        if hasattr(v, "signature"):
+            return v.signature()
+        if isinstance(v, dict):
+            return tuple(sorted((k, freeze(x)) for k, x in v.items()))
+        if isinstance(v, (list, tuple)):
+            return tuple(freeze(x) for x in v)
+        return v
+    return freeze(inputs)
+
+
+# =========================================================
+# 9) Streaming exports (CSV / Parquet / XLSX / JSON / JSONL / iCalendar)
+# =========================================================
+
+# Rows serialized per step.
+EXPORT_CHUNK_ROWS = 2048
+
+EXPORT_FORMATS = {
+    # label: (extension, mime)
+    "CSV": ("csv", "text/csv"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+    "Excel (XLSX)": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "JSON": ("json", "application/json"),
+    "JSON Lines": ("jsonl", "application/x-ndjson"),
+    "iCalendar (cooking days)": ("ics", "text/calendar"),
+}
+
+
+def export_format_available(fmt: str) -> bool:
+    # Parquet and XLSX writers are optional extras (pyarrow / openpyxl).
+    module = {"Parquet": "pyarrow", "Excel (XLSX)": "openpyxl"}.get(fmt)
+    if module is None:
+        return True
+    try:
+        __import__(module)
+        return True
+    except ImportError:
+        return False
+
+
+def iter_frame_chunks(df: pd.DataFrame, chunk_rows: int = EXPORT_CHUNK_ROWS):
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def _json_safe(v):
+    if isinstance(v, np.generic):
+        return v.item()
+    if isinstance(v, float) and np.isnan(v):
+        return None
+    return v
+
+
+def iter_csv_bytes(df: pd.DataFrame, chunk_rows: int = EXPORT_CHUNK_ROWS):
+    header = True
+    for chunk in iter_frame_chunks(df, chunk_rows):
+        yield chunk.to_csv(index=False, header=header).encode("utf-8")
+        header = False
+    if header:  # empty frame: still emit the header row
+        yield df.to_csv(index=False).encode("utf-8")
+
+
+def iter_json_bytes(df: pd.DataFrame, chunk_rows: int = EXPORT_CHUNK_ROWS):
+    """A JSON array of row objects, emitted chunk by chunk."""
+    yield b"["
+    first = True
+    for chunk in iter_frame_chunks(df, chunk_rows):
+        parts = []
+        for rec in chunk.to_dict(orient="records"):
+            parts.append(json.dumps({k: _json_safe(v) for k, v in rec.items()}, ensure_ascii=False))
+        if parts:
+            yield (("" if first else ",") + ",".join(parts)).encode("utf-8")
+            first = False
+    yield b"]"
+
+
+def iter_jsonl_bytes(df: pd.DataFrame, chunk_rows: int = EXPORT_CHUNK_ROWS):
+    """One JSON object per line; pandas serializes each chunk in one call."""
+    for chunk in iter_frame_chunks(df, chunk_rows):
+        yield chunk.to_json(orient="records", lines=True, force_ascii=False).rstrip("\n").encode("utf-8") + b"\n"
+
+
+def _ical_escape(text: str) -> str:
+    return (
+        str(text).replace("\\", "\\\\").replace(";", "\\;")
+        .replace(",", "\\,").replace("\n", "\\n")
+    )
+
+
+def _ical_fold(line: str) -> str:
+    # RFC 5545: content lines longer than 75 octets are folded with CRLF + space.
+    raw = line.encode("utf-8")
+    if len(raw) <= 75:
+        return line + "\r\n"
+    out, cur = [], b""
+    for ch in line:
+        b = ch.encode("utf-8")
+        if len(cur) + len(b) > (75 if not out else 74):
+            out.append(cur)
+            cur = b""
+        cur += b
+    out.append(cur)
+    return "\r\n ".join(part.decode("utf-8") for part in out) + "\r\n"
+
+
+def iter_ical_bytes(plan_df: pd.DataFrame, start_date: date, dog_label: str,
+                    chunk_rows: int = EXPORT_CHUNK_ROWS):
+    """One all-day VEVENT per cooking day of the plan."""
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    head = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:-//{APP_TITLE}//Plan export//EN",
+        "CALSCALE:GREGORIAN",
+        f"X-WR-CALNAME:{_ical_escape(dog_label + ' cooking plan')}",
+    ]
+    yield "".join(_ical_fold(x) for x in head).encode("utf-8")
+
+    offset = 0
+    for chunk in iter_frame_chunks(plan_df, chunk_rows):
+        lines = []
+        for rec in chunk.to_dict(orient="records"):
+            day = start_date + timedelta(days=offset)
+            offset += 1
+            summary = f"Cook for {dog_label}: {rec.get('Meat')} + {rec.get('Veg')} + {rec.get('Carb')}"
+            desc = (
+                f"{rec.get('Day', '')}: Meat {rec.get('Daily Meat (g)', 0)}g · "
+                f"Veg {rec.get('Daily Veg (g)', 0)}g · Carb {rec.get('Daily Carb (g)', 0)}g\n"
+                f"{rec.get('Meals/day', 1)} meals × {rec.get('Per-Meal Total (g)', 0)}g\n"
+                f"Approx {rec.get('Est kcal', 0)} kcal · P {rec.get('Protein (g)', 0)}g · "
+                f"F {rec.get('Fat (g)', 0)}g · C {rec.get('Carbs (g)', 0)}g\n"
+                f"Fruit topper: {rec.get('Optional Fruit Topper', '—')}"
+            )
+            lines += [
+                "BEGIN:VEVENT",
+                f"UID:{day:%Y%m%d}-{offset}-{zlib.crc32(dog_label.encode('utf-8')):08x}@nebula-paw-kitchen",
+                f"DTSTAMP:{stamp}",
+                f"DTSTART;VALUE=DATE:{day:%Y%m%d}",
+                f"DTEND;VALUE=DATE:{day + timedelta(days=1):%Y%m%d}",
+                f"SUMMARY:{_ical_escape(summary)}",
+                f"DESCRIPTION:{_ical_escape(desc)}",
+                "END:VEVENT",
+            ]
+        yield "".join(_ical_fold(x) for x in lines).encode("utf-8")
+    yield _ical_fold("END:VCALENDAR").encode("utf-8")
+
+
+def write_parquet_stream(df: pd.DataFrame, fh, chunk_rows: int = EXPORT_CHUNK_ROWS) -> None:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Inferred from the first chunk: an empty frame's object columns come out as
+    # type null on pandas 2.x. Columns still all-null there are written as strings.
+    schema = pa.Schema.from_pandas(df.head(chunk_rows), preserve_index=False)
+    for i, f in enumerate(schema):
+        if pa.types.is_null(f.type):
+            schema = schema.set(i, f.with_type(pa.string()))
+    with pq.ParquetWriter(fh, schema) as writer:
+        for chunk in iter_frame_chunks(df, chunk_rows):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+def write_xlsx_stream(df: pd.DataFrame, fh, sheet_name: str, chunk_rows: int = EXPORT_CHUNK_ROWS) -> None:
+    from openpyxl import Workbook
+
+    # write-only workbooks flush rows to a temp file instead of keeping a cell grid
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=sheet_name[:31])
+    ws.append([str(c) for c in df.columns])
+    for chunk in iter_frame_chunks(df, chunk_rows):
+        for row in chunk.itertuples(index=False, name=None):
+            ws.append([_json_safe(v) for v in row])
+    wb.save(fh)
+
+
+def write_export(df: pd.DataFrame, fmt: str, fh, sheet_name: str = "Plan",
+                 start_date: Optional[date] = None, dog_label: str = "Your dog") -> None:
+    """Stream `df` in the requested format into a binary file handle."""
+    if fmt == "CSV":
+        for part in iter_csv_bytes(df):
+            fh.write(part)
+    elif fmt == "JSON":
+        for part in iter_json_bytes(df):
+            fh.write(part)
+    elif fmt == "JSON Lines":
+        for part in iter_jsonl_bytes(df):
+            fh.write(part)
+    elif fmt == "iCalendar (cooking days)":
+        for part in iter_ical_bytes(df, start_date or date.today(), dog_label):
+            fh.write(part)
+    elif fmt == "Parquet":
+        write_parquet_stream(df, fh)
+    elif fmt == "Excel (XLSX)":
+        write_xlsx_stream(df, fh, sheet_name)
+    else:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+
+def export_bytes(df: pd.DataFrame, fmt: str, **kwargs) -> bytes:
+    """
+    The whole export file in memory, for `st.download_button` (which only
+    takes str/bytes/BytesIO data, and copies it once more). The writers still
+    stream chunk by chunk, but the finished file is held in RAM in full, so
+    this suits plan- and taste-log-sized frames; write_export to a real file
+    handle for exports that must stay within bounded memory.
+    """
+    buf = io.BytesIO()
+    write_export(df, fmt, buf, **kwargs)
+    return buf.getvalue()
+
+
+# =========================================================
+# 10) Household planning (several dogs, one kitchen)
+# =========================================================
+
+HOUSEHOLD_COLUMNS = ["Name", "Breed", "Age (years)", "Weight (kg)", "Neutered", "Activity", "Meals/day", "Flags", "Id"]
+
+
+def new_household_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+def default_household_profiles(first: Dict) -> pd.DataFrame:
+    rows = [dict(first, Id=new_household_id()), {
+        "Name": "Dog 2", "Breed": "Mixed Breed / Unknown", "Age (years)": 5.0,
+        "Weight (kg)": 20.0, "Neutered": True, "Activity": "Normal",
+        "Meals/day": 2, "Flags": [], "Id": new_household_id(),
+    }]
+    return pd.DataFrame(rows, columns=HOUSEHOLD_COLUMNS)
+
+
+def assign_household_ids(profiles: pd.DataFrame) -> Tuple[pd.DataFrame, bool]:
+    """
+    Give every editor row a persistent "Id" (new rows arrive without one;
+    pasted rows may repeat one). Returns (profiles, whether any id was added),
+    so the caller can store the ids back as the editor's data.
+    """
+    df = profiles.copy()
+    ids = df["Id"].tolist() if "Id" in df.columns else [None] * len(df)
+    seen, changed = set(), False
+    for i, dog_id in enumerate(ids):
+        if not isinstance(dog_id, str) or not dog_id or dog_id in seen:
+            ids[i] = new_household_id()
+            changed = True
+        seen.add(ids[i])
+    df["Id"] = ids
+    return df, changed
+
+
+def clean_household_profiles(profiles: pd.DataFrame) -> pd.DataFrame:
+    """
+    Drop blank editor rows and fill defaults so the planner sees clean values.
+    "Id" (see assign_household_ids) identifies each dog across renames, row
+    edits and deletions, even when names repeat.
+    """
+    df = profiles.copy()
+    df = df[df["Weight (kg)"].notna() & (pd.to_numeric(df["Weight (kg)"], errors="coerce") > 0)]
+    df = df.reset_index(drop=True)
+    names = df["Name"].fillna("").astype(str).str.strip()
+    df["Name"] = [n or f"Dog {i + 1}" for i, n in enumerate(names)]
+    df["Breed"] = df["Breed"].fillna("Mixed Breed / Unknown")
+    df["Age (years)"] = pd.to_numeric(df["Age (years)"], errors="coerce").fillna(3.0).clip(0.1, 25.0)
+    df["Weight (kg)"] = pd.to_numeric(df["Weight (kg)"], errors="coerce").clip(0.5, 90.0)
+    df["Neutered"] = df["Neutered"].fillna(True).astype(bool)
+    df["Activity"] = df["Activity"].where(df["Activity"].isin(list(ACTIVITY_BOOST)), "Normal")
+    df["Meals/day"] = pd.to_numeric(df["Meals/day"], errors="coerce").fillna(2).clip(1, 4).astype(int)
+    df["Flags"] = [list(f) if isinstance(f, (list, tuple)) else [] for f in df["Flags"]]
+    return df
+
+
+def household_dog_labels(names: List[str]) -> List[str]:
+    """Display names with repeats numbered ("Rex", "Rex (2)"), so per-dog views never merge two dogs."""
+    seen: Dict[str, int] = {}
+    labels = []
+    for name in names:
+        seen[name] = seen.get(name, 0) + 1
+        labels.append(name if seen[name] == 1 else f"{name} ({seen[name]})")
+    return labels
+
+
+def household_taste_models(
+    profiles: List[Dict], taste_models: Optional[Dict[str, PreferenceModel]]
+) -> Optional[List[PreferenceModel]]:
+    """
+    One model per dog: that dog's own evidence (`taste_models` is keyed by
+    taste_dog_key of the name) on top of its breed/life-stage prior. None when
+    there is neither evidence nor priors.
+    """
+    if not taste_models and taste_priors() is None:
+        return None
+    taste_models = taste_models or {}
+    empty = PreferenceModel()
+    return [
+        taste_models.get(taste_dog_key(p["Name"]), empty)
+        .with_prior(taste_prior_for(p.get("Breed", ""), p["Age (years)"]))
+        for p in profiles
+    ]
+
+
+def plan_household(
+    profiles: List[Dict],
+    pantry_meats: List[str],
+    pantry_vegs: List[str],
+    pantry_carbs: List[str],
+    allow_new: bool,
+    use_taste_weights: bool,
+    meat_pct: int,
+    veg_pct: int,
+    carb_pct: int,
+    assumed_kcal_per_g: float,
+    days: int = 7,
+    seed: int = 42,
+    progress: Optional[Dict[str, int]] = None,
+    cancel_event: Optional[threading.Event] = None,
+    taste_models: Optional[Dict[str, PreferenceModel]] = None,
+    rules: Optional["RotationRules"] = None,
+    start_weekday: int = 0,
+) -> pd.DataFrame:
+    """
+    Plan every dog of a household in one run (long format: one row per dog per day).
+
+    - Energy targets and per-dog gram splits are computed for all dogs in one batch.
+    - Each dog's taste comes from its own evidence in `taste_models` (keyed by
+      taste_dog_key of the dog's name) on top of its breed/life-stage prior.
+    - One household protein is drawn per day, weighted toward proteins that many
+      dogs' pools accept (and the dogs like on average), so most bowls on a day can come from one cooking batch.
+      Dogs whose pool excludes that protein (e.g. a lower-fat dog on a salmon day)
+      fall back to their own variety-aware pick.
+    - Each dog's rotation comes from sample_rotations_batch, seeded per (dog id, seed)
+      (the profile's persisted "Id", else its position), so adding or removing a dog does
+      not reshuffle the others' veg and carbs and two dogs sharing a name still
+      get their own rotations. Names are only used for display (household_dog_labels).
+    - User rotation `rules` apply to every dog (the household protein is only
+      taken on days the rules allow it for that dog).
+    """
+    if progress is not None:
+        progress["total"] = days
+        progress["done"] = 0
+    if not profiles:
+        return pd.DataFrame()
+
+    n = len(profiles)
+    keys = [str(p.get("Id") or f"dog-{i}") for i, p in enumerate(profiles)]
+    flags = [list(p.get("Flags") or []) for p in profiles]
+    ages = np.array([p["Age (years)"] for p in profiles], dtype=float)
+    meals = np.array([p.get("Meals/day", 2) for p in profiles], dtype=int)
+
+    _, _, mer_adj = compute_daily_energy_batch(
+        [p["Weight (kg)"] for p in profiles],
+        ages,
+        [p["Activity"] for p in profiles],
+        [p["Neutered"] for p in profiles],
+        [energy_adjustment(f) for f in flags],
+    )
+    daily_grams = mer_adj / assumed_kcal_per_g
+    pct = np.array([meat_pct, veg_pct, carb_pct], dtype=float) / 100.0
+    split = daily_grams[:, None] * pct[None, :]  # (dogs, 3) meat/veg/carb grams
+
+    pools = []
+    for i in range(n):
+        diet = diet_profile(age_to_life_stage(ages[i]), flags[i])
+        pools.append(rotation_pools(pantry_meats, pantry_vegs, pantry_carbs, allow_new, diet))
+
+    coverage: Dict[str, int] = {}
+    for meat_pool, _, _ in pools:
+        for m in meat_pool:
+            coverage[m] = coverage.get(m, 0) + 1
+
+    models = household_taste_models(profiles, taste_models)
+    if models is None:
+        meat_maps, veg_maps = [{}] * n, [{}] * n
+    else:
+        meat_maps, veg_maps = (list(maps) for maps in zip(*(tm.mean_scores() for tm in models)))
+
+    # One household protein per day from its own stream; squared coverage
+    # strongly prefers proteins every dog can eat.
+    meats = filter_ingredients_by_category("Meat")
+    shared_mask = np.array([[m in coverage for m in meats]])
+    shared_w = taste_weight_rows(meats, meat_maps, use_taste_weights).mean(axis=0, keepdims=True) * np.array(
+        [[float(coverage.get(m, 0) ** 2) for m in meats]]
+    )
+    u_shared = rotation_stream_uniforms(["__household__"], seed, days, 1)[0, :, 0]
+    day_meat = np.empty(days, dtype=np.int64)
+    last_shared = np.array([-1])
+    for d in range(days):
+        last_shared = variety_pick_batch(u_shared[d:d + 1], shared_mask, shared_w, last_shared)
+        day_meat[d] = last_shared[0]
+
+    # Every dog rotates in one batched pass, seeded per (dog id, seed).
+    picks_idx, shared_flags = sample_rotations_batch(
+        keys, pools, meat_maps, veg_maps, use_taste_weights,
+        days=days, seed=seed, preferred_meat=day_meat,
+        progress=progress, cancel_event=cancel_event,
+        taste_models=models,
+        rules=rules, start_weekday=start_weekday,
+    )
+    idx = picks_idx.transpose(1, 0, 2)  # (days, dogs, 3)
+    shared_flags = shared_flags.T
+    picks = np.asarray(INGREDIENT_NAMES, dtype=object)[idx]
+
+    # Vectorized nutrition: (days, dogs, 3 components, 4 macros)
+    grams = np.broadcast_to(split[None, :, :], idx.shape)
+    macros = (MACRO_MATRIX[idx] * (grams / 100.0)[..., None]).sum(axis=2)
+
+    labels = household_dog_labels([p["Name"] for p in profiles])
+    dog_col = np.tile(np.array(labels, dtype=object), days)
+    day_col = np.repeat([f"Day {d + 1}" for d in range(days)], n)
+    flat_picks = picks.reshape(days * n, 3)
+    flat_split = np.tile(split, (days, 1))
+    flat_meals = np.tile(meals, days)
+    flat_macros = macros.reshape(days * n, 4)
+    return pd.DataFrame({
+        "Dog": dog_col,
+        "Day": day_col,
+        "Meat": flat_picks[:, 0],
+        "Veg": flat_picks[:, 1],
+        "Carb": flat_picks[:, 2],
+        "Shared protein": shared_flags.reshape(-1),
+        "Daily Meat (g)": np.round(flat_split[:, 0]).astype(int),
+        "Daily Veg (g)": np.round(flat_split[:, 1]).astype(int),
+        "Daily Carb (g)": np.round(flat_split[:, 2]).astype(int),
+        "Meals/day": flat_meals,
+        "Per-Meal Total (g)": np.round(flat_split.sum(axis=1) / flat_meals).astype(int),
+        "Est kcal": np.round(flat_macros[:, 0]).astype(int),
+        "Protein (g)": np.round(flat_macros[:, 1], 1),
+        "Fat (g)": np.round(flat_macros[:, 2], 1),
+        "Carbs (g)": np.round(flat_macros[:, 3], 1),
+    })
+
+
+# =========================================================
+# 11) Batch-cooking session scheduler
+# =========================================================
+
+# Conservative fridge life of cooked food, in days including the cooking day.
+SHELF_LIFE_DAYS = {"Meat": 3, "Veg": 4, "Carb": 5}
+
+
+def plan_day_index(plan_df: pd.DataFrame) -> np.ndarray:
+    """0-based day number per row ("Day 3" -> 2)."""
+    return plan_df["Day"].astype(str).str.extract(r"(\d+)")[0].astype(int).to_numpy() - 1
+
+
+def schedule_cooking_sessions(
+    plan_df: pd.DataFrame,
+    shelf_life: Optional[Dict[str, int]] = None,
+    max_span: Optional[int] = None,
+    columns=SHOPPING_COLUMNS,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Group plan days into the fewest cooking sessions.
+
+    Food cooked on day s can be served on day d while d - s is below the
+    shelf life of every category served that day, so each day has a window
+    length; the earliest uncovered day opens a session that extends until a
+    day falls outside its window (greedy is optimal for this covering). Identical
+    ingredients inside a session are batched into one cooking line. Works on
+    single-dog, household (long) and meal-slot plans (`columns` =
+    MEAL_SLOT_COLUMNS).
+
+    Returns (sessions_df, session_items_df).
+    """
+    shelf = dict(SHELF_LIFE_DAYS)
+    shelf.update(shelf_life or {})
+    if plan_df is None or plan_df.empty:
+        return pd.DataFrame(), pd.DataFrame()
+
+    day_idx = plan_day_index(plan_df)
+    n_days = int(day_idx.max()) + 1
+    cats = [c for c, _ in columns if c in plan_df.columns]
+
+    # Window per day = min shelf life over categories served that day.
+    window = np.full(n_days, max(shelf.values()) if shelf else 1, dtype=int)
+    for c in cats:
+        served = np.zeros(n_days, dtype=bool)
+        names = plan_df[c]
+        served[day_idx[(names.notna() & (names != "—")).to_numpy()]] = True
+        window = np.where(served, np.minimum(window, int(shelf.get(c, 1))), window)
+    window = np.maximum(window, 1)
+    if max_span:
+        window = np.minimum(window, int(max_span))
+
+    session_of_day = np.empty(n_days, dtype=int)
+    starts = []
+    d = 0
+    while d < n_days:
+        s = d
+        starts.append(s)
+        while d < n_days and d - s < window[d]:
+            session_of_day[d] = len(starts) - 1
+            d += 1
+
+    sessions_df = pd.DataFrame({
+        "Session": [f"Session {i + 1}" for i in range(len(starts))],
+        "Cook on": [f"Day {s + 1}" for s in starts],
+        "Covers": [
+            f"Day {s + 1}" + ("" if e == s else f"–Day {e + 1}")
+            for s, e in zip(starts, [b - 1 for b in starts[1:]] + [n_days - 1])
+        ],
+        "Days covered": np.bincount(session_of_day, minlength=len(starts)),
+    })
+
+    row_session = session_of_day[day_idx]
+    parts = []
+    for c, grams_col in columns:
+        if c not in plan_df.columns:
+            continue
+        parts.append(pd.DataFrame({
+            "session_idx": row_session,
+            "Category": c,
+            "Ingredient": plan_df[c].to_numpy(),
+            "grams": plan_df[grams_col].to_numpy(dtype=float) if grams_col in plan_df.columns else 0.0,
+        }))
+    long_df = pd.concat(parts, ignore_index=True)
+    long_df = long_df[long_df["Ingredient"].notna() & (long_df["Ingredient"] != "—")]
+
+    items = (
+        long_df.groupby(["session_idx", "Category", "Ingredient"], sort=True)["grams"]
+        .agg(["sum", "size"])
+        .reset_index()
+    )
+    cat_order = {c: i for i, (c, _) in enumerate(columns)}
+    items["cat_order"] = items["Category"].map(cat_order)
+    items = items.sort_values(["session_idx", "cat_order", "sum"], ascending=[True, True, False])
+    session_items = pd.DataFrame({
+        "Session": [f"Session {i + 1}" for i in items["session_idx"]],
+        "Category": items["Category"].to_numpy(),
+        "Ingredient": items["Ingredient"].to_numpy(),
+        "Total grams": items["sum"].round().astype(int).to_numpy(),
+        "Portions (bowl-days)": items["size"].to_numpy(),
+    })
+
+    totals = session_items.groupby("Session", sort=False)["Total grams"].sum()
+    sessions_df["Total grams"] = sessions_df["Session"].map(totals).fillna(0).astype(int)
+    return sessions_df, session_items.reset_index(drop=True)
+
+
+# =========================================================
+# 12) Container packing for portioned meals
+# =========================================================
+
+CONTAINER_SIZES_G = [150, 250, 350, 500, 750, 1000]
+
+
+def pack_meal_portions(
+    plan_df: pd.DataFrame,
+    container_sizes: List[int],
+    cook_every: int = 7,
+    fridge_days: int = 3,
+    dog_label: str = "Your dog",
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Pack every meal portion of a plan into containers.
+
+    Meals are cooked every `cook_every` days; those served within `fridge_days`
+    of the cook day go to the fridge, the rest to the freezer. Different meals
+    are never mixed in one container, so each (dog, day) group is a set of
+    identical portions and the best packing is closed-form: fill the
+    smallest container that reaches the maximum portions-per-container, then
+    put the remainder in the smallest container that fits it. Portions larger
+    than the biggest container are split evenly. All groups are solved at once
+    with array math, which scales to kennel-sized plans.
+
+    Returns (packing_list_df, summary_df).
+    """
+    sizes = np.array(sorted({int(c) for c in container_sizes if int(c) > 0}), dtype=float)
+    if plan_df is None or plan_df.empty or sizes.size == 0:
+        return pd.DataFrame(), pd.DataFrame()
+
+    day_idx = plan_day_index(plan_df)
+    dogs = plan_df["Dog"].astype(str).to_numpy() if "Dog" in plan_df.columns else np.full(len(plan_df), dog_label, dtype=object)
+    portion = plan_df["Per-Meal Total (g)"].to_numpy(dtype=float)
+    count = plan_df["Meals/day"].to_numpy(dtype=int)
+    keep = portion > 0
+    day_idx, dogs, portion, count = day_idx[keep], dogs[keep], portion[keep], count[keep]
+    labels = (
+        plan_df["Meat"].astype(str) + " + " + plan_df["Veg"].astype(str) + " + " + plan_df["Carb"].astype(str)
+    ).to_numpy()[keep]
+
+    cook_every = max(1, int(cook_every))
+    offset = day_idx % cook_every
+    cook_day = day_idx - offset
+    freezer = offset >= int(fridge_days)
+
+    # Split oversize portions into equal pieces that fit the largest container.
+    pieces = np.ceil(portion / sizes[-1]).astype(int)
+    piece_g = portion / pieces
+    n_items = count * pieces
+
+    per = np.floor(sizes[None, :] / piece_g[:, None]).astype(int)  # (groups, sizes)
+    max_per = per.max(axis=1)
+    full_idx = np.argmax(per == max_per[:, None], axis=1)  # smallest size reaching max
+    n_full = n_items // max_per
+    rem = n_items % max_per
+    rem_idx = np.argmax(per >= np.maximum(rem, 1)[:, None], axis=1)
+
+    # Expand to one row per container: full ones, then the remainder container.
+    g_full = np.repeat(np.arange(len(piece_g)), n_full)
+    g_rem = np.nonzero(rem > 0)[0]
+    grp = np.concatenate([g_full, g_rem])
+    size_i = np.concatenate([full_idx[g_full], rem_idx[g_rem]])
+    n_in = np.concatenate([max_per[g_full], rem[g_rem]])
+    order = np.lexsort((size_i, grp))
+    grp, size_i, n_in = grp[order], size_i[order], n_in[order]
+
+    cap = sizes[size_i]
+    fill = n_in * piece_g[grp]
+    storage = np.where(freezer[grp], "Freezer", "Fridge")
+    piece_note = np.where(pieces[grp] > 1, " (split portion)", "")
+    contents = [
+        f"{k} × {g:.0f}g {lbl}{note}"
+        for k, g, lbl, note in zip(n_in, piece_g[grp], labels[grp], piece_note)
+    ]
+
+    packing = pd.DataFrame({
+        "Storage": storage,
+        "Dog": dogs[grp],
+        "Serve on": [f"Day {d + 1}" for d in day_idx[grp]],
+        "Cook on": [f"Day {d + 1}" for d in cook_day[grp]],
+        "Container (g)": cap.astype(int),
+        "Portions": n_in,
+        "Contents": contents,
+        "Fill (g)": np.round(fill).astype(int),
+        "Leftover (g)": np.round(cap - fill).astype(int),
+    })
+    prefix = np.where(packing["Storage"].to_numpy() == "Freezer", "Z", "F")
+    seq = packing.groupby("Storage").cumcount().to_numpy() + 1
+    packing.insert(0, "Label", [f"{p}-{s:04d}" for p, s in zip(prefix, seq)])
+
+    summary = (
+        packing.groupby(["Storage", "Container (g)"])
+        .agg(Containers=("Label", "size"), **{"Fill (g)": ("Fill (g)", "sum"), "Leftover (g)": ("Leftover (g)", "sum")})
+        .reset_index()
+    )
+    summary["Utilization"] = (summary["Fill (g)"] / (summary["Fill (g)"] + summary["Leftover (g)"])).round(3)
+    return packing, summary
+
+
+# =========================================================
+# 13) Energy what-if explorer (weight × age × activity grids)
+# =========================================================
+
+WHATIF_WEIGHT_SPAN_KG = 5.0
+WHATIF_WEIGHT_STEP_KG = 0.5
+WHATIF_AGE_GRID = np.round(np.arange(0.5, 16.01, 0.5), 1)
+
+
+def whatif_axes(weight_kg: float, age_years: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Weight and age axes centred on the profile, always including its exact values."""
+    lo = max(0.5, weight_kg - WHATIF_WEIGHT_SPAN_KG)
+    weights = np.arange(lo, weight_kg + WHATIF_WEIGHT_SPAN_KG + 1e-9, WHATIF_WEIGHT_STEP_KG)
+    weights = np.unique(np.round(np.append(weights, weight_kg), 1))
+    ages = np.unique(np.round(np.append(WHATIF_AGE_GRID, age_years), 1))
+    return weights, ages
+
+
+def energy_sensitivity_grid(
+    weight_kg: float,
+    age_years: float,
+    neutered: bool,
+    adjustment: float,
+    assumed_kcal_per_g: float,
+    meals_per_day: int,
+) -> pd.DataFrame:
+    """
+    Daily energy and cooked-mix targets over the full weight × age × activity
+    grid around one profile, evaluated in a single broadcast pass. Cached per
+    profile, so what-if lookups never recompute.
+    """
+    weights, ages = whatif_axes(weight_kg, age_years)
+    activities = list(ACTIVITY_BOOST)
+    boosts = np.array([ACTIVITY_BOOST[a] for a in activities])
+
+    w = weights[:, None, None]
+    a = ages[None, :, None]
+    b = boosts[None, None, :]
+    rer, mer, mer_adj = compute_daily_energy_batch(w, a, b, neutered, adjustment)
+    shape = np.broadcast_shapes(w.shape, a.shape, b.shape)
+    grams = mer_adj / assumed_kcal_per_g
+
+    stage_idx = np.where(ages < 1, 0, np.where(ages < 7, 1, 2))
+    return pd.DataFrame({
+        "Weight (kg)": np.broadcast_to(w, shape).ravel(),
+        "Age (years)": np.broadcast_to(a, shape).ravel(),
+        "Life stage": np.broadcast_to(np.array(LIFE_STAGES)[stage_idx][None, :, None], shape).ravel(),
+        "Activity": np.broadcast_to(np.array(activities)[None, None, :], shape).ravel(),
+        "RER (kcal)": np.broadcast_to(rer, shape).ravel().round(0),
+        "MER (kcal)": mer.ravel().round(0),
+        "Target kcal/day": mer_adj.ravel().round(0),
+        "Cooked mix (g/day)": grams.ravel().round(0),
+        "Per meal (g)": (grams / meals_per_day).ravel().round(0),
+    })
+
+
+def feeding_chart_by_weight_band(
+    age_years: float,
+    neutered: bool,
+    adjustment: float,
+    assumed_kcal_per_g: float,
+    meals_per_day: int,
+    min_kg: float,
+    max_kg: float,
+    band_kg: float,
+) -> pd.DataFrame:
+    """
+    Printable feeding chart: one row per weight band, cooked-mix grams/day at
+    each activity level evaluated at the band midpoint, plus the per-meal
+    portion at the profile's meal count.
+    """
+    edges = np.arange(min_kg, max_kg + 1e-9, band_kg)
+    if len(edges) < 2:
+        edges = np.array([min_kg, min_kg + band_kg])
+    mids = (edges[:-1] + edges[1:]) / 2
+    activities = list(ACTIVITY_BOOST)
+    boosts = np.array([ACTIVITY_BOOST[a] for a in activities])
+
+    _, _, kcal = compute_daily_energy_batch(mids[:, None], age_years, boosts[None, :], neutered, adjustment)
+    grams = kcal / assumed_kcal_per_g
+
+    chart = pd.DataFrame({"Weight band (kg)": [f"{lo:g}–{hi:g}" for lo, hi in zip(edges[:-1], edges[1:])]})
+    for j, act in enumerate(activities):
+        chart[f"{act} (g/day)"] = grams[:, j].round(0)
+    normal = activities.index("Normal")
+    chart["Normal kcal/day"] = kcal[:, normal].round(0)
+    chart[f"Normal per meal ×{meals_per_day} (g)"] = (grams[:, normal] / meals_per_day).round(0)
+    return chart
+
+
+# =========================================================
+# 14) Body-weight trajectory simulator
+# =========================================================
+
+# Energy content of gained/lost body tissue (kcal per kg), a common planning value.
+KCAL_PER_KG_TISSUE = 7700.0
+MIN_SIM_WEIGHT_KG = 0.5
+TRAJECTORY_HORIZONS = {"4 weeks": 28, "12 weeks": 84, "6 months": 182, "1 year": 365}
+
+
+def plan_category_kcal_per_g(plan_df: pd.DataFrame) -> Dict[str, float]:
+    """Average kcal per cooked gram of each category's picks across the plan."""
+    out = {}
+    for cat in ("Meat", "Veg", "Carb"):
+        idx = plan_df[cat].map(INGREDIENT_INDEX).dropna().astype(int).to_numpy()
+        out[cat] = float(MACRO_MATRIX[idx, 0].mean() / 100.0) if len(idx) else 0.0
+    return out
+
+
+def simulate_weight_trajectories(
+    start_weight_kg: float,
+    age_years: float,
+    neutered: bool,
+    adjustment: float,
+    intake_kcal_per_g: np.ndarray,
+    assumed_kcal_per_g: np.ndarray,
+    activity_boost: np.ndarray,
+    days: int,
+    reportion_every: int = 0,
+) -> np.ndarray:
+    """
+    Project body weight for S scenarios at once with a daily energy balance.
+
+    Portions are sized the way the planner does it (adjusted MER divided by
+    the *assumed* density) but the dog actually receives the plan's real
+    density, while expenditure follows the unadjusted MER at the current
+    weight (RER recomputed each day, life stage advancing with age).
+    With `reportion_every` > 0 portions are re-targeted to the current weight
+    on that cadence, as an owner following the app would do.
+    Returns a (days + 1, S) array of weights.
+    """
+    intake_d = np.asarray(intake_kcal_per_g, dtype=float)
+    assumed_d = np.asarray(assumed_kcal_per_g, dtype=float)
+    boost = np.asarray(activity_boost, dtype=float)
+    n = np.broadcast_shapes(intake_d.shape, assumed_d.shape, boost.shape)
+
+    # Everything that does not depend on weight is precomputed over the time axis.
+    ages = age_years + np.arange(days + 1) / 365.0
+    stage_idx = np.where(ages < 1, 0, np.where(ages < 7, 1, 2))
+    base_table = np.array([MER_BASE[s] for s in LIFE_STAGES], dtype=float)
+    mer_mult = base_table[stage_idx, int(bool(neutered))][:, None] * boost  # (T, S)
+
+    weights = np.empty((days + 1,) + n)
+    w = np.full(n, float(start_weight_kg))
+    weights[0] = w
+    grams = 70 * w ** 0.75 * mer_mult[0] * adjustment / assumed_d
+    for t in range(days):
+        if reportion_every and t and t % reportion_every == 0:
+            grams = 70 * w ** 0.75 * mer_mult[t] * adjustment / assumed_d
+        balance = grams * intake_d - 70 * w ** 0.75 * mer_mult[t]
+        w = np.maximum(w + balance / KCAL_PER_KG_TISSUE, MIN_SIM_WEIGHT_KG)
+        weights[t + 1] = w
+    return weights
+
+
+def weight_trajectory_frames(
+    start_weight_kg: float,
+    age_years: float,
+    neutered: bool,
+    adjustment: float,
+    category_kcal_per_g: Tuple[Tuple[str, float], ...],
+    scenarios: Tuple[Tuple[str, int, int, int, float, str], ...],
+    days: int,
+    reportion_every: int,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Run every (label, meat %, veg %, carb %, assumed density, activity)
+    scenario in one simulation. Returns (weekly long-form trajectories,
+    per-scenario summary).
+    """
+    dens = dict(category_kcal_per_g)
+    labels = [s[0] for s in scenarios]
+    pcts = np.array([s[1:4] for s in scenarios], dtype=float) / 100.0
+    intake_d = pcts @ np.array([dens["Meat"], dens["Veg"], dens["Carb"]])
+    assumed_d = np.array([s[4] for s in scenarios], dtype=float)
+    boost = np.array([ACTIVITY_BOOST.get(s[5], 1.0) for s in scenarios])
+
+    traj = simulate_weight_trajectories(
+        start_weight_kg, age_years, neutered, adjustment,
+        intake_d, assumed_d, boost, days, reportion_every,
+    )
+
+    sample = np.unique(np.append(np.arange(0, days + 1, 7), days))
+    long_df = pd.DataFrame({
+        "Day": np.repeat(sample, len(labels)),
+        "Scenario": np.tile(labels, len(sample)),
+        "Weight (kg)": traj[sample].ravel().round(2),
+    })
+
+    _, _, target = compute_daily_energy_batch(start_weight_kg, age_years, boost, neutered, adjustment)
+    grams0 = target / assumed_d
+    summary = pd.DataFrame({
+        "Scenario": labels,
+        "Start g/day": grams0.round(0),
+        "Start intake kcal/day": (grams0 * intake_d).round(0),
+        "Start MER kcal/day": (target / adjustment).round(0),
+        "End weight (kg)": traj[-1].round(2),
+        "Change (kg)": (traj[-1] - start_weight_kg).round(2),
+        "Change (%)": ((traj[-1] / start_weight_kg - 1) * 100).round(1),
+    })
+    return long_df, summary.sort_values("Change (kg)").reset_index(drop=True)
+
+
+# =========================================================
+# 15) Micronutrient completeness
+# =========================================================
+
+# Minimum per 1000 kcal ME, aligned with MICRO_KEYS (AAFCO/NRC-style reference
+# values; Vit A/D converted from IU, Vit E as mg alpha-tocopherol).
+MICRO_REQUIREMENTS_PER_1000KCAL = {
+    "Puppy": (3000, 2500, 25, 22, 3.1, 375, 3.1, 8.4, 130),
+    "Adult": (1250, 1000, 20, 10, 1.83, 375, 3.1, 8.4, 110),
+    "Senior": (1250, 1000, 20, 10, 1.83, 375, 3.1, 8.4, 110),
+}
+CA_P_RATIO_RANGE = (1.0, 2.0)
+MICRO_MARGINAL = 0.5  # below this fraction of the requirement a shortfall is a gap
+
+# Which SUPPLEMENTS entry covers a shortfall of each nutrient
+MICRO_SUPPLEMENT = {
+    "Ca": "Calcium Support (home-cooked essential)",
+    "P": "Canine Multivitamin",
+    "Zn": "Canine Multivitamin",
+    "Fe": "Canine Multivitamin",
+    "Cu": "Canine Multivitamin",
+    "Vit A": "Canine Multivitamin",
+    "Vit D": "Canine Multivitamin",
+    "Vit E": "Vitamin E (as guided)",
+    "EPA+DHA": "Omega-3 (Fish Oil)",
+}
+SUPPLEMENT_BY_NAME = {s["name"]: s for s in SUPPLEMENTS}
+
+
+def plan_micronutrients(plan_df: pd.DataFrame, columns=SHOPPING_COLUMNS) -> np.ndarray:
+    """(days, len(MICRO_KEYS)) micronutrient totals for each plan row."""
+    cats = [c for c, _ in columns]
+    idx = np.column_stack([plan_df[c].map(INGREDIENT_INDEX).fillna(-1).astype(int) for c in cats])
+    grams = np.column_stack([plan_df[g].to_numpy(dtype=float) for _, g in columns])
+    grams = np.where(idx >= 0, grams, 0.0)
+    return np.einsum("dc,dck->dk", grams / 100.0, MICRO_MATRIX[np.maximum(idx, 0)])
+
+
+def score_micronutrients(plan_df: pd.DataFrame, life_stage,
+                         columns=SHOPPING_COLUMNS) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Adequacy of every plan day and of the plan as a whole, scored per 1000
+    kcal against the life-stage requirement in one vectorized pass.
+    `life_stage` is one stage for the whole plan or one per row (households).
+    Returns (per-day adequacy %, per-nutrient summary with supplement hints).
+    """
+    if plan_df.empty:
+        return pd.DataFrame(), pd.DataFrame()
+    amounts = plan_micronutrients(plan_df, columns)
+    kcal = plan_df["Est kcal"].to_numpy(dtype=float)
+
+    stages = np.broadcast_to(np.asarray(life_stage, dtype=object), (len(plan_df),))
+    req = np.array([MICRO_REQUIREMENTS_PER_1000KCAL.get(st_, MICRO_REQUIREMENTS_PER_1000KCAL["Adult"])
+                    for st_ in stages], dtype=float)
+    day_req = req * kcal[:, None] / 1000.0
+    day_adequacy = np.divide(amounts, day_req, out=np.zeros_like(amounts), where=day_req > 0)
+
+    plan_amounts = amounts.sum(axis=0)
+    plan_req = day_req.sum(axis=0)
+    plan_adequacy = np.divide(plan_amounts, plan_req, out=np.zeros_like(plan_amounts), where=plan_req > 0)
+    ca, p = MICRO_KEYS.index("Ca"), MICRO_KEYS.index("P")
+
+    day_df = pd.DataFrame((day_adequacy * 100).round(0), columns=list(MICRO_KEYS))
+    day_df.insert(0, "Day", plan_df["Day"].to_numpy())
+    if "Meal" in plan_df.columns:
+        day_df.insert(1, "Meal", plan_df["Meal"].to_numpy())
+    if "Dog" in plan_df.columns:
+        day_df.insert(0, "Dog", plan_df["Dog"].to_numpy())
+    day_df["Ca:P"] = np.divide(amounts[:, ca], amounts[:, p],
+                               out=np.zeros(len(amounts)), where=amounts[:, p] > 0).round(2)
+    day_df["Day score"] = (np.clip(day_adequacy, 0, 1).mean(axis=1) * 100).round(0)
+
+    status = np.where(plan_adequacy >= 1, "OK", np.where(plan_adequacy >= MICRO_MARGINAL, "Marginal", "Gap"))
+    summary = pd.DataFrame({
+        "Nutrient": MICRO_KEYS,
+        "Unit": [MICRO_UNITS[k] for k in MICRO_KEYS],
+        "Plan per 1000 kcal": (plan_amounts / max(kcal.sum(), 1e-9) * 1000).round(2),
+        "Need per 1000 kcal": (plan_req / max(kcal.sum(), 1e-9) * 1000).round(2),
+        "Adequacy (%)": (plan_adequacy * 100).round(0),
+        "Days below need": (day_adequacy < 1).sum(axis=0),
+        "Status": status,
+        "Suggested supplement": [MICRO_SUPPLEMENT[k] if s != "OK" else "—" for k, s in zip(MICRO_KEYS, status)],
+    })
+    ratio = plan_amounts[ca] / plan_amounts[p] if plan_amounts[p] > 0 else 0.0
+    lo, hi = CA_P_RATIO_RANGE
+    summary.loc[len(summary)] = {
+        "Nutrient": "Ca:P ratio", "Unit": f"ratio ({lo:g}–{hi:g})",
+        "Plan per 1000 kcal": round(ratio, 2), "Need per 1000 kcal": lo,
+        "Adequacy (%)": np.nan, "Days below need": int((day_df["Ca:P"] < lo).sum()),
+        "Status": "OK" if lo <= ratio <= hi else "Gap",
+        "Suggested supplement": MICRO_SUPPLEMENT["Ca"] if ratio < lo else "—",
+    }
+    return day_df, summary
+
+
+# =========================================================
+# 16) Day locking and partial regeneration
+# =========================================================
+
+LOCK_COLUMNS = {"Meat": "🔒 Meat", "Veg": "🔒 Veg", "Carb": "🔒 Carb"}
+
+
+def default_plan_locks(plan_df: pd.DataFrame) -> pd.DataFrame:
+    locks = pd.DataFrame({"Day": plan_df["Day"].to_numpy()})
+    for col in LOCK_COLUMNS.values():
+        locks[col] = False
+    return locks
+
+
+def lock_matrix(locks: Optional[pd.DataFrame], plan_df: pd.DataFrame) -> np.ndarray:
+    """(days, 3) bool in ROTATION_CATEGORIES order, aligned on the plan's Day labels."""
+    if locks is None or locks.empty:
+        return np.zeros((len(plan_df), 3), dtype=bool)
+    aligned = locks.set_index("Day").reindex(plan_df["Day"])
+    return np.column_stack([
+        aligned[LOCK_COLUMNS[c]].fillna(False).astype(bool).to_numpy() for c in ROTATION_CATEGORIES
+    ])
+
+
+DISLIKE_BELOW = 0.5  # average taste score (0 = Dislike … 3 = Love)
+
+
+def affected_slots(
+    plan_df: pd.DataFrame,
+    pools: Tuple[List[str], List[str], List[str]],
+    taste_meat_map: Optional[Dict[str, float]] = None,
+    taste_veg_map: Optional[Dict[str, float]] = None,
+    rules: Optional["RotationRules"] = None,
+    start_weekday: int = 0,
+) -> np.ndarray:
+    """Slots whose ingredient left its (new) pool, is now mostly disliked or breaks a rotation rule."""
+    out = np.column_stack([
+        ~plan_df[c].isin(pool).to_numpy() for c, pool in zip(ROTATION_CATEGORIES, pools)
+    ])
+    for k, taste_map in enumerate((taste_meat_map, taste_veg_map)):
+        disliked = [x for x, score in (taste_map or {}).items() if score < DISLIKE_BELOW]
+        out[:, k] |= plan_df[ROTATION_CATEGORIES[k]].isin(disliked).to_numpy()
+    if rules:
+        rotation = plan_df[list(ROTATION_CATEGORIES)].to_dict("records")
+        for d, cat, _ in rules.violations(rotation, start_weekday):
+            out[d, ROTATION_CATEGORIES.index(cat)] = True
+    return out
+
+
+def regenerate_plan_slots(
+    plan_df: pd.DataFrame,
+    regen: np.ndarray,
+    pools: Tuple[List[str], List[str], List[str]],
+    taste_meat_map: Dict[str, float],
+    taste_veg_map: Dict[str, float],
+    use_taste_weights: bool,
+    seed: int,
+    rules: Optional["RotationRules"] = None,
+    start_weekday: int = 0,
+) -> Tuple[pd.DataFrame, np.ndarray]:
+    """
+    Re-pick only the slots flagged in `regen` (days x Meat/Veg/Carb).
+    Meat and veg avoid the previous day's pick and, when the next day is kept,
+    the next day's too, so locked neighbours still get no back-to-back repeats.
+    With rotation `rules`, a slot draws from the candidates that leave the
+    whole plan (locked days included) with the fewest rule breaks.
+    Returns (picks-only plan copy, indices of rows that changed); gram and
+    nutrition columns of those rows still need refresh_plan_rows().
+    """
+    rng = random.Random(seed)
+    old = plan_df[list(ROTATION_CATEGORIES)].to_numpy(dtype=object)
+    values = old.copy()
+    taste_maps = (taste_meat_map, taste_veg_map, {})
+    days = len(values)
+
+    def fewest_breaks(d: int, k: int, candidates: List[str]) -> List[str]:
+        if not rules:
+            return candidates
+        breaks = []
+        for x in candidates:
+            values[d, k] = x
+            breaks.append(len(rules.violations([dict(zip(ROTATION_CATEGORIES, row)) for row in values],
+                                               start_weekday)))
+        return [x for x, n in zip(candidates, breaks) if n == min(breaks)]
+
+    for d in range(days):
+        for k, cat in enumerate(ROTATION_CATEGORIES):
+            if not regen[d, k]:
+                continue
+            pool = pools[k] or filter_ingredients_by_category(cat)
+            if cat == "Carb":
+                values[d, k] = rng.choice(fewest_breaks(d, k, list(pool)))
+                continue
+            avoid = set()
+            if d > 0:
+                avoid.add(values[d - 1, k])
+            if d + 1 < days and not regen[d + 1, k]:
+                avoid.add(values[d + 1, k])
+            candidates = fewest_breaks(d, k, [x for x in pool if x not in avoid] or list(pool))
+            weights = [taste_weight(x, taste_maps[k], use_taste_weights) for x in candidates]
+            values[d, k] = weighted_choice(rng, candidates, weights)
+
+    changed = np.flatnonzero((values != old).any(axis=1))
+    new_df = plan_df.copy()
+    for k, cat in enumerate(ROTATION_CATEGORIES):
+        new_df[cat] = values[:, k]
+    return new_df, changed
+
+
+def refresh_plan_rows(
+    plan_df: pd.DataFrame,
+    rows,
+    daily_grams: float,
+    meat_pct: int,
+    veg_pct: int,
+    carb_pct: int,
+    meals_per_day: int,
+) -> pd.DataFrame:
+    """Recompute gram and nutrition columns for `rows` only, as generate_plan_df builds them."""
+    mg, vg, cg = grams_for_day(daily_grams, meat_pct, veg_pct, carb_pct)
+    out = plan_df.copy()
+    for r in np.asarray(rows, dtype=int):
+        nut = day_nutrition_estimate(out.at[r, "Meat"], out.at[r, "Veg"], out.at[r, "Carb"], mg, vg, cg)
+        out.loc[r, [
+            "Daily Meat (g)", "Daily Veg (g)", "Daily Carb (g)", "Meals/day", "Per-Meal Total (g)",
+            "Per-Meal Meat (g)", "Per-Meal Veg (g)", "Per-Meal Carb (g)",
+            "Est kcal", "Protein (g)", "Fat (g)", "Carbs (g)",
+        ]] = [
+            round(mg), round(vg), round(cg), meals_per_day, round(daily_grams / meals_per_day),
+            round(mg / meals_per_day), round(vg / meals_per_day), round(cg / meals_per_day),
+            round(nut["kcal"]), round(nut["protein"], 1), round(nut["fat"], 1), round(nut["carbs"], 1),
+        ]
+    return out
+
+
+# =========================================================
+# 17) Taste-log bulk import / export
+# =========================================================
+
+TASTE_LOG_COLUMNS = [
+    "Dog Name", "Breed", "Age (y)", "Weight (kg)", "Protein", "Veg",
+    "Preference", "Stool", "Energy", "Skin", "Notes", "Logged",
+]
+TASTE_IMPORT_CHUNK_ROWS = 50_000
+TASTE_IMPORT_REJECT_SAMPLES = 50
+
+# normalized header -> canonical column
+TASTE_COLUMN_ALIASES = {
+    "dog name": "Dog Name", "dog": "Dog Name", "name": "Dog Name", "patient": "Dog Name",
+    "breed": "Breed",
+    "age y": "Age (y)", "age": "Age (y)", "age years": "Age (y)",
+    "weight kg": "Weight (kg)", "weight": "Weight (kg)",
+    "protein": "Protein", "meat": "Protein",
+    "veg": "Veg", "vegetable": "Veg", "veggie": "Veg",
+    "preference": "Preference", "pref": "Preference", "liking": "Preference", "rating": "Preference",
+    "stool": "Stool", "poop": "Stool", "feces": "Stool", "faeces": "Stool",
+    "energy": "Energy", "energy level": "Energy",
+    "skin": "Skin", "itch": "Skin", "itching": "Skin", "itching skin": "Skin", "skin coat": "Skin",
+    "notes": "Notes", "note": "Notes", "comment": "Notes", "comments": "Notes",
+    "logged": "Logged", "date": "Logged", "timestamp": "Logged", "observed": "Logged",
+    "observed at": "Logged", "visit date": "Logged",
+}
+
+# column -> {normalized spelling: canonical value}; canonical values are the
+# same options the single-entry form offers.
+TASTE_VALUE_SYNONYMS = {
+    "Preference": {
+        "dislike": "Dislike", "disliked": "Dislike", "hate": "Dislike", "refused": "Dislike",
+        "rejected": "Dislike", "0": "Dislike",
+        "neutral": "Neutral", "ok": "Neutral", "okay": "Neutral", "meh": "Neutral",
+        "indifferent": "Neutral", "1": "Neutral",
+        "like": "Like", "liked": "Like", "likes": "Like", "good": "Like", "2": "Like",
+        "love": "Love", "loved": "Love", "loves": "Love", "favorite": "Love", "favourite": "Love", "3": "Love",
+    },
+    "Stool": {
+        "normal": "Normal", "firm": "Normal", "good": "Normal",
+        "soft": "Soft", "mushy": "Soft",
+        "loose": "Loose", "diarrhea": "Loose", "diarrhoea": "Loose", "runny": "Loose", "watery": "Loose",
+        "constipated": "Constipated", "hard": "Constipated", "constipation": "Constipated",
+    },
+    "Energy": {
+        "normal": "Normal", "usual": "Normal",
+        "high": "High", "hyper": "High", "energetic": "High",
+        "low": "Low", "lethargic": "Low", "tired": "Low", "sluggish": "Low",
+    },
+    "Skin": {
+        "no change": "No change", "same": "No change", "unchanged": "No change", "none": "No change",
+        "improved": "Improved", "better": "Improved", "less itchy": "Improved",
+        "worse": "Worse", "itchy": "Worse", "more itchy": "Worse", "flare": "Worse",
+    },
+}
+_TASTE_BLANKS = {"", "nan", "none", "null", "na", "n a", "skip"}
+
+
+@dataclass
+class TasteImportReport:
+    rows_read: int = 0
+    rows_imported: int = 0
+    rows_rejected: int = 0
+    fields_cleared: int = 0
+    corrections: Dict[Tuple[str, str], str] = field(default_factory=dict)
+    rejects: List[Tuple[int, str]] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows_read / self.seconds if self.seconds > 0 else 0.0
+
+
+class TasteLogNormalizer:
+    """
+    Maps raw spellings to canonical taste-log values.
+
+    Ingredients resolve exactly, then through a per-category FuzzyIndex over
+    full names and their short forms ("Chicken" for "Chicken (lean, cooked)").
+    Observation columns resolve through TASTE_VALUE_SYNONYMS, then fuzzily.
+    Every distinct raw string is resolved once and memoized, so a file with
+    millions of rows costs one lookup per spelling, not per row.
+    """
+
+    def __init__(self, min_score: float = 0.55):
+        self.min_score = min_score
+        self.memo: Dict[str, Dict[str, Optional[str]]] = {}
+        self.indexes: Dict[str, Tuple[FuzzyIndex, List[str]]] = {}
+        for column, category in (("Protein", "Meat"), ("Veg", "Veg")):
+            names = filter_ingredients_by_category(category)
+            keys, owners, weights = list(names), list(range(len(names))), [1.0] * len(names)
+            for i, n in enumerate(names):
+                short = n.split("(")[0].strip()
+                if short != n:
+                    keys.append(short)
+                    owners.append(i)
+                    weights.append(0.98)
+            self.indexes[column] = (FuzzyIndex(keys, owners, weights), names)
+        for column, synonyms in TASTE_VALUE_SYNONYMS.items():
+            values = list(dict.fromkeys(synonyms.values()))
+            keys = values + list(synonyms)
+            owners = list(range(len(values))) + [values.index(v) for v in synonyms.values()]
+            self.indexes[column] = (FuzzyIndex(keys, owners), values)
+
+    def resolve(self, column: str, raw: str) -> Tuple[Optional[str], bool]:
+        """(canonical or None, ok). Blank input is (None, True); unknown input is (None, False)."""
+        memo = self.memo.setdefault(column, {})
+        if raw in memo:
+            value = memo[raw]
+        else:
+            value = memo[raw] = self._lookup(column, raw)
+        if value is None:
+            return None, normalize_search_text(raw) in _TASTE_BLANKS
+        return value, True
+
+    def _lookup(self, column: str, raw: str) -> Optional[str]:
+        norm = normalize_search_text(raw)
+        if norm in _TASTE_BLANKS:
+            return None
+        if column in TASTE_VALUE_SYNONYMS and norm in TASTE_VALUE_SYNONYMS[column]:
+            return TASTE_VALUE_SYNONYMS[column][norm]
+        if column in ("Protein", "Veg") and raw.strip() in INGREDIENTS:
+            return raw.strip()
+        index, values = self.indexes[column]
+        hits = index.search(raw, limit=1, min_score=self.min_score)
+        return values[hits[0][0]] if hits else None
+
+
+@lazy_global("TASTE_NORMALIZER")
+def taste_normalizer() -> TasteLogNormalizer:
+    # Shared by callers that validate small batches (service requests); the
+    # memo keeps growing only with distinct spellings.
+    return TasteLogNormalizer()
+
+
+def _taste_timestamps(raw: pd.Series) -> pd.Series:
+    """
+    ISO-8601 UTC text ("2024-03-01" or "2024-03-01T08:30:00+00:00") per
+    distinct input; None where unreadable. ISO input parses in one vectorized
+    call; only other spellings ("03/01/2024") fall back to one parse each.
+    """
+    uniq = pd.Series(pd.unique(raw[raw != ""]), dtype=object)
+    parsed = pd.to_datetime(uniq, format="ISO8601", errors="coerce", utc=True)
+    for i in np.flatnonzero(parsed.isna().to_numpy()):
+        parsed.iloc[i] = pd.to_datetime(uniq.iloc[i], errors="coerce", utc=True)
+    ok = parsed.notna().to_numpy()
+    secs = parsed.dt.tz_localize(None).to_numpy(dtype="datetime64[s]")
+    has_time = (secs - secs.astype("datetime64[D]")) != np.timedelta64(0, "s")
+    text = np.where(has_time, np.char.add(np.datetime_as_string(secs, unit="s"), "+00:00"),
+                    np.datetime_as_string(secs, unit="D"))
+    # .tolist() hands back plain str: pandas' ISO8601 parser rejects numpy.str_.
+    lookup = dict(zip(uniq[ok], text[ok].tolist()))
+    return raw.map(lookup)
+
+
+def _taste_header(col) -> str:
+    return TASTE_COLUMN_ALIASES.get(normalize_search_text(col), str(col))
+
+
+# Bytes read per step of the CSV record scan.
+TASTE_IMPORT_BLOCK_BYTES = 4 * 1024 * 1024
+
+
+def _scan_csv_records(buf: bytes, final: bool):
+    """
+    Quote-aware record boundaries of a CSV byte block, in a few NumPy passes.
+
+    Returns (starts, ends, fields, newlines_before, consumed): per complete
+    record its byte span (end excludes the newline), its field count, and how
+    many newlines (quoted ones included) precede it, i.e. its physical line
+    offset; `consumed` is where the incomplete tail starts. Quotes are
+    assumed RFC 4180 style ("" escapes toggle twice), as the C parser reads them.
+    """
+    a = np.frombuffer(buf, dtype=np.uint8)
+    quotes = np.flatnonzero(a == ord('"'))
+    newlines = np.flatnonzero(a == ord("\n"))
+    commas = np.flatnonzero(a == ord(","))
+    # A byte is inside quotes when an odd number of quotes precede it.
+    ends = newlines[(np.searchsorted(quotes, newlines) & 1) == 0]
+    commas = commas[(np.searchsorted(quotes, commas) & 1) == 0]
+    consumed = int(ends[-1]) + 1 if ends.size else 0
+    if final and consumed < len(buf):
+        ends = np.append(ends, len(buf))
+        consumed = len(buf)
+    starts = np.concatenate(([0], ends[:-1] + 1)) if ends.size else ends
+    fields = np.searchsorted(commas, ends) - np.searchsorted(commas, starts) + 1
+    newlines_before = np.searchsorted(newlines, starts)
+    return starts, ends, fields, newlines_before, consumed
+
+
+def iter_taste_csv_frames(fh, chunk_rows: int = TASTE_IMPORT_CHUNK_ROWS):
+    """
+    Yield (physical line numbers, raw string frame, bad lines) chunks from a CSV byte stream.
+
+    Each block is split into records by _scan_csv_records first, so rows with
+    more fields than the header are reported with their real line number
+    (multi-line quoted fields included) and only well-formed rows reach the
+    C parser, which left to itself silently truncates, skips or re-indexes
+    such rows depending on where a chunk starts.
+    """
+    header, header_fields = None, 0
+    tail, line_base = b"", 1
+    while True:
+        data = fh.read(TASTE_IMPORT_BLOCK_BYTES)
+        final = not data
+        buf = tail + data
+        if header is None and buf.startswith(b"\xef\xbb\xbf"):
+            buf = buf[3:]
+        starts, ends, fields, newlines_before, consumed = _scan_csv_records(buf, final)
+        lines = line_base + newlines_before
+        line_base += buf.count(b"\n", 0, consumed)
+        tail = buf[consumed:]
+
+        lengths = ends - starts
+        last_byte = np.frombuffer(buf, dtype=np.uint8)[np.maximum(ends - 1, 0)] if len(buf) else lengths
+        keep = (lengths > 1) | ((lengths == 1) & (last_byte != ord("\r")))  # blank lines are skipped
+        if header is None:
+            if not keep.any():
+                if final:
+                    return
+                continue
+            first = int(np.flatnonzero(keep)[0])
+            header, header_fields = buf[starts[first]:ends[first]].rstrip(b"\r"), int(fields[first])
+            keep[:first + 1] = False
+        kept = np.flatnonzero(keep)
+        for lo in range(0, kept.size, chunk_rows):
+            rows = kept[lo:lo + chunk_rows]
+            bad = fields[rows] > header_fields
+            bad_lines = [(int(lines[i]), f"malformed CSV row ({int(fields[i])} fields, header has {header_fields})")
+                         for i in rows[bad]]
+            group = rows[~bad]
+            if group.size and group[-1] - group[0] + 1 == group.size:
+                body = buf[starts[group[0]]:ends[group[-1]]]  # contiguous rows: one slice
+            else:
+                body = b"\n".join(buf[starts[i]:ends[i]] for i in group)
+            frame = pd.read_csv(io.BytesIO(header + b"\n" + body), dtype=str, keep_default_na=False,
+                                index_col=False, skipinitialspace=True)
+            yield lines[group], frame, bad_lines
+        if final:
+            return
+
+
+def iter_taste_frames(fh, fmt: str, chunk_rows: int = TASTE_IMPORT_CHUNK_ROWS):
+    """
+    Yield (source line numbers, raw string frame, bad lines) chunks from a CSV
+    or JSON Lines byte stream without loading the whole file.
+    """
+    if fmt == "CSV":
+        yield from iter_taste_csv_frames(fh, chunk_rows)
+        return
+    if fmt != "JSON Lines":
+        raise ValueError(f"Unknown taste-log import format: {fmt}")
+
+    def parse(block: List[Tuple[int, str]]):
+        # One json.loads over the whole block is far cheaper than one per line;
+        # only a block with a broken line pays for the per-line fallback.
+        try:
+            records = json.loads("[" + ",".join(line for _, line in block) + "]")
+            if all(isinstance(r, dict) for r in records):
+                return np.asarray([n for n, _ in block]), pd.DataFrame.from_records(records), []
+        except ValueError:
+            pass
+        records, lines, bad = [], [], []
+        for line_no, line in block:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                rec = None
+            if isinstance(rec, dict):
+                records.append(rec)
+                lines.append(line_no)
+            else:
+                bad.append((line_no, "not a JSON object"))
+        return np.asarray(lines, dtype=np.int64), pd.DataFrame.from_records(records), bad
+
+    block = []
+    for line_no, line in enumerate(io.TextIOWrapper(fh, encoding="utf-8-sig", newline=""), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        block.append((line_no, line))
+        if len(block) >= chunk_rows:
+            yield parse(block)
+            block = []
+    if block:
+        yield parse(block)
+
+
+def normalize_taste_frame(
+    raw: pd.DataFrame,
+    normalizer: TasteLogNormalizer,
+    report: TasteImportReport,
+    line_numbers: Optional[np.ndarray] = None,
+    defaults: Optional[Dict[str, object]] = None,
+) -> pd.DataFrame:
+    """Canonical TASTE_LOG_COLUMNS frame for one chunk; rejected rows land in `report`."""
+    df = raw.rename(columns=_taste_header)
+    df = df.loc[:, ~df.columns.duplicated()]
+    n = len(df)
+    out = pd.DataFrame(index=df.index)
+    reasons = np.full(n, "", dtype=object)
+
+    def text(col):
+        if col not in df.columns:
+            return pd.Series([""] * n, index=df.index)
+        return df[col].fillna("").astype(str).str.strip()
+
+    for col in ("Protein", "Veg", "Preference", "Stool", "Energy", "Skin"):
+        values = text(col)
+        uniq = pd.unique(values)
+        resolved = {u: normalizer.resolve(col, u) for u in uniq}
+        for u, (value, _) in resolved.items():
+            if value is not None and normalize_search_text(u) != normalize_search_text(value):
+                report.corrections[(col, u)] = value
+        out[col] = values.map({u: r[0] for u, r in resolved.items()})
+        bad = ~values.map({u: r[1] for u, r in resolved.items()}).astype(bool).to_numpy()
+        if col in ("Protein", "Veg", "Preference"):
+            reasons[bad & (reasons == "")] = f"unknown {col.lower()}"
+        else:
+            report.fields_cleared += int(bad.sum())
+
+    missing = (reasons == "") & out["Preference"].isna().to_numpy()
+    reasons[missing] = "missing preference"
+    neither = (reasons == "") & out["Protein"].isna().to_numpy() & out["Veg"].isna().to_numpy()
+    reasons[neither] = "no protein or vegetable"
+
+    defaults = defaults or {}
+    out["Dog Name"] = text("Dog Name").replace("", defaults.get("Dog Name", "Your dog"))
+    out["Breed"] = text("Breed").replace("", defaults.get("Breed", ""))
+    for col in ("Age (y)", "Weight (kg)"):
+        out[col] = pd.to_numeric(text(col).str.replace(",", ".", regex=False), errors="coerce").round(2)
+    out["Notes"] = text("Notes")
+    logged = text("Logged")
+    out["Logged"] = _taste_timestamps(logged)
+    report.fields_cleared += int((out["Logged"].isna() & (logged != "")).sum())
+
+    keep = reasons == ""
+    rejected = np.flatnonzero(~keep)
+    report.rows_read += n
+    report.rows_rejected += rejected.size
+    room = TASTE_IMPORT_REJECT_SAMPLES - len(report.rejects)
+    lines = np.arange(1, n + 1) if line_numbers is None else line_numbers
+    report.rejects += [(int(lines[i]), reasons[i]) for i in rejected[:max(room, 0)]]
+    clean = out.loc[keep, TASTE_LOG_COLUMNS].reset_index(drop=True)
+    report.rows_imported += len(clean)
+    return clean
+
+
+def import_taste_log(
+    fh,
+    fmt: str,
+    write_batch,
+    defaults: Optional[Dict[str, object]] = None,
+    chunk_rows: int = TASTE_IMPORT_CHUNK_ROWS,
+    progress=None,
+) -> TasteImportReport:
+    """
+    Stream a CSV / JSON Lines taste log through validation into `write_batch`.
+
+    `write_batch` receives one canonical DataFrame per chunk, so callers can
+    append to a session log, a database or a file without ever holding the
+    whole import in memory. `progress(report)` is called after every chunk.
+    """
+    report = TasteImportReport()
+    normalizer = TasteLogNormalizer()
+    t0 = time.perf_counter()
+    for line_numbers, raw, bad_lines in iter_taste_frames(fh, fmt, chunk_rows):
+        report.rows_read += len(bad_lines)
+        report.rows_rejected += len(bad_lines)
+        room = TASTE_IMPORT_REJECT_SAMPLES - len(report.rejects)
+        report.rejects += bad_lines[:max(room, 0)]
+        if len(raw):
+            clean = normalize_taste_frame(raw, normalizer, report, line_numbers, defaults)
+            if len(clean):
+                write_batch(clean)
+        report.seconds = time.perf_counter() - t0
+        if progress is not None:
+            progress(report)
+    report.rejects.sort()
+    report.seconds = time.perf_counter() - t0
+    return report
+
+
+def taste_log_frame(entries: List[Dict]) -> pd.DataFrame:
+    """Session taste log as a frame with the canonical column order."""
+    df = pd.DataFrame(entries)
+    for col in TASTE_LOG_COLUMNS:
+        if col not in df.columns:
+            df[col] = None
+    return df[TASTE_LOG_COLUMNS]
+
+
+# =========================================================
+# 18) Prices + cost-aware planning
+# =========================================================
+
+PRICES_FILE = "prices.csv"
+PRICE_COLUMNS = ["Ingredient", "Pack (g)", "Pack price"]
+
+BUDGET_CANDIDATES = 4096  # rotations scored per budget plan
+BUDGET_MAX_TILT = 4.0  # strongest cheap-ingredient bias among the candidates
+BUDGET_MIN_TASTE = 1.0  # average meat/veg score (0 = Dislike … 3 = Love); unlogged count as Neutral
+BUDGET_MIN_DISTINCT = 3  # distinct proteins and veg per plan (fewer if the pool is smaller)
+
+
+def _builtin_price_rows() -> List[Tuple[str, int, float]]:
+    """Illustrative supermarket packs (currency-neutral); replace with data/prices.csv or edit in the app."""
+    return [
+        ("Chicken (lean, cooked)", 500, 4.50), ("Chicken (lean, cooked)", 1000, 7.90),
+        ("Turkey (lean, cooked)", 500, 5.20), ("Turkey (lean, cooked)", 1000, 9.50),
+        ("Beef (lean, cooked)", 500, 6.80), ("Beef (lean, cooked)", 1000, 12.90),
+        ("Lamb (lean, cooked)", 500, 8.90),
+        ("Pork (lean, cooked)", 500, 4.90), ("Pork (lean, cooked)", 1000, 8.90),
+        ("Duck (lean, cooked)", 400, 7.50),
+        ("Venison (lean, cooked)", 400, 9.90),
+        ("Rabbit (cooked)", 500, 9.50),
+        ("Egg (cooked)", 360, 2.60), ("Egg (cooked)", 600, 3.90),
+        ("Salmon (cooked)", 300, 6.50), ("Salmon (cooked)", 1000, 17.90),
+        ("White Fish (cod, cooked)", 400, 6.20),
+        ("Sardines (cooked, deboned)", 120, 1.60), ("Sardines (cooked, deboned)", 500, 5.90),
+        ("Pumpkin (cooked)", 1000, 2.20),
+        ("Carrot (cooked)", 1000, 1.30),
+        ("Zucchini (cooked)", 500, 1.80),
+        ("Green Beans (cooked)", 500, 2.20),
+        ("Broccoli (cooked)", 500, 1.90),
+        ("Cauliflower (cooked)", 700, 2.10),
+        ("Bell Pepper (red, cooked)", 500, 2.90),
+        ("Spinach (cooked, small portions)", 250, 1.90),
+        ("Kale (cooked, small portions)", 250, 2.20),
+        ("Cabbage (cooked, small portions)", 1000, 1.40),
+        ("Sweet Potato (cooked)", 1000, 2.50),
+        ("Brown Rice (cooked)", 1000, 2.40), ("Brown Rice (cooked)", 5000, 9.90),
+        ("White Rice (cooked)", 1000, 1.90), ("White Rice (cooked)", 5000, 7.50),
+        ("Oats (cooked)", 500, 1.10),
+        ("Quinoa (cooked)", 500, 3.90),
+        ("Barley (cooked)", 500, 1.50),
+        ("Potato (cooked, plain)", 2500, 2.90),
+        ("Fish Oil (supplemental)", 250, 9.90),
+        ("Olive Oil (small amounts)", 500, 6.50),
+        ("Flaxseed Oil (small amounts)", 250, 5.90),
+        ("Blueberries (small portions)", 125, 2.50),
+        ("Apple (peeled, no seeds)", 1000, 2.90),
+        ("Strawberries (small portions)", 250, 2.90),
+    ]
+
+
+def default_price_table() -> pd.DataFrame:
+    return pd.DataFrame(_builtin_price_rows(), columns=PRICE_COLUMNS)
+
+
+def load_price_table() -> pd.DataFrame:
+    """
+    Safe loader: data/prices.csv (one row per ingredient and pack size) if
+    present and readable, else the built-in table. Unknown ingredients and
+    rows without a positive pack size or price are dropped.
+    """
+    path = os.path.join(DATA_DIR, PRICES_FILE)
+    if not os.path.exists(path):
+        return default_price_table()
+    try:
+        df = pd.read_csv(path, keep_default_na=False)
+        cleaned = clean_price_table(df)
+        return cleaned if not cleaned.empty else default_price_table()
+    except Exception:
+        return default_price_table()
+
+
+def clean_price_table(df: pd.DataFrame) -> pd.DataFrame:
+    if not set(PRICE_COLUMNS) <= set(df.columns):
+        return pd.DataFrame(columns=PRICE_COLUMNS)
+    out = df[PRICE_COLUMNS].copy()
+    out["Ingredient"] = out["Ingredient"].astype(str).str.strip()
+    out["Pack (g)"] = pd.to_numeric(out["Pack (g)"], errors="coerce")
+    out["Pack price"] = pd.to_numeric(out["Pack price"], errors="coerce")
+    ok = out["Ingredient"].isin(INGREDIENT_INDEX) & (out["Pack (g)"] > 0) & (out["Pack price"] > 0)
+    return out[ok].drop_duplicates(["Ingredient", "Pack (g)"], keep="last").reset_index(drop=True)
+
+
+# Pack-count combinations PriceTable.buy tries per ingredient, at most.
+PACK_SEARCH_COMBOS = 100_000
+
+
+class PriceTable:
+    """
+    Pack prices per ingredient. `per_gram` (aligned with INGREDIENT_NAMES)
+    is the cheapest unit price over an ingredient's packs and drives the
+    vectorized cost scoring; ingredients without a price fall back to the
+    median unit price of their category. `buy()` turns gram totals into
+    whole packs for the shopping list.
+    """
+
+    def __init__(self, table: pd.DataFrame):
+        table = clean_price_table(table)
+        self.packs: Dict[str, List[Tuple[float, float]]] = {}
+        for name, g, price in table.itertuples(index=False):
+            self.packs.setdefault(name, []).append((float(g), float(price)))
+        for packs in self.packs.values():
+            packs.sort()
+
+        unit = np.full(len(INGREDIENT_NAMES), np.nan)
+        for name, packs in self.packs.items():
+            unit[INGREDIENT_INDEX[name]] = min(price / g for g, price in packs)
+        self.priced = ~np.isnan(unit)
+        categories = np.array([INGREDIENTS[n].category for n in INGREDIENT_NAMES])
+        for cat in np.unique(categories):
+            in_cat = categories == cat
+            known = unit[in_cat & self.priced]
+            unit[in_cat & ~self.priced] = float(np.median(known)) if len(known) else 0.0
+        self.per_gram = unit
+
+    def signature(self) -> Tuple:
+        return tuple(sorted((k, tuple(v)) for k, v in self.packs.items()))
+
+    def buy(self, name: str, grams: float) -> Tuple[str, float]:
+        """
+        Cheapest whole-pack purchase covering `grams`, over every mix of pack
+        sizes: each size but the cheapest per gram is tried at every count up
+        to what would cover `grams` alone, and the cheapest-per-gram size
+        tops up the rest. The count grid is capped at PACK_SEARCH_COMBOS
+        (largest ranges halved first), which only matters for tables with
+        many small packs. Ties go to fewer packs. Unpriced ingredients are
+        costed at the fallback unit price with no pack split.
+        """
+        packs = self.packs.get(name)
+        if grams <= 0:
+            return "—", 0.0
+        if not packs:
+            return "unpriced", float(grams * self.per_gram[INGREDIENT_INDEX[name]]) if name in INGREDIENT_INDEX else 0.0
+
+        filler = min(range(len(packs)), key=lambda i: (packs[i][1] / packs[i][0], -packs[i][0]))
+        fill_g, fill_price = packs[filler]
+        others = [p for i, p in enumerate(packs) if i != filler]
+        caps = [int(np.ceil(grams / g - 1e-9)) for g, _ in others]
+        while np.prod([c + 1 for c in caps], dtype=float) > PACK_SEARCH_COMBOS:
+            j = int(np.argmax(caps))
+            caps[j] //= 2
+        grid = np.meshgrid(*(np.arange(c + 1) for c in caps), indexing="ij")
+        counts = np.stack([a.ravel() for a in grid], axis=1) if others else np.zeros((1, 0), dtype=np.int64)
+        sizes = np.array([g for g, _ in others], dtype=float)
+        prices = np.array([p for _, p in others], dtype=float)
+        fill = np.ceil(np.maximum(grams - counts @ sizes, 0.0) / fill_g - 1e-9).astype(np.int64)
+        cost = counts @ prices + fill * fill_price
+        best = int(np.lexsort((counts.sum(axis=1) + fill, np.round(cost, 6)))[0])
+
+        combo = {g: int(n) for g, n in zip(sizes, counts[best]) if n}
+        if fill[best]:
+            combo[fill_g] = int(fill[best])
+        desc = " + ".join(f"{count} × {size:.0f} g" for size, count in sorted(combo.items(), reverse=True))
+        return desc, round(float(cost[best]), 2)
+
+
+def load_prices() -> PriceTable:
+    return PriceTable(load_price_table())
+
+
+@lazy_global("PRICE_CATALOG")
+def price_catalog() -> PriceTable:
+    """The on-disk (or built-in) price table, read once per process."""
+    return load_prices()
+
+
+def rotation_costs(picks: np.ndarray, grams: np.ndarray, per_gram: np.ndarray) -> np.ndarray:
+    """
+    Cost of many rotations at once. `picks` is (..., days, 3) indices into
+    INGREDIENT_NAMES, `grams` the daily meat/veg/carb grams (3,) or
+    (..., 1, 3); returns the summed cost over days for every leading index.
+    """
+    return (per_gram[picks] * grams).sum(axis=(-1, -2))
+
+
+def rotation_distinct(picks: np.ndarray) -> np.ndarray:
+    """(N, 3) number of different ingredients per category in each (N, days, 3) rotation."""
+    s = np.sort(picks, axis=1)
+    return 1 + (np.diff(s, axis=1) != 0).sum(axis=1)
+
+
+def score_rotation_candidates(
+    picks: np.ndarray,
+    grams: np.ndarray,
+    prices: PriceTable,
+    taste_scores: np.ndarray,
+) -> Dict[str, np.ndarray]:
+    """
+    Vectorized scoring of (N, days, 3) candidate rotations: total cost,
+    average meat/veg taste score, lowest single meat/veg score and distinct
+    ingredients per category. `taste_scores` is aligned with INGREDIENT_NAMES.
+    """
+    tastes = taste_scores[picks[..., :2]]
+    return {
+        "cost": rotation_costs(picks, grams, prices.per_gram),
+        "taste": tastes.mean(axis=(1, 2)),
+        "worst": tastes.min(axis=(1, 2)),
+        "distinct": rotation_distinct(picks),
+    }
+
+
+def cheapest_rotation(
+    pools: Tuple[List[str], List[str], List[str]],
+    taste_meat_map: Dict[str, float],
+    taste_veg_map: Dict[str, float],
+    use_taste_weights: bool,
+    grams: Tuple[float, float, float],
+    prices: PriceTable,
+    days: int = 7,
+    seed: int = 42,
+    candidates: int = BUDGET_CANDIDATES,
+    progress: Optional[Dict[str, int]] = None,
+    cancel_event: Optional[threading.Event] = None,
+    rules: Optional["RotationRules"] = None,
+    start_weekday: int = 0,
+) -> Tuple[List[Dict[str, str]], Dict[str, float]]:
+    """
+    Lowest-cost rotation among `candidates` sampled ones that still meets the
+    taste and diversity floors. The ratio is kept by construction (the gram
+    split is fixed), and every candidate follows the sampler's no-repeat rules
+    and any user rotation `rules`.
+
+    Candidates come from one sample_rotations_batch pass, each tilted toward
+    cheap ingredients with its own strength (0 = plain taste-weighted draw,
+    up to BUDGET_MAX_TILT), so the pool spans cheap-but-repetitive through
+    varied-but-pricier plans; scoring is a handful of array reductions.
+    When no candidate meets every floor, the one with the fewest misses wins.
+    Returns (rotation as pick_rotation_smart returns it, summary of the winner).
+    """
+    universes = [filter_ingredients_by_category(c) for c in ROTATION_CATEGORIES]
+    cheapest = [prices.per_gram[[INGREDIENT_INDEX[x] for x in u]] for u in universes]
+    tilt = np.linspace(0.0, BUDGET_MAX_TILT, candidates)
+    scales = tuple(
+        np.power(np.min(c) / np.maximum(c, 1e-12), tilt[:, None]) if np.min(c) > 0 else np.ones((candidates, len(c)))
+        for c in cheapest
+    )
+    picks, _ = sample_rotations_batch(
+        [""] * candidates, [pools] * candidates,
+        [taste_meat_map] * candidates, [taste_veg_map] * candidates, use_taste_weights,
+        days=days, seed=seed, progress=progress, cancel_event=cancel_event, weight_scales=scales,
+        uniforms=np.random.default_rng(seed).random((candidates, days, 3)),
+        rules=rules, start_weekday=start_weekday,
+    )
+
+    taste_scores = np.full(len(INGREDIENT_NAMES), float(pref_score_from_label("Neutral")))
+    for taste_map in (taste_meat_map, taste_veg_map):
+        for name, score in taste_map.items():
+            if name in INGREDIENT_INDEX:
+                taste_scores[INGREDIENT_INDEX[name]] = score
+    score = score_rotation_candidates(picks, np.asarray(grams, dtype=float), prices, taste_scores)
+
+    need = np.array([min(BUDGET_MIN_DISTINCT, len(pool) or len(u), days) for pool, u in zip(pools, universes)])
+    misses = (score["distinct"][:, :2] < need[:2]).sum(axis=1)
+    if use_taste_weights:
+        misses += (score["taste"] < BUDGET_MIN_TASTE) + (score["worst"] < DISLIKE_BELOW)
+    best = int(np.lexsort((-score["taste"], score["cost"], misses))[0])
+
+    rotation = [dict(zip(ROTATION_CATEGORIES, (INGREDIENT_NAMES[j] for j in picks[best, d])))
+                for d in range(days)]
+    summary = {
+        "cost": float(score["cost"][best]),
+        "taste": float(score["taste"][best]),
+        "constraints_met": bool(misses[best] == 0),
+        "median_cost": float(np.median(score["cost"])),
+        "candidates": candidates,
+    }
+    return rotation, summary
+
+
+def add_plan_costs(plan_df: pd.DataFrame, prices: PriceTable, columns=SHOPPING_COLUMNS) -> pd.DataFrame:
+    """Copy of a plan (single dog, household or meal slots) with an "Est cost" column per row."""
+    out = plan_df.copy()
+    if out.empty:
+        return out
+    cost = np.zeros(len(out))
+    for name_col, grams_col in columns:
+        if name_col not in out.columns or grams_col not in out.columns:
+            continue
+        idx = out[name_col].map(INGREDIENT_INDEX)
+        ok = idx.notna().to_numpy()
+        grams = pd.to_numeric(out[grams_col], errors="coerce").fillna(0.0).to_numpy(dtype=float)
+        cost[ok] += prices.per_gram[idx[ok].astype(int).to_numpy()] * grams[ok]
+    out["Est cost"] = np.round(cost, 2)
+    return out
+
+
+def price_shopping_list(shopping_df: pd.DataFrame, prices: PriceTable) -> pd.DataFrame:
+    """Shopping list with the cheapest whole packs and their cost per ingredient."""
+    if shopping_df.empty:
+        return shopping_df
+    out = shopping_df.copy()
+    bought = [prices.buy(n, g) for n, g in zip(out["Ingredient"], out["Total grams"])]
+    out["Packs"] = [b[0] for b in bought]
+    out["Cost"] = [b[1] for b in bought]
+    return out
+
+
+# =========================================================
+# 19) Dog-profile registry (local SQLite, indexed search)
+# =========================================================
+
+PROFILE_DB_FILE = "profiles.sqlite3"
+PROFILE_FIELDS = [
+    "Name", "Breed", "Age (years)", "Weight (kg)", "Neutered", "Activity",
+    "Meals/day", "Flags", "Preset", "Pantry",
+]
+PROFILE_ENERGY_FIELDS = ("Weight (kg)", "Age (years)", "Activity", "Neutered", "Flags")
+PROFILE_SEARCH_LIMIT = 50
+_PROFILE_SCHEMA_VERSION = 1
+
+
+def profile_derived(profile: Dict) -> Dict:
+    """Values the app would otherwise recompute on every rerun (energy targets)."""
+    flags = [f for f in profile.get("Flags") or [] if f != "None"]
+    rer, mer, mer_adj, explanation = compute_daily_energy(
+        float(profile["Weight (kg)"]), float(profile["Age (years)"]),
+        profile.get("Activity", "Normal"), bool(profile.get("Neutered", True)), flags,
+    )
+    return {
+        "life_stage": age_to_life_stage(float(profile["Age (years)"])),
+        "rer": rer, "mer": mer, "mer_adj": mer_adj, "explanation": explanation,
+        "energy_inputs": profile_energy_key(profile),
+    }
+
+
+def profile_energy_key(profile: Dict) -> List:
+    """JSON-safe fingerprint of the inputs profile_derived() depends on."""
+    flags = sorted(f for f in profile.get("Flags") or [] if f != "None")
+    return [round(float(profile["Weight (kg)"]), 3), round(float(profile["Age (years)"]), 3),
+            profile.get("Activity", "Normal"), bool(profile.get("Neutered", True)), flags]
+
+
+def profile_search_terms(profile: Dict) -> List[str]:
+    """Normalized words of the name and breed; each is a row in the term index."""
+    text = f"{profile.get('Name', '')} {profile.get('Breed', '')}"
+    return sorted(set(normalize_search_text(text).split()))
+
+
+class ProfileRegistry:
+    """
+    Persistent dog profiles in one local SQLite file.
+
+    Each profile is a row with its fields as JSON plus the derived energy
+    values, and every word of its name and breed is a row in an indexed term
+    table, so a prefix search over thousands of patients is a few B-tree
+    range scans rather than a table scan. One connection is shared by all
+    threads of the process behind a lock (Streamlit reruns run on threads).
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.path.join(DATA_DIR, PROFILE_DB_FILE)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] < _PROFILE_SCHEMA_VERSION:
+            self.conn.executescript(f"""
+                CREATE TABLE IF NOT EXISTS profiles (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    breed TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    derived TEXT NOT NULL,
+                    updated REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS profile_terms (
+                    term TEXT NOT NULL,
+                    profile_id INTEGER NOT NULL REFERENCES profiles(id) ON DELETE CASCADE,
+                    PRIMARY KEY (term, profile_id)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS profile_terms_by_profile ON profile_terms(profile_id);
+                CREATE INDEX IF NOT EXISTS profiles_by_updated ON profiles(updated);
+                PRAGMA user_version = {_PROFILE_SCHEMA_VERSION};
+            """)
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
+
+    def count(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM profiles").fetchone()[0]
+
+    def save(self, profile: Dict, profile_id: Optional[int] = None) -> int:
+        """Insert (or overwrite `profile_id`) and refresh its derived values and search terms."""
+        data = {k: profile.get(k) for k in PROFILE_FIELDS}
+        data["Name"] = str(data.get("Name") or "").strip() or "Unnamed"
+        derived = profile_derived(data)
+        row = (data["Name"], str(data.get("Breed") or ""), json.dumps(data), json.dumps(derived), time.time())
+        with self.lock:
+            cur = self.conn.cursor()
+            cur.execute("BEGIN")
+            try:
+                if profile_id is None:
+                    cur.execute("INSERT INTO profiles (name, breed, data, derived, updated) VALUES (?, ?, ?, ?, ?)", row)
+                    profile_id = cur.lastrowid
+                else:
+                    cur.execute("INSERT OR REPLACE INTO profiles (id, name, breed, data, derived, updated) "
+                                "VALUES (?, ?, ?, ?, ?, ?)", (profile_id,) + row)
+                    cur.execute("DELETE FROM profile_terms WHERE profile_id = ?", (profile_id,))
+                cur.executemany("INSERT OR IGNORE INTO profile_terms (term, profile_id) VALUES (?, ?)",
+                                [(t, profile_id) for t in profile_search_terms(data)])
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+        return int(profile_id)
+
+    def save_many(self, profiles: List[Dict]) -> List[int]:
+        """Bulk insert in one transaction (imports, seeding a clinic's patient list)."""
+        rows, terms = [], []
+        for profile in profiles:
+            data = {k: profile.get(k) for k in PROFILE_FIELDS}
+            data["Name"] = str(data.get("Name") or "").strip() or "Unnamed"
+            rows.append((data["Name"], str(data.get("Breed") or ""), json.dumps(data),
+                         json.dumps(profile_derived(data)), time.time()))
+            terms.append(profile_search_terms(data))
+        ids = []
+        with self.lock:
+            cur = self.conn.cursor()
+            cur.execute("BEGIN")
+            try:
+                for row, words in zip(rows, terms):
+                    cur.execute("INSERT INTO profiles (name, breed, data, derived, updated) VALUES (?, ?, ?, ?, ?)", row)
+                    ids.append(cur.lastrowid)
+                    cur.executemany("INSERT OR IGNORE INTO profile_terms (term, profile_id) VALUES (?, ?)",
+                                    [(t, cur.lastrowid) for t in words])
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+        return ids
+
+    def get(self, profile_id: int) -> Optional[Dict]:
+        """The stored profile with its cached derived values under "Derived"."""
+        with self.lock:
+            row = self.conn.execute("SELECT data, derived FROM profiles WHERE id = ?", (profile_id,)).fetchone()
+        if row is None:
+            return None
+        profile = json.loads(row[0])
+        profile["Derived"] = json.loads(row[1])
+        return profile
+
+    def delete(self, profile_id: int) -> None:
+        with self.lock:
+            self.conn.execute("BEGIN")
+            self.conn.execute("DELETE FROM profile_terms WHERE profile_id = ?", (profile_id,))
+            self.conn.execute("DELETE FROM profiles WHERE id = ?", (profile_id,))
+            self.conn.execute("COMMIT")
+
+    def search(self, query: str, limit: int = PROFILE_SEARCH_LIMIT) -> List[Tuple[int, str, str]]:
+        """
+        (id, name, breed) of profiles where every query word prefixes some word
+        of the name or breed, most recently saved first. An empty query lists
+        the most recent profiles.
+        """
+        words = normalize_search_text(query).split()
+        if not words:
+            sql = "SELECT id, name, breed FROM profiles ORDER BY updated DESC LIMIT ?"
+            args: List = [limit]
+        else:
+            # One index range scan per word: term >= w AND term < w + U+FFFF.
+            parts = " INTERSECT ".join(
+                "SELECT profile_id FROM profile_terms WHERE term >= ? AND term < ?" for _ in words
+            )
+            sql = (f"SELECT id, name, breed FROM profiles WHERE id IN ({parts}) "
+                   "ORDER BY updated DESC LIMIT ?")
+            args = [x for w in words for x in (w, w + "\uffff")] + [limit]
+        with self.lock:
+            return [(int(i), n, b) for i, n, b in self.conn.execute(sql, args).fetchall()]
+
+
+# =========================================================
+# 20) Ratio preset × density sweep (Ratio Lab comparison mode)
+# =========================================================
+
+SWEEP_DENSITIES = (1.2, 1.35, 1.5)
+SWEEP_SEEDS = 32  # sampled 7-day rotations per sweep
+SWEEP_QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+SWEEP_METRICS = ("kcal error (%)", "Protein (g)", "Fat (g)")
+SWEEP_ON_TARGET_PCT = 10.0  # a day within ±10 % of the kcal target counts as on target
+
+
+def ratio_grid(meat: List[int], veg: List[int], carb: List[int]) -> List[Tuple[str, int, int, int]]:
+    """
+    Every meat × veg × carb combination as (label, meat %, veg %, carb %),
+    normalized with ensure_ratio_sum; combinations that normalize to the
+    same ratio are kept once.
+    """
+    out: Dict[Tuple[int, int, int], str] = {}
+    for m, v, c in itertools.product(meat, veg, carb):
+        if m + v + c <= 0:
+            continue
+        r = ensure_ratio_sum(int(m), int(v), int(c))
+        out.setdefault(r, f"Custom {r[0]}/{r[1]}/{r[2]}")
+    return [(label,) + r for r, label in out.items()]
+
+
+def sweep_rotations(pools: Tuple[List[str], List[str], List[str]], seeds: int, days: int = 7,
+                    seed: int = 42) -> np.ndarray:
+    """(seeds, days, 3) global ingredient indices: one planner rotation per seed, no taste weighting."""
+    pools = tuple(list(p) for p in pools)
+    return sample_rotations_batch(
+        [f"sweep-{i}" for i in range(seeds)], [pools] * seeds, [{}] * seeds, [{}] * seeds,
+        use_taste_weights=False, days=days, seed=seed,
+    )[0]
+
+
+def ratio_density_sweep(
+    target_kcal: float,
+    ratios: Tuple[Tuple[str, int, int, int], ...],
+    densities: Tuple[float, ...],
+    pools: Tuple[Tuple[str, ...], Tuple[str, ...], Tuple[str, ...]],
+    seeds: int = SWEEP_SEEDS,
+    days: int = 7,
+    seed: int = 42,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Evaluate every (label, meat %, veg %, carb %) ratio at every assumed
+    density over the same sampled rotations in one broadcast pass.
+
+    Portions are sized the way the planner does it (target kcal divided by
+    the assumed density, split by the ratio); each day then delivers the
+    picked ingredients' real kcal, protein and fat. All ratios and densities
+    share the rotations, so their differences are not sampling noise.
+    Returns (distribution bands in long form: one row per ratio × density ×
+    metric with the SWEEP_QUANTILES, per ratio × density summary ranked by
+    mean absolute kcal error within each density).
+    """
+    labels = [r[0] for r in ratios]
+    pcts = np.array([r[1:4] for r in ratios], dtype=float) / 100.0  # (R, 3)
+    dens = np.asarray(densities, dtype=float)  # (D,)
+    picks = sweep_rotations(pools, seeds, days, seed)  # (S, T, 3)
+
+    grams = target_kcal / dens[None, :, None] * pcts[:, None, :]  # (R, D, 3)
+    macros = MACRO_MATRIX[picks][..., :3] / 100.0  # (S, T, 3 categories, kcal/protein/fat)
+    daily = np.einsum("rdc,stck->rdstk", grams, macros).reshape(len(labels), len(dens), -1, 3)
+    daily[..., 0] = (daily[..., 0] / target_kcal - 1.0) * 100.0  # kcal -> % error vs target
+    q = np.quantile(daily, SWEEP_QUANTILES, axis=2)  # (Q, R, D, metrics)
+
+    r_idx, d_idx, m_idx = (a.ravel() for a in np.meshgrid(
+        np.arange(len(labels)), np.arange(len(dens)), np.arange(len(SWEEP_METRICS)), indexing="ij"))
+    bands = pd.DataFrame({
+        "Ratio": np.array(labels)[r_idx],
+        "Density": dens[d_idx],
+        "Metric": np.array(SWEEP_METRICS)[m_idx],
+    })
+    for qi, qv in enumerate(SWEEP_QUANTILES):
+        bands[f"p{round(qv * 100)}"] = q[qi].ravel().round(1)
+
+    err = daily[..., 0]
+    r_idx, d_idx = (a.ravel() for a in np.meshgrid(np.arange(len(labels)), np.arange(len(dens)), indexing="ij"))
+    mid = SWEEP_QUANTILES.index(0.5)
+    summary = pd.DataFrame({
+        "Ratio": np.array(labels)[r_idx],
+        "Meat %": (pcts[r_idx, 0] * 100).round().astype(int),
+        "Veg %": (pcts[r_idx, 1] * 100).round().astype(int),
+        "Carb %": (pcts[r_idx, 2] * 100).round().astype(int),
+        "Density": dens[d_idx],
+        "Mean |kcal error| (%)": np.abs(err).mean(axis=2).ravel().round(1),
+        "Median kcal error (%)": q[mid, ..., 0].ravel().round(1),
+        "Days on target (%)": ((np.abs(err) <= SWEEP_ON_TARGET_PCT).mean(axis=2) * 100).ravel().round(0),
+        "Median protein (g)": q[mid, ..., 1].ravel().round(1),
+        "Median fat (g)": q[mid, ..., 2].ravel().round(1),
+    })
+    summary["Rank"] = summary.groupby("Density")["Mean |kcal error| (%)"].rank(method="min").astype(int)
+    return bands, summary.sort_values(["Density", "Rank"]).reset_index(drop=True)
+
+
+# =========================================================
+# 21) Shared read-only catalogs (memory-mapped across server processes)
+# =========================================================
+
+CATALOG_DIR_ENV = "NEBULA_CATALOG_DIR"
+SHARED_CATALOGS_ENV = "NEBULA_SHARED_CATALOGS"  # "0" keeps every catalog private to its process
+_CATALOG_FORMAT = 1
+
+
+def catalog_dir() -> str:
+    """
+    Where catalogs are published: $NEBULA_CATALOG_DIR, or a per-user folder
+    under the temp dir created with mode 0700. Other processes memory-map
+    these files, so a folder someone else owns or can write to is refused
+    with OSError (shared_catalog then builds privately) rather than trusted.
+    """
+    configured = os.environ.get(CATALOG_DIR_ENV)
+    if not hasattr(os, "getuid"):  # Windows: the temp dir is already per-user
+        return configured or os.path.join(tempfile.gettempdir(), "nebula-catalogs")
+    folder = configured or os.path.join(tempfile.gettempdir(), f"nebula-catalogs-{os.getuid()}")
+    os.makedirs(folder, mode=0o700, exist_ok=True)
+    info = os.lstat(folder)
+    # A configured folder may be shared with a group; the default is private.
+    unsafe = 0o002 if configured else 0o077
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & unsafe:
+        raise OSError(f"catalog directory {folder} is not a private directory of this user")
+    return folder
+
+
+def catalog_stamp(*sources: str) -> str:
+    """
+    Version of a catalog from its inputs: this module (the built-in tables)
+    and any source files, by size and mtime. Changing an input publishes a
+    new file instead of touching one other processes have mapped.
+    """
+    parts = [str(_CATALOG_FORMAT)]
+    for path in (__file__,) + sources:
+        try:
+            info = os.stat(path)
+            parts.append(f"{os.path.abspath(path)}:{info.st_size}:{info.st_mtime_ns}")
+        except OSError:
+            parts.append(f"{path}:missing")
+    return f"{zlib.crc32('|'.join(parts).encode('utf-8')):08x}"
+
+
+def publish_catalog(name: str, stamp: str, build: Callable[[], pd.DataFrame]) -> str:
+    """
+    Path of the Arrow IPC file for (name, stamp), building and writing it
+    first if no process on this host has yet. The file is written under a
+    temporary name and renamed into place, so readers never see a partial
+    catalog; concurrent builders write identical content and the last
+    rename wins. Older versions of the catalog are unlinked (processes that
+    still map them keep their pages until they exit).
+    """
+    import pyarrow as pa
+
+    folder = catalog_dir()
+    path = os.path.join(folder, f"{name}-{stamp}.arrow")
+    if os.path.exists(path):
+        return path
+    table = pa.Table.from_pandas(build(), preserve_index=False)
+    tmp = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    try:
+        with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    for old in os.listdir(folder):
+        if old.startswith(f"{name}-") and old.endswith(".arrow") and old != os.path.basename(path):
+            try:
+                os.remove(os.path.join(folder, old))
+            except OSError:
+                pass  # still open on platforms that refuse to unlink mapped files
+    return path
+
+
+def attach_catalog(path: str) -> pd.DataFrame:
+    """
+    Frame over a published catalog without copying it: string columns stay
+    Arrow-backed on the memory map and numeric columns are read-only views
+    into it, so every process shares the same page-cache pages.
+    """
+    import pyarrow as pa
+
+    table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+    return table.to_pandas(types_mapper={pa.string(): pd.StringDtype("pyarrow")}.get, split_blocks=True)
+
+
+def shared_catalog(name: str, build: Callable[[], pd.DataFrame], *sources: str) -> pd.DataFrame:
+    """
+    `build()` published once per host and attached zero-copy by every
+    process. Falls back to a private in-process build when pyarrow is not
+    installed, sharing is switched off or the catalog directory is unusable.
+    """
+    if os.environ.get(SHARED_CATALOGS_ENV, "1") == "0":
+        return build()
+    try:
+        return attach_catalog(publish_catalog(name, catalog_stamp(*sources), build))
+    except (ImportError, OSError, ValueError):
+        return build()
+
+
+class CatalogRows(Mapping):
+    """
+    Read-only {key: {column: value}} view over a catalog frame — the shape
+    of `df.set_index(key).to_dict(orient="index")` — that reads rows from
+    the shared columns on lookup instead of holding a dict per row.
+    """
+
+    def __init__(self, df: pd.DataFrame, key: str):
+        self._row = {k: i for i, k in enumerate(df[key].tolist())}
+        self._cols = {c: df[c].array for c in df.columns if c != key}
+
+    def __getitem__(self, key: str) -> Dict[str, object]:
+        i = self._row[key]
+        return {c: values[i] for c, values in self._cols.items()}
+
+    def __iter__(self):
+        return iter(self._row)
+
+    def __len__(self) -> int:
+        return len(self._row)
+
+
+# =========================================================
+# 22) Rotation rules (small rule language, compiled to bitmasks)
+# =========================================================
+
+WEEKDAY_NAMES = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+ALL_DAYS = 0b1111111  # weekday bitmask, bit 0 = Monday
+MAX_ROTATION_RULES = 64  # one bit per rule in a uint64 ingredient mask
+RULE_EXAMPLES = (
+    "no fish two days running",
+    "red meat at most twice per week",
+    "salmon only on weekends",
+    "no beef on mondays",
+)
+_RULE_NUMBERS = {"once": 1, "twice": 2, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+                 "seven": 7}
+_DAY_WORDS = {
+    **{n.lower(): 1 << i for i, n in enumerate(WEEKDAY_NAMES)},
+    **{n[:3].lower(): 1 << i for i, n in enumerate(WEEKDAY_NAMES)},
+    "weekend": 0b1100000, "weekends": 0b1100000, "weekday": 0b0011111, "weekdays": 0b0011111,
+}
+_RULE_PATTERNS = (
+    ("max_run", re.compile(r"^no (?P<t>.+?) (?P<n>\w+) days? (?:running|in a row)$")),
+    ("max_run", re.compile(r"^no (?P<t>.+?) (?:on )?(?:consecutive|back to back) days$")),
+    ("max_per_week", re.compile(
+        r"^(?P<t>.+?) (?:at most|no more than|max) (?P<n>\w+)(?: times?| days?)? (?:per|a|each) week$")),
+    ("days", re.compile(r"^(?P<t>.+?) only on (?P<d>.+)$")),
+    ("not_days", re.compile(r"^no (?P<t>.+?) on (?P<d>.+)$")),
+    ("not_days", re.compile(r"^(?:no|never) (?P<t>.+)$")),
+)
+_RULE_KINDS = {"max_run": 0, "max_per_week": 1, "days": 2}
+
+
+@dataclass(frozen=True)
+class RotationRule:
+    text: str
+    targets: Tuple[str, ...]  # ingredient names, any rotation category
+    kind: str  # "max_run" | "max_per_week" | "days"
+    limit: int = 0  # longest run of target days, or target days per calendar week
+    days: int = ALL_DAYS  # weekdays on which the target may be served ("days" rules)
+
+
+def _rule_count(word: str) -> Optional[int]:
+    return int(word) if word.isdigit() else _RULE_NUMBERS.get(word)
+
+
+def _rule_days(text: str) -> Optional[int]:
+    mask = 0
+    for word in text.split():
+        if word in ("and", "or", "on"):
+            continue
+        bit = _DAY_WORDS.get(word) or _DAY_WORDS.get(word.rstrip("s"))
+        if bit is None:
+            return None
+        mask |= bit
+    return mask or None
+
+
+def resolve_rule_target(text: str) -> List[str]:
+    """
+    Rotation ingredients a rule names: an INGREDIENT_TAGS group (plural
+    allowed), else every ingredient with those words in its name.
+    """
+    key = normalize_search_text(text)
+    for tag in (key, key[:-1] if key.endswith("s") else key):
+        if tag in INGREDIENT_TAGS:
+            return list(INGREDIENT_TAGS[tag])
+    rotation = [n for c in ROTATION_CATEGORIES for n in filter_ingredients_by_category(c)]
+    return [n for n in rotation if f" {key}" in f" {normalize_search_text(n)}"] if key else []
+
+
+def parse_rotation_rule(line: str) -> RotationRule:
+    """One rule, e.g. "no fish two days running"; raises ValueError with a readable message."""
+    text = normalize_search_text(line)
+    for kind, pattern in _RULE_PATTERNS:
+        m = pattern.match(text)
+        if m is None:
+            continue
+        targets = resolve_rule_target(m.group("t"))
+        if not targets:
+            raise ValueError(f"unknown ingredient or group '{m.group('t')}'")
+        groups = m.groupdict()
+        if kind == "max_run":
+            n = _rule_count(groups["n"]) if groups.get("n") else 2
+            if n is None or n < 2:
+                raise ValueError(f"cannot read '{groups['n']}' as a number of days (2 or more)")
+            return RotationRule(line.strip(), tuple(targets), kind, limit=n - 1)
+        if kind == "max_per_week":
+            n = _rule_count(groups["n"])
+            if n is None or n > 7:
+                raise ValueError(f"cannot read '{groups['n']}' as a count per week (0–7)")
+            return RotationRule(line.strip(), tuple(targets), kind, limit=n)
+        days = _rule_days(groups["d"]) if groups.get("d") else ALL_DAYS
+        if days is None:
+            raise ValueError(f"cannot read '{groups['d']}' as weekdays")
+        allowed = days if kind == "days" else ALL_DAYS & ~days
+        return RotationRule(line.strip(), tuple(targets), "days", days=allowed)
+    raise ValueError("not a rule I understand — try e.g. " + "; ".join(f'"{e}"' for e in RULE_EXAMPLES))
+
+
+class RotationRules:
+    """
+    A compiled rule set. Every rule owns one bit; each rotation category gets
+    a uint64 mask per ingredient with the bits of the rules naming it. During
+    sampling a RuleTracker turns the rules' running state into one "blocked"
+    mask per dog, and a slot's candidates are filtered with a single AND
+    against the ingredient masks, so the check costs the same for 1 or 64
+    rules and scales with dogs x catalog size only.
+    """
+
+    def __init__(self, rules: List[RotationRule]):
+        if len(rules) > MAX_ROTATION_RULES:
+            raise ValueError(f"at most {MAX_ROTATION_RULES} rotation rules are supported")
+        self.rules = list(rules)
+        self.bit = np.array([1 << j for j in range(len(rules))], dtype=np.uint64)
+        self.kind = np.array([_RULE_KINDS[r.kind] for r in rules], dtype=np.int8)
+        self.limit = np.array([r.limit for r in rules], dtype=np.int64)
+        self.days = np.array([r.days for r in rules], dtype=np.int64)
+        universes = [filter_ingredients_by_category(c) for c in ROTATION_CATEGORIES]
+        self.local = [{n: i for i, n in enumerate(u)} for u in universes]
+        self.item_bits = [np.zeros(len(u), dtype=np.uint64) for u in universes]
+        self.name_bits: Dict[str, int] = {}
+        for j, rule in enumerate(rules):
+            for name in rule.targets:
+                self.name_bits[name] = self.name_bits.get(name, 0) | (1 << j)
+                for k in range(len(universes)):
+                    if name in self.local[k]:
+                        self.item_bits[k][self.local[k][name]] |= np.uint64(1 << j)
+
+    @classmethod
+    def parse(cls, text: str) -> Tuple["RotationRules", List[str]]:
+        """Compile one rule per line ('#' starts a comment); returns (rules, "line N: problem" messages)."""
+        rules, errors = [], []
+        for n, line in enumerate(str(text or "").splitlines(), start=1):
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            try:
+                rules.append(parse_rotation_rule(line))
+            except ValueError as exc:
+                errors.append(f"line {n}: {exc}")
+        if len(rules) > MAX_ROTATION_RULES:
+            errors.append(f"only the first {MAX_ROTATION_RULES} rules are used")
+            rules = rules[:MAX_ROTATION_RULES]
+        return cls(rules), errors
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def signature(self) -> Tuple:
+        return tuple((r.targets, r.kind, r.limit, r.days) for r in self.rules)
+
+    def tracker(self, dogs: int, start_weekday: int = 0) -> "RuleTracker":
+        return RuleTracker(self, dogs, start_weekday)
+
+    def violations(self, rotation: List[Dict[str, str]], start_weekday: int = 0,
+                   meals: int = 1) -> List[Tuple[int, str, str]]:
+        """
+        (row index, category, rule text) for every slot of a finished rotation
+        that breaks a rule. With `meals` > 1 the rows are meal slots, `meals`
+        per day (plan_meal_slots order), so the day is row // meals.
+        """
+        out = []
+        tracker = self.tracker(1, start_weekday)
+        for d, combo in enumerate(rotation):
+            for k, cat in enumerate(ROTATION_CATEGORIES):
+                name = combo.get(cat)
+                hit = self.name_bits.get(name, 0) & int(tracker.blocked()[0])
+                out += [(d, cat, r.text) for j, r in enumerate(self.rules) if hit >> j & 1]
+                if name in self.local[k]:
+                    tracker.record(k, np.array([self.local[k][name]]))
+            if (d + 1) % meals == 0:
+                tracker.next_day()
+        return out
+
+
+class RuleTracker:
+    """
+    Running rule state for M dogs over consecutive days: the current run of
+    days each rule's target was served, target days so far this calendar
+    week (Monday to Sunday) and whether a target is already in today's bowl
+    (a second slot of the same day then costs nothing).
+    """
+
+    def __init__(self, rules: RotationRules, dogs: int, start_weekday: int = 0):
+        self.rules = rules
+        self.weekday = int(start_weekday) % 7
+        shape = (dogs, len(rules))
+        self.run = np.zeros(shape, dtype=np.int64)
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.today = np.zeros(shape, dtype=bool)
+
+    def blocked(self) -> np.ndarray:
+        """(M,) uint64: bits of the rules that today's next pick must not hit."""
+        r = self.rules
+        off_day = ((r.days >> self.weekday) & 1) == 0
+        over = np.where(r.kind == 0, self.run >= r.limit, self.count >= r.limit) & ~self.today
+        cond = np.where(r.kind == 2, off_day, over)
+        return np.bitwise_or.reduce(np.where(cond, r.bit, np.uint64(0)), axis=1, initial=np.uint64(0))
+
+    def blocked_extra(self, run_after: np.ndarray, week_after: np.ndarray) -> np.ndarray:
+        """
+        blocked() for an extra serving on a day whose later days are already
+        planned. A run or weekly-count rule today's bowl has not hit yet may
+        gain today only if the run it joins (through the `run_after` planned
+        hit days from tomorrow) or the week's total (with `week_after` planned
+        hit days still to come) stays within its limit. Both are (M, rules).
+        """
+        r = self.rules
+        grown = np.where(r.kind == 0, self.run + 1 + run_after, self.count + 1 + week_after)
+        tight = (r.kind != 2)[None, :] & ~self.today & (grown > r.limit)
+        return self.blocked() | np.bitwise_or.reduce(
+            np.where(tight, r.bit, np.uint64(0)), axis=1, initial=np.uint64(0))
+
+    def allowed(self, k: int, masks: np.ndarray) -> np.ndarray:
+        """Pool masks for category k minus rule-blocked ingredients; a dog with nothing left keeps its pool."""
+        ok = masks & ((self.rules.item_bits[k][None, :] & self.blocked()[:, None]) == 0)
+        return np.where(ok.any(axis=1, keepdims=True), ok, masks)
+
+    def allowed_names(self, k: int, pool: List[str]) -> List[str]:
+        """Single-dog form of allowed() over a list of names."""
+        blocked = int(self.blocked()[0])
+        if not blocked:
+            return pool
+        return [x for x in pool if not self.rules.name_bits.get(x, 0) & blocked] or pool
+
+    def record(self, k: int, picks: np.ndarray) -> None:
+        """Today's category-k picks (local indices into that category)."""
+        self.today |= (self.rules.item_bits[k][picks][:, None] & self.rules.bit[None, :]) != 0
+
+    def next_day(self) -> None:
+        self.run = np.where(self.today, self.run + 1, 0)
+        self.count += self.today
+        self.today[:] = False
+        self.weekday = (self.weekday + 1) % 7
+        if self.weekday == 0:
+            self.count[:] = 0
+
+
+# =========================================================
+# 23) Per-meal rotation slots
+# =========================================================
+
+MEAL_MAX_PER_DAY = 1  # servings of one ingredient per day, across all of the day's meals
+MEAL_REST_DAYS = 1  # days an extra-meal ingredient sits out before it returns to the extra meals
+
+
+def sample_meal_slots(
+    lead: np.ndarray,
+    pools: List[Tuple[List[str], List[str], List[str]]],
+    meals: int,
+    taste_meat_maps: List[Dict[str, float]],
+    taste_veg_maps: List[Dict[str, float]],
+    use_taste_weights: bool,
+    dog_keys: Optional[List[str]] = None,
+    seed: int = 42,
+    max_per_day: int = MEAL_MAX_PER_DAY,
+    rest_days: int = MEAL_REST_DAYS,
+    rules: Optional[RotationRules] = None,
+    start_weekday: int = 0,
+) -> np.ndarray:
+    """
+    Meal-level rotations for M dogs: (M, D, meals, 3) indices into
+    INGREDIENT_NAMES whose meal 0 is `lead` (the day rotation, (M, D, 3)).
+
+    The other meals of a day are one Gumbel top-k per category: taste
+    weight logs plus Gumbel noise over one copy of every pool item per meal
+    (the lead's item has one copy fewer), and the k = meals - 1 best keys
+    are a weighted draw without replacement. Copies past `max_per_day`
+    carry a penalty, so no ingredient fills more than `max_per_day` of a
+    day's meals while the pool allows. An item served in an extra
+    meal then sits out the next `rest_days` days of extra meals. With
+    `rules` (day 1 falls on `start_weekday`) an extra meal may only add a
+    rule's target to a day while the run or week it lands in, counting the
+    day rotation's later days, stays within the limit
+    (RuleTracker.blocked_extra), so a rule-abiding day rotation stays
+    rule-abiding. Where a day cannot be filled otherwise, the slots that
+    are short break the rest days first, then the per-day cap, then the
+    rules. Deterministic per (dog key, seed).
+    """
+    m, days = lead.shape[:2]
+    out = np.empty((m, days, meals, 3), dtype=np.int64)
+    out[:, :, 0] = lead
+    extra = meals - 1
+    if extra <= 0 or m == 0:
+        return out
+
+    dog_keys = dog_keys if dog_keys is not None else [str(i) for i in range(m)]
+    universes = [filter_ingredients_by_category(c) for c in ROTATION_CATEGORIES]
+    masks = [pool_masks([p[k] for p in pools], universes[k]) for k in range(3)]
+    weights = [
+        taste_weight_rows(universes[0], taste_meat_maps, use_taste_weights),
+        taste_weight_rows(universes[1], taste_veg_maps, use_taste_weights),
+        np.ones_like(masks[2], dtype=float),
+    ]
+    log_w = [np.log(np.maximum(w, 1e-12)) for w in weights]
+    to_global = [np.array([INGREDIENT_INDEX[x] for x in u]) for u in universes]
+    to_local = np.full(len(INGREDIENT_NAMES), -1, dtype=np.int64)
+    for g in to_global:
+        to_local[g] = np.arange(len(g))
+
+    # One copy per meal, so even a one-item pool fills the day; copies past the cap carry a penalty.
+    c_max = max(max_per_day, meals)
+    n_max = max(len(u) for u in universes)
+    noise = np.empty((m, days, 3, c_max, n_max))
+    for i, key in enumerate(dog_keys):
+        ss = np.random.SeedSequence([int(seed), zlib.crc32(str(key).encode("utf-8")), 2])
+        noise[i] = np.random.default_rng(ss).gumbel(size=(days, 3, c_max, n_max))
+    # Soft constraints are tiers subtracted from the keys: top-k takes a rested, in-cap,
+    # rule-abiding candidate first and only breaks the rest days, then the cap, then rules.
+    tier = np.float64(1e6)
+    copy = np.arange(c_max)
+    over_cap = np.where(copy < max_per_day, 0.0, 2 * tier + (copy - max_per_day) * tier / c_max)
+
+    rows = np.arange(m)
+    last_used = [np.full(masks[k].shape, -(rest_days + 1), dtype=np.int64) for k in range(3)]
+    tracker = rules.tracker(m, start_weekday) if rules is not None and len(rules) else None
+    if tracker is not None:
+        # The day rotation's own rule hits, looked ahead from each day: the run of hit
+        # days starting tomorrow and the hit days still to come in the calendar week.
+        hits = np.zeros((m, days + 1, len(rules)), dtype=bool)
+        for k in range(3):
+            hits[:, :days] |= (rules.item_bits[k][to_local[lead[:, :, k]]][..., None] & rules.bit) != 0
+        run_after = np.zeros((m, days + 1, len(rules)), dtype=np.int64)
+        week_after = np.zeros_like(run_after)
+        for d in range(days - 1, -1, -1):
+            run_after[:, d] = np.where(hits[:, d + 1], run_after[:, d + 1] + 1, 0)
+            if (start_weekday + d) % 7 != 6:
+                week_after[:, d] = week_after[:, d + 1] + hits[:, d + 1]
+    for d in range(days):
+        lead_local = [to_local[lead[:, d, k]] for k in range(3)]
+        if tracker is not None:
+            for k in range(3):
+                tracker.record(k, lead_local[k])
+        for k in range(3):
+            n = len(universes[k])
+            valid = np.repeat(masks[k][:, None, :], c_max, axis=1)
+            valid[rows, 0, lead_local[k]] = False
+            penalty = np.where(d - last_used[k] > rest_days, 0.0, tier)
+            if tracker is not None:
+                blocked = tracker.blocked_extra(run_after[:, d], week_after[:, d])
+                hit = rules.item_bits[k][None, :] & blocked[:, None]
+                penalty = penalty + np.where(hit != 0, 4 * tier, 0.0)
+            keys = log_w[k][:, None, :] + noise[:, d, k, :, :n] - penalty[:, None, :] - over_cap[None, :, None]
+            keys = np.where(valid, keys, -np.inf).reshape(m, -1)
+            top = np.argpartition(-keys, extra - 1, axis=1)[:, :extra]
+            top = np.take_along_axis(top, np.argsort(-np.take_along_axis(keys, top, axis=1), axis=1), axis=1)
+            picks = top % n
+            out[:, d, 1:, k] = to_global[k][picks]
+            last_used[k][rows[:, None], picks] = d
+            if tracker is not None:
+                for j in range(extra):
+                    tracker.record(k, picks[:, j])
+        if tracker is not None:
+            tracker.next_day()
+    return out
+
+
+def meal_slot_breaks(
+    slots: np.ndarray,
+    max_per_day: int = MEAL_MAX_PER_DAY,
+    rest_days: int = MEAL_REST_DAYS,
+) -> List[Tuple[int, int, int, str]]:
+    """
+    Soft limits one dog's (D, meals, 3) meal slots break, as (day index,
+    category index, INGREDIENT_NAMES index, "cap" | "rest") — one entry per
+    serving over `max_per_day`, and one per extra-meal serving of an item
+    that was in an extra meal within the previous `rest_days` days.
+    sample_meal_slots gives these up before the rules when a pool is too
+    narrow, so a non-empty result means the pantry needs more variety.
+    """
+    days = slots.shape[0]
+    out: List[Tuple[int, int, int, str]] = []
+    for k in range(slots.shape[2]):
+        for d in range(days):
+            items, counts = np.unique(slots[d, :, k], return_counts=True)
+            for item, c in zip(items, counts):
+                out += [(d, k, int(item), "cap")] * max(int(c) - max_per_day, 0)
+            recent = set(slots[max(d - rest_days, 0):d, 1:, k].ravel().tolist())
+            out += [(d, k, int(item), "rest") for item in slots[d, 1:, k] if int(item) in recent]
+    out.sort()
+    return out
+
+
+def plan_meal_slots(
+    plan_df: pd.DataFrame,
+    pools: Tuple[List[str], List[str], List[str]],
+    meals: int,
+    taste_meat_map: Dict[str, float],
+    taste_veg_map: Dict[str, float],
+    use_taste_weights: bool,
+    seed: int = 42,
+    max_per_day: int = MEAL_MAX_PER_DAY,
+    rest_days: int = MEAL_REST_DAYS,
+    rules: Optional[RotationRules] = None,
+    start_weekday: int = 0,
+) -> pd.DataFrame:
+    """
+    One row per day and meal for a single-dog plan: meal 1 is the day's
+    rotation, the other meals come from sample_meal_slots. Each meal gets an
+    equal share of the day's category grams and its own macros; gram
+    columns follow MEAL_SLOT_COLUMNS.
+    """
+    if plan_df is None or plan_df.empty:
+        return pd.DataFrame()
+    cats = list(ROTATION_CATEGORIES)
+    lead = np.column_stack([plan_df[c].map(INGREDIENT_INDEX).to_numpy(dtype=np.int64) for c in cats])
+    slots = sample_meal_slots(
+        lead[None], [pools], meals, [taste_meat_map], [taste_veg_map], use_taste_weights,
+        ["plan"], seed, max_per_day, rest_days, rules, start_weekday,
+    )[0].reshape(-1, 3)
+    daily = plan_df[[g for _, g in SHOPPING_COLUMNS]].to_numpy(dtype=float)
+    grams = np.repeat(daily / meals, meals, axis=0)
+    macros = (MACRO_MATRIX[slots] * (grams / 100.0)[..., None]).sum(axis=1)
+
+    out = pd.DataFrame({
+        "Day": np.repeat(plan_df["Day"].to_numpy(), meals),
+        "Meal": np.tile([f"Meal {j + 1}" for j in range(meals)], len(plan_df)),
+    })
+    names = np.array(INGREDIENT_NAMES, dtype=object)
+    for k, (c, g) in enumerate(MEAL_SLOT_COLUMNS):
+        out[c] = names[slots[:, k]]
+    for k, (c, g) in enumerate(MEAL_SLOT_COLUMNS):
+        out[g] = np.round(grams[:, k]).astype(int)
+    out["Est kcal"] = np.round(macros[:, 0]).astype(int)
+    out["Protein (g)"] = macros[:, 1].round(1)
+    out["Fat (g)"] = macros[:, 2].round(1)
+    out["Carbs (g)"] = macros[:, 3].round(1)
+    return out
@@ -0,0 +1,699 @@
+"""
+Local JSON planning service for Nebula Paw Kitchen™.
+
+A small stdlib HTTP server over the same planning core the Streamlit app uses
+(nebula_core.py). No external infrastructure: one process, one port.
+
+    python service.py --port 8765 --workers 4 --queue 256
+    curl -s localhost:8765/v1/energy -d '{"weight_kg": 12, "age_years": 4}'
+
+Endpoints (all POST bodies are JSON objects describing one dog):
+
+    GET  /health               liveness
+    GET  /metrics              throughput, latency percentiles, batch sizes, queue depth
+    POST /v1/energy            RER / MER / adjusted MER and daily grams
+    POST /v1/recommendations   life-stage + flag aware ingredient suggestions
+    POST /v1/plan              multi-day rotation with per-day grams and macros
+    POST /v1/shopping-list     totals for a posted plan ("plan": [rows]) or for a dog profile
+
+Concurrent requests to the same endpoint are coalesced: a dispatcher collects
+whatever arrives within `--max-wait-ms` (up to `--max-batch` items) and runs it
+as one vectorized call — compute_daily_energy_batch for energy, one
+sample_rotations_batch pass for plans. Rotation streams are seeded per
+(dog_id, seed), so a dog's plan does not depend on who else shared its batch;
+requests without a "dog_id" are keyed by their own body, so two different
+anonymous dogs never share a stream.
+Plans for a known "breed" start from the learned taste prior of its size
+class / FCI group / life stage when data/taste_priors.csv is installed
+(see tools/build_taste_priors.py). Plan rows and shopping lists carry costs
+from data/prices.csv (or the built-in price table); `"budget_mode": true`
+returns the cheapest rotation that meets the taste and variety floors.
+Optional "rules" (e.g. ["no fish two days running", "salmon only on
+weekends"]) constrain every plan; "start_weekday" (0 = Monday) places day 1.
+`"meal_variety": true` plans every meal slot: meal 1 follows the day
+rotation, the other meals come from sample_meal_slots and are returned as
+"meals" rows (day rows then carry the day's summed macros and cost).
+Plans may carry a "taste_log": a list of objects with "Protein" and/or
+"Veg" (ingredient names; short forms like "Chicken" resolve), "Preference"
+(Dislike / Neutral / Like / Love or a synonym such as "loves") and optional
+"Logged" (ISO date), "Stool", "Energy", "Skin" and "Notes"; the import
+header aliases ("meat", "rating", "date", ...) work as keys too. Entries
+that fail validation get `400` listing each bad index and its reason.
+Bodies over `--max-body-kb` get `413`.
+Recommendations also list "Avoid": ingredients a flag rules out (e.g. the
+common allergens for "Food allergy suspected"), which plans keep out of
+their add-on pools.
+
+Batches run on a bounded worker pool. When every worker is busy and the
+request queue is full, new requests get `503` with `Retry-After` instead of
+piling up.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import queue
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from nebula_core import (
+    ACTIVITY_BOOST, age_to_life_stage, build_weekly_shopping_list, cheapest_rotation,
+    compute_daily_energy_batch, diet_profile, energy_adjustment, ensure_ratio_sum, INGREDIENT_INDEX, INGREDIENT_NAMES,
+    INGREDIENTS, MACRO_MATRIX, MEAL_SLOT_COLUMNS, normalize_taste_frame, pd, PreferenceModel, price_catalog,
+    price_shopping_list, RATIO_PRESETS, recommend_ingredients, rotation_pools, RotationRules,
+    sample_meal_slots, sample_rotations_batch, SHOPPING_COLUMNS, TasteImportReport, taste_normalizer,
+    taste_prior_for,
+)
+
+DEFAULT_KCAL_PER_G = 1.35
+MAX_PLAN_DAYS = 366
+MAX_BODY_BYTES = 2 * 1024 * 1024
+LATENCY_WINDOW = 4096
+RATE_WINDOW_S = 60.0
+PRESET_BY_KEY = {p.key: p for p in RATIO_PRESETS}
+
+
+class ServiceError(Exception):
+    """A request problem with an HTTP status attached."""
+
+    def __init__(self, status: int, message: str, details: Optional[Dict] = None):
+        super().__init__(message)
+        self.status = status
+        self.details = details or {}  # extra keys for the error payload
+
+
+class Overloaded(ServiceError):
+    def __init__(self):
+        super().__init__(503, "server busy, retry shortly")
+
+
+# =========================================================
+# Request parsing
+# =========================================================
+
+def _number(body: Dict, key: str, default: Optional[float], lo: float, hi: float) -> float:
+    value = body.get(key, default)
+    if value is None:
+        raise ServiceError(400, f"'{key}' is required")
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ServiceError(400, f"'{key}' must be a number")
+    if not lo <= value <= hi:
+        raise ServiceError(400, f"'{key}' must be between {lo:g} and {hi:g}")
+    return value
+
+
+def _names(body: Dict, key: str, category: Optional[str] = None) -> List[str]:
+    values = body.get(key) or []
+    if not isinstance(values, list):
+        raise ServiceError(400, f"'{key}' must be a list")
+    unknown = [v for v in values if v not in INGREDIENTS or (category and INGREDIENTS[v].category != category)]
+    if unknown:
+        raise ServiceError(400, f"unknown {category or 'ingredient'} in '{key}': {', '.join(map(str, unknown))}")
+    return list(values)
+
+
+def parse_dog(body: Dict) -> Dict:
+    """Validated dog profile + planning knobs shared by every endpoint."""
+    if not isinstance(body, dict):
+        raise ServiceError(400, "request body must be a JSON object")
+    activity = body.get("activity", "Normal")
+    if activity not in ACTIVITY_BOOST:
+        raise ServiceError(400, f"'activity' must be one of: {', '.join(ACTIVITY_BOOST)}")
+    flags = body.get("flags") or []
+    if not isinstance(flags, list):
+        raise ServiceError(400, "'flags' must be a list")
+
+    if "ratio" in body:
+        ratio = body["ratio"]
+        if not (isinstance(ratio, list) and len(ratio) == 3 and all(isinstance(r, (int, float)) and r >= 0 for r in ratio)
+                and sum(ratio) > 0):
+            raise ServiceError(400, "'ratio' must be three non-negative percentages [meat, veg, carb]")
+        ratio = ensure_ratio_sum(*(int(round(r)) for r in ratio))
+    else:
+        preset = PRESET_BY_KEY.get(body.get("preset", "balanced"))
+        if preset is None:
+            raise ServiceError(400, f"'preset' must be one of: {', '.join(PRESET_BY_KEY)}")
+        ratio = (preset.meat_pct, preset.veg_pct, preset.carb_pct)
+
+    age = _number(body, "age_years", 3.0, 0.1, 25.0)
+    weight = _number(body, "weight_kg", None, 0.5, 90.0)
+    if "dog_id" in body:
+        dog_key = str(body["dog_id"])
+    else:
+        # No id: key the streams on the dog itself, not on a shared default.
+        profile = [weight, age, activity, bool(body.get("neutered", True)), sorted(map(str, flags)),
+                   str(body.get("breed") or "")]
+        dog_key = f"anon:{zlib.crc32(json.dumps(profile).encode('utf-8')):08x}"
+    return {
+        "dog_id": str(body.get("dog_id", "dog")),  # echoed back for display only
+        "dog_key": dog_key,  # seeds the dog's rotation streams
+        "weight_kg": weight,
+        "age_years": age,
+        "life_stage": age_to_life_stage(age),
+        "activity": activity,
+        "neutered": bool(body.get("neutered", True)),
+        "flags": [str(f) for f in flags],
+        "meals_per_day": int(_number(body, "meals_per_day", 2, 1, 4)),
+        "kcal_per_g": _number(body, "kcal_per_g", DEFAULT_KCAL_PER_G, 0.5, 3.0),
+        "ratio": ratio,
+    }
+
+
+def parse_taste_log(body: Dict) -> pd.DataFrame:
+    """Canonical taste-log frame; any bad entry fails the request with its index."""
+    entries = body.get("taste_log") or []
+    if not isinstance(entries, list):
+        raise ServiceError(400, "'taste_log' must be a list of taste entries")
+    bad = [{"index": i, "reason": "not an object"} for i, e in enumerate(entries) if not isinstance(e, dict)]
+    report = TasteImportReport()
+    clean = pd.DataFrame()
+    if entries and not bad:
+        clean = normalize_taste_frame(pd.DataFrame(entries), taste_normalizer(), report, np.arange(len(entries)))
+        bad = [{"index": i, "reason": reason} for i, reason in report.rejects]
+    if bad:
+        total = max(len(bad), report.rows_rejected)
+        raise ServiceError(400, f"{total} invalid 'taste_log' entr{'y' if total == 1 else 'ies'}",
+                           {"bad_entries": bad})
+    return clean
+
+
+def parse_plan(body: Dict) -> Dict:
+    dog = parse_dog(body)
+    taste_log = parse_taste_log(body)
+    prior = taste_prior_for(str(body.get("breed") or ""), dog["age_years"])
+    taste_model = PreferenceModel.from_entries(taste_log).with_prior(prior)
+    meat_map, veg_map = taste_model.mean_scores()
+    rule_lines = body.get("rules") or []
+    if isinstance(rule_lines, str):
+        rule_lines = rule_lines.splitlines()
+    if not isinstance(rule_lines, list) or not all(isinstance(r, str) for r in rule_lines):
+        raise ServiceError(400, "'rules' must be a list of rule strings")
+    rules, problems = RotationRules.parse("\n".join(rule_lines))
+    if problems:
+        raise ServiceError(400, "invalid 'rules': " + "; ".join(problems))
+    dog.update({
+        "days": int(_number(body, "days", 7, 1, MAX_PLAN_DAYS)),
+        "seed": int(_number(body, "seed", 42, 0, 2 ** 31 - 1)),
+        "pantry_meats": _names(body, "pantry_meats", "Meat"),
+        "pantry_vegs": _names(body, "pantry_vegs", "Veg"),
+        "pantry_carbs": _names(body, "pantry_carbs", "Carb"),
+        "allow_new": bool(body.get("allow_new", True)),
+        "use_taste_weights": bool(body.get("use_taste_weights", len(taste_log) > 0 or prior is not None)),
+        "taste_meat_map": meat_map,
+        "taste_veg_map": veg_map,
+        "taste_model": taste_model,
+        "budget_mode": bool(body.get("budget_mode", False)),
+        "rules": rules,
+        "start_weekday": int(_number(body, "start_weekday", 0, 0, 6)),
+        "meal_variety": bool(body.get("meal_variety", False)),
+    })
+    return dog
+
+
+# =========================================================
+# Batch handlers (one call per coalesced batch)
+# =========================================================
+
+def _energy_arrays(items: List[Dict]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    rer, mer, mer_adj = compute_daily_energy_batch(
+        [it["weight_kg"] for it in items],
+        [it["age_years"] for it in items],
+        [it["activity"] for it in items],
+        [it["neutered"] for it in items],
+        [energy_adjustment(it["flags"]) for it in items],
+    )
+    grams = mer_adj / np.array([it["kcal_per_g"] for it in items], dtype=float)
+    return rer, mer, mer_adj, grams
+
+
+def energy_batch(items: List[Dict]) -> List[Dict]:
+    rer, mer, mer_adj, grams = _energy_arrays(items)
+    split = grams[:, None] * np.array([it["ratio"] for it in items], dtype=float) / 100.0
+    return [{
+        "dog_id": it["dog_id"],
+        "life_stage": it["life_stage"],
+        "rer_kcal": round(float(rer[i]), 1),
+        "mer_kcal": round(float(mer[i]), 1),
+        "mer_adjusted_kcal": round(float(mer_adj[i]), 1),
+        "flag_factor": round(float(energy_adjustment(it["flags"])), 3),
+        "daily_grams": round(float(grams[i])),
+        "per_meal_grams": round(float(grams[i]) / it["meals_per_day"]),
+        "daily_meat_g": round(float(split[i, 0])),
+        "daily_veg_g": round(float(split[i, 1])),
+        "daily_carb_g": round(float(split[i, 2])),
+    } for i, it in enumerate(items)]
+
+
+def recommendations_batch(items: List[Dict]) -> List[Dict]:
+    # Many callers share a (stage, flags) combination; compute each once.
+    unique: Dict[Tuple, Dict[str, List[str]]] = {}
+    out = []
+    for it in items:
+        key = (it["life_stage"], tuple(sorted(it["flags"])))
+        if key not in unique:
+            unique[key] = recommend_ingredients(it["life_stage"], it["flags"])
+        out.append({"dog_id": it["dog_id"], "life_stage": it["life_stage"], "recommendations": unique[key]})
+    return out
+
+
+def _budget_picks(sub: List[Dict], pools: List, split: np.ndarray, days: int, seed: int, use_taste: bool):
+    """Budget-mode rotations: one cheapest_rotation candidate search per dog."""
+    picks = np.empty((len(sub), days, 3), dtype=np.int64)
+    for j, (it, pool) in enumerate(zip(sub, pools)):
+        rotation, _ = cheapest_rotation(pool, it["taste_meat_map"], it["taste_veg_map"], use_taste,
+                                        tuple(split[j]), price_catalog(), days=days, seed=seed,
+                                        rules=it["rules"], start_weekday=it["start_weekday"])
+        picks[j] = [[INGREDIENT_INDEX[day[c]] for c in ("Meat", "Veg", "Carb")] for day in rotation]
+    return picks
+
+
+def plan_batch(items: List[Dict]) -> List[Dict]:
+    """
+    Every plan in the batch rotates in one sample_rotations_batch pass per
+    (days, seed, taste mode, rule set, start weekday); budget-mode plans run
+    their own candidate search. Meal-variety plans then fill their other
+    meals in one sample_meal_slots pass per meals/day.
+    """
+    _, _, mer_adj, grams = _energy_arrays(items)
+    split = grams[:, None] * np.array([it["ratio"] for it in items], dtype=float) / 100.0
+    names = np.asarray(INGREDIENT_NAMES, dtype=object)
+
+    groups: Dict[Tuple, List[int]] = {}
+    for i, it in enumerate(items):
+        key = (it["days"], it["seed"], it["use_taste_weights"], it["budget_mode"], it["rules"].signature(),
+               it["start_weekday"])
+        groups.setdefault(key, []).append(i)
+
+    out: List[Optional[Dict]] = [None] * len(items)
+    for (days, seed, use_taste, budget, _, start_weekday), members in groups.items():
+        sub = [items[i] for i in members]
+        pools = [
+            rotation_pools(it["pantry_meats"], it["pantry_vegs"], it["pantry_carbs"], it["allow_new"],
+                           diet_profile(it["life_stage"], it["flags"]))
+            for it in sub
+        ]
+        g = split[members]
+        if budget:
+            picks_idx = _budget_picks(sub, pools, g, days, seed, use_taste)
+        else:
+            picks_idx, _ = sample_rotations_batch(
+                [it["dog_key"] for it in sub], pools,
+                [it["taste_meat_map"] for it in sub], [it["taste_veg_map"] for it in sub],
+                use_taste, days=days, seed=seed, taste_models=[it["taste_model"] for it in sub],
+                rules=sub[0]["rules"], start_weekday=start_weekday,
+            )
+        # (dogs, days, 3 components, 4 macros) -> per-day macros
+        macros = (MACRO_MATRIX[picks_idx] * (g[:, None, :] / 100.0)[..., None]).sum(axis=2)
+        costs = (price_catalog().per_gram[picks_idx] * g[:, None, :]).sum(axis=2)
+
+        varied: Dict[int, List[int]] = {}
+        for j, it in enumerate(sub):
+            if it["meal_variety"] and it["meals_per_day"] > 1:
+                varied.setdefault(it["meals_per_day"], []).append(j)
+        meal_rows: Dict[int, pd.DataFrame] = {}
+        for meals, js in varied.items():
+            slots = sample_meal_slots(
+                picks_idx[js], [pools[j] for j in js], meals,
+                [sub[j]["taste_meat_map"] for j in js], [sub[j]["taste_veg_map"] for j in js], use_taste,
+                [sub[j]["dog_key"] for j in js], seed, rules=sub[0]["rules"], start_weekday=start_weekday,
+            )
+            portion = g[js] / meals  # (dogs, 3) grams per meal
+            meal_macros = (MACRO_MATRIX[slots] * (portion[:, None, None, :] / 100.0)[..., None]).sum(axis=3)
+            meal_costs = (price_catalog().per_gram[slots] * portion[:, None, None, :]).sum(axis=3)
+            for n, j in enumerate(js):
+                macros[j] = meal_macros[n].sum(axis=1)
+                costs[j] = meal_costs[n].sum(axis=1)
+                flat = slots[n].reshape(-1, 3)
+                frame = pd.DataFrame({
+                    "Day": np.repeat([f"Day {d + 1}" for d in range(days)], meals),
+                    "Meal": np.tile([f"Meal {k + 1}" for k in range(meals)], days),
+                })
+                for k, (c, grams_col) in enumerate(MEAL_SLOT_COLUMNS):
+                    frame[c] = names[flat[:, k]]
+                for k, (c, grams_col) in enumerate(MEAL_SLOT_COLUMNS):
+                    frame[grams_col] = round(float(portion[n, k]))
+                frame["Est kcal"] = np.round(meal_macros[n, ..., 0].ravel()).astype(int)
+                frame["Protein (g)"] = np.round(meal_macros[n, ..., 1].ravel(), 1)
+                frame["Fat (g)"] = np.round(meal_macros[n, ..., 2].ravel(), 1)
+                frame["Carbs (g)"] = np.round(meal_macros[n, ..., 3].ravel(), 1)
+                frame["Est cost"] = np.round(meal_costs[n].ravel(), 2)
+                meal_rows[j] = frame
+
+        for j, i in enumerate(members):
+            it = items[i]
+            meals = it["meals_per_day"]
+            rows = pd.DataFrame({
+                "Day": [f"Day {d + 1}" for d in range(days)],
+                "Meat": names[picks_idx[j, :, 0]],
+                "Veg": names[picks_idx[j, :, 1]],
+                "Carb": names[picks_idx[j, :, 2]],
+                "Daily Meat (g)": round(float(g[j, 0])),
+                "Daily Veg (g)": round(float(g[j, 1])),
+                "Daily Carb (g)": round(float(g[j, 2])),
+                "Meals/day": meals,
+                "Per-Meal Total (g)": round(float(g[j].sum()) / meals),
+                "Est kcal": np.round(macros[j, :, 0]).astype(int),
+                "Protein (g)": np.round(macros[j, :, 1], 1),
+                "Fat (g)": np.round(macros[j, :, 2], 1),
+                "Carbs (g)": np.round(macros[j, :, 3], 1),
+                "Est cost": np.round(costs[j], 2),
+            })
+            out[i] = {
+                "dog_id": it["dog_id"],
+                "life_stage": it["life_stage"],
+                "mer_adjusted_kcal": round(float(mer_adj[i]), 1),
+                "daily_grams": round(float(grams[i])),
+                "ratio": list(it["ratio"]),
+                "est_cost": round(float(costs[j].sum()), 2),
+                "plan": _records(rows),
+            }
+            if j in meal_rows:
+                out[i]["meals"] = _records(meal_rows[j])
+    return out
+
+
+def shopping_for_plan(rows: List[Dict]) -> List[Dict]:
+    """Shopping list for day rows or, when the rows carry a "Meal", for meal-slot rows."""
+    if not isinstance(rows, list) or not all(isinstance(r, dict) for r in rows):
+        raise ServiceError(400, "'plan' must be a list of plan rows")
+    df = pd.DataFrame(rows)
+    columns = MEAL_SLOT_COLUMNS if "Meal" in df.columns else SHOPPING_COLUMNS
+    return _records(price_shopping_list(build_weekly_shopping_list(df, columns), price_catalog()))
+
+
+def _records(df: pd.DataFrame) -> List[Dict]:
+    # JSON round-trip turns numpy scalars into plain numbers.
+    return json.loads(df.to_json(orient="records"))
+
+
+# =========================================================
+# Coalescing + bounded execution
+# =========================================================
+
+class Metrics:
+    """Thread-safe request counters and latency percentiles per endpoint, batch sizes per batcher."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.requests: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.rejected: Dict[str, int] = {}
+        self.latency_ms: Dict[str, deque] = {}
+        self.batches: Dict[str, int] = {}
+        self.batched_items: Dict[str, int] = {}
+        self.max_batch: Dict[str, int] = {}
+        self.recent: deque = deque()
+
+    def record(self, endpoint: str, seconds: float, ok: bool) -> None:
+        now = time.time()
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+            self.latency_ms.setdefault(endpoint, deque(maxlen=LATENCY_WINDOW)).append(seconds * 1000.0)
+            self.recent.append(now)
+            while self.recent and self.recent[0] < now - RATE_WINDOW_S:
+                self.recent.popleft()
+
+    def reject(self, endpoint: str) -> None:
+        with self.lock:
+            self.rejected[endpoint] = self.rejected.get(endpoint, 0) + 1
+
+    def batch(self, endpoint: str, size: int) -> None:
+        with self.lock:
+            self.batches[endpoint] = self.batches.get(endpoint, 0) + 1
+            self.batched_items[endpoint] = self.batched_items.get(endpoint, 0) + size
+            self.max_batch[endpoint] = max(self.max_batch.get(endpoint, 0), size)
+
+    def snapshot(self, gauges: Dict[str, object]) -> Dict:
+        now = time.time()
+        with self.lock:
+            uptime = now - self.started
+            total = sum(self.requests.values())
+            recent = sum(1 for t in self.recent if t >= now - RATE_WINDOW_S)
+            endpoints = {}
+            for ep in sorted(set(self.requests) | set(self.rejected)):
+                lat = np.asarray(self.latency_ms.get(ep, ()), dtype=float)
+                endpoints[ep] = {
+                    "requests": self.requests.get(ep, 0),
+                    "errors": self.errors.get(ep, 0),
+                    "rejected": self.rejected.get(ep, 0),
+                    "latency_ms": {
+                        f"p{q}": round(float(np.percentile(lat, q)), 2) for q in (50, 90, 99)
+                    } if lat.size else {},
+                }
+            batchers = {
+                name: {
+                    "batches": n,
+                    "mean_batch": round(self.batched_items[name] / n, 2),
+                    "max_batch": self.max_batch[name],
+                }
+                for name, n in sorted(self.batches.items())
+            }
+        return {
+            "uptime_s": round(uptime, 1),
+            "requests": total,
+            "throughput_rps": round(total / uptime, 2) if uptime > 0 else 0.0,
+            "recent_rps": round(recent / min(RATE_WINDOW_S, max(uptime, 1e-9)), 2),
+            **gauges,
+            "endpoints": endpoints,
+            "batchers": batchers,
+        }
+
+
+class Batcher:
+    """
+    Coalesces single-item requests into batches for one handler.
+
+    - `submit` enqueues without blocking; a full queue raises Overloaded.
+    - The dispatcher waits up to `max_wait_s` after the first item (or until
+      `max_batch` items) and hands the batch to the shared worker pool.
+    - A semaphore caps batches in flight at the pool size, so a saturated pool
+      stops the dispatcher, the queue fills and callers are turned away early.
+    """
+
+    def __init__(self, name: str, handler: Callable[[List[Dict]], List[Dict]], pool: ThreadPoolExecutor,
+                 slots: threading.Semaphore, metrics: Metrics, max_batch: int, max_wait_s: float,
+                 queue_size: int):
+        self.name = name
+        self.handler = handler
+        self.pool = pool
+        self.slots = slots
+        self.metrics = metrics
+        self.max_batch = max_batch
+        self.max_wait_s = max_wait_s
+        self.queue: "queue.Queue[Tuple[Dict, Future]]" = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self._dispatch, name=f"batcher-{name}", daemon=True)
+        self.thread.start()
+
+    def submit(self, item: Dict) -> Future:
+        fut: Future = Future()
+        try:
+            self.queue.put_nowait((item, fut))
+        except queue.Full:
+            raise Overloaded()
+        return fut
+
+    def _dispatch(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.max_wait_s
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.slots.acquire()
+            self.metrics.batch(self.name, len(batch))
+            self.pool.submit(self._run, batch)
+
+    def _run(self, batch: List[Tuple[Dict, Future]]) -> None:
+        try:
+            results = self.handler([item for item, _ in batch])
+        except Exception as exc:  # one bad batch fails its callers, not the service
+            for _, fut in batch:
+                fut.set_exception(exc)
+        else:
+            for (_, fut), result in zip(batch, results):
+                fut.set_result(result)
+        finally:
+            self.slots.release()
+
+
+class PlanningService:
+    def __init__(self, workers: int = 4, max_batch: int = 64, max_wait_ms: float = 5.0,
+                 queue_size: int = 256, timeout_s: float = 30.0, max_body_bytes: int = MAX_BODY_BYTES):
+        self.metrics = Metrics()
+        self.max_body_bytes = max_body_bytes
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="plan-worker")
+        self.slots = threading.Semaphore(workers)
+        self.timeout_s = timeout_s
+        self.workers = workers
+
+        def batcher(name, handler):
+            return Batcher(name, handler, self.pool, self.slots, self.metrics,
+                           max_batch, max_wait_ms / 1000.0, queue_size)
+
+        self.batchers = {
+            "energy": batcher("energy", energy_batch),
+            "recommendations": batcher("recommendations", recommendations_batch),
+            "plan": batcher("plan", plan_batch),
+        }
+        self.routes: Dict[str, Callable[[Dict], object]] = {
+            "/v1/energy": lambda body: self._call("energy", parse_dog(body)),
+            "/v1/recommendations": lambda body: self._call("recommendations", parse_dog(body)),
+            "/v1/plan": lambda body: self._call("plan", parse_plan(body)),
+            "/v1/shopping-list": self.shopping_list,
+        }
+
+    def _call(self, batcher: str, item: Dict):
+        return self.batchers[batcher].submit(item).result(timeout=self.timeout_s)
+
+    def shopping_list(self, body: Dict) -> Dict:
+        if isinstance(body, dict) and "plan" in body:
+            return {"shopping_list": shopping_for_plan(body["plan"])}
+        planned = self._call("plan", parse_plan(body))
+        rows = planned.get("meals", planned["plan"])
+        return {"dog_id": planned["dog_id"], "shopping_list": shopping_for_plan(rows)}
+
+    def gauges(self) -> Dict[str, object]:
+        return {
+            "workers": self.workers,
+            "queue_depth": {name: b.queue.qsize() for name, b in self.batchers.items()},
+            "queue_capacity": next(iter(self.batchers.values())).queue.maxsize,
+        }
+
+
+# =========================================================
+# HTTP layer
+# =========================================================
+
+def make_handler(service: PlanningService):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        server_version = "NebulaPawKitchen/1.0"
+
+        def log_message(self, format, *args):  # keep stdout quiet under load
+            pass
+
+        def _send(self, status: int, payload, headers: Optional[Dict[str, str]] = None) -> None:
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, {"status": "ok"})
+            elif self.path == "/metrics":
+                self._send(200, service.metrics.snapshot(service.gauges()))
+            else:
+                self._send(404, {"error": f"no route for GET {self.path}"})
+
+        def _body_length(self) -> int:
+            header = self.headers.get("Content-Length")
+            try:
+                length = int(header or 0)
+            except ValueError:
+                raise ServiceError(400, "invalid Content-Length header")
+            if length < 0:
+                raise ServiceError(400, "invalid Content-Length header")
+            if length > service.max_body_bytes:
+                raise ServiceError(413, f"request body over {service.max_body_bytes} bytes")
+            return length
+
+        def do_POST(self):
+            route = service.routes.get(self.path)
+            try:
+                length = self._body_length()
+            except ServiceError as exc:
+                # The unread body would be taken for the next request.
+                self.close_connection = True
+                self._send(exc.status, {"error": str(exc)}, {"Connection": "close"})
+                return
+            raw = self.rfile.read(length) if length else b""
+            if route is None:
+                self._send(404, {"error": f"no route for POST {self.path}"})
+                return
+
+            t0 = time.perf_counter()
+            ok = False
+            try:
+                try:
+                    body = json.loads(raw or b"{}")
+                except ValueError:
+                    raise ServiceError(400, "request body is not valid JSON")
+                result = route(body)
+                ok = True
+                self._send(200, result)
+            except Overloaded as exc:
+                service.metrics.reject(self.path)
+                self._send(exc.status, {"error": str(exc)}, {"Retry-After": "1"})
+                return
+            except ServiceError as exc:
+                self._send(exc.status, {"error": str(exc), **exc.details})
+            except TimeoutError:
+                self._send(504, {"error": "request timed out in the worker pool"})
+            except Exception as exc:
+                self._send(500, {"error": f"{type(exc).__name__}: {exc}"})
+            service.metrics.record(self.path, time.perf_counter() - t0, ok)
+
+    return Handler
+
+
+class PlanningHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 512  # listen backlog; the stdlib default of 5 resets bursts
+
+
+def serve(host: str, port: int, service: PlanningService) -> ThreadingHTTPServer:
+    return PlanningHTTPServer((host, port), make_handler(service))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip(),
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--workers", type=int, default=4, help="worker threads running batches")
+    ap.add_argument("--max-batch", type=int, default=64, help="largest coalesced batch")
+    ap.add_argument("--max-wait-ms", type=float, default=5.0, help="how long a batch waits to fill")
+    ap.add_argument("--queue", type=int, default=256, help="pending requests per endpoint before 503")
+    ap.add_argument("--timeout", type=float, default=30.0, help="seconds a request may wait for its batch")
+    ap.add_argument("--max-body-kb", type=int, default=MAX_BODY_BYTES // 1024, help="largest request body (413 above)")
+    args = ap.parse_args(argv)
+
+    service = PlanningService(args.workers, args.max_batch, args.max_wait_ms, args.queue, args.timeout,
+                              args.max_body_kb * 1024)
+    server = serve(args.host, args.port, service)
+    print(f"Serving on http://{args.host}:{server.server_address[1]} "
+          f"({args.workers} workers, batches ≤{args.max_batch}, wait ≤{args.max_wait_ms:g} ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.pool.shutdown(wait=False, cancel_futures=True)
+
+
+if __name__ == "__main__":
+    main()
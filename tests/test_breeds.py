@@ -0,0 +1,28 @@
+import numpy as np
+
+from nebula_core import FuzzyIndex, breed_df, filter_breed_options, missing_breed_alias_targets
+
+
+def test_every_breed_alias_points_into_the_atlas():
+    assert missing_breed_alias_targets(breed_df()) == []
+
+
+def test_alias_search_covers_every_target_breed():
+    opts = filter_breed_options("Doxie", [], [], [])
+    assert {"Dachshund - Standard", "Dachshund - Miniature", "Dachshund - Wirehaired"} <= set(opts)
+    assert filter_breed_options("Dobie", [], [], [])[0] == "Doberman Pinscher"
+
+
+def test_owner_mask_applies_before_the_search_limit():
+    index = FuzzyIndex(["Collie", "Rough Collie", "Bearded Collie", "Border Collie"], [0, 1, 2, 3])
+    mask = np.array([False, False, False, True])
+    assert [owner for owner, _, _ in index.search("collie", limit=1, owner_mask=mask)] == [3]
+
+
+def test_breed_filters_keep_every_matching_breed():
+    atlas = breed_df()
+    region = atlas["Region"].iloc[-1]
+    opts = filter_breed_options("terrier", [], [region], [])
+    in_region = atlas.loc[atlas["Region"] == region, "Breed"]
+    assert set(in_region[in_region.str.contains("Terrier")]) <= set(opts)
+    assert set(opts) <= set(in_region)
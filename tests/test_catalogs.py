@@ -0,0 +1,33 @@
+import os
+import stat
+
+import pytest
+
+import nebula_core
+from nebula_core import CATALOG_DIR_ENV, catalog_dir, shared_catalog
+
+posix_only = pytest.mark.skipif(not hasattr(os, "getuid"), reason="POSIX ownership checks")
+
+
+@posix_only
+def test_default_catalog_dir_is_private(monkeypatch, tmp_path):
+    monkeypatch.delenv(CATALOG_DIR_ENV, raising=False)
+    monkeypatch.setattr(nebula_core.tempfile, "gettempdir", lambda: str(tmp_path))
+    folder = catalog_dir()
+    assert folder == str(tmp_path / f"nebula-catalogs-{os.getuid()}")
+    assert stat.S_IMODE(os.stat(folder).st_mode) == 0o700
+
+    os.chmod(folder, 0o777)
+    with pytest.raises(OSError):
+        catalog_dir()
+
+
+@posix_only
+def test_unsafe_catalog_dir_falls_back_to_a_private_build(monkeypatch, tmp_path):
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    os.chmod(shared, 0o777)
+    monkeypatch.setenv(CATALOG_DIR_ENV, str(shared))
+    frame = shared_catalog("probe", lambda: nebula_core.pd.DataFrame({"a": [1, 2]}))
+    assert frame["a"].tolist() == [1, 2]
+    assert os.listdir(shared) == []
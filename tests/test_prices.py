@@ -0,0 +1,18 @@
+from nebula_core import PRICE_COLUMNS, PriceTable, pd
+
+BEEF = "Beef (lean, cooked)"
+
+
+def table(*packs):
+    return PriceTable(pd.DataFrame([(BEEF, g, p) for g, p in packs], columns=PRICE_COLUMNS))
+
+
+def test_buy_mixes_three_pack_sizes_when_that_is_cheapest():
+    prices = table((300, 3.0), (400, 3.6), (1000, 8.0))
+    assert prices.buy(BEEF, 1650) == ("1 × 1000 g + 1 × 400 g + 1 × 300 g", 14.6)
+
+
+def test_buy_prefers_fewer_packs_on_a_price_tie():
+    prices = table((250, 2.0), (500, 4.0))
+    assert prices.buy(BEEF, 900) == ("2 × 500 g", 8.0)
+    assert prices.buy(BEEF, 0) == ("—", 0.0)
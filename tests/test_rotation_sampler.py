@@ -0,0 +1,99 @@
+import numpy as np
+
+from nebula_core import (
+    diet_profile,
+    INGREDIENT_INDEX,
+    INGREDIENT_NAMES,
+    filter_ingredients_by_category,
+    meal_slot_breaks,
+    recommend_ingredients,
+    rotation_pools,
+    sample_meal_slots,
+    sample_rotations_batch,
+    variety_pick_batch,
+)
+
+MEATS = filter_ingredients_by_category("Meat")
+VEGS = filter_ingredients_by_category("Veg")
+CARBS = filter_ingredients_by_category("Carb")
+POOLS = [
+    (MEATS[:3], VEGS[:2], CARBS[:2]),
+    (MEATS, VEGS, CARBS),
+    (MEATS[2:4], VEGS[3:6], CARBS[1:2]),
+]
+
+
+def sample(keys, pools, seed=7, days=14, **kwargs):
+    n = len(keys)
+    picks, _ = sample_rotations_batch(keys, pools, [{}] * n, [{}] * n, False, days=days, seed=seed, **kwargs)
+    return picks
+
+
+def test_rotation_is_deterministic_per_dog_regardless_of_batch():
+    alone = sample(["rex"], POOLS[:1])
+    batched = sample(["fido", "rex", "bella"], [POOLS[1], POOLS[0], POOLS[2]])
+    reordered = sample(["rex", "bella"], [POOLS[0], POOLS[2]])
+    assert np.array_equal(alone[0], batched[1])
+    assert np.array_equal(alone[0], reordered[0])
+    assert np.array_equal(batched[2], reordered[1])
+    assert not np.array_equal(alone[0], sample(["rex"], POOLS[:1], seed=8)[0])
+
+
+def test_rotation_avoids_consecutive_protein_and_veg_and_honours_pools():
+    picks = sample(["a", "b", "c"], POOLS, days=28)
+    for dog, (meats, vegs, carbs) in enumerate(POOLS):
+        names = np.asarray(INGREDIENT_NAMES, dtype=object)[picks[dog]]
+        assert set(names[:, 0]) <= set(meats)
+        assert set(names[:, 1]) <= set(vegs)
+        assert set(names[:, 2]) <= set(carbs)
+        assert (picks[dog, 1:, 0] != picks[dog, :-1, 0]).all()
+        assert (picks[dog, 1:, 1] != picks[dog, :-1, 1]).all()
+
+
+def test_preferred_meat_never_repeats_yesterday():
+    days = 10
+    beef = MEATS.index(POOLS[0][0][0])
+    picks = sample(["a", "b"], POOLS[:2], days=days, preferred_meat=np.full(days, beef))
+    shared = INGREDIENT_INDEX[MEATS[beef]]
+    assert (picks[:, 1:, 0] != picks[:, :-1, 0]).all()
+    assert (picks[:, ::2, 0] == shared).all()
+
+
+def test_variety_pick_batch_skips_last_pick_and_masked_columns():
+    masks = np.array([[True, True, False], [True, False, False], [False, True, True]])
+    weights = np.ones((3, 3))
+    last = np.array([0, 0, -1])
+    for u in np.linspace(0.0, 0.999, 25):
+        pick = variety_pick_batch(np.full(3, u), masks, weights, last)
+        assert pick[0] == 1          # yesterday's column dropped
+        assert pick[1] == 0          # nothing else allowed: repeat is kept
+        assert masks[2, pick[2]]
+
+
+def test_variety_pick_batch_draws_uniformly_when_allowed_weights_are_zero():
+    masks = np.array([[False, True, True]])
+    picks = {int(variety_pick_batch(np.array([u]), masks, np.zeros((1, 3)), np.array([-1]))[0])
+             for u in (0.0, 0.3, 0.7)}
+    assert picks == {1, 2}
+
+
+def test_meal_slot_breaks_flag_a_pool_too_narrow_for_the_meal_limits():
+    keys = ["a", "b"]
+    narrow, wide = (MEATS[:2], VEGS[:2], CARBS[:1]), (MEATS, VEGS, CARBS)
+    for pool, expect_breaks in ((narrow, True), (wide, False)):
+        lead = sample(keys, [pool, pool], days=7)
+        slots = sample_meal_slots(lead, [pool, pool], 3, [{}] * 2, [{}] * 2, False, keys, max_per_day=1, rest_days=1)
+        breaks = [meal_slot_breaks(slots[i], 1, 1) for i in range(2)]
+        assert all(bool(b) == expect_breaks for b in breaks)
+        assert {kind for b in breaks for *_, kind in b} <= {"cap", "rest"}
+
+
+def test_rotation_pools_from_a_diet_profile_match_the_recommendations_dict():
+    flags = ["Food allergy suspected", "Sensitive stomach"]
+    profile, recs = diet_profile("Senior", flags), recommend_ingredients("Senior", flags)
+    for pantry in (([], [], []), (MEATS[3:5], VEGS[:1], [])):
+        for allow_new in (True, False):
+            from_profile = rotation_pools(*pantry, allow_new, profile)
+            assert [list(p) for p in from_profile] == [list(p) for p in rotation_pools(*pantry, allow_new, recs)]
+            assert not set(recs["Avoid"]) & set(from_profile[0]) - set(pantry[0])
+    assert rotation_pools([], [], [], True, profile)[0] is rotation_pools([], [], [], True, profile)[0]
@@ -0,0 +1,78 @@
+import http.client
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from service import PlanningService, parse_plan, plan_batch, serve
+
+
+@pytest.fixture
+def server():
+    service = PlanningService(workers=2, max_batch=16, max_wait_ms=50.0, max_body_bytes=4096)
+    httpd = serve("127.0.0.1", 0, service)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield service, httpd.server_address[1]
+    httpd.shutdown()
+    httpd.server_close()
+    service.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def request(port, method, path, body=None, headers=None):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    data = body if isinstance(body, (bytes, type(None))) else json.dumps(body).encode()
+    conn.request(method, path, body=data, headers=headers or {})
+    resp = conn.getresponse()
+    payload = json.loads(resp.read() or b"null")
+    conn.close()
+    return resp.status, payload
+
+
+def test_routes_answer_and_reject_bad_requests(server):
+    _, port = server
+    assert request(port, "GET", "/health") == (200, {"status": "ok"})
+    status, energy = request(port, "POST", "/v1/energy", {"weight_kg": 12, "age_years": 4})
+    assert status == 200 and energy["daily_grams"] > 0
+    status, plan = request(port, "POST", "/v1/plan", {"weight_kg": 12, "days": 3})
+    assert status == 200 and len(plan["plan"]) == 3
+    assert request(port, "POST", "/v1/nope", {})[0] == 404
+    assert request(port, "POST", "/v1/energy", {"age_years": 4})[0] == 400
+    assert request(port, "POST", "/v1/energy", b"{not json")[0] == 400
+
+
+def test_content_length_is_validated_and_capped(server):
+    _, port = server
+    assert request(port, "POST", "/v1/energy", b"{}", {"Content-Length": "abc"})[0] == 400
+    status, payload = request(port, "POST", "/v1/plan", {"weight_kg": 12, "notes": "x" * 5000})
+    assert status == 413 and "4096" in payload["error"]
+
+
+def test_invalid_taste_log_entries_are_listed(server):
+    _, port = server
+    log = [
+        {"Protein": "Chicken", "Preference": "loves"},
+        {"Protein": "Unobtainium", "Preference": "Love"},
+        "Beef, Love",
+    ]
+    status, payload = request(port, "POST", "/v1/plan", {"weight_kg": 12, "taste_log": log})
+    assert status == 400 and payload["bad_entries"] == [{"index": 2, "reason": "not an object"}]
+    status, payload = request(port, "POST", "/v1/plan", {"weight_kg": 12, "taste_log": log[:2] + [{"Veg": "Carrot"}]})
+    assert status == 400
+    assert payload["bad_entries"] == [{"index": 1, "reason": "unknown protein"},
+                                      {"index": 2, "reason": "missing preference"}]
+    assert request(port, "POST", "/v1/plan", {"weight_kg": 12, "taste_log": log[:1]})[0] == 200
+
+
+def test_concurrent_plans_are_batched_without_changing_results(server):
+    service, port = server
+    bodies = [{"weight_kg": 5 + i, "dog_id": f"dog-{i}", "days": 5} for i in range(8)]
+    with ThreadPoolExecutor(len(bodies)) as pool:
+        results = list(pool.map(lambda b: request(port, "POST", "/v1/plan", b), bodies))
+    assert all(status == 200 for status, _ in results)
+    batches = service.metrics.snapshot(service.gauges())["batchers"]["plan"]
+    assert batches["max_batch"] > 1
+    for body, (_, batched) in zip(bodies, results):
+        alone = plan_batch([parse_plan(body)])[0]
+        assert [r["Meat"] for r in alone["plan"]] == [r["Meat"] for r in batched["plan"]]
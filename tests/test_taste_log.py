@@ -0,0 +1,54 @@
+import io
+
+import pandas as pd
+
+from nebula_core import PreferenceModel, epoch_days, import_taste_log
+
+
+DATED_CSV = (
+    "Dog Name,Protein,Veg,Preference,Logged\n"
+    'Rex,"Beef (lean, cooked)",Carrot (cooked),Love,2024-03-01\n'
+    'Rex,"Chicken (lean, cooked)",Pumpkin (cooked),Dislike,2024-03-05T08:30:00Z\n'
+)
+
+
+def test_dated_csv_import_fits_preference_model():
+    batches = []
+    report = import_taste_log(io.BytesIO(DATED_CSV.encode()), "CSV", batches.append)
+    assert report.rows_imported == 2
+    log = pd.concat(batches, ignore_index=True)
+    assert all(type(v) is str for v in log["Logged"])
+
+    model = PreferenceModel.from_entries(log)
+    assert model.as_of == epoch_days("2024-03-05T08:30:00Z")
+    meats, vegs = model.mean_scores()
+    assert meats["Beef (lean, cooked)"] > meats["Chicken (lean, cooked)"]
+    assert vegs["Carrot (cooked)"] > vegs["Pumpkin (cooked)"]
+
+
+def test_malformed_csv_rows_are_reported_with_their_line():
+    text = (
+        "Dog Name,Protein,Veg,Preference,Logged\n"
+        'Rex,"Chicken (lean, cooked)",Pumpkin (cooked),Dislike,2024-03-05\n'
+        "Rex,Beef (lean, cooked),Carrot (cooked),Love,2024-03-01\n"
+        'Rex,"Chicken (lean, cooked)",Nope,Love,2024-03-06\n'
+    )
+    report = import_taste_log(io.BytesIO(text.encode()), "CSV", lambda df: None, chunk_rows=2)
+    assert (report.rows_read, report.rows_imported, report.rows_rejected) == (3, 1, 2)
+    assert report.rejects == [(3, "malformed CSV row (6 fields, header has 5)"), (4, "unknown veg")]
+
+
+def test_malformed_csv_rows_count_physical_lines_across_chunks():
+    text = (
+        "\ufeffDog Name,Protein,Veg,Preference,Logged,Note\n"
+        'Rex,"Chicken (lean, cooked)",Pumpkin (cooked),Dislike,2024-03-05,"ate it,\nthen left"\n'
+        "\n"
+        "Rex,Beef (lean, cooked),Carrot (cooked),Love,2024-03-01,\n"
+        'Rex,"Chicken (lean, cooked)",Nope,Love,2024-03-06,\n'
+        'Rex,"Beef (lean, cooked)",Carrot (cooked),Love,2024-03-07'
+    )
+    batches = []
+    report = import_taste_log(io.BytesIO(text.encode()), "CSV", batches.append, chunk_rows=1)
+    assert (report.rows_read, report.rows_imported, report.rows_rejected) == (4, 2, 2)
+    assert report.rejects == [(5, "malformed CSV row (7 fields, header has 6)"), (6, "unknown veg")]
+    assert pd.concat(batches)["Logged"].tolist() == ["2024-03-05", "2024-03-07"]
@@ -0,0 +1,230 @@
+"""
+Learn collaborative taste priors from many dogs' taste logs (offline batch).
+
+Reads one or more taste-log exports (CSV or JSON Lines, the same files the
+app's bulk import accepts), aggregates every dog's time-decayed score per
+protein and veg into a sparse dogs x ingredients matrix, and factorizes it
+with biased alternating least squares. Dog factors are then averaged per
+(size class, FCI group, life stage) — plus coarser back-off groups — and the
+predicted scores are written to data/taste_priors.csv, which the app and the
+JSON service load at startup. A new dog then starts from its group's prior
+instead of a flat one; the lookup at plan time is a dict probe.
+
+    python tools/build_taste_priors.py clinic_a.csv clinic_b.jsonl
+    python tools/build_taste_priors.py logs/*.csv --factors 6 --min-dogs 10 --out /tmp/priors.csv
+
+Dogs are identified by (Dog Name, Breed); rows without a dog name cannot be
+attributed to one dog and are skipped. Breed metadata comes from the same
+atlas the app uses; unknown breeds fall into the "Unknown" size class.
+"""
+
+import argparse
+import os
+import sys
+import time
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nebula_core import (  # noqa: E402
+    ANY_GROUP, BREED_META, DATA_DIR, PREFERENCE_HALF_LIFE_DAYS, TASTE_PRIOR_COLUMNS, TASTE_PRIORS_FILE,
+    age_to_life_stage, epoch_days, filter_ingredients_by_category, import_taste_log, pref_score_from_label,
+)
+
+ITEMS = [("Protein", n) for n in filter_ingredients_by_category("Meat")] + \
+        [("Veg", n) for n in filter_ingredients_by_category("Veg")]
+ITEM_COL = {kind: {name: i for i, (k, name) in enumerate(ITEMS) if k == kind} for kind in ("Protein", "Veg")}
+MAX_CONFIDENCE = 20.0  # a dog's weight per ingredient stops growing after ~20 fresh entries
+COMPACT_EVERY = 2_000_000  # partial aggregate rows kept before re-grouping
+
+
+class RatingAccumulator:
+    """Streams canonical taste-log chunks into per (dog, ingredient) weighted sums."""
+
+    def __init__(self, as_of_days: float, half_life_days: float):
+        self.as_of_days = as_of_days
+        self.half_life_days = half_life_days
+        self.parts: List[pd.DataFrame] = []
+        self.rows = 0
+        self.unnamed = 0
+        self.dog_parts: List[pd.DataFrame] = []
+
+    def __call__(self, df: pd.DataFrame) -> None:
+        named = df["Dog Name"].fillna("").astype(str).str.strip() != ""
+        self.unnamed += int((~named).sum())
+        df = df[named]
+        if df.empty:
+            return
+        dog = df["Dog Name"].astype(str) + "|" + df["Breed"].astype(str)
+        when = pd.to_datetime(df["Logged"], errors="coerce", format="ISO8601", utc=True)
+        t = ((when - pd.Timestamp(0, tz="UTC")).dt.total_seconds() / 86_400.0).to_numpy(dtype=float)
+        w = np.where(np.isnan(t), 1.0, np.power(0.5, np.maximum(self.as_of_days - t, 0.0) / self.half_life_days))
+        score = df["Preference"].map(pref_score_from_label).to_numpy(dtype=float)
+
+        for kind, col in (("Protein", "Protein"), ("Veg", "Veg")):
+            item = df[col].map(ITEM_COL[kind])
+            ok = item.notna().to_numpy()
+            if ok.any():
+                self.parts.append(pd.DataFrame({
+                    "dog": dog.to_numpy()[ok],
+                    "item": item.to_numpy()[ok].astype(np.int64),
+                    "w": w[ok],
+                    "wr": w[ok] * score[ok],
+                }))
+                self.rows += int(ok.sum())
+        self.dog_parts.append(pd.DataFrame({
+            "dog": dog, "Breed": df["Breed"].astype(str), "age": pd.to_numeric(df["Age (y)"], errors="coerce"),
+        }).groupby("dog").agg(Breed=("Breed", "last"), age_sum=("age", "sum"), age_n=("age", "count")))
+        if self.rows > COMPACT_EVERY:
+            self.parts = [self.ratings()]
+            self.rows = len(self.parts[0])
+
+    def ratings(self) -> pd.DataFrame:
+        if not self.parts:
+            return pd.DataFrame(columns=["dog", "item", "w", "wr"])
+        return pd.concat(self.parts, ignore_index=True).groupby(["dog", "item"], as_index=False)[["w", "wr"]].sum()
+
+    def dogs(self) -> pd.DataFrame:
+        agg = pd.concat(self.dog_parts).groupby(level=0).agg(
+            Breed=("Breed", "last"), age_sum=("age_sum", "sum"), age_n=("age_n", "sum"))
+        agg["age"] = (agg["age_sum"] / agg["age_n"].where(agg["age_n"] > 0)).fillna(3.0)
+        return agg[["Breed", "age"]]
+
+
+def _ridge_rows(n_rows: int, row: np.ndarray, feats: np.ndarray, target: np.ndarray, conf: np.ndarray,
+                reg: float) -> np.ndarray:
+    """Solve one weighted ridge regression per row id in a single batched call."""
+    k = feats.shape[1]
+    a = np.zeros((n_rows, k, k))
+    b = np.zeros((n_rows, k))
+    np.add.at(a, row, conf[:, None, None] * feats[:, :, None] * feats[:, None, :])
+    np.add.at(b, row, (conf * target)[:, None] * feats)
+    a += reg * np.eye(k)
+    return np.linalg.solve(a, b[..., None])[..., 0]
+
+
+def factorize(dog: np.ndarray, item: np.ndarray, r: np.ndarray, conf: np.ndarray, n_dogs: int, n_items: int,
+              factors: int = 4, reg: float = 20.0, iterations: int = 15, seed: int = 0):
+    """
+    Biased ALS on the observed entries only: r ~ mu + b_dog + b_item + u_dog . v_item.
+    Returns (mu, dog_bias, item_bias, U, V).
+    """
+    rng = np.random.default_rng(seed)
+    mu = float(np.average(r, weights=conf))
+    u = rng.normal(0, 0.1, (n_dogs, factors))
+    v = rng.normal(0, 0.1, (n_items, factors))
+    bu = np.zeros(n_dogs)
+    bi = np.zeros(n_items)
+    ones = np.ones((len(r), 1))
+    for _ in range(iterations):
+        sol = _ridge_rows(n_dogs, dog, np.hstack([v[item], ones]), r - mu - bi[item], conf, reg)
+        u, bu = sol[:, :factors], sol[:, factors]
+        sol = _ridge_rows(n_items, item, np.hstack([u[dog], ones]), r - mu - bu[dog], conf, reg)
+        v, bi = sol[:, :factors], sol[:, factors]
+    return mu, bu, bi, u, v
+
+
+def group_keys(dogs: pd.DataFrame) -> pd.DataFrame:
+    meta = [BREED_META.get(b, {}) for b in dogs["Breed"]]
+    return pd.DataFrame({
+        "Size Class": [m.get("Size Class") or "Unknown" for m in meta],
+        "FCI Group": [m.get("FCI Group") or "N/A" for m in meta],
+        "Life Stage": [age_to_life_stage(a) for a in dogs["age"]],
+    }, index=dogs.index)
+
+
+def group_priors(keys: pd.DataFrame, mu: float, bu: np.ndarray, bi: np.ndarray, u: np.ndarray, v: np.ndarray,
+                 min_dogs: int) -> pd.DataFrame:
+    """Predicted score per ingredient for every group (and back-off level) with enough dogs."""
+    levels = [
+        ("Size Class", "FCI Group", "Life Stage"),
+        ("Size Class", "Life Stage"),
+        ("Life Stage",),
+        (),
+    ]
+    rows = []
+    dog_vec = np.hstack([u, bu[:, None]])
+    for cols in levels:
+        grouped = keys.groupby(list(cols)).indices.items() if cols else [((), np.arange(len(keys)))]
+        for key, idx in grouped:
+            if len(idx) < min_dogs:
+                continue
+            key = key if isinstance(key, tuple) else (key,)
+            named = dict(zip(cols, key))
+            mean = dog_vec[idx].mean(axis=0)
+            score = np.clip(mu + mean[-1] + bi + v @ mean[:-1], 0.0, 3.0)
+            for (kind, name), sc in zip(ITEMS, score):
+                rows.append({
+                    "Size Class": named.get("Size Class", ANY_GROUP),
+                    "FCI Group": named.get("FCI Group", ANY_GROUP),
+                    "Life Stage": named.get("Life Stage", ANY_GROUP),
+                    "Kind": kind, "Ingredient": name, "Score": round(float(sc), 3), "Dogs": len(idx),
+                })
+    return pd.DataFrame(rows, columns=TASTE_PRIOR_COLUMNS)
+
+
+def rmse(pred: np.ndarray, r: np.ndarray, conf: np.ndarray) -> float:
+    return float(np.sqrt(np.average((pred - r) ** 2, weights=conf))) if len(r) else float("nan")
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip(),
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("logs", nargs="+", help="taste-log CSV / JSON Lines files")
+    ap.add_argument("--out", default=os.path.join(DATA_DIR, TASTE_PRIORS_FILE))
+    ap.add_argument("--factors", type=int, default=4)
+    ap.add_argument("--reg", type=float, default=20.0, help="L2 penalty on factors and biases")
+    ap.add_argument("--iterations", type=int, default=15)
+    ap.add_argument("--min-dogs", type=int, default=5, help="smallest group that gets its own prior")
+    ap.add_argument("--half-life", type=float, default=PREFERENCE_HALF_LIFE_DAYS, help="days")
+    ap.add_argument("--as-of", default=None, help="date the decay is measured to (default: today)")
+    ap.add_argument("--holdout", type=float, default=0.1, help="share of ratings held out for the RMSE check")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+
+    t0 = time.perf_counter()
+    acc = RatingAccumulator(epoch_days(args.as_of or pd.Timestamp.now(tz="UTC")), args.half_life)
+    for path in args.logs:
+        fmt = "CSV" if path.lower().endswith(".csv") else "JSON Lines"
+        with open(path, "rb") as fh:
+            # No default name: unnamed rows would otherwise pool into one "dog".
+            report = import_taste_log(fh, fmt, acc, defaults={"Dog Name": ""})
+        print(f"{path}: {report.rows_imported:,} of {report.rows_read:,} rows "
+              f"({report.rows_per_second:,.0f} rows/s)", file=sys.stderr)
+
+    if acc.unnamed:
+        print(f"skipped {acc.unnamed:,} rows without a dog name", file=sys.stderr)
+    ratings = acc.ratings()
+    if ratings.empty:
+        sys.exit("no usable taste entries found")
+    dogs = acc.dogs()
+    dog_ids = {d: i for i, d in enumerate(dogs.index)}
+    dog = ratings["dog"].map(dog_ids).to_numpy(dtype=np.int64)
+    item = ratings["item"].to_numpy(dtype=np.int64)
+    r = (ratings["wr"] / ratings["w"]).to_numpy(dtype=float)
+    conf = np.minimum(ratings["w"].to_numpy(dtype=float), MAX_CONFIDENCE)
+
+    test = np.random.default_rng(args.seed).random(len(r)) < args.holdout
+    fit_args = dict(n_dogs=len(dogs), n_items=len(ITEMS), factors=args.factors, reg=args.reg,
+                    iterations=args.iterations, seed=args.seed)
+    mu, bu, bi, u, v = factorize(dog[~test], item[~test], r[~test], conf[~test], **fit_args)
+    pred = mu + bu[dog] + bi[item] + np.einsum("nk,nk->n", u[dog], v[item])
+    item_mean = np.bincount(item[~test], weights=(conf * r)[~test], minlength=len(ITEMS)) / np.maximum(
+        np.bincount(item[~test], weights=conf[~test], minlength=len(ITEMS)), 1e-9)
+    print(f"{len(dogs):,} dogs · {len(r):,} dog x ingredient ratings · "
+          f"holdout RMSE {rmse(pred[test], r[test], conf[test]):.3f} "
+          f"(ingredient-mean baseline {rmse(item_mean[item[test]], r[test], conf[test]):.3f})", file=sys.stderr)
+
+    # Final fit on everything for the shipped priors.
+    mu, bu, bi, u, v = factorize(dog, item, r, conf, **fit_args)
+    table = group_priors(group_keys(dogs), mu, bu, bi, u, v, args.min_dogs)
+    table.to_csv(args.out, index=False)
+    groups = table[["Size Class", "FCI Group", "Life Stage"]].drop_duplicates()
+    print(f"wrote {len(groups):,} group priors to {args.out} in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""
+Concurrent-session load harness for the Nebula Paw Kitchen app.
+
+Starts one real `streamlit run app.py` server on localhost and drives it with
+N simulated browser sessions. Each session is a small websocket client that
+speaks Streamlit's BackMsg/ForwardMsg protocol and replays a realistic
+interaction script — sidebar edits, atlas search, plan generation (including
+the progress-fragment polling a browser does) and taste logging. Every rerun
+is timed from request to `script_finished`.
+
+For every session count the harness reports rerun latency percentiles,
+throughput and the server's RSS, so you can see where one process stops
+keeping up.
+
+    python tools/loadtest.py --sessions 1,2,4,8 --iterations 3
+    python tools/loadtest.py --sessions 16 --json results.json
+
+Needs `websockets` (ships with recent Streamlit installs). Server RSS is read
+from /proc, so memory figures are Linux only.
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+PLAN_WAIT_S = 30.0
+RERUN_TIMEOUT_S = 120.0
+
+
+# ---------------------------------------------------------
+# Server process
+# ---------------------------------------------------------
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int) -> subprocess.Popen:
+    cmd = [
+        sys.executable, "-m", "streamlit", "run", APP_PATH,
+        "--server.headless", "true",
+        "--server.port", str(port),
+        "--server.address", "127.0.0.1",
+        "--server.fileWatcherType", "none",
+        "--browser.gatherUsageStats", "false",
+        "--logger.level", "error",
+    ]
+    proc = subprocess.Popen(
+        cmd, cwd=os.path.dirname(APP_PATH),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("streamlit server exited during startup")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as r:
+                if r.status == 200:
+                    return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("streamlit server did not become healthy within 60s")
+
+
+def rss_mb(pid: int) -> float:
+    try:
+        with open(f"/proc/{pid}/status") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return float("nan")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100.0
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+# ---------------------------------------------------------
+# Browser stand-in
+# ---------------------------------------------------------
+
+class BrowserSession:
+    """
+    One simulated browser tab. Keeps the widget registry from the last run,
+    sends the accumulated widget states with every rerun request and waits
+    for the run to finish. Only the widget kinds the script touches are modelled.
+    """
+
+    def __init__(self, port: int, seed: int):
+        from websockets.sync.client import connect
+
+        self._stack = ExitStack()
+        self.ws = self._stack.enter_context(connect(
+            f"ws://127.0.0.1:{port}/_stcore/stream",
+            subprotocols=["streamlit"],
+            max_size=None,
+            open_timeout=30,
+        ))
+        self.rng = random.Random(seed)
+        self.widgets: Dict[Tuple[str, str], object] = {}  # (kind, label) -> element proto
+        self.values: Dict[str, WidgetState] = {}          # widget id -> last state sent
+        self.markdown: List[str] = []
+        self.fragments: Dict[str, float] = {}             # auto-rerun fragment id -> interval
+        self.latencies: List[float] = []
+        self.plan_waits: List[float] = []
+        self.errors: List[str] = []
+
+    def close(self) -> None:
+        try:
+            self._stack.close()
+        except Exception:
+            pass
+
+    # --- protocol ---
+
+    def _send_rerun(self, triggers: Optional[List[WidgetState]] = None, fragment_id: str = "") -> None:
+        msg = BackMsg()
+        cs = msg.rerun_script
+        if fragment_id:
+            cs.fragment_id = fragment_id
+        cs.widget_states.widgets.extend(self.values.values())
+        cs.widget_states.widgets.extend(triggers or [])
+        self.ws.send(msg.SerializeToString())
+
+    def _read_until_finished(self, full_run: bool) -> None:
+        if full_run:
+            self.widgets = {}
+            self.markdown = []
+        deadline = time.time() + RERUN_TIMEOUT_S
+        while True:
+            fm = ForwardMsg()
+            fm.ParseFromString(self.ws.recv(timeout=max(0.1, deadline - time.time())))
+            kind = fm.WhichOneof("type")
+            if kind == "delta" and fm.delta.WhichOneof("type") == "new_element":
+                el = fm.delta.new_element
+                el_kind = el.WhichOneof("type")
+                body = getattr(el, el_kind) if el_kind else None
+                if el_kind == "markdown":
+                    self.markdown.append(body.body)
+                elif el_kind == "exception":
+                    self.errors.append(f"{body.type}: {body.message}"[:200])
+                elif body is not None and hasattr(body, "id") and hasattr(body, "label"):
+                    self.widgets[(el_kind, body.label)] = body
+            elif kind == "auto_rerun":
+                self.fragments[fm.auto_rerun.fragment_id] = fm.auto_rerun.interval
+            elif kind == "script_finished":
+                status = fm.script_finished
+                if status == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    continue  # st.rerun() or a queued rerun follows
+                if status == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    self.errors.append("script compile error")
+                return
+
+    def rerun(self, triggers: Optional[List[WidgetState]] = None) -> None:
+        t0 = time.perf_counter()
+        self.fragments = {}
+        self._send_rerun(triggers)
+        self._read_until_finished(full_run=True)
+        self.latencies.append(time.perf_counter() - t0)
+
+    def fragment_tick(self) -> None:
+        for fid in list(self.fragments):
+            t0 = time.perf_counter()
+            self._send_rerun(fragment_id=fid)
+            self._read_until_finished(full_run=False)
+            self.latencies.append(time.perf_counter() - t0)
+
+    # --- widget helpers ---
+
+    def widget(self, kind: str, label: str):
+        el = self.widgets.get((kind, label))
+        if el is None:
+            raise LookupError(f"No {kind} labelled {label!r}")
+        return el
+
+    def _set(self, kind: str, label: str, **value) -> WidgetState:
+        ws = WidgetState(id=self.widget(kind, label).id, **value)
+        self.values[ws.id] = ws
+        return ws
+
+    def set_number(self, label: str, value: float) -> None:
+        self._set("number_input", label, double_value=value)
+
+    def set_text(self, label: str, value: str) -> None:
+        self._set("text_input", label, string_value=value)
+
+    def set_slider(self, label: str, value: float) -> None:
+        self._set("slider", label).double_array_value.data[:] = [value]
+
+    def set_select(self, label: str, option: str) -> None:
+        self._set("selectbox", label, string_value=option)
+
+    def click(self, label_part: str) -> WidgetState:
+        for (kind, label), el in self.widgets.items():
+            if kind == "button" and label_part in label:
+                return WidgetState(id=el.id, trigger_value=True)
+        raise LookupError(f"No button containing {label_part!r}")
+
+    # --- interaction script ---
+
+    def plan_ready(self) -> bool:
+        # The "### <name>'s weekly plan" heading is only rendered above a finished plan
+        # (a bare "weekly plan" substring also matches the static ratio-section heading).
+        return any(m.startswith("### ") and m.endswith("'s weekly plan") for m in self.markdown)
+
+    def script(self) -> None:
+        rng = self.rng
+        self.set_number("Weight (kg)", round(rng.uniform(3, 45), 1))
+        self.rerun()
+        self.set_number("Age (years)", round(rng.uniform(0.5, 14), 1))
+        self.rerun()
+        self.set_text("Search breed", rng.choice(["shep", "terrier", "retriever", "poodle", ""]))
+        self.rerun()
+        self.set_slider("Rotation randomness seed", rng.randint(1, 999))
+        self.rerun()
+
+        started = time.perf_counter()
+        self.rerun([self.click("Generate 7-Day")])
+        while not self.plan_ready() and time.perf_counter() - started < PLAN_WAIT_S:
+            if self.fragments:
+                time.sleep(min(self.fragments.values()))
+                self.fragment_tick()  # progress monitor poll; it reruns the app when done
+            else:
+                time.sleep(0.4)
+                self.rerun()
+        self.plan_waits.append(time.perf_counter() - started)
+        if not self.plan_ready():
+            self.errors.append("plan not ready within timeout")
+
+        protein = self.widget("selectbox", "Observed protein")
+        self.set_select("Observed protein", rng.choice(list(protein.options)[1:]))
+        self.rerun()
+        self.rerun([self.click("Add taste entry")])
+
+
+# ---------------------------------------------------------
+# Driver
+# ---------------------------------------------------------
+
+def run_level(port: int, server_pid: int, n_sessions: int, iterations: int, seed: int) -> Dict:
+    rss_idle = rss_mb(server_pid)
+    sessions = [BrowserSession(port, seed * 1000 + i) for i in range(n_sessions)]
+    barrier = threading.Barrier(n_sessions)
+
+    def drive(s: BrowserSession):
+        try:
+            s.rerun()  # first page load
+        except Exception as e:
+            s.errors.append(f"first load: {type(e).__name__}: {e}"[:200])
+        barrier.wait()
+        for _ in range(iterations):
+            try:
+                s.script()
+            except Exception as e:
+                s.errors.append(f"{type(e).__name__}: {e}"[:200])
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=n_sessions) as pool:
+        list(pool.map(drive, sessions))
+    wall = time.perf_counter() - t0
+    rss_loaded = rss_mb(server_pid)
+    for s in sessions:
+        s.close()
+
+    lat = [x for s in sessions for x in s.latencies]
+    waits = [x for s in sessions for x in s.plan_waits]
+    errors = [e for s in sessions for e in s.errors]
+    return {
+        "sessions": n_sessions,
+        "reruns": len(lat),
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(lat) / wall, 2) if wall else float("nan"),
+        "p50_ms": round(percentile(lat, 50) * 1000, 1),
+        "p90_ms": round(percentile(lat, 90) * 1000, 1),
+        "p99_ms": round(percentile(lat, 99) * 1000, 1),
+        "max_ms": round(max(lat) * 1000, 1) if lat else float("nan"),
+        "plan_ready_p50_ms": round(percentile(waits, 50) * 1000, 1),
+        "server_rss_mb": round(rss_loaded, 1),
+        "rss_per_session_mb": round((rss_loaded - rss_idle) / n_sessions, 2),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else "",
+    }
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Concurrent-session load harness for app.py")
+    ap.add_argument("--sessions", default="1,2,4,8", help="comma-separated session counts")
+    ap.add_argument("--iterations", type=int, default=2, help="interaction scripts per session")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--port", type=int, default=0, help="server port (default: any free port)")
+    ap.add_argument("--json", default="", help="also write results to this file")
+    args = ap.parse_args(argv)
+
+    levels = [int(x) for x in args.sessions.split(",") if x.strip()]
+    port = args.port or free_port()
+    server = start_server(port)
+    results = []
+    try:
+        # Warm imports and cached catalogs so the first level is not a cold start.
+        warm = BrowserSession(port, 0)
+        warm.rerun()
+        warm.close()
+        print(f"server pid {server.pid} · warm RSS {rss_mb(server.pid):.1f} MB", flush=True)
+
+        cols = ["sessions", "reruns", "throughput_rps", "p50_ms", "p90_ms", "p99_ms",
+                "plan_ready_p50_ms", "server_rss_mb", "rss_per_session_mb", "errors"]
+        print(" ".join(f"{c:>18}" for c in cols))
+        for n in levels:
+            r = run_level(port, server.pid, n, args.iterations, args.seed)
+            results.append(r)
+            print(" ".join(f"{r[c]:>18}" for c in cols), flush=True)
+            if r["errors"]:
+                print(f"  first error: {r['first_error']}", file=sys.stderr)
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump(results, fh, indent=2)
+    return 1 if any(r["errors"] for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+Import-time / cold-start budget check for the planning core, the JSON
+service and the Streamlit app.
+
+Every target is imported in a fresh interpreter under `python -X importtime`
+(best of --repeat runs, so a cold disk cache does not count against it). The
+report lists the total import time, the heaviest top-level packages and any
+module a target must not pull in at import time — e.g. the core must stay
+usable for energy maths without pandas, and nothing may load Altair before
+the first chart.
+
+    python tools/startup_check.py
+    python tools/startup_check.py --top 12 --repeat 5
+    python tools/startup_check.py --budget-scale 2.0     # slow CI runners
+
+For app.py only the module's top-level import statements are executed (the
+rest of the file is the Streamlit script itself). Exits 1 when a target is
+over budget or imports a forbidden module, so it can gate a CI job.
+"""
+
+import argparse
+import ast
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, "app.py")
+
+# name -> (import statement(s), budget in ms, modules that must stay unloaded)
+TARGETS: Dict[str, Tuple[str, float, Tuple[str, ...]]] = {
+    "nebula_core": ("import nebula_core", 200.0, ("pandas", "altair", "streamlit")),
+    "service": ("import service", 250.0, ("pandas", "altair", "streamlit")),
+    "app.py imports": ("", 900.0, ("altair",)),
+}
+
+
+def app_import_block() -> str:
+    """The top-level import statements of app.py, as source."""
+    with open(APP_PATH, encoding="utf-8") as fh:
+        source = fh.read()
+    tree = ast.parse(source)
+    nodes = [n for n in tree.body if isinstance(n, (ast.Import, ast.ImportFrom))]
+    return "\n".join(ast.get_source_segment(source, n) for n in nodes)
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """(module, self_us, cumulative_us, depth) per `-X importtime` line."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        head, cum_us, name = line.split("|", 2)
+        self_us = int(head.split(":", 1)[1])
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        rows.append((name.strip(), self_us, int(cum_us), depth))
+    return rows
+
+
+def measure(code: str, forbid: Tuple[str, ...]) -> Tuple[float, List[Tuple[str, int, int, int]], List[str]]:
+    probe = (
+        f"{code}\n"
+        "import sys\n"
+        f"print(','.join(m for m in {forbid!r} if m in sys.modules))\n"
+    )
+    # Bytecode caching stays on: the first run writes .pyc files and the
+    # best-of-N runs measure what a deployed process actually pays.
+    env = {k: v for k, v in os.environ.items() if k != "PYTHONDONTWRITEBYTECODE"}
+    env["PYTHONPATH"] = ROOT
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", probe],
+        cwd=ROOT, capture_output=True, text=True, env=env,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import failed")
+    rows = parse_importtime(proc.stderr)
+    total_ms = sum(cum for _, _, cum, depth in rows if depth == 0) / 1000.0
+    loaded = [m for m in proc.stdout.strip().splitlines()[-1].split(",") if m] if proc.stdout.strip() else []
+    return total_ms, rows, loaded
+
+
+def heaviest_packages(rows: List[Tuple[str, int, int, int]], top: int) -> List[Tuple[str, float]]:
+    by_pkg: Dict[str, int] = {}
+    for name, self_us, _, _ in rows:
+        pkg = name.split(".")[0]
+        by_pkg[pkg] = by_pkg.get(pkg, 0) + self_us
+    return [(p, us / 1000.0) for p, us in sorted(by_pkg.items(), key=lambda kv: -kv[1])[:top]]
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip(),
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--repeat", type=int, default=3, help="fresh interpreters per target (best run counts)")
+    ap.add_argument("--top", type=int, default=8, help="heaviest packages to list per target")
+    ap.add_argument("--budget-scale", type=float, default=1.0, help="multiply every budget (slow machines)")
+    ap.add_argument("--only", action="append", choices=list(TARGETS), help="check just these targets")
+    args = ap.parse_args(argv)
+
+    failures = 0
+    for name, (code, budget_ms, forbid) in TARGETS.items():
+        if args.only and name not in args.only:
+            continue
+        code = code or app_import_block()
+        try:
+            runs = [measure(code, forbid) for _ in range(max(1, args.repeat))]
+        except RuntimeError as exc:
+            print(f"{name}: FAILED to import — {exc}")
+            failures += 1
+            continue
+        total_ms, rows, loaded = min(runs, key=lambda r: r[0])
+        budget = budget_ms * args.budget_scale
+        ok = total_ms <= budget and not loaded
+        failures += not ok
+        print(f"{name}: {total_ms:.0f} ms (budget {budget:.0f} ms, {len(rows)} modules) "
+              f"{'ok' if ok else 'OVER BUDGET' if total_ms > budget else 'FORBIDDEN IMPORT'}")
+        if loaded:
+            print(f"    imports at load time: {', '.join(loaded)}")
+        for pkg, ms in heaviest_packages(rows, args.top):
+            print(f"    {ms:8.1f} ms  {pkg}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())